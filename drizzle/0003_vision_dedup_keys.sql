@@ -0,0 +1,4 @@
+ALTER TABLE `pen_counts` ADD `dedupKey` varchar(64);--> statement-breakpoint
+ALTER TABLE `weight_estimates` ADD `dedupKey` varchar(64);--> statement-breakpoint
+ALTER TABLE `pen_counts` ADD CONSTRAINT `pen_counts_dedupKey_unique` UNIQUE(`dedupKey`);--> statement-breakpoint
+ALTER TABLE `weight_estimates` ADD CONSTRAINT `weight_estimates_dedupKey_unique` UNIQUE(`dedupKey`);
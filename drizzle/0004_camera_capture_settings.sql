@@ -0,0 +1,4 @@
+ALTER TABLE `cameras` ADD `substreamUrl` varchar(500);--> statement-breakpoint
+ALTER TABLE `cameras` ADD `captureBackend` enum('opencv','ffmpeg');--> statement-breakpoint
+ALTER TABLE `cameras` ADD `captureWidth` int;--> statement-breakpoint
+ALTER TABLE `cameras` ADD `keyframeOnly` boolean DEFAULT false NOT NULL;
\ No newline at end of file
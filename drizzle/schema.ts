@@ -1,4 +1,4 @@
-import { int, mysqlEnum, mysqlTable, text, timestamp, varchar, decimal, json } from "drizzle-orm/mysql-core";
+import { int, mysqlEnum, mysqlTable, text, timestamp, varchar, decimal, json, boolean } from "drizzle-orm/mysql-core";
 
 /**
  * Core user table backing auth flow.
@@ -49,6 +49,9 @@ export const cameras = mysqlTable("cameras", {
     enabled: boolean;
     points: { x: number; y: number }[];
     excludeZones?: { x: number; y: number }[][];
+    /** Resolução em que a geometria em pixels foi desenhada */
+    frameWidth?: number;
+    frameHeight?: number;
   }>(),
   /** Posição da câmera no curral (ex: NE, NW, SE, SW) */
   position: varchar("position", { length: 20 }),
@@ -56,6 +59,14 @@ export const cameras = mysqlTable("cameras", {
   penId: int("penId"),
   /** ID da estação de pesagem associada (se aplicável) */
   weighStationId: int("weighStationId"),
+  /** URL do substream (resolução menor), usada pelo Vision Agent quando existir */
+  substreamUrl: varchar("substreamUrl", { length: 500 }),
+  /** Backend de captura no Vision Agent (null = padrão do agente) */
+  captureBackend: mysqlEnum("captureBackend", ["opencv", "ffmpeg"]),
+  /** Largura entregue pelo FFmpeg em px (null = padrão do agente, 0 = nativa) */
+  captureWidth: int("captureWidth"),
+  /** Decodificar só keyframes (câmeras de contagem que precisam de poucos frames) */
+  keyframeOnly: boolean("keyframeOnly").default(false).notNull(),
   createdAt: timestamp("createdAt").defaultNow().notNull(),
   updatedAt: timestamp("updatedAt").defaultNow().onUpdateNow().notNull(),
 });
@@ -112,6 +123,8 @@ export const penCounts = mysqlTable("pen_counts", {
     frameId?: string;
     processingTimeMs?: number;
   }>(),
+  /** Chave de deduplicação do Vision Agent (reenvios do outbox repetem a mesma chave) */
+  dedupKey: varchar("dedupKey", { length: 64 }).unique(),
   createdAt: timestamp("createdAt").defaultNow().notNull(),
 });
 
@@ -136,6 +149,7 @@ export const weighStations = mysqlTable("weigh_stations", {
     cameraHeight: number; // altura da câmera em metros
     triggerZone: { x1: number; y1: number; x2: number; y2: number }; // zona de trigger
     scaleReference?: { pixelsPerMeter: number }; // referência de escala para RGB
+    intrinsics?: { fx: number; fy: number; cx: number; cy: number; width: number; height: number; depthScale?: number }; // câmera depth (pinhole, em pixels)
   }>(),
   /** Versão atual da calibração */
   currentCalibrationVersion: int("currentCalibrationVersion"),
@@ -174,6 +188,8 @@ export const weightEstimates = mysqlTable("weight_estimates", {
   }>(),
   /** ID do animal associado (se identificado) */
   animalId: int("animalId"),
+  /** Chave de deduplicação do Vision Agent (reenvios do outbox repetem a mesma chave) */
+  dedupKey: varchar("dedupKey", { length: 64 }).unique(),
   createdAt: timestamp("createdAt").defaultNow().notNull(),
 });
 
@@ -21,7 +21,8 @@ import {
   calibrations,
   visionLogs 
 } from "../drizzle/schema";
-import { eq, desc, and, gte, lte, sql } from "drizzle-orm";
+import { eq, desc, and, gte, lt, lte, sql } from "drizzle-orm";
+import { createHash } from "crypto";
 
 // ============================================================================
 // SCHEMAS DE VALIDAÇÃO
@@ -60,6 +61,8 @@ const WeightEstimateSchema = z.object({
 const VisionIngestSchema = z.object({
   type: z.enum(["count", "weight"]),
   apiKey: z.string(),
+  // Chave única gerada pelo agente; reenvios do outbox offline repetem a mesma chave
+  dedupKey: z.string().optional(),
   data: z.object({
     // Para contagem
     penId: z.number().optional(),
@@ -76,6 +79,276 @@ const VisionIngestSchema = z.object({
   }),
 });
 
+// Item individual (sem API Key) e lote para ingestão em massa
+const VisionIngestItemSchema = VisionIngestSchema.omit({ apiKey: true });
+
+const VisionIngestBatchSchema = z.object({
+  apiKey: z.string(),
+  items: z.array(VisionIngestItemSchema).max(500),
+});
+
+// Leitura de uma câmera de curral cujo curral é fundido por outro nó
+const PenPartialSchema = z.object({
+  penId: z.number(),
+  cameraId: z.number(),
+  count: z.number(),
+  confidence: z.number(),
+  capturedAt: z.string(),
+  ageS: z.number(), // idade da leitura quando o heartbeat saiu do agente
+  groundPoints: z.array(z.array(z.number())).optional(),
+});
+
+// Heartbeat de um Vision Agent quando vários dividem as câmeras da fazenda
+const AgentHeartbeatSchema = z.object({
+  apiKey: z.string(),
+  nodeId: z.string().min(1),
+  leaseSeconds: z.number().min(1).max(300),
+  cameras: z.array(z.number()).optional(), // câmeras rodando no nó (diagnóstico)
+  partials: z.array(PenPartialSchema).max(500).optional(),
+  leaving: z.boolean().optional(),
+});
+
+// ============================================================================
+// INGESTÃO (compartilhado entre ingest e ingestBatch)
+// ============================================================================
+
+type VisionIngestItem = z.infer<typeof VisionIngestItemSchema>;
+type Db = NonNullable<Awaited<ReturnType<typeof getDb>>>;
+
+// Chaves de deduplicação já gravadas (reenvios do outbox do agente). Cache em
+// memória para responder rápido; a garantia é o índice único em dedupKey
+const DEDUP_CAPACITY = 20000;
+const recentDedupKeys = new Set<string>();
+
+function isDuplicate(dedupKey?: string): boolean {
+  return !!dedupKey && recentDedupKeys.has(dedupKey);
+}
+
+/**
+ * Registra a chave só depois que a linha foi gravada: um insert que falhou
+ * precisa ser aceito no reenvio
+ */
+function rememberDedupKey(dedupKey?: string) {
+  if (!dedupKey) return;
+  recentDedupKeys.add(dedupKey);
+  if (recentDedupKeys.size > DEDUP_CAPACITY) {
+    // Set mantém ordem de inserção: remove a chave mais antiga
+    const oldest = recentDedupKeys.values().next().value;
+    if (oldest !== undefined) recentDedupKeys.delete(oldest);
+  }
+}
+
+/**
+ * Erro de chave duplicada no índice único de dedupKey (reenvio de um item já
+ * gravado, ex.: após reinício do servidor). O drizzle embrulha o erro do
+ * mysql2 em `cause`
+ */
+function isDedupKeyConflict(error: unknown): boolean {
+  const err = error as { code?: string; sqlMessage?: string; cause?: unknown } | null;
+  if (!err || typeof err !== "object") return false;
+  if (err.code === "ER_DUP_ENTRY") return (err.sqlMessage ?? "").includes("dedupKey");
+  return isDedupKeyConflict(err.cause);
+}
+
+type Pen = typeof pens.$inferSelect;
+type CameraCount = { cameraId: number; count: number };
+
+/**
+ * A regra usada pelo agente na fusão é a do curral? ("homography" é a soma
+ * sem contar duas vezes o mesmo animal, então vale para "sum")
+ */
+function fusedRuleMatches(pen: Pen, fusedRule: unknown): boolean {
+  return fusedRule === pen.aggregationRule || (pen.aggregationRule === "sum" && fusedRule === "homography");
+}
+
+/**
+ * Aplica a regra do curral às contagens por câmera de uma fusão do agente;
+ * undefined se a regra não puder ser aplicada (ex.: sem a câmera principal)
+ */
+function aggregateCameraCounts(pen: Pen, cameraCounts: CameraCount[]): number | undefined {
+  const counts = cameraCounts.map((c) => c.count);
+  if (counts.length === 0) return undefined;
+
+  switch (pen.aggregationRule) {
+    case "median":
+      counts.sort((a, b) => a - b);
+      return counts[Math.floor(counts.length / 2)];
+    case "sum":
+      return counts.reduce((a, b) => a + b, 0);
+    case "max":
+      return Math.max(...counts);
+    case "principal":
+      return cameraCounts.find((c) => c.cameraId === pen.primaryCameraId)?.count;
+  }
+  return undefined;
+}
+
+/**
+ * Grava uma contagem ou estimativa de peso vinda do Vision Agent. Recusas
+ * definitivas (dados inválidos) levam retryable: false; o agente guarda as
+ * demais no outbox e reenvia
+ */
+async function ingestItem(db: Db, item: VisionIngestItem) {
+  const { type, data } = item;
+
+  if (isDuplicate(item.dedupKey)) {
+    return { success: true, duplicate: true };
+  }
+
+  if (type === "count") {
+    // Inserir contagem
+    if (!data.penId || !data.cameraId || data.count === undefined) {
+      return { success: false, error: "Dados incompletos para contagem", retryable: false };
+    }
+
+    // Buscar regra de agregação do curral
+    const pen = await db.select()
+      .from(pens)
+      .where(eq(pens.id, data.penId))
+      .limit(1);
+
+    let aggregatedCount = data.count;
+
+    // Contagem já fundida pelo Vision Agent (todas as câmeras do curral)
+    const alreadyFused = data.meta?.fused === true;
+
+    if (pen.length > 0 && alreadyFused && !fusedRuleMatches(pen[0], data.meta?.rule)) {
+      // Agente com regra desatualizada: refazer com a regra do curral a partir das câmeras
+      const cameraCounts: CameraCount[] = Array.isArray(data.meta?.cameras) ? data.meta.cameras : [];
+      const recomputed = aggregateCameraCounts(pen[0], cameraCounts);
+      if (recomputed === undefined) {
+        return {
+          success: false,
+          error: `Contagem fundida com regra ${data.meta?.rule} diferente da do curral (${pen[0].aggregationRule})`,
+          retryable: false,
+        };
+      }
+      console.log(`[Vision] Curral ${data.penId}: fusão ${data.meta?.rule} refeita com a regra ${pen[0].aggregationRule}`);
+      aggregatedCount = recomputed;
+    }
+
+    if (pen.length > 0 && !alreadyFused) {
+      // Buscar contagens recentes de outras câmeras
+      const recentCounts = await db.select()
+        .from(penCounts)
+        .where(
+          and(
+            eq(penCounts.penId, data.penId),
+            gte(penCounts.capturedAt, new Date(Date.now() - 10000)) // últimos 10s
+          )
+        );
+
+      const counts = [...recentCounts.map((c: typeof penCounts.$inferSelect) => c.count), data.count];
+
+      switch (pen[0].aggregationRule) {
+        case "median":
+          counts.sort((a, b) => a - b);
+          aggregatedCount = counts[Math.floor(counts.length / 2)];
+          break;
+        case "sum":
+          aggregatedCount = counts.reduce((a, b) => a + b, 0);
+          break;
+        case "max":
+          aggregatedCount = Math.max(...counts);
+          break;
+        case "principal":
+          if (pen[0].primaryCameraId === data.cameraId) {
+            aggregatedCount = data.count;
+          }
+          break;
+      }
+    }
+
+    // Chave já gravada (reenvio após restart do servidor) esbarra no índice único;
+    // qualquer outro erro do banco sobe e o item é recusado
+    try {
+      await db.insert(penCounts).values({
+        penId: data.penId,
+        cameraId: data.cameraId,
+        count: data.count,
+        aggregatedCount,
+        confidence: data.confidence?.toString() || "0.9",
+        capturedAt: new Date(data.capturedAt),
+        metaJson: data.meta,
+        dedupKey: item.dedupKey,
+      });
+    } catch (error) {
+      if (!item.dedupKey || !isDedupKeyConflict(error)) throw error;
+      rememberDedupKey(item.dedupKey);
+      return { success: true, duplicate: true };
+    }
+    rememberDedupKey(item.dedupKey);
+
+    // Atualizar status da câmera
+    await db.update(cameras)
+      .set({ status: "online", lastSeenAt: new Date() })
+      .where(eq(cameras.id, data.cameraId));
+
+    console.log(`[Vision] Contagem recebida: Curral ${data.penId}, Câmera ${data.cameraId}, Count ${data.count}, Agregado ${aggregatedCount}`);
+
+    return { success: true, aggregatedCount };
+
+  } else if (type === "weight") {
+    // Inserir estimativa de peso
+    if (!data.stationId || data.estimatedKg === undefined || data.calibrationVersion === undefined) {
+      return { success: false, error: "Dados incompletos para peso", retryable: false };
+    }
+
+    try {
+      await db.insert(weightEstimates).values({
+        stationId: data.stationId,
+        estimatedKg: data.estimatedKg.toString(),
+        confidence: (data.confidence || 0.8).toString(),
+        capturedAt: new Date(data.capturedAt),
+        calibrationVersion: data.calibrationVersion,
+        metaJson: data.meta,
+        dedupKey: item.dedupKey,
+      });
+    } catch (error) {
+      if (!item.dedupKey || !isDedupKeyConflict(error)) throw error;
+      rememberDedupKey(item.dedupKey);
+      return { success: true, duplicate: true };
+    }
+    rememberDedupKey(item.dedupKey);
+
+    console.log(`[Vision] Peso estimado: Estação ${data.stationId}, ${data.estimatedKg}kg, Confiança ${data.confidence}`);
+
+    return { success: true };
+  }
+
+  return { success: false, error: "Tipo de dados desconhecido", retryable: false };
+}
+
+// ============================================================================
+// COORDENAÇÃO DE VÁRIOS AGENTES (SHARDING DE CÂMERAS)
+// ============================================================================
+
+type PenPartial = z.infer<typeof PenPartialSchema>;
+
+type AgentNode = {
+  expiresAt: number;
+  lastSeenAt: number;
+  cameras: number[];
+  partials: PenPartial[];
+};
+
+// Nós com lease válido. Em memória, como as dedupKeys: se o servidor
+// reinicia, os agentes se registram de novo no próximo heartbeat
+const agentNodes = new Map<string, AgentNode>();
+
+/**
+ * Remove os nós cujo lease venceu e devolve os vivos, em ordem
+ */
+function liveAgentNodes(now: number): string[] {
+  for (const [nodeId, node] of agentNodes) {
+    if (node.expiresAt <= now) {
+      agentNodes.delete(nodeId);
+      console.log(`[Vision] Lease do agente ${nodeId} venceu; câmeras redistribuídas`);
+    }
+  }
+  return [...agentNodes.keys()].sort();
+}
+
 // ============================================================================
 // ROUTER DE VISÃO COMPUTACIONAL
 // ============================================================================
@@ -119,6 +392,67 @@ export const visionRouter = router({
     }
   }),
 
+  /**
+   * GET /vision/getAgentConfig - Câmeras e currais completos para o Vision Agent
+   * Autenticado por API Key. A resposta leva o hash do conteúdo; se knownHash
+   * ainda é o atual, devolve só { hash, unchanged } (sem status/lastSeenAt,
+   * que mudam a cada ingestão e não afetam o agente)
+   */
+  getAgentConfig: publicProcedure
+    .input(z.object({
+      apiKey: z.string(),
+      knownHash: z.string().optional(),
+    }))
+    .query(async ({ input }) => {
+      const validApiKey = process.env.VISION_AGENT_API_KEY || "dev-vision-key";
+      if (input.apiKey !== validApiKey) {
+        console.error("[Vision] API Key inválida");
+        return { success: false, error: "Unauthorized", data: null };
+      }
+
+      try {
+        const db = await getDb();
+        if (!db) return { success: false, error: "Database não disponível", data: null };
+
+        const allCameras = await db.select().from(cameras).orderBy(cameras.id);
+        const allPens = await db.select().from(pens).orderBy(pens.id);
+
+        const agentConfig = {
+          cameras: allCameras.map((cam: typeof cameras.$inferSelect) => ({
+            id: cam.id,
+            name: cam.name,
+            rtspUrl: cam.rtspUrl,
+            type: cam.type,
+            position: cam.position,
+            penId: cam.penId,
+            weighStationId: cam.weighStationId,
+            roiConfig: cam.roiConfig,
+            substreamUrl: cam.substreamUrl,
+            captureBackend: cam.captureBackend,
+            captureWidth: cam.captureWidth,
+            keyframeOnly: cam.keyframeOnly,
+          })),
+          pens: allPens.map((pen: typeof pens.$inferSelect) => ({
+            id: pen.id,
+            name: pen.name,
+            aggregationRule: pen.aggregationRule,
+            primaryCameraId: pen.primaryCameraId,
+            status: pen.status,
+          })),
+        };
+
+        const hash = createHash("sha256").update(JSON.stringify(agentConfig)).digest("hex");
+        if (input.knownHash === hash) {
+          return { success: true, data: { hash, unchanged: true } };
+        }
+
+        return { success: true, data: { hash, ...agentConfig } };
+      } catch (error) {
+        console.error("[Vision] Erro ao montar configuração do agente:", error);
+        return { success: false, error: "Erro ao montar configuração", data: null };
+      }
+    }),
+
   /**
    * Criar/atualizar câmera
    */
@@ -132,6 +466,10 @@ export const visionRouter = router({
       penId: z.number().optional(),
       weighStationId: z.number().optional(),
       roiConfig: z.any().optional(),
+      substreamUrl: z.string().optional(),
+      captureBackend: z.enum(["opencv", "ffmpeg"]).optional(),
+      captureWidth: z.number().int().min(0).optional(),
+      keyframeOnly: z.boolean().optional(),
     }))
     .mutation(async ({ input }) => {
       try {
@@ -149,6 +487,10 @@ export const visionRouter = router({
               penId: input.penId,
               weighStationId: input.weighStationId,
               roiConfig: input.roiConfig,
+              substreamUrl: input.substreamUrl,
+              captureBackend: input.captureBackend,
+              captureWidth: input.captureWidth,
+              keyframeOnly: input.keyframeOnly,
             })
             .where(eq(cameras.id, input.id));
           
@@ -163,6 +505,10 @@ export const visionRouter = router({
             penId: input.penId,
             weighStationId: input.weighStationId,
             roiConfig: input.roiConfig,
+            substreamUrl: input.substreamUrl,
+            captureBackend: input.captureBackend,
+            captureWidth: input.captureWidth,
+            keyframeOnly: input.keyframeOnly,
           });
           
           return { success: true, id: result[0].insertId, action: "created" };
@@ -565,7 +911,8 @@ export const visionRouter = router({
             .where(
               and(
                 eq(calibrations.stationId, input.stationId),
-                eq(calibrations.status, "active")
+                eq(calibrations.status, "active"),
+                lt(calibrations.version, newVersion)
               )
             );
         }
@@ -583,6 +930,70 @@ export const visionRouter = router({
       }
     }),
 
+  /**
+   * GET /vision/getCalibration - Calibração vigente de uma estação (Vision Agent)
+   * Autenticado por API Key; se knownVersion já é a vigente, devolve só { version, unchanged }
+   */
+  getCalibration: publicProcedure
+    .input(z.object({
+      apiKey: z.string(),
+      stationId: z.number(),
+      knownVersion: z.number().optional(),
+    }))
+    .query(async ({ input }) => {
+      const validApiKey = process.env.VISION_AGENT_API_KEY || "dev-vision-key";
+      if (input.apiKey !== validApiKey) {
+        console.error("[Vision] API Key inválida");
+        return { success: false, error: "Unauthorized", data: null };
+      }
+
+      try {
+        const db = await getDb();
+        if (!db) return { success: false, error: "Database não disponível", data: null };
+
+        const [station] = await db.select()
+          .from(weighStations)
+          .where(eq(weighStations.id, input.stationId))
+          .limit(1);
+
+        if (!station) return { success: false, error: "Estação não encontrada", data: null };
+
+        const version = station.currentCalibrationVersion;
+        if (!version) return { success: true, data: null };
+
+        if (input.knownVersion === version) {
+          return { success: true, data: { stationId: station.id, version, unchanged: true } };
+        }
+
+        const [calibration] = await db.select()
+          .from(calibrations)
+          .where(
+            and(
+              eq(calibrations.stationId, station.id),
+              eq(calibrations.version, version)
+            )
+          )
+          .limit(1);
+
+        if (!calibration) return { success: true, data: null };
+
+        return {
+          success: true,
+          data: {
+            stationId: station.id,
+            version,
+            params: calibration.paramsJson,
+            cameraType: station.cameraType,
+            stationConfig: station.config,
+            createdAt: calibration.createdAt.toISOString(),
+          },
+        };
+      } catch (error) {
+        console.error("[Vision] Erro ao buscar calibração:", error);
+        return { success: false, error: "Erro ao buscar calibração", data: null };
+      }
+    }),
+
   /**
    * Criar/atualizar estação de pesagem
    */
@@ -647,101 +1058,117 @@ export const visionRouter = router({
       try {
         const db = await getDb();
         if (!db) return { success: false, error: "Database não disponível" };
-        
-        const { type, data } = input;
 
-        if (type === "count") {
-          // Inserir contagem
-          if (!data.penId || !data.cameraId || data.count === undefined) {
-            return { success: false, error: "Dados incompletos para contagem" };
-          }
+        return await ingestItem(db, input);
+      } catch (error) {
+        console.error("[Vision] Erro ao processar ingestão:", error);
+        return { success: false, error: "Erro interno" };
+      }
+    }),
 
-          // Buscar regra de agregação do curral
-          const pen = await db.select()
-            .from(pens)
-            .where(eq(pens.id, data.penId))
-            .limit(1);
-
-          let aggregatedCount = data.count;
-
-          if (pen.length > 0) {
-            // Buscar contagens recentes de outras câmeras
-            const recentCounts = await db.select()
-              .from(penCounts)
-              .where(
-                and(
-                  eq(penCounts.penId, data.penId),
-                  gte(penCounts.capturedAt, new Date(Date.now() - 10000)) // últimos 10s
-                )
-              );
-
-            const counts = [...recentCounts.map((c: typeof penCounts.$inferSelect) => c.count), data.count];
-            
-            switch (pen[0].aggregationRule) {
-              case "median":
-                counts.sort((a, b) => a - b);
-                aggregatedCount = counts[Math.floor(counts.length / 2)];
-                break;
-              case "sum":
-                aggregatedCount = counts.reduce((a, b) => a + b, 0);
-                break;
-              case "max":
-                aggregatedCount = Math.max(...counts);
-                break;
-              case "principal":
-                if (pen[0].primaryCameraId === data.cameraId) {
-                  aggregatedCount = data.count;
-                }
-                break;
-            }
-          }
+  /**
+   * POST /vision/ingestBatch - Vários resultados do Vision Agent em uma requisição
+   * Autenticado por API Key; cada item é processado como em /vision/ingest
+   */
+  ingestBatch: publicProcedure
+    .input(VisionIngestBatchSchema)
+    .mutation(async ({ input }) => {
+      const validApiKey = process.env.VISION_AGENT_API_KEY || "dev-vision-key";
+      if (input.apiKey !== validApiKey) {
+        console.error("[Vision] API Key inválida");
+        return { success: false, error: "Unauthorized" };
+      }
 
-          await db.insert(penCounts).values({
-            penId: data.penId,
-            cameraId: data.cameraId,
-            count: data.count,
-            aggregatedCount,
-            confidence: data.confidence?.toString() || "0.9",
-            capturedAt: new Date(data.capturedAt),
-            metaJson: data.meta,
-          });
+      try {
+        const db = await getDb();
+        if (!db) return { success: false, error: "Database não disponível" };
 
-          // Atualizar status da câmera
-          await db.update(cameras)
-            .set({ status: "online", lastSeenAt: new Date() })
-            .where(eq(cameras.id, data.cameraId));
+        const results = [];
+        for (const item of input.items) {
+          try {
+            results.push(await ingestItem(db, item));
+          } catch (error) {
+            console.error("[Vision] Erro ao processar item do lote:", error);
+            results.push({ success: false, error: "Erro interno" });
+          }
+        }
 
-          console.log(`[Vision] Contagem recebida: Curral ${data.penId}, Câmera ${data.cameraId}, Count ${data.count}, Agregado ${aggregatedCount}`);
-          
-          return { success: true, aggregatedCount };
+        const accepted = results.filter((r) => r.success).length;
+        console.log(`[Vision] Lote recebido: ${accepted}/${input.items.length} itens aceitos`);
 
-        } else if (type === "weight") {
-          // Inserir estimativa de peso
-          if (!data.stationId || data.estimatedKg === undefined || data.calibrationVersion === undefined) {
-            return { success: false, error: "Dados incompletos para peso" };
-          }
+        return { success: true, accepted, rejected: input.items.length - accepted, results };
+      } catch (error) {
+        console.error("[Vision] Erro ao processar lote:", error);
+        return { success: false, error: "Erro interno" };
+      }
+    }),
 
-          await db.insert(weightEstimates).values({
-            stationId: data.stationId,
-            estimatedKg: data.estimatedKg.toString(),
-            confidence: (data.confidence || 0.8).toString(),
-            capturedAt: new Date(data.capturedAt),
-            calibrationVersion: data.calibrationVersion,
-            metaJson: data.meta,
-          });
+  // ==========================================================================
+  // COORDENAÇÃO DE AGENTES (SHARDING)
+  // ==========================================================================
 
-          console.log(`[Vision] Peso estimado: Estação ${data.stationId}, ${data.estimatedKg}kg, Confiança ${data.confidence}`);
-          
-          return { success: true };
+  /**
+   * POST /vision/agentHeartbeat - Renova o lease de um Vision Agent
+   * Autenticado por API Key. Devolve os nós vivos (cada agente calcula as
+   * suas câmeras por hash consistente sobre a lista) e as leituras parciais
+   * de curral enviadas pelos outros nós, com a idade atualizada. leaving
+   * tira o nó na hora, sem esperar o lease vencer
+   */
+  agentHeartbeat: publicProcedure
+    .input(AgentHeartbeatSchema)
+    .mutation(async ({ input }) => {
+      const validApiKey = process.env.VISION_AGENT_API_KEY || "dev-vision-key";
+      if (input.apiKey !== validApiKey) {
+        console.error("[Vision] API Key inválida");
+        return { success: false, error: "Unauthorized", data: null };
+      }
+
+      const now = Date.now();
+      if (input.leaving) {
+        agentNodes.delete(input.nodeId);
+        console.log(`[Vision] Agente ${input.nodeId} saiu`);
+      } else {
+        if (!agentNodes.has(input.nodeId)) {
+          console.log(`[Vision] Agente ${input.nodeId} entrou`);
         }
+        agentNodes.set(input.nodeId, {
+          expiresAt: now + input.leaseSeconds * 1000,
+          lastSeenAt: now,
+          cameras: input.cameras ?? [],
+          partials: input.partials ?? [],
+        });
+      }
 
-        return { success: false, error: "Tipo de dados desconhecido" };
-      } catch (error) {
-        console.error("[Vision] Erro ao processar ingestão:", error);
-        return { success: false, error: "Erro interno" };
+      const nodes = liveAgentNodes(now);
+      const partials: Array<PenPartial & { nodeId: string }> = [];
+      for (const [nodeId, node] of agentNodes) {
+        if (nodeId === input.nodeId) continue;
+        const elapsed = (now - node.lastSeenAt) / 1000;
+        for (const partial of node.partials) {
+          partials.push({ ...partial, nodeId, ageS: partial.ageS + elapsed });
+        }
       }
+
+      return { success: true, data: { nodes, partials } };
     }),
 
+  /**
+   * Nós do Vision Agent com lease válido e as câmeras de cada um
+   */
+  getAgentNodes: protectedProcedure.query(async () => {
+    const now = Date.now();
+    liveAgentNodes(now);
+    return {
+      success: true,
+      data: [...agentNodes.entries()].map(([nodeId, node]) => ({
+        nodeId,
+        cameras: node.cameras,
+        lastSeenAt: new Date(node.lastSeenAt).toISOString(),
+        leaseExpiresAt: new Date(node.expiresAt).toISOString(),
+      })),
+    };
+  }),
+
   // ==========================================================================
   // LOGS E DIAGNÓSTICO
   // ==========================================================================
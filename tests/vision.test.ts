@@ -1,4 +1,11 @@
 import { describe, it, expect, vi, beforeEach } from 'vitest';
+import { visionRouter } from '../server/visionRouter';
+import { getDb } from '../server/db';
+import { cameras, pens, penCounts, weightEstimates } from '../drizzle/schema';
+import type { TrpcContext } from '../server/_core/context';
+
+// Rotas do Vision Agent com o banco substituído por um fake em memória
+vi.mock('../server/db', () => ({ getDb: vi.fn() }));
 
 // Mock das funções de visão computacional
 const mockVisionFunctions = {
@@ -348,3 +355,274 @@ describe('Estrutura de Dados do Módulo de Visão', () => {
     expect(calibration).toHaveProperty('samplesCount');
   });
 });
+
+// ============================================================================
+// ROTAS DO VISION AGENT
+// ============================================================================
+
+const API_KEY = process.env.VISION_AGENT_API_KEY || 'dev-vision-key';
+
+type InsertCall = { table: unknown; values: Record<string, any> };
+
+/**
+ * Banco fake com o subconjunto do query builder do drizzle usado pelo router:
+ * select().from().where()/orderBy()/limit() devolvem as linhas da tabela e
+ * insert().values() pode falhar via failInsert
+ */
+function createFakeDb() {
+  const rows = new Map<unknown, unknown[]>();
+  const inserted: InsertCall[] = [];
+  let failInsert: ((call: InsertCall) => unknown) | null = null;
+
+  const query = (table: unknown) => {
+    const result = Promise.resolve(rows.get(table) ?? []);
+    const chain: any = {
+      where: () => chain,
+      orderBy: () => chain,
+      limit: () => chain,
+      then: result.then.bind(result),
+    };
+    return chain;
+  };
+
+  const db = {
+    select: () => ({ from: query }),
+    insert: (table: unknown) => ({
+      values: async (values: Record<string, any>) => {
+        const error = failInsert?.({ table, values });
+        if (error) throw error;
+        inserted.push({ table, values });
+      },
+    }),
+    update: () => ({ set: () => ({ where: async () => undefined }) }),
+  };
+
+  return {
+    db,
+    rows,
+    inserted,
+    failInsert: (fn: (call: InsertCall) => unknown) => {
+      failInsert = fn;
+    },
+  };
+}
+
+/** Erro de chave duplicada como o drizzle repassa do mysql2 (em cause) */
+function duplicateKeyError(table: string, key: string) {
+  return Object.assign(new Error('Failed query'), {
+    cause: {
+      code: 'ER_DUP_ENTRY',
+      sqlMessage: `Duplicate entry '${key}' for key '${table}.${table}_dedupKey_unique'`,
+    },
+  });
+}
+
+function createCaller() {
+  const ctx: TrpcContext = {
+    user: null,
+    req: { protocol: 'https', headers: {} } as TrpcContext['req'],
+    res: {} as TrpcContext['res'],
+  };
+  return visionRouter.createCaller(ctx);
+}
+
+let keySeq = 0;
+
+/** dedupKeys únicas por teste: o cache de chaves do router é do módulo */
+function dedupKey() {
+  keySeq += 1;
+  return `test-${Date.now()}-${keySeq}`;
+}
+
+function countItem(extra: Record<string, unknown> = {}) {
+  return {
+    type: 'count' as const,
+    dedupKey: dedupKey(),
+    data: { penId: 1, cameraId: 10, count: 42, confidence: 0.9, capturedAt: new Date().toISOString() },
+    ...extra,
+  };
+}
+
+function weightItem(extra: Record<string, unknown> = {}) {
+  return {
+    type: 'weight' as const,
+    dedupKey: dedupKey(),
+    data: { stationId: 1, estimatedKg: 450.5, confidence: 0.85, calibrationVersion: 2, capturedAt: new Date().toISOString() },
+    ...extra,
+  };
+}
+
+describe('Rotas do Vision Agent', () => {
+  let fake: ReturnType<typeof createFakeDb>;
+
+  beforeEach(() => {
+    fake = createFakeDb();
+    fake.rows.set(pens, [{ id: 1, name: 'Curral 1', aggregationRule: 'median', primaryCameraId: null, status: 'active' }]);
+    vi.mocked(getDb).mockResolvedValue(fake.db as any);
+    vi.spyOn(console, 'log').mockImplementation(() => {});
+    vi.spyOn(console, 'error').mockImplementation(() => {});
+  });
+
+  describe('ingestBatch', () => {
+    it('deve gravar cada item e contar aceitos e recusados', async () => {
+      const result: any = await createCaller().ingestBatch({
+        apiKey: API_KEY,
+        items: [countItem(), weightItem(), weightItem({ data: { stationId: 1, capturedAt: new Date().toISOString() } })],
+      });
+
+      expect(result).toMatchObject({ success: true, accepted: 2, rejected: 1 });
+      expect(result.results[2]).toEqual({ success: false, error: 'Dados incompletos para peso', retryable: false });
+      expect(fake.inserted.map((call) => call.table)).toEqual([penCounts, weightEstimates]);
+    });
+
+    it('deve recusar o lote inteiro com API Key inválida', async () => {
+      const result = await createCaller().ingestBatch({ apiKey: 'errada', items: [countItem()] });
+
+      expect(result).toEqual({ success: false, error: 'Unauthorized' });
+      expect(fake.inserted).toHaveLength(0);
+    });
+
+    it('deve responder success:false sem banco (o agente guarda o lote no outbox)', async () => {
+      vi.mocked(getDb).mockResolvedValue(null as any);
+      const result = await createCaller().ingestBatch({ apiKey: API_KEY, items: [countItem()] });
+
+      expect(result).toEqual({ success: false, error: 'Database não disponível' });
+    });
+
+    it('deve marcar como retentável só o item cujo insert falhou', async () => {
+      const failing = countItem();
+      fake.failInsert(({ values }) => (values.dedupKey === failing.dedupKey ? new Error('Lock wait timeout') : null));
+
+      const result: any = await createCaller().ingestBatch({ apiKey: API_KEY, items: [countItem(), failing] });
+
+      expect(result).toMatchObject({ success: true, accepted: 1, rejected: 1 });
+      expect(result.results[1]).toEqual({ success: false, error: 'Erro interno' });
+      expect(result.results[1].retryable).toBeUndefined();
+    });
+
+    it('deve recusar em definitivo contagem fundida sem a câmera principal', async () => {
+      fake.rows.set(pens, [{ id: 1, name: 'Curral 1', aggregationRule: 'principal', primaryCameraId: 12, status: 'active' }]);
+      const fused = countItem({
+        data: {
+          penId: 1, cameraId: 10, count: 40, confidence: 0.9, capturedAt: new Date().toISOString(),
+          meta: { fused: true, rule: 'median', cameras: [{ cameraId: 10, count: 40 }, { cameraId: 11, count: 44 }] },
+        },
+      });
+
+      const result: any = await createCaller().ingestBatch({ apiKey: API_KEY, items: [fused] });
+
+      expect(result.results[0]).toMatchObject({ success: false, retryable: false });
+      expect(fake.inserted).toHaveLength(0);
+    });
+  });
+
+  describe('dedupKey', () => {
+    it('deve aceitar o reenvio de um item já gravado sem gravar de novo', async () => {
+      const item = countItem();
+      const caller = createCaller();
+
+      expect(await caller.ingest({ apiKey: API_KEY, ...item })).toMatchObject({ success: true, aggregatedCount: 42 });
+      expect(await caller.ingest({ apiKey: API_KEY, ...item })).toEqual({ success: true, duplicate: true });
+      expect(fake.inserted).toHaveLength(1);
+    });
+
+    it('deve tratar ER_DUP_ENTRY em dedupKey como duplicata (reenvio após restart)', async () => {
+      const item = weightItem();
+      fake.failInsert(() => duplicateKeyError('weight_estimates', item.dedupKey));
+
+      const result: any = await createCaller().ingestBatch({ apiKey: API_KEY, items: [item] });
+
+      expect(result).toMatchObject({ success: true, accepted: 1, rejected: 0 });
+      expect(result.results[0]).toEqual({ success: true, duplicate: true });
+    });
+
+    it('não deve engolir chave duplicada em outro índice', async () => {
+      const item = countItem();
+      fake.failInsert(() => ({ cause: { code: 'ER_DUP_ENTRY', sqlMessage: "Duplicate entry '1' for key 'PRIMARY'" } }));
+
+      const result: any = await createCaller().ingestBatch({ apiKey: API_KEY, items: [item] });
+
+      expect(result.results[0]).toEqual({ success: false, error: 'Erro interno' });
+
+      // A chave não foi registrada: o reenvio grava normalmente
+      fake.failInsert(() => null);
+      expect(await createCaller().ingest({ apiKey: API_KEY, ...item })).toMatchObject({ success: true, aggregatedCount: 42 });
+    });
+  });
+
+  describe('getAgentConfig', () => {
+    beforeEach(() => {
+      fake.rows.set(cameras, [{
+        id: 10, name: 'Câmera NE', rtspUrl: 'rtsp://10.0.0.10/stream', type: 'rtsp', position: 'NE',
+        penId: 1, weighStationId: null, roiConfig: null, status: 'offline', lastSeenAt: null,
+        substreamUrl: 'rtsp://10.0.0.10/sub', captureBackend: 'ffmpeg', captureWidth: 640, keyframeOnly: true,
+      }]);
+    });
+
+    it('deve devolver câmeras com as configurações de captura e o hash', async () => {
+      const result: any = await createCaller().getAgentConfig({ apiKey: API_KEY });
+
+      expect(result.success).toBe(true);
+      expect(result.data.hash).toMatch(/^[0-9a-f]{64}$/);
+      expect(result.data.cameras[0]).toMatchObject({
+        id: 10, penId: 1, substreamUrl: 'rtsp://10.0.0.10/sub', captureBackend: 'ffmpeg', captureWidth: 640, keyframeOnly: true,
+      });
+      expect(result.data.cameras[0]).not.toHaveProperty('status');
+      expect(result.data.pens[0]).toMatchObject({ id: 1, aggregationRule: 'median' });
+    });
+
+    it('deve responder unchanged com o hash atual e ignorar a saúde das câmeras', async () => {
+      const caller = createCaller();
+      const first: any = await caller.getAgentConfig({ apiKey: API_KEY });
+
+      const camera: any = fake.rows.get(cameras)![0];
+      camera.status = 'online';
+      camera.lastSeenAt = new Date();
+      expect(await caller.getAgentConfig({ apiKey: API_KEY, knownHash: first.data.hash }))
+        .toEqual({ success: true, data: { hash: first.data.hash, unchanged: true } });
+
+      camera.captureWidth = 960;
+      const changed: any = await caller.getAgentConfig({ apiKey: API_KEY, knownHash: first.data.hash });
+      expect(changed.data.hash).not.toBe(first.data.hash);
+      expect(changed.data.cameras[0].captureWidth).toBe(960);
+    });
+
+    it('deve recusar API Key inválida', async () => {
+      expect(await createCaller().getAgentConfig({ apiKey: 'errada' }))
+        .toEqual({ success: false, error: 'Unauthorized', data: null });
+    });
+  });
+
+  describe('agentHeartbeat', () => {
+    it('deve listar os nós vivos e repassar as leituras parciais dos outros nós', async () => {
+      const caller = createCaller();
+      const partial = { penId: 1, cameraId: 11, count: 7, confidence: 0.9, capturedAt: new Date().toISOString(), ageS: 1 };
+
+      await caller.agentHeartbeat({ apiKey: API_KEY, nodeId: 'hb-a', leaseSeconds: 30, cameras: [11], partials: [partial] });
+      const result: any = await caller.agentHeartbeat({ apiKey: API_KEY, nodeId: 'hb-b', leaseSeconds: 30, cameras: [10] });
+
+      expect(result.success).toBe(true);
+      expect(result.data.nodes).toEqual(expect.arrayContaining(['hb-a', 'hb-b']));
+      const received = result.data.partials.find((p: any) => p.nodeId === 'hb-a');
+      expect(received).toMatchObject({ penId: 1, cameraId: 11, count: 7 });
+      expect(received.ageS).toBeGreaterThanOrEqual(1);
+      expect(result.data.partials.some((p: any) => p.nodeId === 'hb-b')).toBe(false);
+
+      await caller.agentHeartbeat({ apiKey: API_KEY, nodeId: 'hb-a', leaseSeconds: 30, leaving: true });
+      await caller.agentHeartbeat({ apiKey: API_KEY, nodeId: 'hb-b', leaseSeconds: 30, leaving: true });
+    });
+
+    it('deve tirar o nó na hora com leaving', async () => {
+      const caller = createCaller();
+      await caller.agentHeartbeat({ apiKey: API_KEY, nodeId: 'hb-c', leaseSeconds: 30 });
+      const result: any = await caller.agentHeartbeat({ apiKey: API_KEY, nodeId: 'hb-c', leaseSeconds: 30, leaving: true });
+
+      expect(result.data.nodes).not.toContain('hb-c');
+    });
+
+    it('deve recusar API Key inválida', async () => {
+      expect(await createCaller().agentHeartbeat({ apiKey: 'errada', nodeId: 'hb-d', leaseSeconds: 30 }))
+        .toEqual({ success: false, error: 'Unauthorized', data: null });
+    });
+  });
+});
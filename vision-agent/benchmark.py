@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Benchmark do Vision Agent - Fazenda Digital
+===========================================
+
+Reproduz vídeos gravados ou frames sintéticos pelo pipeline completo do
+VisionAgent (captura, detecção, rastreamento, contagem, peso, fila e envio)
+sem câmeras nem backend, e grava as métricas em JSON para comparar versões:
+tempo por estágio, FPS por câmera e percentis de latência captura -> resultado.
+
+Uso:
+    python benchmark.py --cameras 5 --duration 60 --output bench.json
+    python benchmark.py --source curral.mp4 --source pesagem.mp4 --fast
+    python benchmark.py --detector real --inference-backend onnxruntime
+    python benchmark.py --cameras 0 --weigh-cameras 2 --depth --fast
+    python benchmark.py --cameras 40 --runtime asyncio
+    python benchmark.py --cameras 8 --fake-latency-ms 40 --no-scheduler
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import threading
+import argparse
+import tempfile
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, List, Any
+
+import main
+from main import (
+    config, metrics, VisionAgent, CameraConfig, CameraType, PenConfig, VERSION
+)
+
+
+class LocalSession:
+    """Substitui a sessão HTTP: aceita tudo depois de latency_ms"""
+    
+    def __init__(self, latency_ms: float):
+        self.latency = latency_ms / 1000
+    
+    def post(self, url: str, **kwargs) -> Any:
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return SimpleNamespace(status_code=200, json=lambda: {})
+    
+    def get(self, url: str, **kwargs) -> Any:
+        return SimpleNamespace(status_code=404, json=lambda: {})
+    
+    def mount(self, *args, **kwargs):
+        pass
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark offline do pipeline de câmeras")
+    parser.add_argument('--source', action='append', default=[],
+                        help="vídeo gravado (pode repetir); sem --source usa frames sintéticos")
+    parser.add_argument('--cameras', type=int, default=4, help="câmeras de curral")
+    parser.add_argument('--weigh-cameras', type=int, default=1, help="câmeras de pesagem")
+    parser.add_argument('--resolution', default='1280x720', help="resolução dos frames sintéticos")
+    parser.add_argument('--fps', type=float, default=25.0, help="FPS dos frames sintéticos")
+    parser.add_argument('--animals', type=int, default=15, help="animais por frame sintético")
+    parser.add_argument('--depth', action='store_true',
+                        help="câmeras de pesagem sintéticas com profundidade (pesagem volumétrica)")
+    parser.add_argument('--duration', type=float, default=30.0, help="segundos medidos")
+    parser.add_argument('--warmup', type=float, default=5.0, help="segundos descartados no início")
+    parser.add_argument('--fast', action='store_true',
+                        help="sem perda, o mais rápido possível (padrão: tempo real)")
+    parser.add_argument('--detector', choices=['fake', 'real'], default='fake')
+    parser.add_argument('--fake-latency-ms', type=float, default=0.0,
+                        help="custo artificial por inferência do detector simulado")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--frame-skip', type=int, default=None)
+    parser.add_argument('--upload-latency-ms', type=float, default=20.0, help="latência simulada do backend")
+    parser.add_argument('--runtime', choices=['threads', 'asyncio'], default=None,
+                        help="thread por câmera ou event loop com executores limitados")
+    parser.add_argument('--inference-mode', choices=['thread', 'process'], default=None)
+    parser.add_argument('--inference-backend', choices=['ultralytics', 'onnxruntime', 'openvino'], default=None)
+    parser.add_argument('--no-batching', action='store_true', help="desliga a inferência em lote")
+    parser.add_argument('--no-scheduler', action='store_true',
+                        help="sem prioridade por papel nem descarte de carga")
+    parser.add_argument('--metrics-port', type=int, default=None, help="expõe /metrics durante o benchmark")
+    parser.add_argument('--output', help="arquivo JSON (padrão: stdout)")
+    parser.add_argument('--verbose', action='store_true')
+    return parser.parse_args()
+
+
+def configure(args: argparse.Namespace, outbox_dir: str):
+    """Aplica as opções do benchmark na configuração global do agente"""
+    config.simulate_detection = args.detector == 'fake'
+    config.simulation_seed = args.seed
+    config.simulation_latency_ms = args.fake_latency_ms
+    config.replay_realtime = not args.fast
+    config.outbox_dir = outbox_dir
+    config.calibration_dir = os.path.join(outbox_dir, 'calibrations')
+    config.metrics_enabled = args.metrics_port is not None
+    if args.metrics_port is not None:
+        config.metrics_port = args.metrics_port
+    if args.frame_skip is not None:
+        config.frame_skip = args.frame_skip
+    if args.runtime:
+        config.runtime_mode = args.runtime
+    if args.inference_mode:
+        config.inference_mode = args.inference_mode
+    if args.inference_backend:
+        config.inference_backend = args.inference_backend
+    if args.no_batching:
+        config.batched_inference = False
+    if args.no_scheduler:
+        config.scheduler_enabled = False
+
+
+def camera_configs(args: argparse.Namespace) -> List[CameraConfig]:
+    """Câmeras de curral (todas no curral 1) e de pesagem"""
+    cameras = []
+    total = args.cameras + args.weigh_cameras
+    
+    for i in range(total):
+        if args.source:
+            url, backend = args.source[i % len(args.source)], 'replay'
+        else:
+            url = f"synthetic://{args.resolution}?fps={args.fps:g}&animals={args.animals}&seed={args.seed + i}"
+            backend = None
+        
+        weigh = i >= args.cameras
+        depth = weigh and (args.depth or (args.source and os.path.isdir(url)))
+        if depth and not args.source:
+            url += '&depth=1'
+        cameras.append(CameraConfig(
+            id=i + 1,
+            name=f"{'Pesagem' if weigh else 'Curral'} {i + 1}",
+            rtsp_url=url,
+            type=(CameraType.DEPTH if depth else CameraType.RGB) if weigh else CameraType.RTSP,
+            pen_id=None if weigh else 1,
+            weigh_station_id=1 if weigh else None,
+            capture_backend=backend
+        ))
+    return cameras
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Executa o agente pelo tempo pedido e monta o relatório"""
+    agent = VisionAgent()
+    agent.api_client.session = LocalSession(args.upload_latency_ms)
+    agent.pens[1] = PenConfig(id=1, name="Curral Benchmark", primary_camera_id=1)
+    # Calibração fixa para medir o caminho completo da estimativa de peso
+    if args.depth:
+        agent.weight_estimator.load_calibration(1, {'modelType': 'custom', 'coefficients': [150.0, 400.0, 80.0]}, 1)
+    else:
+        agent.weight_estimator.load_calibration(1, {'modelType': 'linear', 'coefficients': [0.0025, 200.0]}, 1)
+    for camera in camera_configs(args):
+        agent.add_camera(camera)
+    
+    agent.start()
+    try:
+        time.sleep(args.warmup)
+        
+        # Zerar o que foi medido no aquecimento
+        metrics.reset()
+        for processor in agent.processors.values():
+            processor.latencies.clear()
+        frames_before = {cid: p.frames_processed for cid, p in agent.processors.items()}
+        sent_before = agent.uploader.get_stats()['sent_items']
+        started = time.monotonic()
+        
+        time.sleep(args.duration)
+        
+        elapsed = time.monotonic() - started
+        stages = metrics.snapshot()
+        cameras = {}
+        for cid, processor in agent.processors.items():
+            stats = processor.get_stats()
+            frames = processor.frames_processed - frames_before[cid]
+            stats['frames'] = frames
+            stats['fps'] = frames / elapsed
+            cameras[str(cid)] = stats
+        uploader = agent.uploader.get_stats()
+        result_bus = agent.result_bus.get_stats()
+        inference = agent.inference_service.get_stats() if agent.shared_inference else None
+        scheduler = agent.scheduler.get_stats() if agent.scheduler is not None else None
+        startup = agent.get_startup_stats()
+        threads = threading.active_count()
+    finally:
+        agent.stop()
+    
+    total_frames = sum(c['frames'] for c in cameras.values())
+    return {
+        'agent_version': VERSION,
+        'timestamp': datetime.now().isoformat(),
+        'host': {
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+        },
+        'settings': {
+            'sources': args.source or ['synthetic'],
+            'resolution': None if args.source else args.resolution,
+            'cameras': args.cameras,
+            'weigh_cameras': args.weigh_cameras,
+            'depth': args.depth,
+            'mode': 'fast' if args.fast else 'realtime',
+            'detector': args.detector,
+            'fake_latency_ms': args.fake_latency_ms,
+            'seed': args.seed,
+            'frame_skip': config.frame_skip,
+            'runtime_mode': config.runtime_mode,
+            'inference_mode': config.inference_mode,
+            'inference_backend': config.inference_backend,
+            'batched_inference': config.batched_inference,
+            'scheduler_enabled': config.scheduler_enabled,
+            'tracking_enabled': config.tracking_enabled,
+            'motion_gate_enabled': config.motion_gate_enabled,
+            'upload_latency_ms': args.upload_latency_ms,
+        },
+        'duration_s': elapsed,
+        'totals': {
+            'frames': total_frames,
+            'fps': total_frames / elapsed,
+            'results_sent': uploader['sent_items'] - sent_before,
+            'threads': threads,
+        },
+        'startup': startup,
+        'cameras': cameras,
+        'stages': stages,
+        'inference': inference,
+        'scheduler': scheduler,
+        'result_bus': result_bus,
+        'uploader': uploader,
+    }
+
+
+def benchmark():
+    """Função principal"""
+    args = parse_args()
+    if not args.verbose:
+        main.logger.setLevel(logging.WARNING)
+    
+    with tempfile.TemporaryDirectory(prefix='vision-bench-') as outbox_dir:
+        configure(args, outbox_dir)
+        report = run(args)
+    
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(
+            f"{report['totals']['fps']:.1f} fps em {len(report['cameras'])} câmeras; "
+            f"relatório em {args.output}",
+            file=sys.stderr
+        )
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    benchmark()
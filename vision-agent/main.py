@@ -21,18 +21,40 @@ Versão: 4.0.0
 import os
 import sys
 import time
+import signal
+import subprocess
+import shutil
+import argparse
+import asyncio
+import bisect
+import hashlib
+import heapq
+import itertools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import json
+import gzip
+import socket
 import logging
 import threading
 import queue
+import uuid
+import random
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait as wait_connections
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple, Any
-from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple, Any, Callable
+from dataclasses import dataclass, field, fields
 from enum import Enum
 
+# Imports de topo de propósito: numpy é usado na definição do módulo (aliases de
+# tipo, matrizes de classe) e cv2 na captura e no pré-processamento do primeiro
+# frame em todo processo que carrega este módulo, inclusive os workers de inferência
 import cv2
 import numpy as np
-import requests
 
 # Configurar logging
 logging.basicConfig(
@@ -45,6 +67,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger('VisionAgent')
 
+VERSION = "4.0.0"
+
+# Referência dos tempos de partida (time-to-first-result)
+STARTED_AT = time.monotonic()
+
 # ============================================================================
 # CONFIGURAÇÕES
 # ============================================================================
@@ -57,23 +84,181 @@ class Config:
     api_key: str = os.getenv('VISION_AGENT_API_KEY', 'dev-vision-key')
     
     # Câmeras
-    camera_reconnect_interval: int = 30  # segundos
+    camera_reconnect_interval: int = 30  # segundos (espera máxima entre tentativas)
+    camera_reconnect_backoff: float = 1.0  # primeira espera; dobra a cada falha seguida
+    camera_open_timeout: float = 8.0  # segundos para abrir o stream (RTSP morto não segura a câmera)
     frame_skip: int = 5  # processar 1 a cada N frames
+    frame_read_timeout: float = 5.0  # segundos sem frame = stream caído
+    max_frame_age: float = 1.0  # frames mais velhos que isso são descartados
+    frame_ring_enabled: bool = True  # decodificar direto em memória compartilhada
+    frame_ring_slots: int = 3  # escrita + publicado + em uso pelo consumidor
+    
+    # Backend de captura (pode ser trocado por câmera em CameraConfig)
+    capture_backend: str = os.getenv('CAPTURE_BACKEND', 'opencv')  # 'opencv' ou 'ffmpeg'
+    capture_width: int = 1280  # largura entregue pelo FFmpeg (0 = nativa)
+    capture_prefer_substream: bool = True  # usar o substream quando a câmera tiver
+    ffmpeg_path: str = os.getenv('FFMPEG_PATH', 'ffmpeg')
+    ffprobe_path: str = os.getenv('FFPROBE_PATH', 'ffprobe')
+    ffmpeg_open_timeout: float = 10.0  # segundos
     
     # Detecção
     detection_confidence: float = 0.5
     detection_model: str = 'yolov8n.pt'  # Modelo YOLO
+    # COCO: 19 = cow, 20 = elephant, 21 = bear, etc.
+    # Para modelo customizado, ajustar conforme necessário
+    detection_classes: Tuple[int, ...] = (19, 20, 21, 22, 23)  # Animais grandes
+    detection_imgsz: int = 640  # resolução nativa do modelo
+    nms_iou_threshold: float = 0.7  # mesmo padrão do predict() do Ultralytics
+    max_detections: int = 300
+    
+    # Backend de inferência (CPU)
+    inference_backend: str = os.getenv('INFERENCE_BACKEND', 'ultralytics')  # 'ultralytics', 'onnxruntime' ou 'openvino'
+    inference_int8: bool = os.getenv('INFERENCE_INT8', 'false').lower() == 'true'
+    inference_threads: int = 0  # threads por sessão (0 = automático)
+    int8_calibration_data: str = os.getenv('INT8_CALIBRATION_DATA', 'coco8.yaml')  # usado pelo OpenVINO
+    model_cache_dir: str = os.getenv('MODEL_CACHE_DIR', 'models')
+    
+    # Partida rápida (voltar a contar em segundos após queda de energia)
+    model_background_load: bool = True  # câmeras conectam enquanto o modelo carrega
+    model_warmup_runs: int = 2  # inferências de aquecimento no tamanho esperado do frame
+    agent_config_cache: str = os.getenv('AGENT_CONFIG_CACHE', 'agent_config.json')  # última configuração do backend
+    
+    # Simulação (demo e benchmark)
+    simulate_detection: bool = os.getenv('SIMULATE_DETECTION', 'false').lower() == 'true'  # não carregar modelo
+    simulation_seed: int = int(os.getenv('SIMULATION_SEED', '42'))
+    simulation_latency_ms: float = 0.0  # custo artificial de cada inferência simulada
+    replay_realtime: bool = True  # vídeos/frames sintéticos no FPS original (False = sem perda, o mais rápido possível)
+    
+    # ROI
+    roi_crop_inference: bool = True  # inferir apenas nos retângulos que envolvem o ROI
+    roi_padding: int = 16  # margem (px) em volta de cada retângulo
+    roi_filter: str = 'coverage'  # 'coverage' (área no polígono), 'center' ou 'none'
+    roi_min_coverage: float = 0.5  # fração mínima da caixa dentro do polígono
     
     # Contagem
     count_interval: float = 2.0  # segundos entre contagens
     count_smoothing_window: int = 5  # média móvel
     
+    # Rastreamento (trilhas estáveis entre frames)
+    tracking_enabled: bool = os.getenv('TRACKING_ENABLED', 'false').lower() == 'true'  # contagem pelas trilhas confirmadas
+    tracker_mode: str = 'detect'  # 'detect' ou 'extrapolate' (prediz trilhas entre inferências)
+    pen_detection_interval: float = 1.0  # segundos entre inferências no modo 'extrapolate'
+    track_min_hits: int = 3  # detecções para confirmar uma trilha
+    track_max_age: float = 3.0  # segundos sem detecção até descartar a trilha
+    track_iou_threshold: float = 0.3
+    track_high_confidence: float = 0.5  # abaixo disso a detecção só estende trilhas confirmadas
+    track_low_confidence: float = 0.25  # limiar do modelo quando o tracker está ativo
+    
+    # Gate de movimento (pula o YOLO em cena parada)
+    motion_gate_enabled: bool = True
+    motion_gate_width: int = 160  # largura do frame reduzido em tons de cinza
+    motion_pixel_threshold: int = 20  # diferença de cinza para considerar o pixel alterado
+    motion_area_threshold: float = 0.002  # fração do ROI alterada que dispara inferência
+    motion_max_staleness: float = 30.0  # segundos máximos reaproveitando detecções
+    
+    # Propagação entre keyframes (fluxo óptico esparso no lugar do YOLO)
+    flow_keyframe_interval: int = 3  # detecção completa a cada N frames processados (1 = desligado)
+    flow_width: int = 640  # largura do frame em tons de cinza usado no fluxo
+    flow_grid: int = 4  # pontos por lado da grade em cada caixa (4 = 16 pontos)
+    flow_fb_threshold: float = 1.0  # px: erro ida-e-volta máximo de um ponto válido
+    flow_min_points: int = 4  # pontos válidos para a caixa acompanhar o movimento
+    flow_min_tracked: float = 0.8  # fração mínima de caixas acompanhadas; abaixo, volta ao YOLO
+    
+    # Fusão multi-câmera por curral
+    pen_fusion_enabled: bool = True
+    pen_fusion_interval: float = 2.0  # segundos entre contagens fundidas
+    pen_fusion_max_age: float = 6.0  # leituras mais velhas não entram na fusão
+    pen_dedup_radius_m: float = 0.8  # distância no chão para considerar o mesmo animal
+    
     # Peso
-    weight_trigger_cooldown: float = 3.0  # segundos entre estimativas
+    weight_trigger_cooldown: float = 3.0  # segundos entre estimativas (sem detector de passagem)
+    weigh_pass_enabled: bool = True  # um peso por passagem do animal pela zona de gatilho
+    weigh_trigger_zone: Tuple[float, float, float, float] = (0.3, 0.0, 0.7, 1.0)  # faixa normalizada, se a câmera não definir
+    weigh_pass_timeout: float = 1.5  # segundos sem ver o animal encerram a passagem
+    weigh_min_pass_frames: int = 3  # frames mínimos na zona para valer
+    weigh_candidates: int = 5  # recortes guardados por passagem
+    weigh_best_frames: int = 3  # recortes que vão para o WeightEstimator
+    weigh_edge_margin: int = 8  # px: caixa encostada na borda = animal cortado
+    weigh_crop_margin: int = 16  # px em volta da caixa no recorte guardado
+    
+    # Câmeras de profundidade (pesagem volumétrica)
+    depth_default_hfov: float = 87.0  # graus; sem intrínsecos da estação nem da câmera
+    depth_scale: float = 0.001  # metros por unidade do frame de profundidade (uint16 em mm)
+    depth_min_m: float = 0.3  # leituras fora da faixa são ignoradas
+    depth_max_m: float = 6.0
+    depth_grid_points: int = 4096  # pontos da grade reduzida usada nas medições
+    depth_floor_percentile: float = 90.0  # piso estimado quando a estação não informa cameraHeight
+    depth_min_body_height: float = 0.25  # metros acima do piso para o ponto ser do animal
+    depth_min_points: int = 50  # mínimo de pontos do animal para medir
+    
+    # Endpoint Prometheus local
+    metrics_enabled: bool = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+    metrics_host: str = os.getenv('METRICS_HOST', '127.0.0.1')
+    metrics_port: int = int(os.getenv('METRICS_PORT', '9108'))
+    
+    # Runtime: 'threads' (uma thread por câmera) ou 'asyncio' (event loop + executores limitados)
+    runtime_mode: str = os.getenv('RUNTIME_MODE', 'threads')
+    async_decode_workers: int = 8  # leitura/decodificação de capturas bloqueantes (no FFmpeg o loop lê o pipe)
+    async_process_workers: int = 4  # processamento dos frames (inferência, rastreamento, contagem)
+    async_io_workers: int = 8  # abertura e fechamento de streams
+    
+    # Agendador de inferência: prioridade por papel da câmera e descarte de carga
+    scheduler_enabled: bool = os.getenv('SCHEDULER_ENABLED', 'true').lower() == 'true'
+    weigh_target_fps: float = 0.0  # FPS máximo da câmera de pesagem (0 = ritmo da câmera)
+    pen_target_fps: float = 0.0  # FPS máximo das câmeras de curral (0 = ritmo da câmera)
+    weigh_deadline: float = 0.5  # segundos captura -> resultado antes de contar como atraso
+    pen_deadline: float = 2.0
+    scheduler_interval: float = 2.0  # segundos de cada janela de avaliação da carga
+    scheduler_miss_ratio: float = 0.1  # fração de frames atrasados que caracteriza sobrecarga
+    scheduler_recover_windows: int = 3  # janelas folgadas seguidas para devolver um nível
+    scheduler_rate_levels: int = 3  # primeiros níveis de descarte: FPS / 2, / 4, / 8
+    scheduler_min_imgsz: int = 320  # níveis seguintes: resolução da inferência até este mínimo
     
     # Performance
     max_workers: int = 8
-    queue_size: int = 100
+    queue_size: int = 100  # resultados pendentes no barramento (contagens coalescidas por câmera)
+    
+    # Envio em lote para vision.ingestBatch
+    upload_batch_size: int = 50  # resultados por requisição
+    upload_max_batch_age: float = 0.5  # segundos até enviar um lote incompleto
+    upload_max_in_flight: int = 4  # requisições simultâneas
+    upload_compress_min_bytes: int = 1024  # gzip a partir deste tamanho
+    upload_timeout: float = 10.0  # segundos
+    
+    # Outbox em disco (operação offline)
+    outbox_dir: str = os.getenv('OUTBOX_DIR', 'outbox')
+    outbox_segment_bytes: int = 4 * 1024 * 1024
+    outbox_max_bytes: int = 512 * 1024 * 1024  # acima disso descarta os segmentos mais antigos
+    outbox_max_age: float = 7 * 24 * 3600  # segundos
+    outbox_replay_batch_size: int = 500
+    outbox_retry_interval: float = 5.0  # segundos entre tentativas enquanto offline
+    
+    # Calibração de peso (cache local por estação/versão)
+    calibration_dir: str = os.getenv('CALIBRATION_DIR', 'calibrations')
+    calibration_refresh_interval: float = 300.0  # segundos entre consultas por nova versão
+    
+    # Configuração de câmeras/currais recarregada do backend sem reiniciar
+    config_refresh_interval: float = 30.0  # segundos entre verificações (hash do conteúdo)
+    
+    # Sharding: vários agentes dividem as câmeras (hash consistente sobre os ids)
+    shard_enabled: bool = os.getenv('SHARD_ENABLED', 'false').lower() == 'true'
+    node_id: str = os.getenv('NODE_ID', '') or socket.gethostname()
+    shard_heartbeat_interval: float = 2.0  # segundos entre renovações do lease
+    shard_lease_seconds: float = 10.0  # sem renovação, o nó sai e as câmeras vão para os outros
+    shard_join_timeout: float = 3.0  # coordenador mudo na partida: assumir nó único
+    shard_virtual_nodes: int = 64  # pontos de cada nó no anel
+    
+    # Inferência em lote (compartilhada entre câmeras)
+    batched_inference: bool = True
+    inference_batch_size: int = 8  # máximo de frames por forward pass
+    inference_max_wait_ms: float = 15.0  # espera máxima para completar o lote
+    inference_timeout: float = 10.0  # segundos
+    
+    # Inferência em processos separados (contorna o GIL)
+    inference_mode: str = os.getenv('INFERENCE_MODE', 'thread')  # 'thread' (um processo) ou 'process' (max_workers processos)
+    inference_worker_hang_timeout: float = 30.0  # segundos sem resposta até reiniciar o worker
+    inference_worker_ready_timeout: float = 120.0  # prazo para carregar e aquecer o modelo no worker
+    inference_worker_max_backoff: float = 30.0  # espera máxima entre reinícios
 
 
 config = Config()
@@ -116,6 +301,222 @@ class Detection:
         return (x2 - x1) * (y2 - y1)
 
 
+@dataclass
+class DetectionBatch:
+    """
+    Detecções de um frame em formato colunar (arrays NumPy)
+    
+    Filtros, centros, áreas e médias rodam como operações vetorizadas; a
+    conversão para Detection/JSON acontece só na borda (peso e envio).
+    """
+    xyxy: np.ndarray  # (N, 4) int32 - x1, y1, x2, y2
+    conf: np.ndarray  # (N,) float32
+    cls: np.ndarray  # (N,) int32
+    ids: np.ndarray  # (N,) int64
+    prefix: str = "det"
+    
+    @classmethod
+    def empty(cls, prefix: str = "det") -> 'DetectionBatch':
+        return cls(
+            xyxy=np.zeros((0, 4), dtype=np.int32),
+            conf=np.zeros(0, dtype=np.float32),
+            cls=np.zeros(0, dtype=np.int32),
+            ids=np.zeros(0, dtype=np.int64),
+            prefix=prefix
+        )
+    
+    @classmethod
+    def from_detections(cls, detections: List[Detection], prefix: str = "det") -> 'DetectionBatch':
+        """Converte uma lista de Detection (ids viram índices sequenciais)"""
+        if not detections:
+            return cls.empty(prefix)
+        return cls(
+            xyxy=np.array([d.bbox for d in detections], dtype=np.int32),
+            conf=np.array([d.confidence for d in detections], dtype=np.float32),
+            cls=np.array([d.class_id for d in detections], dtype=np.int32),
+            ids=np.arange(len(detections), dtype=np.int64),
+            prefix=prefix
+        )
+    
+    def __len__(self) -> int:
+        return len(self.conf)
+    
+    @property
+    def centers(self) -> np.ndarray:
+        """Centros (N, 2) em pixels inteiros"""
+        return (self.xyxy[:, :2] + self.xyxy[:, 2:]) // 2
+    
+    @property
+    def areas(self) -> np.ndarray:
+        """Áreas (N,) em pixels"""
+        wh = (self.xyxy[:, 2:] - self.xyxy[:, :2]).astype(np.int64)
+        return wh[:, 0] * wh[:, 1]
+    
+    def select(self, keep: np.ndarray) -> 'DetectionBatch':
+        """Subconjunto por máscara booleana ou índices"""
+        return DetectionBatch(
+            xyxy=self.xyxy[keep],
+            conf=self.conf[keep],
+            cls=self.cls[keep],
+            ids=self.ids[keep],
+            prefix=self.prefix
+        )
+    
+    def mean_confidence(self) -> float:
+        return float(self.conf.mean()) if len(self) else 0.0
+    
+    def detection(self, index: int) -> Detection:
+        """Converte uma linha em Detection"""
+        x1, y1, x2, y2 = self.xyxy[index].tolist()
+        return Detection(
+            id=f"{self.prefix}_{int(self.ids[index])}",
+            bbox=(x1, y1, x2, y2),
+            confidence=float(self.conf[index]),
+            class_id=int(self.cls[index])
+        )
+    
+    def to_detections(self) -> List[Detection]:
+        return [
+            Detection(id=f"{self.prefix}_{i}", bbox=tuple(b), confidence=c, class_id=k)
+            for i, b, c, k in zip(self.ids.tolist(), self.xyxy.tolist(), self.conf.tolist(), self.cls.tolist())
+        ]
+    
+    def to_json(self) -> List[Dict]:
+        """Formato enviado ao backend em meta.detections"""
+        return [
+            {'id': f"{self.prefix}_{i}", 'bbox': b, 'confidence': c}
+            for i, b, c in zip(self.ids.tolist(), self.xyxy.tolist(), self.conf.tolist())
+        ]
+
+
+@dataclass
+class ROIRegion:
+    """
+    Geometria de ROI de uma câmera, pré-calculada para uma resolução
+    
+    Guarda a máscara do(s) polígono(s), os retângulos onde a inferência
+    roda (bounding rect de cada polígono, com margem, unidos quando se
+    sobrepõem) e a imagem integral da máscara, que dá a fração de cada
+    caixa dentro do polígono em O(1) por caixa.
+    """
+    shape: Tuple[int, int]  # (h, w)
+    mask: np.ndarray  # (h, w) uint8, 255 dentro do ROI
+    rects: List[Tuple[int, int, int, int]]  # x1, y1, x2, y2
+    integral: np.ndarray  # (h + 1, w + 1)
+    version: Optional[int] = None  # atribuída pelo CameraProcessor; None = sem cache nos workers
+    
+    @classmethod
+    def build(
+        cls,
+        shape: Tuple[int, int],
+        polygons: List[np.ndarray],
+        padding: Optional[int] = None
+    ) -> 'ROIRegion':
+        h, w = shape
+        padding = config.roi_padding if padding is None else padding
+        mask = np.zeros((h, w), dtype=np.uint8)
+        rects: List[List[int]] = []
+        
+        for polygon in polygons:
+            cv2.fillPoly(mask, [polygon], 255)
+            x, y, bw, bh = cv2.boundingRect(polygon)
+            rects.append([
+                max(0, x - padding), max(0, y - padding),
+                min(w, x + bw + padding), min(h, y + bh + padding)
+            ])
+        
+        if not polygons:
+            mask[:] = 255  # Usar frame inteiro
+            rects.append([0, 0, w, h])
+        
+        # Unir retângulos que se sobrepõem (evita detectar o mesmo animal duas vezes)
+        merged = True
+        while merged and len(rects) > 1:
+            merged = False
+            for i in range(len(rects)):
+                for j in range(i + 1, len(rects)):
+                    a, b = rects[i], rects[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        rects[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                        del rects[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        
+        integral = cv2.integral((mask > 0).astype(np.uint8))
+        return cls(shape=(h, w), mask=mask, rects=[tuple(r) for r in rects], integral=integral)
+    
+    @classmethod
+    def from_config(
+        cls,
+        shape: Tuple[int, int],
+        roi_config: Optional[Dict],
+        scale: Tuple[float, float] = (1.0, 1.0)
+    ) -> 'ROIRegion':
+        """
+        Monta a ROI a partir de roi_config ('points' ou 'polygons'); pontos
+        entre 0 e 1 são interpretados como coordenadas normalizadas, e podem
+        vir como [x, y] ou {x, y} (formato do backend). Pontos em pixels são
+        multiplicados por scale (ver geometry_scale). enabled = False
+        desliga a ROI.
+        """
+        h, w = shape
+        raw = []
+        if roi_config and roi_config.get('enabled', True):
+            if roi_config.get('polygons'):
+                raw = roi_config['polygons']
+            elif roi_config.get('points'):
+                raw = [roi_config['points']]
+        
+        polygons = []
+        for points in raw:
+            points = [[p['x'], p['y']] if isinstance(p, dict) else p for p in points]
+            pts = np.array(points, dtype=np.float64).reshape(-1, 2)
+            if len(pts) < 3:
+                continue
+            pts = pts * [w, h] if pts.max() <= 1.0 else pts * scale
+            polygons.append(np.round(pts).astype(np.int32))
+        
+        return cls.build(shape, polygons)
+    
+    def coverage(self, xyxy: np.ndarray) -> np.ndarray:
+        """Fração da área de cada caixa (N, 4) que está dentro do polígono"""
+        h, w = self.shape
+        x1 = np.clip(xyxy[:, 0], 0, w)
+        y1 = np.clip(xyxy[:, 1], 0, h)
+        x2 = np.clip(xyxy[:, 2], 0, w)
+        y2 = np.clip(xyxy[:, 3], 0, h)
+        I = self.integral
+        inside = I[y2, x2] - I[y1, x2] - I[y2, x1] + I[y1, x1]
+        area = (xyxy[:, 2] - xyxy[:, 0]).astype(np.int64) * (xyxy[:, 3] - xyxy[:, 1])
+        return inside / np.maximum(area, 1)
+
+
+def geometry_scale(
+    roi_config: Optional[Dict],
+    shape: Tuple[int, int],
+    source_size: Optional[Tuple[int, int]] = None
+) -> Tuple[float, float]:
+    """
+    Fator (x, y) que leva a geometria em pixels de roi_config ao frame recebido
+    
+    Polígonos, linha de gatilho e homografia em pixels valem para a
+    resolução em que foram desenhados: roi_config['frameWidth'] e
+    ['frameHeight'] ou, sem eles, a resolução nativa do stream aberto
+    (source_size). Com capture_width ou substream o frame chega menor, e
+    a geometria é reescalada. Sem referência conhecida, fica 1:1.
+    Coordenadas normalizadas (0 a 1) não dependem disso.
+    """
+    h, w = shape
+    reference = source_size
+    if roi_config and roi_config.get('frameWidth') and roi_config.get('frameHeight'):
+        reference = (roi_config['frameWidth'], roi_config['frameHeight'])
+    if not reference or not reference[0] or not reference[1]:
+        return 1.0, 1.0
+    return w / float(reference[0]), h / float(reference[1])
+
+
 @dataclass
 class CameraConfig:
     """Configuração de uma câmera"""
@@ -127,6 +528,10 @@ class CameraConfig:
     pen_id: Optional[int] = None
     weigh_station_id: Optional[int] = None
     roi_config: Optional[Dict] = None
+    substream_url: Optional[str] = None
+    capture_backend: Optional[str] = None  # None = config.capture_backend
+    capture_width: Optional[int] = None  # None = config.capture_width
+    keyframe_only: bool = False  # decodificar só keyframes (câmeras de contagem)
 
 
 @dataclass
@@ -150,574 +555,6825 @@ class WeighStationConfig:
     config: Optional[Dict] = None
 
 
+@dataclass
+class CameraIntrinsics:
+    """Intrínsecos de uma câmera (modelo pinhole) na resolução width x height"""
+    fx: float
+    fy: float
+    cx: float
+    cy: float
+    width: int
+    height: int
+    depth_scale: float = 0.001  # metros por unidade do frame de profundidade
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'CameraIntrinsics':
+        """Formato do backend: {fx, fy, cx, cy, width, height, depthScale?}"""
+        return cls(
+            fx=float(data['fx']),
+            fy=float(data['fy']),
+            cx=float(data['cx']),
+            cy=float(data['cy']),
+            width=int(data['width']),
+            height=int(data['height']),
+            depth_scale=float(data.get('depthScale') or config.depth_scale)
+        )
+    
+    @classmethod
+    def from_fov(cls, width: int, height: int, hfov_deg: float) -> 'CameraIntrinsics':
+        """Aproximação pelo campo de visão horizontal (pixels quadrados, centro óptico no meio)"""
+        f = (width / 2) / np.tan(np.radians(hfov_deg) / 2)
+        return cls(f, f, (width - 1) / 2, (height - 1) / 2, width, height, config.depth_scale)
+    
+    def scaled(self, width: int, height: int) -> 'CameraIntrinsics':
+        """Os mesmos intrínsecos para outra resolução (frame redimensionado)"""
+        if (width, height) == (self.width, self.height):
+            return self
+        sx, sy = width / self.width, height / self.height
+        return CameraIntrinsics(
+            self.fx * sx, self.fy * sy, self.cx * sx, self.cy * sy, width, height, self.depth_scale
+        )
+    
+    def cropped(self, x: int, y: int) -> 'CameraIntrinsics':
+        """Intrínsecos de um recorte com canto superior esquerdo em (x, y)"""
+        return CameraIntrinsics(
+            self.fx, self.fy, self.cx - x, self.cy - y, self.width, self.height, self.depth_scale
+        )
+
+
 # ============================================================================
-# DETECTOR DE GADO (YOLO)
+# MÉTRICAS DO PIPELINE
 # ============================================================================
 
-class CattleDetector:
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+MetricLabels = Tuple[Tuple[str, str], ...]  # (('camera', '1'), ('pen', '1'), ...)
+
+
+def format_labels(labels: MetricLabels) -> str:
+    """Rótulos no formato de exposição do Prometheus: {a="1",b="2"}"""
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+class _MetricsShard:
+    """Observações de uma thread: só ela escreve, os leitores copiam"""
+    
+    def __init__(self, thread: Optional[threading.Thread], epoch: int):
+        self.thread = thread
+        self.epoch = epoch  # janela do benchmark a que samples/count/total pertencem
+        self.samples: Dict[str, deque] = {}
+        self.count: Dict[str, int] = {}
+        self.total: Dict[str, float] = {}
+        # (estágio, rótulos) -> [contagem por bucket (+Inf no fim), soma]
+        self.histograms: Dict[Tuple[str, MetricLabels], List[Any]] = {}
+    
+    def clear_window(self, epoch: int):
+        self.samples = {}
+        self.count = {}
+        self.total = {}
+        self.epoch = epoch
+
+
+class PipelineMetrics:
     """
-    Detector de gado usando YOLOv8
+    Tempos por estágio do pipeline (decode, inferência, contagem, envio...)
     
-    Pode ser substituído por modelo customizado treinado especificamente
-    para detecção de gado (Nelore, Angus, etc.)
+    Guarda contagem e soma de todas as observações e uma janela das mais
+    recentes para percentis (benchmark), além de um histograma cumulativo
+    por estágio e rótulos (câmera, curral, estação) para o Prometheus.
+    Compartilhado por todas as câmeras, mas cada thread escreve no seu
+    próprio shard: a observação no caminho quente é uma busca binária e
+    alguns incrementos, sem lock. O lock só protege o registro de shards
+    e a leitura (exposição, snapshot), que soma os shards; os de threads
+    encerradas são consolidados em um só.
     """
     
-    def __init__(self, model_path: str = None):
-        self.model = None
-        self.model_path = model_path or config.detection_model
-        self._load_model()
+    def __init__(self, max_samples: int = 10000, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.max_samples = max_samples  # janela por thread
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards: List[_MetricsShard] = []
+        self._retired = _MetricsShard(None, 0)  # threads que já terminaram
+        self._epoch = 0  # incrementado pelo reset()
     
-    def _load_model(self):
-        """Carrega o modelo YOLO"""
-        try:
-            from ultralytics import YOLO
-            self.model = YOLO(self.model_path)
-            logger.info(f"Modelo YOLO carregado: {self.model_path}")
-        except ImportError:
-            logger.warning("Ultralytics não instalado. Usando detector simulado.")
-            self.model = None
-        except Exception as e:
-            logger.error(f"Erro ao carregar modelo YOLO: {e}")
-            self.model = None
+    def _shard(self) -> _MetricsShard:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _MetricsShard(threading.current_thread(), self._epoch)
+            with self._lock:
+                self._shards.append(shard)
+        return shard
     
-    def detect(self, frame: np.ndarray, roi_mask: Optional[np.ndarray] = None) -> List[Detection]:
-        """
-        Detecta gado no frame
+    def observe(self, stage: str, seconds: float, labels: MetricLabels = ()):
+        """Registra a duração de uma execução do estágio"""
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        shard = self._shard()
+        if shard.epoch != self._epoch:
+            shard.clear_window(self._epoch)
         
-        Args:
-            frame: Imagem BGR do OpenCV
-            roi_mask: Máscara opcional de região de interesse
-            
-        Returns:
-            Lista de detecções
-        """
-        if self.model is None:
-            return self._simulate_detection(frame)
+        samples = shard.samples.get(stage)
+        if samples is None:
+            samples = shard.samples[stage] = deque(maxlen=self.max_samples)
+            shard.count[stage] = 0
+            shard.total[stage] = 0.0
+        samples.append(seconds)
+        shard.count[stage] += 1
+        shard.total[stage] += seconds
         
+        histogram = shard.histograms.get((stage, labels))
+        if histogram is None:
+            histogram = shard.histograms[(stage, labels)] = [[0] * (len(self.buckets) + 1), 0.0]
+        histogram[0][bucket] += 1
+        histogram[1] += seconds
+    
+    @contextmanager
+    def time(self, stage: str, labels: MetricLabels = ()):
+        """Mede o bloco: with metrics.time('inference'): ..."""
+        started = time.perf_counter()
         try:
-            # Executar inferência
-            results = self.model(frame, conf=config.detection_confidence, verbose=False)
-            
-            detections = []
-            for r in results:
-                boxes = r.boxes
-                for i, box in enumerate(boxes):
-                    # Filtrar apenas classes relevantes (cow, cattle, etc.)
-                    cls = int(box.cls[0])
-                    # COCO: 19 = cow, 20 = elephant, 21 = bear, etc.
-                    # Para modelo customizado, ajustar conforme necessário
-                    if cls in [19, 20, 21, 22, 23]:  # Animais grandes
-                        x1, y1, x2, y2 = map(int, box.xyxy[0])
-                        conf = float(box.conf[0])
-                        
-                        # Verificar se está dentro do ROI
-                        if roi_mask is not None:
-                            cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
-                            if roi_mask[cy, cx] == 0:
-                                continue
-                        
-                        detections.append(Detection(
-                            id=f"det_{i}_{int(time.time()*1000)}",
-                            bbox=(x1, y1, x2, y2),
-                            confidence=conf,
-                            class_id=cls
-                        ))
-            
-            return detections
-            
-        except Exception as e:
-            logger.error(f"Erro na detecção: {e}")
-            return []
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, labels)
     
-    def _simulate_detection(self, frame: np.ndarray) -> List[Detection]:
-        """
-        Simula detecções para testes quando o modelo não está disponível
-        """
-        import random
-        
-        h, w = frame.shape[:2]
-        num_detections = random.randint(5, 25)
+    def _collect(self) -> List[_MetricsShard]:
+        """Shards vivos + consolidado (chamar com o lock); shards de threads mortas são somados"""
+        retired = self._retired
+        alive = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+                continue
+            for key, (counts, total) in list(shard.histograms.items()):
+                target = retired.histograms.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+                target[0] = [a + b for a, b in zip(target[0], counts)]
+                target[1] += total
+            if shard.epoch == self._epoch:
+                for stage, samples in shard.samples.items():
+                    window = retired.samples.setdefault(stage, deque(maxlen=self.max_samples))
+                    window.extend(samples)
+                    retired.count[stage] = retired.count.get(stage, 0) + shard.count[stage]
+                    retired.total[stage] = retired.total.get(stage, 0.0) + shard.total[stage]
+        self._shards = alive
+        return alive + [retired]
+    
+    def render_prometheus(self) -> List[str]:
+        """Histogramas no formato de exposição do Prometheus"""
+        merged: Dict[Tuple[str, MetricLabels], List[Any]] = {}
+        with self._lock:
+            for shard in self._collect():
+                for key, (counts, total) in list(shard.histograms.items()):
+                    target = merged.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+                    target[0] = [a + b for a, b in zip(target[0], counts)]
+                    target[1] += total
+        histograms = [(key, h[0], h[1]) for key, h in merged.items()]
         
-        detections = []
-        for i in range(num_detections):
-            # Gerar bounding box aleatório
-            bw = random.randint(50, 150)
-            bh = random.randint(40, 120)
-            x1 = random.randint(0, w - bw)
-            y1 = random.randint(0, h - bh)
-            
-            detections.append(Detection(
-                id=f"sim_{i}_{int(time.time()*1000)}",
-                bbox=(x1, y1, x1 + bw, y1 + bh),
-                confidence=random.uniform(0.6, 0.95),
-                class_id=19
-            ))
+        name = 'vision_stage_duration_seconds'
+        lines = [
+            f'# HELP {name} Duração de cada estágio do pipeline',
+            f'# TYPE {name} histogram',
+        ]
+        for (stage, labels), counts, total in sorted(histograms):
+            base = (('stage', stage),) + labels
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels(base + (("le", repr(bound)),))} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{name}_bucket{format_labels(base + (("le", "+Inf"),))} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(base)} {total}')
+            lines.append(f'{name}_count{format_labels(base)} {cumulative}')
+        return lines
+    
+    def reset(self):
+        """Zera a janela do benchmark (histogramas continuam acumulando)"""
+        with self._lock:
+            self._epoch += 1
+            self._retired.clear_window(self._epoch)
+    
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Contagem, total, média e percentis (ms) de cada estágio"""
+        stages: Dict[str, Tuple[List[float], int, float]] = {}
+        with self._lock:
+            for shard in self._collect():
+                if shard.epoch != self._epoch:
+                    continue  # janela anterior ao último reset
+                for name, samples in list(shard.samples.items()):
+                    merged, count, total = stages.get(name, ([], 0, 0.0))
+                    merged.extend(list(samples))
+                    stages[name] = (merged, count + shard.count.get(name, 0), total + shard.total.get(name, 0.0))
         
-        return detections
+        result = {}
+        for name, (samples, count, total) in sorted(stages.items()):
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000 if samples else (0.0, 0.0, 0.0)
+            result[name] = {
+                'count': count,
+                'total_s': total,
+                'mean_ms': total / count * 1000 if count else 0.0,
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99),
+                'max_ms': max(samples) * 1000 if samples else 0.0,
+            }
+        return result
+
+
+metrics = PipelineMetrics()
 
 
 # ============================================================================
-# ESTIMADOR DE PESO
+# BACKENDS DE INFERÊNCIA
 # ============================================================================
 
-class WeightEstimator:
+RawDetections = Tuple[np.ndarray, np.ndarray, np.ndarray]  # xyxy (N, 4) int32, conf (N,), cls (N,)
+
+
+def letterbox(image: np.ndarray, size: int) -> Tuple[np.ndarray, float, Tuple[int, int]]:
     """
-    Estimador de peso baseado em dimensões do animal
+    Redimensiona mantendo a proporção e completa até size x size (cinza 114)
+        
+    Returns:
+        (imagem, escala aplicada, (padding esquerdo, padding superior))
+    """
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    
+    left = (size - new_w) // 2
+    top = (size - new_h) // 2
+    image = cv2.copyMakeBorder(
+        image, top, size - new_h - top, left, size - new_w - left,
+        cv2.BORDER_CONSTANT, value=(114, 114, 114)
+    )
+    return image, scale, (left, top)
+
+
+class InferenceBackend:
+    """
+    Interface dos backends usados pelo CattleDetector
     
-    Usa regressão linear/polinomial calibrada com pesos reais
+    predict() recebe imagens BGR de qualquer tamanho e devolve, para cada
+    uma, (xyxy, conf, cls) em coordenadas da própria imagem, já com limiar
+    de confiança e NMS aplicados. imgsz pede uma resolução de entrada menor
+    que a nativa (descarte de carga); modelos de entrada fixa a ignoram.
     """
     
-    def __init__(self):
-        self.calibrations: Dict[int, Dict] = {}  # station_id -> calibration params
+    name = 'base'
     
-    def load_calibration(self, station_id: int, params: Dict):
-        """Carrega parâmetros de calibração para uma estação"""
-        self.calibrations[station_id] = params
-        logger.info(f"Calibração carregada para estação {station_id}")
+    def predict(self, images: List[np.ndarray], conf: float, imgsz: Optional[int] = None) -> List[RawDetections]:
+        raise NotImplementedError
+
+
+class UltralyticsBackend(InferenceBackend):
+    """PyTorch via Ultralytics (referência)"""
     
-    def estimate(
-        self,
-        station_id: int,
-        detection: Detection,
-        frame: np.ndarray,
-        depth_frame: Optional[np.ndarray] = None,
-        scale_reference: Optional[float] = None
-    ) -> Tuple[float, float]:
-        """
-        Estima o peso do animal
+    name = 'ultralytics'
+    
+    def __init__(self, model_path: str):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+    
+    def predict(self, images: List[np.ndarray], conf: float, imgsz: Optional[int] = None) -> List[RawDetections]:
+        results = self.model(
+            images,
+            conf=conf,
+            iou=config.nms_iou_threshold,
+            imgsz=imgsz or config.detection_imgsz,
+            max_det=config.max_detections,
+            verbose=False
+        )
+        return [self._parse_result(r) for r in results]
+    
+    def _parse_result(self, r: Any) -> RawDetections:
+        """Extrai (xyxy, conf, cls) do resultado YOLO"""
+        boxes = r.boxes
+        if boxes is None or len(boxes) == 0:
+            empty = DetectionBatch.empty()
+            return empty.xyxy, empty.conf, empty.cls
         
-        Args:
-            station_id: ID da estação de pesagem
-            detection: Detecção do animal
-            frame: Frame RGB
-            depth_frame: Frame de profundidade (se disponível)
-            scale_reference: Pixels por metro (para câmera RGB)
-            
-        Returns:
-            Tuple (peso_estimado_kg, confiança)
-        """
-        calibration = self.calibrations.get(station_id)
-        if not calibration:
-            logger.warning(f"Sem calibração para estação {station_id}")
-            return self._estimate_fallback(detection)
+        boxes = boxes.cpu().numpy()
+        return boxes.xyxy.astype(np.int32), boxes.conf.astype(np.float32), boxes.cls.astype(np.int32)
+
+
+class ExportedBackend(InferenceBackend):
+    """
+    Base dos backends com modelo exportado (saída YOLOv8 crua)
+    
+    Faz o letterbox, monta o tensor NCHW, roda o lote em pedaços do tamanho
+    aceito pelo modelo e decodifica a saída (N, 4 + classes, âncoras) com
+    NMS vetorizado por classe, desfazendo o letterbox no final.
+    """
+    
+    def __init__(self, imgsz: Optional[int] = None):
+        self.imgsz = imgsz or config.detection_imgsz
+        self.max_batch: Optional[int] = None  # None = batch dinâmico
+        self.fixed_imgsz = False  # entrada estática: não aceita outra resolução
+    
+    def _run(self, blob: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+    
+    def predict(self, images: List[np.ndarray], conf: float, imgsz: Optional[int] = None) -> List[RawDetections]:
+        if not images:
+            return []
         
-        try:
-            # Extrair medições do animal
-            measurements = self._extract_measurements(
-                detection, frame, depth_frame, scale_reference
-            )
-            
-            # Aplicar modelo de regressão
-            coefficients = calibration.get('coefficients', [1.0, 0.0])
-            model_type = calibration.get('modelType', 'linear')
-            
-            if model_type == 'linear':
-                # y = ax + b
-                weight = coefficients[0] * measurements[0] + coefficients[1]
-            elif model_type == 'polynomial':
-                # y = a0 + a1*x + a2*x^2 + ...
-                weight = sum(c * (measurements[0] ** i) for i, c in enumerate(coefficients))
-            else:
-                weight = self._estimate_fallback(detection)[0]
-            
-            # Calcular confiança baseada na qualidade da medição
-            confidence = min(0.95, detection.confidence * 0.9)
-            
-            return max(100, min(1500, weight)), confidence
-            
-        except Exception as e:
-            logger.error(f"Erro na estimativa de peso: {e}")
-            return self._estimate_fallback(detection)
+        size = self.imgsz if self.fixed_imgsz or not imgsz else imgsz
+        boxed = [letterbox(image, size) for image in images]
+        blob = np.stack([b[0] for b in boxed])[..., ::-1].transpose(0, 3, 1, 2)  # BGR -> RGB, NHWC -> NCHW
+        blob = np.ascontiguousarray(blob, dtype=np.float32) / 255.0
+        
+        step = self.max_batch or len(images)
+        outputs = np.concatenate([self._run(blob[i:i + step]) for i in range(0, len(images), step)])
+        
+        return [
+            self._postprocess(output, conf, scale, pad, image.shape[:2])
+            for output, (_, scale, pad), image in zip(outputs, boxed, images)
+        ]
     
-    def _extract_measurements(
+    def _postprocess(
         self,
-        detection: Detection,
-        frame: np.ndarray,
-        depth_frame: Optional[np.ndarray],
-        scale_reference: Optional[float]
-    ) -> List[float]:
-        """
-        Extrai medições do animal para estimativa de peso
+        output: np.ndarray,
+        conf: float,
+        scale: float,
+        pad: Tuple[int, int],
+        shape: Tuple[int, int]
+    ) -> RawDetections:
+        """Decodifica a saída de uma imagem: (4 + classes, âncoras) -> detecções"""
+        pred = output.T  # (âncoras, 4 + classes)
+        class_scores = pred[:, 4:]
+        cls = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(cls)), cls]
         
-        Para câmera RGB: usa proporções do bounding box
-        Para câmera depth: usa dimensões reais em metros
-        """
-        x1, y1, x2, y2 = detection.bbox
-        width_px = x2 - x1
-        height_px = y2 - y1
+        keep = scores >= conf
+        if not keep.any():
+            empty = DetectionBatch.empty()
+            return empty.xyxy, empty.conf, empty.cls
         
-        if depth_frame is not None:
-            # Usar profundidade para calcular dimensões reais
-            roi_depth = depth_frame[y1:y2, x1:x2]
-            avg_depth = np.median(roi_depth[roi_depth > 0])
-            
-            # Converter para metros (assumindo câmera calibrada)
-            # Fórmula simplificada: tamanho_real = tamanho_px * profundidade / focal_length
-            focal_length = 500  # Ajustar conforme câmera
-            width_m = width_px * avg_depth / focal_length
-            height_m = height_px * avg_depth / focal_length
-            
-            # Estimar volume aproximado (elipsoide)
-            volume = (4/3) * 3.14159 * (width_m/2) * (height_m/2) * (width_m/3)
-            
-            return [volume, width_m, height_m, avg_depth]
+        boxes = _cxcywh_to_xyxy(pred[keep, :4].astype(np.float64))
+        scores, cls = scores[keep], cls[keep]
         
-        elif scale_reference:
-            # Usar referência de escala para RGB
-            width_m = width_px / scale_reference
-            height_m = height_px / scale_reference
-            
-            # Estimar área lateral
-            area = width_m * height_m
-            
-            return [area, width_m, height_m]
+        # NMS por classe: deslocar as caixas de cada classe para regiões disjuntas
+        shifted = boxes + (cls * 4096.0)[:, None]
+        order = nms(shifted, scores, config.nms_iou_threshold)[:config.max_detections]
+        boxes, scores, cls = boxes[order], scores[order], cls[order]
         
-        else:
-            # Fallback: usar apenas proporções do bounding box
-            area_px = width_px * height_px
-            aspect_ratio = width_px / max(height_px, 1)
-            
-            return [area_px, aspect_ratio, width_px, height_px]
+        # Desfazer letterbox
+        boxes -= [pad[0], pad[1], pad[0], pad[1]]
+        boxes /= scale
+        h, w = shape
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, w)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, h)
+        
+        return boxes.astype(np.int32), scores.astype(np.float32), cls.astype(np.int32)
+
+
+class OnnxRuntimeBackend(ExportedBackend):
+    """Modelo ONNX (FP32 ou INT8 dinâmico) no ONNX Runtime, CPU"""
     
-    def _estimate_fallback(self, detection: Detection) -> Tuple[float, float]:
-        """
-        Estimativa de fallback baseada apenas no tamanho do bounding box
-        """
-        area = detection.area
+    name = 'onnxruntime'
+    
+    def __init__(self, onnx_path: str, imgsz: Optional[int] = None):
+        super().__init__(imgsz)
+        import onnxruntime as ort
         
-        # Fórmula empírica simplificada
-        # Ajustar coeficientes com dados reais
-        weight = 200 + (area / 1000) * 2.5
-        weight = max(150, min(800, weight))
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if config.inference_threads:
+            options.intra_op_num_threads = config.inference_threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
         
-        return weight, 0.5
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch = model_input.shape[0]
+        self.max_batch = batch if isinstance(batch, int) else None
+        if isinstance(model_input.shape[2], int):
+            self.imgsz = model_input.shape[2]
+            self.fixed_imgsz = True
+    
+    def _run(self, blob: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: blob})[0]
 
 
-# ============================================================================
-# PROCESSADOR DE CÂMERA
-# ============================================================================
+class OpenVINOBackend(ExportedBackend):
+    """Modelo OpenVINO IR (FP32 ou INT8 via NNCF), CPU"""
+    
+    name = 'openvino'
+    
+    def __init__(self, xml_path: str, imgsz: Optional[int] = None):
+        super().__init__(imgsz)
+        import openvino as ov
+        
+        core = ov.Core()
+        properties = {'PERFORMANCE_HINT': 'LATENCY'}
+        if config.inference_threads:
+            properties['INFERENCE_NUM_THREADS'] = config.inference_threads
+        self.compiled = core.compile_model(core.read_model(xml_path), 'CPU', properties)
+        
+        shape = self.compiled.inputs[0].get_partial_shape()
+        self.max_batch = shape[0].get_length() if shape[0].is_static else None
+        if shape[2].is_static:
+            self.imgsz = shape[2].get_length()
+            self.fixed_imgsz = True
+    
+    def _run(self, blob: np.ndarray) -> np.ndarray:
+        return self.compiled(blob)[self.compiled.outputs[0]]
 
-class CameraProcessor:
+
+def weights_fingerprint(model_path: str) -> Optional[str]:
+    """Hash curto do conteúdo dos pesos (None se o arquivo ainda não existe)"""
+    try:
+        digest = hashlib.blake2b(digest_size=6)
+        with open(model_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    except OSError:
+        return None
+
+
+def export_model(model_path: str, backend: str, int8: Optional[bool] = None) -> str:
     """
-    Processa stream de uma câmera individual
+    Exporta o modelo para o backend e guarda em cache
+    
+    O arquivo em model_cache_dir leva no nome o hash dos pesos, a resolução
+    e a precisão, então a exportação (e a quantização INT8) só acontece na
+    primeira execução, e pesos retreinados com o mesmo nome geram outra.
+    Modelos já exportados (.onnx / .xml) são usados diretamente.
+        
+    Returns:
+        Caminho do .onnx ou do .xml do OpenVINO
+    """
+    int8 = config.inference_int8 if int8 is None else int8
+    if model_path.endswith(('.onnx', '.xml')):
+        return model_path
+    
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    parts = [stem, weights_fingerprint(model_path), str(config.detection_imgsz), 'int8' if int8 else None]
+    variant = '_'.join(part for part in parts if part)
+    os.makedirs(config.model_cache_dir, exist_ok=True)
+    
+    # Ultralytics (e o PyTorch) só são importados se for preciso exportar
+    if backend == 'onnxruntime':
+        target = os.path.join(config.model_cache_dir, f"{variant}.onnx")
+        if os.path.exists(target):
+            return target
+        
+        from ultralytics import YOLO
+        logger.info(f"Exportando {model_path} para ONNX...")
+        exported = YOLO(model_path).export(format='onnx', imgsz=config.detection_imgsz, dynamic=True)
+        if int8:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(exported, target, weight_type=QuantType.QUInt8)
+        else:
+            shutil.move(exported, target)
+        return target
+    
+    if backend == 'openvino':
+        target = os.path.join(config.model_cache_dir, f"{variant}_openvino_model")
+        if not os.path.isdir(target):
+            from ultralytics import YOLO
+            logger.info(f"Exportando {model_path} para OpenVINO{' INT8' if int8 else ''}...")
+            exported = YOLO(model_path).export(
+                format='openvino',
+                imgsz=config.detection_imgsz,
+                dynamic=True,
+                int8=int8,
+                data=config.int8_calibration_data
+            )
+            shutil.move(exported, target)
+        return os.path.join(target, f"{stem}.xml")
+    
+    raise ValueError(f"Backend sem exportação: {backend}")
+
+
+def resolve_model_path(model_path: str) -> str:
+    """
+    Caminho local do modelo, baixado uma única vez para model_cache_dir
+    
+    URLs http(s) são baixadas para o cache. Nomes sem diretório que não
+    existem no diretório atual (ex.: 'yolov8n.pt') passam a apontar para o
+    cache, onde o Ultralytics baixa o peso oficial na primeira execução;
+    nas partidas seguintes o arquivo já está no disco, mesmo sem internet.
+    """
+    if model_path.startswith(('http://', 'https://')):
+        from urllib.parse import urlsplit
+        target = os.path.join(config.model_cache_dir, os.path.basename(urlsplit(model_path).path))
+        if os.path.exists(target):
+            return target
+        
+        import requests
+        os.makedirs(config.model_cache_dir, exist_ok=True)
+        logger.info(f"Baixando modelo {model_path}...")
+        tmp = target + '.part'
+        with requests.get(model_path, stream=True, timeout=30) as response:
+            response.raise_for_status()
+            with open(tmp, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
+        os.replace(tmp, target)
+        return target
+    
+    if os.path.dirname(model_path) or os.path.exists(model_path):
+        return model_path
+    
+    os.makedirs(config.model_cache_dir, exist_ok=True)
+    return os.path.join(config.model_cache_dir, model_path)
+
+
+def create_backend(name: str, model_path: str) -> InferenceBackend:
+    """Instancia o backend pelo nome (exportando o modelo se necessário)"""
+    model_path = resolve_model_path(model_path)
+    if name == 'ultralytics':
+        return UltralyticsBackend(model_path)
+    if name == 'onnxruntime':
+        return OnnxRuntimeBackend(export_model(model_path, name))
+    if name == 'openvino':
+        return OpenVINOBackend(export_model(model_path, name))
+    raise ValueError(f"Backend de inferência desconhecido: {name}")
+
+
+def load_frames(source: str, limit: int = 100) -> List[np.ndarray]:
+    """Lê até limit frames de um vídeo, de uma imagem ou de um diretório de imagens"""
+    if os.path.isdir(source):
+        names = sorted(n for n in os.listdir(source) if n.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')))
+        frames = [cv2.imread(os.path.join(source, n)) for n in names[:limit]]
+        return [f for f in frames if f is not None]
+    
+    cap = cv2.VideoCapture(source)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def compare_backends(frames: List[np.ndarray], backend: Optional[str] = None, model_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Compara um backend com o caminho Ultralytics nos mesmos frames
+    
+    Mede latência por frame dos dois e a concordância das detecções de
+    gado: pares casados por IoU >= 0.5 com a mesma classe, precisão e
+    recall do candidato em relação à referência, IoU médio dos pares,
+    diferença média de confiança e fração de frames com a mesma contagem.
+    """
+    backend = backend or config.inference_backend
+    model_path = model_path or config.detection_model
+    if backend == 'ultralytics':
+        raise ValueError("Escolha um backend diferente de 'ultralytics' para comparar")
+    
+    reference = UltralyticsBackend(model_path)
+    candidate = create_backend(backend, model_path)
+    classes = np.array(config.detection_classes, dtype=np.int32)
+    conf = config.detection_confidence
+    
+    # Aquecimento
+    reference.predict(frames[:1], conf)
+    candidate.predict(frames[:1], conf)
+    
+    times = {'reference': [], 'candidate': []}
+    matched = ref_total = cand_total = same_count = 0
+    ious, conf_diffs = [], []
+    
+    for frame in frames:
+        started = time.perf_counter()
+        ref = reference.predict([frame], conf)[0]
+        times['reference'].append(time.perf_counter() - started)
+        
+        started = time.perf_counter()
+        cand = candidate.predict([frame], conf)[0]
+        times['candidate'].append(time.perf_counter() - started)
+        
+        ref_keep = np.isin(ref[2], classes)
+        cand_keep = np.isin(cand[2], classes)
+        ref_boxes, ref_conf, ref_cls = (a[ref_keep] for a in ref)
+        cand_boxes, cand_conf, cand_cls = (a[cand_keep] for a in cand)
+        
+        iou = box_iou(ref_boxes, cand_boxes) * (ref_cls[:, None] == cand_cls[None, :])
+        rows, cols = greedy_match(iou, 0.5)
+        
+        matched += len(rows)
+        ref_total += len(ref_boxes)
+        cand_total += len(cand_boxes)
+        same_count += int(len(ref_boxes) == len(cand_boxes))
+        ious.extend(iou[rows, cols].tolist())
+        conf_diffs.extend(np.abs(ref_conf[rows] - cand_conf[cols]).tolist())
+    
+    def latency(values: List[float]) -> Dict[str, float]:
+        p50, p95 = np.percentile(values, [50, 95]) * 1000
+        return {'p50_ms': float(p50), 'p95_ms': float(p95), 'mean_ms': float(np.mean(values) * 1000)}
+    
+    report = {
+        'backend': backend,
+        'int8': config.inference_int8,
+        'frames': len(frames),
+        'reference_latency': latency(times['reference']),
+        'candidate_latency': latency(times['candidate']),
+        'speedup': float(np.mean(times['reference']) / max(np.mean(times['candidate']), 1e-9)),
+        'precision': matched / cand_total if cand_total else 1.0,
+        'recall': matched / ref_total if ref_total else 1.0,
+        'mean_iou': float(np.mean(ious)) if ious else 0.0,
+        'mean_confidence_diff': float(np.mean(conf_diffs)) if conf_diffs else 0.0,
+        'count_agreement': same_count / len(frames),
+    }
+    
+    logger.info(
+        f"{backend} vs ultralytics: {report['candidate_latency']['p50_ms']:.1f}ms vs "
+        f"{report['reference_latency']['p50_ms']:.1f}ms (p50, {report['speedup']:.2f}x), "
+        f"precisão {report['precision']:.1%}, recall {report['recall']:.1%}, "
+        f"contagem igual em {report['count_agreement']:.0%} dos frames"
+    )
+    return report
+
+
+# ============================================================================
+# DETECTOR DE GADO (YOLO)
+# ============================================================================
+
+class CattleDetector:
+    """
+    Detector de gado usando YOLOv8
+    
+    Pode ser substituído por modelo customizado treinado especificamente
+    para detecção de gado (Nelore, Angus, etc.). O modelo roda no backend
+    de config.inference_backend (Ultralytics, ONNX Runtime ou OpenVINO).
+    
+    Com background=True o modelo carrega (e aquece) em thread própria;
+    ready sinaliza quando detect() pode ser chamado sem esperar.
+    """
+    
+    def __init__(self, model_path: str = None, background: bool = False):
+        self.model: Optional[InferenceBackend] = None
+        self.model_path = model_path or config.detection_model
+        self.classes = np.array(config.detection_classes, dtype=np.int32)
+        # Com tracker, detecções fracas também são usadas (segundo estágio de associação)
+        self.confidence_threshold = config.detection_confidence
+        if config.tracking_enabled:
+            self.confidence_threshold = min(config.detection_confidence, config.track_low_confidence)
+        self._id_lock = threading.Lock()
+        self._next_id = 0
+        self._rngs: Dict[Any, random.Random] = {}  # camera_id -> gerador do detector simulado
+        
+        # Partida: carga + aquecimento
+        self.ready = threading.Event()
+        self.ready_at: Optional[float] = None  # time.monotonic() quando ficou pronto
+        self.load_seconds = 0.0
+        if background:
+            threading.Thread(target=self._load_model, name='model-loader', daemon=True).start()
+        else:
+            self._load_model()
+    
+    def _load_model(self):
+        """Carrega e aquece o modelo; ready é sinalizado mesmo se a carga falhar"""
+        started = time.monotonic()
+        try:
+            self._load_backend()
+            if self.model is not None:
+                self._warmup()
+        finally:
+            self.ready_at = time.monotonic()
+            self.load_seconds = self.ready_at - started
+            self.ready.set()
+        
+        if self.model is not None:
+            logger.info(f"Detector pronto em {self.load_seconds:.1f}s (carga + aquecimento)")
+    
+    def _load_backend(self):
+        """Carrega o modelo no backend configurado (Ultralytics como reserva)"""
+        if config.simulate_detection:
+            logger.info(f"Detector simulado (semente {config.simulation_seed})")
+            self.model = None
+            return
+        
+        backend = config.inference_backend
+        if backend != 'ultralytics':
+            try:
+                self.model = create_backend(backend, self.model_path)
+                logger.info(f"Modelo carregado no backend {backend}: {self.model_path}")
+                return
+            except ImportError as e:
+                logger.warning(f"Backend {backend} indisponível ({e}). Usando Ultralytics.")
+            except Exception as e:
+                logger.error(f"Erro ao carregar modelo no backend {backend}: {e}. Usando Ultralytics.")
+        
+        try:
+            self.model = create_backend('ultralytics', self.model_path)
+            logger.info(f"Modelo YOLO carregado: {self.model_path}")
+        except ImportError:
+            logger.warning("Ultralytics não instalado. Usando detector simulado.")
+            self.model = None
+        except Exception as e:
+            logger.error(f"Erro ao carregar modelo YOLO: {e}")
+            self.model = None
+    
+    def _warmup(self):
+        """
+        Inferências de aquecimento no tamanho esperado dos frames
+        
+        A primeira chamada paga alocações, escolha de kernels e a fusão das
+        camadas; feita aqui, ela não atrasa o primeiro resultado das câmeras.
+        """
+        width = config.capture_width or 1280
+        frame = np.zeros((width * 9 // 16, width, 3), dtype=np.uint8)  # 16:9, como as câmeras
+        for _ in range(config.model_warmup_runs):
+            try:
+                self.model.predict([frame], self.confidence_threshold)
+            except Exception as e:
+                logger.warning(f"Erro no aquecimento do modelo: {e}")
+                return
+    
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Aguarda o modelo carregar; False se o prazo acabou antes"""
+        return self.ready.wait(timeout)
+    
+    def detect(self, frame: np.ndarray, roi_mask: Optional[np.ndarray] = None) -> List[Detection]:
+        """
+        Detecta gado no frame
+        
+        Args:
+            frame: Imagem BGR do OpenCV
+            roi_mask: Máscara opcional de região de interesse
+            
+        Returns:
+            Lista de detecções
+        """
+        return self.detect_array(frame, roi_mask).to_detections()
+    
+    def detect_batch(
+        self,
+        frames: List[np.ndarray],
+        roi_masks: Optional[List[Optional[np.ndarray]]] = None
+    ) -> List[List[Detection]]:
+        """Versão em lote de detect(), com um único forward pass"""
+        return [batch.to_detections() for batch in self.detect_array_batch(frames, roi_masks)]
+    
+    def detect_array(
+        self,
+        frame: np.ndarray,
+        roi_mask: Any = None,
+        camera_id: Optional[int] = None,
+        imgsz: Optional[int] = None
+    ) -> DetectionBatch:
+        """
+        Detecta gado no frame e retorna as detecções em formato colunar
+        
+        camera_id mantém a interface do InferenceService (e separa a
+        sequência do detector simulado por câmera).
+        """
+        return self.detect_array_batch([frame], [roi_mask], imgsz, [camera_id])[0]
+    
+    def detect_array_batch(
+        self,
+        frames: List[np.ndarray],
+        roi_masks: Optional[List[Any]] = None,
+        imgsz: Optional[int] = None,
+        camera_ids: Optional[List[Any]] = None
+    ) -> List[DetectionBatch]:
+        """
+        Detecta gado em vários frames com um único forward pass
+        
+        Args:
+            frames: Imagens BGR do OpenCV (podem ter tamanhos diferentes)
+            roi_masks: ROI de cada frame: None, máscara (teste do centro) ou
+                ROIRegion (inferência só nos recortes do ROI)
+            imgsz: Resolução de entrada do modelo (None = detection_imgsz)
+            camera_ids: Câmera de cada frame (só usado pelo detector simulado)
+            
+        Returns:
+            DetectionBatch de cada frame, na mesma ordem
+        """
+        if roi_masks is None:
+            roi_masks = [None] * len(frames)
+        
+        # Carga em segundo plano: sem modelo ainda, esperar em vez de simular
+        self.ready.wait()
+        if self.model is None:
+            camera_ids = camera_ids or [None] * len(frames)
+            with metrics.time('inference'):
+                return [
+                    self._simulate_detection(frame, imgsz, camera_id)
+                    for frame, camera_id in zip(frames, camera_ids)
+                ]
+        
+        # Cada frame vira um ou mais recortes; todos vão no mesmo forward pass
+        started = time.perf_counter()
+        inputs, owners, offsets = [], [], []
+        for i, (frame, roi) in enumerate(zip(frames, roi_masks)):
+            if isinstance(roi, ROIRegion) and config.roi_crop_inference:
+                for x1, y1, x2, y2 in roi.rects:
+                    inputs.append(frame[y1:y2, x1:x2])
+                    owners.append(i)
+                    offsets.append((x1, y1))
+            else:
+                inputs.append(frame)
+                owners.append(i)
+                offsets.append((0, 0))
+        metrics.observe('preprocess', time.perf_counter() - started)
+        
+        try:
+            # Executar inferência
+            with metrics.time('inference'):
+                results = self.model.predict(inputs, self.confidence_threshold, imgsz)
+            
+            with metrics.time('postprocess'):
+                parts: List[List[RawDetections]] = [[] for _ in frames]
+                for (xyxy, conf, cls), owner, offset in zip(results, owners, offsets):
+                    if offset != (0, 0):
+                        # Recorte -> coordenadas do frame
+                        xyxy = xyxy + np.array([offset[0], offset[1], offset[0], offset[1]], dtype=np.int32)
+                    parts[owner].append((xyxy, conf, cls))
+                
+                return [self._merge_parts(p, roi) for p, roi in zip(parts, roi_masks)]
+            
+        except Exception as e:
+            logger.error(f"Erro na detecção: {e}")
+            return [DetectionBatch.empty() for _ in frames]
+    
+    def _merge_parts(self, parts: List[RawDetections], roi: Any) -> DetectionBatch:
+        """Junta os recortes de um frame (NMS entre recortes) e aplica os filtros"""
+        xyxy = np.concatenate([p[0] for p in parts]) if parts else np.zeros((0, 4), dtype=np.int32)
+        conf = np.concatenate([p[1] for p in parts]) if parts else np.zeros(0, dtype=np.float32)
+        cls = np.concatenate([p[2] for p in parts]) if parts else np.zeros(0, dtype=np.int32)
+        
+        if len(parts) > 1 and len(conf) > 1:
+            keep = nms(xyxy, conf, 0.5)
+            xyxy, conf, cls = xyxy[keep], conf[keep], cls[keep]
+        
+        return self._build_batch(xyxy, conf, cls, roi)
+    
+    def _build_batch(
+        self,
+        xyxy: np.ndarray,
+        conf: np.ndarray,
+        cls: np.ndarray,
+        roi: Any,
+        prefix: str = "det"
+    ) -> DetectionBatch:
+        """Aplica filtro de classes e de ROI e numera as detecções"""
+        # Filtrar apenas classes relevantes (cow, cattle, etc.)
+        keep = np.isin(cls, self.classes)
+        
+        if isinstance(roi, ROIRegion):
+            if config.roi_filter == 'coverage' and keep.any():
+                # Fração da caixa dentro do polígono (imagem integral)
+                keep &= roi.coverage(xyxy) >= config.roi_min_coverage
+            elif config.roi_filter == 'center':
+                roi = roi.mask
+        
+        # Verificar se o centro está dentro do ROI
+        if isinstance(roi, np.ndarray) and keep.any():
+            h, w = roi.shape[:2]
+            centers = (xyxy[:, :2] + xyxy[:, 2:]) // 2
+            cx = np.clip(centers[:, 0], 0, w - 1)
+            cy = np.clip(centers[:, 1], 0, h - 1)
+            keep &= roi[cy, cx] != 0
+        
+        return DetectionBatch(
+            xyxy=xyxy[keep],
+            conf=conf[keep],
+            cls=cls[keep],
+            ids=self._allocate_ids(int(keep.sum())),
+            prefix=prefix
+        )
+    
+    def _allocate_ids(self, n: int) -> np.ndarray:
+        """Reserva n ids sequenciais (únicos no processo)"""
+        with self._id_lock:
+            start = self._next_id
+            self._next_id += n
+        return np.arange(start, start + n, dtype=np.int64)
+    
+    def _simulate_detection(
+        self,
+        frame: np.ndarray,
+        imgsz: Optional[int] = None,
+        camera_id: Any = None
+    ) -> DetectionBatch:
+        """
+        Simula detecções para testes quando o modelo não está disponível
+        
+        Cada câmera tem o seu gerador, com semente derivada de
+        config.simulation_seed e do id da câmera: a mesma sequência de
+        frames produz as mesmas detecções entre execuções, qualquer que seja
+        a ordem em que as câmeras chegam ao detector. O custo artificial cai
+        com a área da entrada, como no modelo real.
+        """
+        if config.simulation_latency_ms > 0:
+            scale = (imgsz / config.detection_imgsz) ** 2 if imgsz else 1.0
+            time.sleep(config.simulation_latency_ms / 1000 * scale)
+        
+        rng = self._rngs.get(camera_id)
+        if rng is None:
+            rng = self._rngs.setdefault(camera_id, random.Random(f"{config.simulation_seed}:{camera_id}"))
+        h, w = frame.shape[:2]
+        num_detections = rng.randint(5, 25)
+        
+        boxes = []
+        scores = []
+        for _ in range(num_detections):
+            # Gerar bounding box aleatório
+            bw = rng.randint(50, 150)
+            bh = rng.randint(40, 120)
+            x1 = rng.randint(0, w - bw)
+            y1 = rng.randint(0, h - bh)
+            
+            boxes.append((x1, y1, x1 + bw, y1 + bh))
+            scores.append(rng.uniform(0.6, 0.95))
+        
+        return self._build_batch(
+            np.array(boxes, dtype=np.int32).reshape(-1, 4),
+            np.array(scores, dtype=np.float32),
+            np.full(num_detections, 19, dtype=np.int32),
+            None,
+            prefix="sim"
+        )
+
+
+# ============================================================================
+# AGENDADOR DE INFERÊNCIA (PRIORIDADE E DESCARTE DE CARGA)
+# ============================================================================
+
+def shed_imgsz(steps: int) -> int:
+    """Resolução da inferência após `steps` reduções de 25% (múltiplo de 32)"""
+    floor = min(config.scheduler_min_imgsz, config.detection_imgsz)
+    size = config.detection_imgsz
+    for _ in range(steps):
+        size = max(floor, int(size * 0.75) // 32 * 32)
+    return size
+
+
+@dataclass
+class CameraBudget:
+    """Papel, metas e estado de descarte de uma câmera no agendador"""
+    camera_id: int
+    role: str  # 'weigh', 'pen' ou 'other'
+    priority: int  # 0 = mais importante (nunca descartada)
+    target_fps: float  # 0 = ritmo da câmera
+    deadline: float  # segundos captura -> resultado
+    level: int = 0  # nível de descarte (0 = sem descarte)
+    base_fps: float = 0.0  # FPS medido quando o descarte começou (sem target_fps)
+    next_at: float = 0.0  # time.monotonic() do próximo frame admitido
+    fps: float = 0.0  # FPS efetivo na última janela
+    miss_ratio: float = 0.0  # fração de frames atrasados na última janela
+    window_frames: int = 0
+    window_misses: int = 0
+    frames: int = 0
+    misses: int = 0
+    throttled: int = 0  # esperas impostas pelo agendador
+    
+    @property
+    def rate_factor(self) -> float:
+        return 0.5 ** min(self.level, config.scheduler_rate_levels)
+    
+    @property
+    def max_fps(self) -> float:
+        """FPS permitido agora (0 = sem limite)"""
+        base = self.target_fps or (self.base_fps if self.level else 0.0)
+        return base * self.rate_factor
+    
+    @property
+    def imgsz(self) -> Optional[int]:
+        """Resolução da inferência (None = detection_imgsz)"""
+        steps = self.level - config.scheduler_rate_levels
+        return shed_imgsz(steps) if steps > 0 else None
+
+
+class InferenceScheduler:
+    """
+    Agendador central da inferência: prioridade por papel e descarte de carga
+    
+    Cada câmera tem um papel (pesagem > curral > outras), um FPS alvo e um
+    prazo captura -> resultado. A cada scheduler_interval o agendador olha
+    a fração de frames que estourou o prazo: com sobrecarga, o nível de
+    descarte da camada de menor prioridade sobe (primeiro o FPS cai pela
+    metade a cada nível, depois a resolução da inferência diminui); com
+    folga por algumas janelas seguidas, os níveis voltam, começando pela
+    camada mais importante. A pesagem nunca é descartada: uma passagem
+    perdida não volta, uma contagem de curral pode esperar.
+    
+    As câmeras pedem a vez em admit() antes de ler cada frame e informam a
+    latência em record(); o InferenceService usa priority() para tirar da
+    fila primeiro os frames mais importantes.
+    """
+    
+    ROLE_PRIORITY = {'weigh': 0, 'pen': 1, 'other': 2}
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.budgets: Dict[int, CameraBudget] = {}
+        
+        steps = 0
+        while shed_imgsz(steps) > min(config.scheduler_min_imgsz, config.detection_imgsz):
+            steps += 1
+        self.max_level = config.scheduler_rate_levels + steps
+        
+        self.window_started = time.monotonic()
+        self.healthy_windows = 0
+        self.overloaded = False
+        self.shed_events = 0
+        self.restore_events = 0
+    
+    @staticmethod
+    def role_of(camera_config: CameraConfig) -> str:
+        if camera_config.weigh_station_id:
+            return 'weigh'
+        if camera_config.pen_id:
+            return 'pen'
+        return 'other'
+    
+    def register(self, camera_config: CameraConfig):
+        """Cadastra a câmera (ou troca o papel, se a configuração mudou)"""
+        role = self.role_of(camera_config)
+        if role == 'weigh':
+            target_fps, deadline = config.weigh_target_fps, config.weigh_deadline
+        else:
+            target_fps, deadline = config.pen_target_fps, config.pen_deadline
+        
+        with self._lock:
+            budget = self.budgets.get(camera_config.id)
+            if budget is not None and budget.role == role:
+                return
+            self.budgets[camera_config.id] = CameraBudget(
+                camera_id=camera_config.id,
+                role=role,
+                priority=self.ROLE_PRIORITY[role],
+                target_fps=target_fps,
+                deadline=deadline
+            )
+    
+    def unregister(self, camera_id: int):
+        with self._lock:
+            self.budgets.pop(camera_id, None)
+    
+    def priority(self, camera_id: Optional[int]) -> int:
+        """Prioridade na fila de inferência (menor = antes)"""
+        budget = self.budgets.get(camera_id)
+        return budget.priority if budget is not None else self.ROLE_PRIORITY['other']
+    
+    def imgsz(self, camera_id: int) -> Optional[int]:
+        """Resolução da inferência da câmera (None = detection_imgsz)"""
+        budget = self.budgets.get(camera_id)
+        return budget.imgsz if budget is not None else None
+    
+    def admit(self, camera_id: int, now: Optional[float] = None) -> float:
+        """
+        Segundos até a câmera poder processar o próximo frame
+        
+        0 = pode agora, e a vaga fica reservada. Com valor positivo a câmera
+        dorme em vez de ler e decodificar o frame.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            budget = self.budgets.get(camera_id)
+            if budget is None:
+                return 0.0
+            max_fps = budget.max_fps
+            if max_fps <= 0:
+                return 0.0
+            
+            wait = budget.next_at - now
+            if wait > 0:
+                budget.throttled += 1
+                return wait
+            budget.next_at = now + 1.0 / max_fps
+            return 0.0
+    
+    def record(self, camera_id: int, latency: float, now: Optional[float] = None):
+        """Registra a latência captura -> resultado de um frame processado"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            budget = self.budgets.get(camera_id)
+            if budget is not None:
+                budget.frames += 1
+                budget.window_frames += 1
+                if latency > budget.deadline:
+                    budget.misses += 1
+                    budget.window_misses += 1
+            
+            if now - self.window_started >= config.scheduler_interval:
+                self._rebalance(now)
+    
+    def _rebalance(self, now: float):
+        """Fecha a janela e sobe ou devolve um nível de descarte (com o lock)"""
+        elapsed = now - self.window_started
+        self.window_started = now
+        
+        worst = 0.0
+        for budget in self.budgets.values():
+            budget.fps = budget.window_frames / elapsed
+            budget.miss_ratio = budget.window_misses / budget.window_frames if budget.window_frames else 0.0
+            budget.window_frames = budget.window_misses = 0
+            worst = max(worst, budget.miss_ratio)
+        
+        self.overloaded = worst > config.scheduler_miss_ratio
+        if self.overloaded:
+            self.healthy_windows = 0
+            self._shed()
+        elif worst <= config.scheduler_miss_ratio / 2:
+            # Histerese: só devolver depois de algumas janelas com folga
+            self.healthy_windows += 1
+            if self.healthy_windows >= config.scheduler_recover_windows:
+                self.healthy_windows = 0
+                self._restore()
+        else:
+            self.healthy_windows = 0
+    
+    def _shed(self):
+        """Sobe um nível na camada menos importante que ainda pode ceder"""
+        candidates = [b for b in self.budgets.values() if b.priority > 0 and b.level < self.max_level]
+        if not candidates:
+            return
+        
+        tier = max(b.priority for b in candidates)
+        shed = [b for b in candidates if b.priority == tier]
+        for budget in shed:
+            if budget.level == 0:
+                budget.base_fps = max(budget.fps, 1.0)
+            budget.level += 1
+        self.shed_events += 1
+        
+        logger.warning(
+            f"Inferência sobrecarregada: câmeras {[b.camera_id for b in shed]} ({shed[0].role}) "
+            f"no nível de descarte {shed[0].level} "
+            f"(FPS x{shed[0].rate_factor:g}, entrada {shed[0].imgsz or config.detection_imgsz})"
+        )
+    
+    def _restore(self):
+        """Devolve um nível à camada mais importante que está descartando"""
+        shed = [b for b in self.budgets.values() if b.level > 0]
+        if not shed:
+            return
+        
+        tier = min(b.priority for b in shed)
+        restored = [b for b in shed if b.priority == tier]
+        for budget in restored:
+            budget.level -= 1
+            if budget.level == 0:
+                budget.base_fps = 0.0
+        self.restore_events += 1
+        
+        logger.info(
+            f"Folga na inferência: câmeras {[b.camera_id for b in restored]} ({restored[0].role}) "
+            f"voltam ao nível de descarte {restored[0].level}"
+        )
+    
+    def camera_stats(self, camera_id: int) -> Dict[str, Any]:
+        """FPS efetivo e estado de descarte de uma câmera"""
+        with self._lock:
+            budget = self.budgets.get(camera_id)
+            if budget is None:
+                return {}
+            return {
+                'role': budget.role,
+                'priority': budget.priority,
+                'effective_fps': budget.fps,
+                'max_fps': budget.max_fps,
+                'shed_level': budget.level,
+                'inference_imgsz': budget.imgsz or config.detection_imgsz,
+                'deadline_ms': budget.deadline * 1000,
+                'deadline_misses': budget.misses,
+                'miss_ratio': budget.miss_ratio,
+                'throttled': budget.throttled,
+            }
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Estado do agendador e de cada câmera"""
+        cameras = {str(camera_id): self.camera_stats(camera_id) for camera_id in list(self.budgets)}
+        return {
+            'overloaded': self.overloaded,
+            'shed_events': self.shed_events,
+            'restore_events': self.restore_events,
+            'max_level': self.max_level,
+            'cameras': cameras,
+        }
+
+
+# ============================================================================
+# SERVIÇO DE INFERÊNCIA EM LOTE
+# ============================================================================
+
+@dataclass
+class InferenceRequest:
+    """Frame de uma câmera aguardando inferência"""
+    frame: np.ndarray
+    roi_mask: Any  # None, máscara ou ROIRegion
+    future: Future
+    camera_id: Optional[int] = None
+    imgsz: Optional[int] = None  # resolução reduzida pelo agendador
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class InferenceService:
+    """
+    Agrupa frames de todas as câmeras em lotes para o CattleDetector
+    
+    Expõe a mesma interface detect() do detector, então cada CameraProcessor
+    continua chamando detect() normalmente. O serviço segura o pedido até
+    completar max_batch_size frames ou até estourar max_wait_ms desde o
+    primeiro frame do lote, roda um único forward pass e devolve a cada
+    câmera as suas próprias detecções. Com agendador, a fila sai por
+    prioridade da câmera (pesagem antes de curral); cada lote tem uma só
+    resolução de entrada.
+    """
+    
+    def __init__(
+        self,
+        detector: CattleDetector,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        scheduler: Optional[InferenceScheduler] = None
+    ):
+        self.detector = detector
+        self.scheduler = scheduler
+        self.max_batch_size = max(1, max_batch_size or config.inference_batch_size)
+        if max_wait_ms is None:
+            max_wait_ms = config.inference_max_wait_ms
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        
+        # (prioridade, ordem de chegada, pedido)
+        self.pending: queue.PriorityQueue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        
+        # Estatísticas
+        self._stats_lock = threading.Lock()
+        self.started_at = 0.0
+        self.batches = 0
+        self.frames = 0
+        self.total_wait = 0.0
+        self.total_inference = 0.0
+    
+    def start(self):
+        """Inicia a thread de inferência"""
+        if self.running:
+            return
+        
+        self.running = True
+        self.started_at = time.monotonic()
+        self.thread = threading.Thread(target=self._batch_loop, daemon=True)
+        self.thread.start()
+        logger.info(
+            f"Serviço de inferência iniciado (lote máx. {self.max_batch_size}, "
+            f"espera máx. {self.max_wait * 1000:.0f}ms)"
+        )
+    
+    def stop(self):
+        """Para a thread e libera quem ainda aguarda resultado"""
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=5)
+        
+        while True:
+            try:
+                _, _, request = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            request.future.set_result(DetectionBatch.empty())
+        
+        stats = self.get_stats()
+        logger.info(
+            f"Serviço de inferência parado: {stats['frames']} frames em {stats['batches']} lotes "
+            f"(ocupação média {stats['occupancy']:.0%})"
+        )
+    
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Aguarda o modelo do detector carregar"""
+        return self.detector.wait_ready(timeout)
+    
+    @property
+    def ready_at(self) -> Optional[float]:
+        return self.detector.ready_at
+    
+    def detect(
+        self,
+        frame: np.ndarray,
+        roi_mask: Any = None,
+        camera_id: Optional[int] = None
+    ) -> List[Detection]:
+        """Mesma interface de CattleDetector.detect()"""
+        return self.detect_array(frame, roi_mask, camera_id).to_detections()
+    
+    def detect_array(
+        self,
+        frame: np.ndarray,
+        roi_mask: Any = None,
+        camera_id: Optional[int] = None,
+        imgsz: Optional[int] = None
+    ) -> DetectionBatch:
+        """
+        Enfileira o frame no próximo lote e aguarda as detecções
+        
+        Se o serviço não estiver rodando, chama o detector diretamente.
+        """
+        if not self.running:
+            return self.detector.detect_array(frame, roi_mask, camera_id, imgsz)
+        
+        request = InferenceRequest(frame=frame, roi_mask=roi_mask, future=Future(), camera_id=camera_id, imgsz=imgsz)
+        priority = self.scheduler.priority(camera_id) if self.scheduler is not None else 0
+        self.pending.put((priority, next(self._sequence), request))
+        
+        try:
+            return request.future.result(timeout=config.inference_timeout)
+        except Exception as e:
+            logger.error(f"Timeout aguardando inferência (câmera {camera_id}): {e}")
+            return DetectionBatch.empty()
+    
+    def _batch_loop(self):
+        """Monta lotes por tamanho ou janela de tempo e executa a inferência"""
+        while self.running:
+            try:
+                _, _, first = self.pending.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            
+            batch = [first]
+            other_sizes = []  # pedidos em outra resolução: voltam para a fila
+            deadline = first.enqueued_at + self.max_wait
+            
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        item = self.pending.get(timeout=remaining)
+                    else:
+                        # Janela esgotada: aproveitar apenas o que já chegou
+                        item = self.pending.get_nowait()
+                except queue.Empty:
+                    break
+                if item[2].imgsz != first.imgsz:
+                    other_sizes.append(item)
+                else:
+                    batch.append(item[2])
+            
+            for item in other_sizes:
+                self.pending.put(item)
+            self._run_batch(batch)
+    
+    def _run_batch(self, batch: List[InferenceRequest]):
+        """Executa um forward pass e distribui os resultados"""
+        started = time.monotonic()
+        
+        try:
+            results = self.detector.detect_array_batch(
+                [r.frame for r in batch],
+                [r.roi_mask for r in batch],
+                batch[0].imgsz,
+                [r.camera_id for r in batch]
+            )
+        except Exception as e:
+            logger.error(f"Erro na inferência em lote: {e}")
+            results = [DetectionBatch.empty() for _ in batch]
+        
+        finished = time.monotonic()
+        
+        for request, detections in zip(batch, results):
+            request.future.set_result(detections)
+        
+        with self._stats_lock:
+            self.batches += 1
+            self.frames += len(batch)
+            self.total_wait += sum(started - r.enqueued_at for r in batch)
+            self.total_inference += finished - started
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna ocupação dos lotes, latências médias e throughput"""
+        with self._stats_lock:
+            batches = self.batches
+            frames = self.frames
+            total_wait = self.total_wait
+            total_inference = self.total_inference
+        
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        avg_batch = frames / batches if batches else 0.0
+        
+        return {
+            'batches': batches,
+            'frames': frames,
+            'avg_batch_size': avg_batch,
+            'occupancy': avg_batch / self.max_batch_size,
+            'avg_wait_ms': (total_wait / frames * 1000) if frames else 0.0,
+            'avg_inference_ms': (total_inference / batches * 1000) if batches else 0.0,
+            'fps': frames / elapsed if elapsed > 0 else 0.0,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+        }
+
+
+# ============================================================================
+# WORKERS DE INFERÊNCIA (PROCESSOS)
+# ============================================================================
+
+def _inference_worker_main(
+    worker_id: int,
+    requests_queue: Any,
+    conn: Any,
+    model_path: Optional[str],
+    max_batch_size: int,
+    parent_config: Optional[Config] = None
+):
+    """
+    Loop de um processo de inferência
+    
+    Cada worker tem o seu próprio CattleDetector. Recebe
+    (req_id, camera_id, frame, roi_changed, roi, imgsz, prioridade) pela
+    fila (frame pode ser uma referência a um slot de FrameRing), tira da
+    fila tudo o que já chegou, monta o lote pelos pedidos de menor
+    prioridade (pesagem antes do curral, como no InferenceService), agrupa
+    por resolução e devolve ('result', req_id, xyxy,
+    conf, cls, segundos) pelo pipe. A ROI só é enviada quando muda, e
+    fica em cache por câmera. Anéis abertos ficam mapeados enquanto alguma
+    câmera os usa: quando a câmera passa a mandar outro anel (reconexão,
+    mudança de resolução), o anterior é fechado.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # o processo principal coordena o encerramento
+    cv2.setNumThreads(1)
+    
+    # 'spawn' reimporta o módulo: herdar a configuração em uso no processo principal
+    if parent_config is not None:
+        config.__dict__.update(parent_config.__dict__)
+    
+    detector = CattleDetector(model_path)  # carrega e aquece antes de avisar 'ready'
+    rois: Dict[Any, Any] = {}
+    rings: Dict[str, FrameRing] = {}
+    camera_rings: Dict[Any, str] = {}  # camera_id -> nome do anel em uso
+    conn.send(('ready', os.getpid()))
+    
+    backlog: List[Tuple[int, int, tuple]] = []  # heap (prioridade, ordem de chegada, pedido)
+    arrival = itertools.count()
+    stopping = False
+    while backlog or not stopping:
+        if not backlog:
+            item = requests_queue.get()
+            if item is None:
+                break
+            heapq.heappush(backlog, (item[6], next(arrival), item))
+        
+        # Tudo o que já chegou disputa o lote pela prioridade
+        while not stopping:
+            try:
+                item = requests_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                stopping = True
+                break
+            heapq.heappush(backlog, (item[6], next(arrival), item))
+        
+        batch = [heapq.heappop(backlog)[2] for _ in range(min(max_batch_size, len(backlog)))]
+        
+        frames, masks, refs = [], [], []
+        sizes: Dict[Optional[int], List[int]] = {}  # resolução -> posições no lote
+        stale: Set[str] = set()  # anéis que nenhuma câmera usa mais
+        for i, (_, camera_id, frame, roi_changed, roi, imgsz, _) in enumerate(batch):
+            sizes.setdefault(imgsz, []).append(i)
+            if roi_changed:
+                rois[camera_id] = roi
+            ref = None
+            if isinstance(frame, tuple):
+                # Referência a um slot de FrameRing: ler direto da memória compartilhada
+                name, shape, slots, slot, seq = frame
+                previous = camera_rings.get(camera_id)
+                if previous is not None and previous != name:
+                    stale.add(previous)
+                camera_rings[camera_id] = name
+                if name not in rings:
+                    rings[name] = FrameRing.attach(name, shape, slots)
+                ref = (rings[name], slot, seq)
+                frame = rings[name].frames[slot]
+            frames.append(frame)
+            masks.append(rois.get(camera_id))
+            refs.append(ref)
+        
+        started = time.monotonic()
+        try:
+            results = [DetectionBatch.empty() for _ in batch]
+            for imgsz, positions in sizes.items():
+                detections = detector.detect_array_batch(
+                    [frames[i] for i in positions], [masks[i] for i in positions], imgsz,
+                    [batch[i][1] for i in positions]
+                )
+                for i, batch_detections in zip(positions, detections):
+                    results[i] = batch_detections
+        except Exception as e:
+            logger.error(f"Worker {worker_id}: erro na inferência: {e}")
+            results = [DetectionBatch.empty() for _ in batch]
+        elapsed = time.monotonic() - started
+        
+        # Slot sobrescrito durante a inferência: o resultado não vale
+        results = [
+            DetectionBatch.empty() if ref and not ref[0].is_current(ref[1], ref[2]) else detections
+            for ref, detections in zip(refs, results)
+        ]
+        
+        for request, detections in zip(batch, results):
+            conn.send(('result', request[0], detections.xyxy, detections.conf, detections.cls, elapsed / len(batch)))
+        
+        # Fechar só depois do lote: as views dos frames já foram descartadas
+        del frames, refs, frame, ref
+        in_use = set(camera_rings.values())
+        for name in stale - in_use:
+            ring = rings.pop(name, None)
+            if ring is not None:
+                ring.close()
+    
+    for ring in rings.values():
+        ring.close()
+    conn.close()
+
+
+@dataclass
+class InferenceWorker:
+    """Estado, no processo principal, de um processo de inferência"""
+    id: int
+    process: Any = None
+    requests: Any = None  # mp.Queue de pedidos
+    conn: Any = None  # ponta do pipe de onde chegam os resultados
+    ready: bool = False
+    pid: Optional[int] = None
+    spawned_at: float = 0.0  # time.monotonic() do último start do processo
+    restarts: int = 0
+    failures: int = 0  # mortes seguidas sem nenhum resultado (define o backoff)
+    next_restart_at: float = 0.0
+    pending: Dict[int, Tuple[Future, float]] = field(default_factory=dict)  # req_id -> (future, enviado em)
+    rois_sent: Dict[Any, Optional[int]] = field(default_factory=dict)  # camera_id -> versão da ROI em cache no worker
+    frames: int = 0
+    busy_time: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class ProcessInferencePool:
+    """
+    Distribui a inferência entre processos, cada um com o seu detector
+    
+    Expõe a mesma interface detect()/detect_array() do InferenceService.
+    Cada frame vai para o worker pronto com menos pedidos pendentes, onde é
+    agrupado com o que chegou junto; com o InferenceScheduler, o pedido
+    leva a prioridade da câmera e o worker atende primeiro os de menor
+    valor. Uma thread de supervisão reinicia
+    workers que morreram ou travaram (com backoff exponencial) e libera
+    as câmeras que aguardavam por eles.
+    """
+    
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        num_workers: Optional[int] = None,
+        max_batch_size: Optional[int] = None,
+        scheduler: Optional['InferenceScheduler'] = None
+    ):
+        self.model_path = model_path or config.detection_model
+        self.scheduler = scheduler
+        self.num_workers = max(1, num_workers or min(config.max_workers, os.cpu_count() or 1))
+        self.max_batch_size = max(1, max_batch_size or config.inference_batch_size)
+        
+        # 'spawn': não herdar threads, sockets e contexto CUDA do processo principal
+        self.ctx = mp.get_context('spawn')
+        self.workers = [InferenceWorker(id=i) for i in range(self.num_workers)]
+        self.running = False
+        self.collector_thread: Optional[threading.Thread] = None
+        self.supervisor_thread: Optional[threading.Thread] = None
+        self.fallback: Optional[CattleDetector] = None
+        
+        self._id_lock = threading.Lock()
+        self._next_request = 0
+        self._next_detection = 0
+        self._round_robin = 0
+        
+        # Primeiro worker com o modelo carregado e aquecido
+        self._ready = threading.Event()
+        self.ready_at: Optional[float] = None
+        
+        # Estatísticas
+        self.started_at = 0.0
+        self.dropped = 0
+    
+    def start(self):
+        """Inicia os processos e as threads de coleta e supervisão"""
+        if self.running:
+            return
+        
+        self.running = True
+        self.started_at = time.monotonic()
+        for worker in self.workers:
+            self._spawn(worker)
+        
+        self.collector_thread = threading.Thread(target=self._collect_loop, daemon=True)
+        self.collector_thread.start()
+        self.supervisor_thread = threading.Thread(target=self._supervise_loop, daemon=True)
+        self.supervisor_thread.start()
+        logger.info(f"Pool de inferência iniciado com {self.num_workers} processos (lote máx. {self.max_batch_size})")
+    
+    def stop(self):
+        """Encerra os workers e libera quem ainda aguarda resultado"""
+        self.running = False
+        
+        for worker in self.workers:
+            if worker.requests is not None:
+                try:
+                    worker.requests.put(None)
+                except Exception:
+                    pass
+        
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join(timeout=5)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+                    worker.process.join(timeout=2)
+            self._fail_pending(worker)
+        
+        if self.collector_thread:
+            self.collector_thread.join(timeout=2)
+        if self.supervisor_thread:
+            self.supervisor_thread.join(timeout=2)
+        
+        for worker in self.workers:
+            self._close_channels(worker)
+        
+        stats = self.get_stats()
+        logger.info(
+            f"Pool de inferência parado: {stats['frames']} frames, "
+            f"{stats['restarts']} reinícios, {stats['dropped']} frames descartados"
+        )
+    
+    def detect(
+        self,
+        frame: np.ndarray,
+        roi_mask: Any = None,
+        camera_id: Optional[int] = None
+    ) -> List[Detection]:
+        """Mesma interface de CattleDetector.detect()"""
+        return self.detect_array(frame, roi_mask, camera_id).to_detections()
+    
+    def detect_array(
+        self,
+        frame: np.ndarray,
+        roi_mask: Any = None,
+        camera_id: Optional[int] = None,
+        imgsz: Optional[int] = None
+    ) -> DetectionBatch:
+        """
+        Envia o frame ao worker menos ocupado e aguarda as detecções
+        
+        Se o pool não estiver rodando, usa um detector local. Sem nenhum
+        worker pronto (todos reiniciando), o frame é descartado.
+        """
+        if not self.running:
+            if self.fallback is None:
+                self.fallback = CattleDetector(self.model_path)
+            return self.fallback.detect_array(frame, roi_mask, camera_id, imgsz)
+        
+        worker = self._pick_worker()
+        if worker is None:
+            self.dropped += 1
+            return DetectionBatch.empty()
+        
+        future: Future = Future()
+        with self._id_lock:
+            req_id = self._next_request
+            self._next_request += 1
+        
+        with worker.lock:
+            # A ROI (máscara + imagem integral) só viaja quando muda de versão (0 = sem ROI)
+            version = getattr(roi_mask, 'version', None) if roi_mask is not None else 0
+            roi_changed = camera_id is None or version is None or worker.rois_sent.get(camera_id) != version
+            if roi_changed and camera_id is not None:
+                worker.rois_sent[camera_id] = version
+            worker.pending[req_id] = (future, time.monotonic())
+            requests_queue = worker.requests
+        
+        # Frames do FrameRing vão por referência (nome do anel + slot), sem copiar pixels
+        payload = FrameRing.locate(frame) or frame
+        priority = self.scheduler.priority(camera_id) if self.scheduler is not None else 0
+        
+        try:
+            requests_queue.put(
+                (req_id, camera_id, payload, roi_changed, roi_mask if roi_changed else None, imgsz, priority)
+            )
+            xyxy, conf, cls = future.result(timeout=config.inference_timeout)
+        except Exception as e:
+            logger.error(f"Timeout aguardando inferência no worker {worker.id} (câmera {camera_id}): {e}")
+            with worker.lock:
+                worker.pending.pop(req_id, None)
+            return DetectionBatch.empty()
+        
+        # Ids atribuídos aqui para continuarem únicos entre workers
+        with self._id_lock:
+            start = self._next_detection
+            self._next_detection += len(conf)
+        return DetectionBatch(
+            xyxy=xyxy,
+            conf=conf,
+            cls=cls,
+            ids=np.arange(start, start + len(conf), dtype=np.int64),
+            prefix="det"
+        )
+    
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Aguarda o primeiro worker ficar pronto (fora do pool, o detector local)"""
+        if not self.running:
+            return True
+        return self._ready.wait(timeout)
+    
+    def _pick_worker(self) -> Optional[InferenceWorker]:
+        """Worker pronto com menos pedidos pendentes (empate: rodízio)"""
+        ready = [w for w in self.workers if w.ready and w.alive]
+        if not ready:
+            return None
+        
+        self._round_robin = (self._round_robin + 1) % len(ready)
+        ready = ready[self._round_robin:] + ready[:self._round_robin]
+        return min(ready, key=lambda w: len(w.pending))
+    
+    def _spawn(self, worker: InferenceWorker):
+        """Cria (ou recria) o processo de um worker com canais novos"""
+        self._close_channels(worker)
+        
+        worker.requests = self.ctx.Queue()
+        parent_conn, child_conn = self.ctx.Pipe(duplex=False)
+        worker.conn = parent_conn
+        worker.ready = False
+        worker.pid = None
+        worker.spawned_at = time.monotonic()
+        worker.rois_sent.clear()
+        worker.process = self.ctx.Process(
+            target=_inference_worker_main,
+            args=(worker.id, worker.requests, child_conn, self.model_path, self.max_batch_size, config),
+            name=f'inference-worker-{worker.id}',
+            daemon=True
+        )
+        worker.process.start()
+        child_conn.close()
+    
+    def _close_channels(self, worker: InferenceWorker):
+        if worker.conn is not None:
+            try:
+                worker.conn.close()
+            except OSError:
+                pass
+            worker.conn = None
+        if worker.requests is not None:
+            worker.requests.cancel_join_thread()
+            worker.requests.close()
+            worker.requests = None
+    
+    def _fail_pending(self, worker: InferenceWorker):
+        """Libera as câmeras que aguardavam um worker que morreu"""
+        with worker.lock:
+            pending = list(worker.pending.values())
+            worker.pending.clear()
+        
+        empty = DetectionBatch.empty()
+        for future, _ in pending:
+            if not future.done():
+                future.set_result((empty.xyxy, empty.conf, empty.cls))
+    
+    def _collect_loop(self):
+        """Recebe os resultados de todos os workers e resolve os futures"""
+        while self.running:
+            owners = {w.conn: w for w in self.workers if w.conn is not None}
+            if not owners:
+                time.sleep(0.1)
+                continue
+            
+            try:
+                readable = wait_connections(list(owners), timeout=0.5)
+            except (OSError, ValueError):
+                continue  # pipe fechado pelo supervisor durante a espera
+            
+            for conn in readable:
+                worker = owners[conn]
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    continue  # processo morreu; o supervisor cuida
+                
+                if message[0] == 'ready':
+                    worker.pid = message[1]
+                    worker.ready = True
+                    if self.ready_at is None:
+                        self.ready_at = time.monotonic()
+                        self._ready.set()
+                    logger.info(f"Worker de inferência {worker.id} pronto (pid {worker.pid})")
+                    continue
+                
+                _, req_id, xyxy, conf, cls, elapsed = message
+                with worker.lock:
+                    entry = worker.pending.pop(req_id, None)
+                    worker.frames += 1
+                    worker.busy_time += elapsed
+                    worker.failures = 0
+                metrics.observe('inference', elapsed)
+                if entry and not entry[0].done():
+                    entry[0].set_result((xyxy, conf, cls))
+    
+    def _supervise_loop(self):
+        """Reinicia workers mortos, travados ou que não ficam prontos"""
+        while self.running:
+            now = time.monotonic()
+            
+            for worker in self.workers:
+                if not self.running:
+                    break
+                
+                if worker.alive and not worker.ready:
+                    # Travado carregando o modelo: sem 'ready' nunca recebe pedidos
+                    if now - worker.spawned_at > config.inference_worker_ready_timeout:
+                        logger.error(
+                            f"Worker de inferência {worker.id} não ficou pronto em "
+                            f"{config.inference_worker_ready_timeout:.0f}s, reiniciando"
+                        )
+                        worker.process.terminate()
+                    continue
+                
+                if worker.alive:
+                    with worker.lock:
+                        oldest = min((sent for _, sent in worker.pending.values()), default=now)
+                    if now - oldest > config.inference_worker_hang_timeout:
+                        logger.error(f"Worker de inferência {worker.id} travado há {now - oldest:.0f}s, reiniciando")
+                        worker.process.terminate()
+                    continue
+                
+                if worker.ready or worker.next_restart_at == 0.0:
+                    # Acabou de morrer: liberar pendentes e agendar reinício
+                    exitcode = worker.process.exitcode if worker.process is not None else None
+                    logger.error(f"Worker de inferência {worker.id} encerrou (código {exitcode})")
+                    worker.ready = False
+                    self._fail_pending(worker)
+                    backoff = min(config.inference_worker_max_backoff, 2.0 ** worker.failures)
+                    worker.failures += 1
+                    worker.next_restart_at = now + backoff
+                    continue
+                
+                if now >= worker.next_restart_at:
+                    worker.restarts += 1
+                    worker.next_restart_at = 0.0
+                    logger.info(f"Reiniciando worker de inferência {worker.id} (reinício {worker.restarts})")
+                    self._spawn(worker)
+            
+            time.sleep(1.0)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna throughput total e o estado de cada worker"""
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        workers = []
+        for w in self.workers:
+            workers.append({
+                'id': w.id,
+                'pid': w.pid,
+                'alive': w.alive,
+                'ready': w.ready,
+                'restarts': w.restarts,
+                'pending': len(w.pending),
+                'frames': w.frames,
+                'avg_inference_ms': (w.busy_time / w.frames * 1000) if w.frames else 0.0,
+                'utilization': w.busy_time / elapsed if elapsed > 0 else 0.0,
+            })
+        
+        frames = sum(w['frames'] for w in workers)
+        return {
+            'workers': workers,
+            'num_workers': self.num_workers,
+            'ready_workers': sum(1 for w in workers if w['ready']),
+            'frames': frames,
+            'fps': frames / elapsed if elapsed > 0 else 0.0,
+            'restarts': sum(w['restarts'] for w in workers),
+            'dropped': self.dropped,
+        }
+
+
+# ============================================================================
+# RASTREAMENTO (TRACKER)
+# ============================================================================
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU entre dois conjuntos de caixas xyxy: (N, 4) x (M, 4) -> (N, M)"""
+    a = a.astype(np.float64, copy=False)
+    b = b.astype(np.float64, copy=False)
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(br - tl, 0, None).prod(axis=2)
+    area_a = np.clip(a[:, 2:] - a[:, :2], 0, None).prod(axis=1)
+    area_b = np.clip(b[:, 2:] - b[:, :2], 0, None).prod(axis=1)
+    union = area_a[:, None] + area_b[None, :] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Non-maximum suppression vetorizada; retorna os índices mantidos"""
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while len(order):
+        i = order[0]
+        keep.append(i)
+        if len(order) == 1:
+            break
+        ious = box_iou(boxes[i:i + 1], boxes[order[1:]])[0]
+        order = order[1:][ious <= iou_threshold]
+    return np.array(keep, dtype=np.intp)
+
+
+def greedy_match(scores: np.ndarray, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Associação gulosa: pares com maior score primeiro, cada linha/coluna
+    usada uma única vez. Retorna (índices de linha, índices de coluna).
+    """
+    empty = np.zeros(0, dtype=np.intp)
+    if scores.size == 0:
+        return empty, empty
+    
+    rows, cols = np.nonzero(scores >= threshold)
+    order = np.argsort(-scores[rows, cols], kind='stable')
+    
+    used_rows = np.zeros(scores.shape[0], dtype=bool)
+    used_cols = np.zeros(scores.shape[1], dtype=bool)
+    matched_rows, matched_cols = [], []
+    for r, c in zip(rows[order].tolist(), cols[order].tolist()):
+        if used_rows[r] or used_cols[c]:
+            continue
+        used_rows[r] = used_cols[c] = True
+        matched_rows.append(r)
+        matched_cols.append(c)
+    
+    return np.array(matched_rows, dtype=np.intp), np.array(matched_cols, dtype=np.intp)
+
+
+def _xyxy_to_cxcywh(boxes: np.ndarray) -> np.ndarray:
+    boxes = boxes.astype(np.float64, copy=False)
+    wh = boxes[:, 2:] - boxes[:, :2]
+    return np.hstack([boxes[:, :2] + wh / 2, wh])
+
+
+def _cxcywh_to_xyxy(boxes: np.ndarray) -> np.ndarray:
+    half = boxes[:, 2:4] / 2
+    return np.hstack([boxes[:, :2] - half, boxes[:, :2] + half])
+
+
+class CattleTracker:
+    """
+    Rastreador multi-objeto no estilo SORT/ByteTrack
+    
+    Cada trilha tem um filtro de Kalman de velocidade constante sobre
+    (cx, cy, w, h); o estado de todas as trilhas fica em arrays e o
+    predict/update é vetorizado. A associação por IoU é feita em dois
+    estágios: detecções de alta confiança contra todas as trilhas e, em
+    seguida, as de baixa confiança apenas contra trilhas confirmadas que
+    sobraram (animais parcialmente ocluídos). Uma trilha confirmada
+    sobrevive a até max_age segundos sem detecção, o que estabiliza a
+    contagem e permite extrapolar entre inferências.
+    """
+    
+    _H = np.hstack([np.eye(4), np.zeros((4, 4))])
+    _STD_POSITION = 1.0 / 20
+    _STD_VELOCITY = 1.0 / 160
+    
+    def __init__(
+        self,
+        min_hits: Optional[int] = None,
+        max_age: Optional[float] = None,
+        iou_threshold: Optional[float] = None,
+        high_confidence: Optional[float] = None
+    ):
+        self.min_hits = min_hits or config.track_min_hits
+        self.max_age = max_age if max_age is not None else config.track_max_age
+        self.iou_threshold = iou_threshold if iou_threshold is not None else config.track_iou_threshold
+        self.high_confidence = high_confidence if high_confidence is not None else config.track_high_confidence
+        
+        # Estado das trilhas (uma linha por trilha)
+        self.X = np.zeros((0, 8))  # cx, cy, w, h, vx, vy, vw, vh
+        self.P = np.zeros((0, 8, 8))
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.hits = np.zeros(0, dtype=np.int32)
+        self.last_seen = np.zeros(0)
+        self.last_box = np.zeros((0, 4), dtype=np.int32)
+        self.conf = np.zeros(0, dtype=np.float32)
+        self.cls = np.zeros(0, dtype=np.int32)
+        
+        self.time: Optional[float] = None
+        self._next_id = 1
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    @property
+    def confirmed(self) -> np.ndarray:
+        return self.hits >= self.min_hits
+    
+    def confirmed_count(self) -> int:
+        """Número de animais: trilhas confirmadas ainda vivas"""
+        return int(self.confirmed.sum())
+    
+    def predict(self, t: float) -> DetectionBatch:
+        """Extrapola as trilhas até o instante t sem nova detecção"""
+        self._advance(t)
+        self._prune(t)
+        keep = self.confirmed
+        boxes = np.rint(_cxcywh_to_xyxy(self.X[keep, :4])).astype(np.int32)
+        return DetectionBatch(
+            xyxy=boxes,
+            conf=self.conf[keep],
+            cls=self.cls[keep],
+            ids=self.ids[keep],
+            prefix="trk"
+        )
+    
+    def update(self, detections: DetectionBatch, t: float) -> DetectionBatch:
+        """
+        Associa as detecções às trilhas e atualiza os filtros
+            
+        Returns:
+            Detecções das trilhas confirmadas vistas neste frame, com o id
+            da trilha (estável entre frames)
+        """
+        self._advance(t)
+        
+        track_boxes = _cxcywh_to_xyxy(self.X[:, :4])
+        det_boxes = detections.xyxy
+        high = np.nonzero(detections.conf >= self.high_confidence)[0]
+        low = np.nonzero(detections.conf < self.high_confidence)[0]
+        
+        # Estágio 1: alta confiança x todas as trilhas
+        t1, d1 = greedy_match(box_iou(track_boxes, det_boxes[high]), self.iou_threshold)
+        
+        # Estágio 2: baixa confiança x trilhas confirmadas restantes
+        free = np.ones(len(self), dtype=bool)
+        free[t1] = False
+        remaining = np.nonzero(free & self.confirmed)[0]
+        t2, d2 = greedy_match(box_iou(track_boxes[remaining], det_boxes[low]), self.iou_threshold)
+        
+        matched_tracks = np.concatenate([t1, remaining[t2]])
+        matched_dets = np.concatenate([high[d1], low[d2]])
+        
+        if len(matched_tracks):
+            self._correct(matched_tracks, det_boxes[matched_dets])
+            self.hits[matched_tracks] += 1
+            self.last_seen[matched_tracks] = t
+            self.last_box[matched_tracks] = det_boxes[matched_dets]
+            self.conf[matched_tracks] = detections.conf[matched_dets]
+            self.cls[matched_tracks] = detections.cls[matched_dets]
+        
+        # Trilhas ainda não confirmadas que perderam a detecção são descartadas
+        missed = np.ones(len(self), dtype=bool)
+        missed[matched_tracks] = False
+        self._remove(missed & ~self.confirmed)
+        self._prune(t)
+        
+        # Detecções de alta confiança sem trilha iniciam novas trilhas
+        unmatched = np.setdiff1d(high, high[d1])
+        if len(unmatched):
+            self._spawn(detections.select(unmatched), t)
+        
+        visible = self.confirmed & (self.last_seen == t)
+        return DetectionBatch(
+            xyxy=self.last_box[visible],
+            conf=self.conf[visible],
+            cls=self.cls[visible],
+            ids=self.ids[visible],
+            prefix="trk"
+        )
+    
+    def reset(self):
+        """Descarta todas as trilhas (ex.: câmera reconectada ou ROI alterado)"""
+        self._remove(np.ones(len(self), dtype=bool))
+        self.time = None
+    
+    def _advance(self, t: float):
+        """Predição de Kalman de todas as trilhas até o instante t"""
+        if self.time is None or len(self) == 0:
+            self.time = t
+            return
+        
+        dt = t - self.time
+        if dt <= 0:
+            return
+        self.time = t
+        
+        F = np.eye(8)
+        F[:4, 4:] = np.eye(4) * dt
+        
+        h = self.X[:, 3:4]
+        std_pos = self._STD_POSITION * h
+        std_vel = self._STD_VELOCITY * h
+        q = np.hstack([np.repeat(std_pos, 4, axis=1), np.repeat(std_vel, 4, axis=1)]) ** 2 * dt
+        
+        self.X = self.X @ F.T
+        self.X[:, 2:4] = np.maximum(self.X[:, 2:4], 1.0)
+        self.P = F @ self.P @ F.T
+        self.P[:, np.arange(8), np.arange(8)] += q
+    
+    def _correct(self, idx: np.ndarray, boxes: np.ndarray):
+        """Atualização de Kalman das trilhas idx com as caixas medidas"""
+        z = _xyxy_to_cxcywh(boxes)
+        H = self._H
+        
+        P = self.P[idx]
+        r = (self._STD_POSITION * z[:, 3:4]) ** 2
+        R = np.eye(4)[None] * r[:, :, None]
+        
+        PHt = P @ H.T  # (K, 8, 4)
+        S = H @ PHt + R  # (K, 4, 4)
+        K = PHt @ np.linalg.inv(S)  # (K, 8, 4)
+        
+        y = z - self.X[idx, :4]
+        self.X[idx] += (K @ y[:, :, None])[:, :, 0]
+        self.P[idx] = (np.eye(8)[None] - K @ H) @ P
+    
+    def _spawn(self, detections: DetectionBatch, t: float):
+        """Cria trilhas novas a partir de detecções sem associação"""
+        n = len(detections)
+        z = _xyxy_to_cxcywh(detections.xyxy)
+        X = np.hstack([z, np.zeros((n, 4))])
+        
+        h = z[:, 3:4]
+        std = np.hstack([
+            np.repeat(2 * self._STD_POSITION * h, 4, axis=1),
+            np.repeat(10 * self._STD_VELOCITY * h, 4, axis=1)
+        ])
+        P = np.zeros((n, 8, 8))
+        P[:, np.arange(8), np.arange(8)] = std ** 2
+        
+        ids = np.arange(self._next_id, self._next_id + n, dtype=np.int64)
+        self._next_id += n
+        
+        self.X = np.vstack([self.X, X])
+        self.P = np.concatenate([self.P, P])
+        self.ids = np.concatenate([self.ids, ids])
+        self.hits = np.concatenate([self.hits, np.ones(n, dtype=np.int32)])
+        self.last_seen = np.concatenate([self.last_seen, np.full(n, t)])
+        self.last_box = np.vstack([self.last_box, detections.xyxy])
+        self.conf = np.concatenate([self.conf, detections.conf])
+        self.cls = np.concatenate([self.cls, detections.cls])
+        if self.time is None:
+            self.time = t
+    
+    def _prune(self, t: float):
+        """Remove trilhas sem detecção há mais de max_age segundos"""
+        self._remove(t - self.last_seen > self.max_age)
+    
+    def _remove(self, drop: np.ndarray):
+        if not drop.any():
+            return
+        keep = ~drop
+        self.X = self.X[keep]
+        self.P = self.P[keep]
+        self.ids = self.ids[keep]
+        self.hits = self.hits[keep]
+        self.last_seen = self.last_seen[keep]
+        self.last_box = self.last_box[keep]
+        self.conf = self.conf[keep]
+        self.cls = self.cls[keep]
+
+
+# ============================================================================
+# ESTIMADOR DE PESO
+# ============================================================================
+
+CALIBRATION_MODEL_TYPES = ('linear', 'polynomial', 'multivariate')
+
+
+@dataclass
+class CalibrationModel:
+    """
+    Modelo de regressão peso ~ medições de uma versão de calibração
+    
+    - linear: coeficientes [a, b] -> peso = a*x0 + b
+    - polynomial: coeficientes [a0, a1, ...] -> peso = a0 + a1*x0 + a2*x0² + ...
+    - multivariate ('custom' no backend): [c, b0, b1, ...] -> peso = c + b0*x0 + b1*x1 + ...
+    
+    x0, x1, ... são as medições de WeightEstimator._extract_measurements,
+    na mesma ordem das trainingSamples.
+    """
+    station_id: int
+    version: int
+    model_type: str
+    coefficients: np.ndarray
+    metrics: Dict[str, float] = field(default_factory=dict)
+    fitted_locally: bool = False
+    
+    @staticmethod
+    def design_matrix(model_type: str, measurements: np.ndarray, n_coefficients: int) -> np.ndarray:
+        """Matriz (N, n_coefficients) tal que peso = matriz @ coeficientes"""
+        X = np.atleast_2d(np.asarray(measurements, dtype=np.float64))
+        if model_type == 'linear':
+            return np.stack([X[:, 0], np.ones(len(X))], axis=1)
+        if model_type == 'polynomial':
+            return np.vander(X[:, 0], n_coefficients, increasing=True)
+        
+        features = n_coefficients - 1
+        if X.shape[1] < features:
+            raise ValueError(f"modelo multivariado espera {features} medições, recebeu {X.shape[1]}")
+        return np.hstack([np.ones((len(X), 1)), X[:, :features]])
+    
+    def predict(self, measurements: np.ndarray) -> np.ndarray:
+        """Peso (kg) para N vetores de medições de uma vez"""
+        return self.design_matrix(self.model_type, measurements, len(self.coefficients)) @ self.coefficients
+    
+    def evaluate(self, measurements: np.ndarray, weights: np.ndarray) -> Dict[str, float]:
+        """R², MAE e RMSE contra pesos reais"""
+        residuals = weights - self.predict(measurements)
+        ss_res = float(np.sum(residuals ** 2))
+        ss_tot = float(np.sum((weights - weights.mean()) ** 2))
+        return {
+            'r2': 1.0 - ss_res / ss_tot if ss_tot > 0 else 0.0,
+            'mae': float(np.mean(np.abs(residuals))),
+            'rmse': float(np.sqrt(ss_res / len(weights))),
+            'sampleSize': len(weights)
+        }
+    
+    @classmethod
+    def fit(
+        cls,
+        station_id: int,
+        version: int,
+        model_type: str,
+        samples: List[Dict],
+        degree: int = 2
+    ) -> 'CalibrationModel':
+        """Ajusta o modelo por mínimos quadrados a partir das trainingSamples do backend"""
+        weights = np.array([s['realWeight'] for s in samples], dtype=np.float64)
+        measurements = np.array([s['measurements'] for s in samples], dtype=np.float64)
+        if measurements.ndim != 2 or measurements.shape[1] == 0:
+            raise ValueError("amostras de calibração com medições vazias ou de tamanhos diferentes")
+        
+        if model_type == 'linear':
+            n_coefficients = 2
+        elif model_type == 'polynomial':
+            n_coefficients = degree + 1
+        else:
+            n_coefficients = measurements.shape[1] + 1
+        if len(weights) < n_coefficients:
+            raise ValueError(f"{len(weights)} amostras para {n_coefficients} coeficientes")
+        
+        A = cls.design_matrix(model_type, measurements, n_coefficients)
+        coefficients, _, _, _ = np.linalg.lstsq(A, weights, rcond=None)
+        
+        model = cls(station_id, version, model_type, coefficients, fitted_locally=True)
+        model.metrics = model.evaluate(measurements, weights)
+        return model
+    
+    @classmethod
+    def from_params(cls, station_id: int, version: int, params: Dict) -> 'CalibrationModel':
+        """
+        Cria o modelo a partir do paramsJson do backend
+        
+        Usa os coeficientes salvos; sem coeficientes, ajusta localmente
+        pelas trainingSamples.
+        """
+        model_type = params.get('modelType', 'linear')
+        if model_type == 'custom':
+            model_type = 'multivariate'
+        if model_type not in CALIBRATION_MODEL_TYPES:
+            raise ValueError(f"tipo de modelo desconhecido: {model_type}")
+        
+        coefficients = params.get('coefficients') or []
+        if not coefficients:
+            samples = params.get('trainingSamples') or []
+            if not samples:
+                raise ValueError("calibração sem coeficientes nem amostras de treinamento")
+            return cls.fit(station_id, version, model_type, samples, params.get('polynomialDegree') or 2)
+        
+        if model_type == 'linear' and len(coefficients) != 2:
+            raise ValueError(f"modelo linear espera 2 coeficientes, recebeu {len(coefficients)}")
+        
+        return cls(
+            station_id,
+            version,
+            model_type,
+            np.asarray(coefficients, dtype=np.float64),
+            metrics=dict(params.get('metrics') or {})
+        )
+
+
+def point_cloud_measurements(
+    depth: np.ndarray,
+    bbox: Tuple[int, int, int, int],
+    intrinsics: CameraIntrinsics,
+    floor_depth: Optional[float] = None
+) -> Optional[np.ndarray]:
+    """
+    Medições do animal pela nuvem de pontos da câmera de cima do corredor
+    
+    Retro-projeta, de uma vez, uma grade reduzida (~depth_grid_points) da
+    caixa no frame de profundidade. Pontos a mais de depth_min_body_height
+    acima do piso são do animal; o eixo do corpo sai de uma PCA 2x2 dos
+    pontos no plano do chão e as extensões usam percentis, para não depender
+    de pixels isolados. O volume integra a altura sobre a área de chão de
+    cada célula da grade.
+    
+    Args:
+        depth: Frame de profundidade alinhado ao RGB (unidades de intrinsics.depth_scale)
+        bbox: Caixa do animal (x1, y1, x2, y2) no frame
+        intrinsics: Intrínsecos na resolução (e no recorte) do frame
+        floor_depth: Distância câmera -> piso em metros (estimada se None)
+        
+    Returns:
+        [volume_m3, comprimento_m, largura_m, altura_m, distância_m] ou None
+        se não há pontos válidos suficientes
+    """
+    h, w = depth.shape[:2]
+    x1, y1 = max(0, int(bbox[0])), max(0, int(bbox[1]))
+    x2, y2 = min(w, int(bbox[2])), min(h, int(bbox[3]))
+    if x2 <= x1 or y2 <= y1:
+        return None
+    
+    # Grade reduzida: custo fixo independente da resolução e do tamanho da caixa
+    stride = max(1, int(np.sqrt((x2 - x1) * (y2 - y1) / config.depth_grid_points)))
+    z = depth[y1:y2:stride, x1:x2:stride].astype(np.float32) * intrinsics.depth_scale
+    valid = (z > config.depth_min_m) & (z < config.depth_max_m)
+    if np.count_nonzero(valid) < config.depth_min_points:
+        return None
+    
+    floor = floor_depth or float(np.percentile(z[valid], config.depth_floor_percentile))
+    body = valid & (floor - z > config.depth_min_body_height)
+    if np.count_nonzero(body) < config.depth_min_points:
+        return None
+    
+    # Retro-projeção vetorizada dos pontos do animal
+    v, u = np.nonzero(body)
+    zb = z[v, u]
+    u = x1 + u * stride
+    v = y1 + v * stride
+    xs = (u - intrinsics.cx) * zb / intrinsics.fx
+    ys = (v - intrinsics.cy) * zb / intrinsics.fy
+    heights = floor - zb
+    
+    # Eixos do corpo no plano do chão (PCA 2x2)
+    ground = np.stack([xs, ys], axis=1)
+    ground -= ground.mean(axis=0)
+    _, axes = np.linalg.eigh(ground.T @ ground)
+    lo, hi = np.percentile(ground @ axes, [2, 98], axis=0)
+    width, length = hi - lo  # autovalores em ordem crescente: eixo menor, eixo maior
+    
+    height = float(np.percentile(heights, 95))
+    cell_area = (stride * zb / intrinsics.fx) * (stride * zb / intrinsics.fy)
+    volume = float(np.sum(np.minimum(heights, height) * cell_area))
+    
+    return np.array([volume, length, width, height, float(np.median(zb))])
+
+
+class WeightEstimator:
+    """
+    Estimador de peso baseado em dimensões do animal
+    
+    Usa regressão linear/polinomial/multivariada calibrada com pesos reais.
+    A calibração de cada estação pode ser trocada a quente por
+    load_calibration(); cada estimativa usa uma única versão e a devolve.
+    """
+    
+    def __init__(self):
+        self.calibrations: Dict[int, CalibrationModel] = {}  # station_id -> modelo vigente
+        self.scale_references: Dict[int, float] = {}  # station_id -> pixels por metro
+        self.floor_depths: Dict[int, float] = {}  # station_id -> altura da câmera (m)
+        self.intrinsics: Dict[int, CameraIntrinsics] = {}  # informados na estação (backend)
+        self.device_intrinsics: Dict[int, CameraIntrinsics] = {}  # informados pela câmera/gravação
+    
+    def load_calibration(self, station_id: int, params: Dict, version: int = 0) -> CalibrationModel:
+        """Carrega (ou substitui) os parâmetros de calibração de uma estação"""
+        model = CalibrationModel.from_params(station_id, version, params)
+        previous = self.calibrations.get(station_id)
+        
+        # Troca de referência: estimativas em andamento terminam com o modelo anterior
+        self.calibrations[station_id] = model
+        
+        replaced = f", substitui v{previous.version}" if previous else ""
+        metrics = model.metrics
+        quality = f", RMSE {metrics['rmse']:.1f}kg, R² {metrics['r2']:.3f}" if 'rmse' in metrics and 'r2' in metrics else ""
+        logger.info(
+            f"Calibração v{version} ({model.model_type}"
+            f"{', ajustada localmente' if model.fitted_locally else ''}{quality}{replaced}) "
+            f"carregada para estação {station_id}"
+        )
+        return model
+    
+    def load_station_config(self, station_id: int, station_config: Optional[Dict]):
+        """Geometria da estação (configJson do backend): escala, altura da câmera e intrínsecos"""
+        station_config = station_config or {}
+        scale = (station_config.get('scaleReference') or {}).get('pixelsPerMeter')
+        if scale:
+            self.scale_references[station_id] = float(scale)
+        if station_config.get('cameraHeight'):
+            self.floor_depths[station_id] = float(station_config['cameraHeight'])
+        if station_config.get('intrinsics'):
+            try:
+                self.intrinsics[station_id] = CameraIntrinsics.from_dict(station_config['intrinsics'])
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error(f"Intrínsecos inválidos para estação {station_id}: {e}")
+    
+    def set_device_intrinsics(self, station_id: int, intrinsics: CameraIntrinsics):
+        """Intrínsecos reportados pela câmera (usados se a estação não definir os seus)"""
+        self.device_intrinsics[station_id] = intrinsics
+    
+    def intrinsics_for(self, station_id: int, shape: Tuple[int, int]) -> CameraIntrinsics:
+        """Intrínsecos da estação para um frame (altura, largura)"""
+        h, w = shape[:2]
+        intrinsics = self.intrinsics.get(station_id) or self.device_intrinsics.get(station_id)
+        if intrinsics is None:
+            return CameraIntrinsics.from_fov(w, h, config.depth_default_hfov)
+        return intrinsics.scaled(w, h)
+    
+    def version_for(self, station_id: int) -> int:
+        """Versão da calibração vigente (0 = sem calibração)"""
+        calibration = self.calibrations.get(station_id)
+        return calibration.version if calibration else 0
+    
+    def estimate(
+        self,
+        station_id: int,
+        detection: Detection,
+        frame: np.ndarray,
+        depth_frame: Optional[np.ndarray] = None,
+        scale_reference: Optional[float] = None
+    ) -> Tuple[float, float, int]:
+        """
+        Estima o peso do animal
+        
+        Args:
+            station_id: ID da estação de pesagem
+            detection: Detecção do animal
+            frame: Frame RGB
+            depth_frame: Frame de profundidade alinhado ao RGB (se disponível)
+            scale_reference: Pixels por metro (para câmera RGB)
+            
+        Returns:
+            Tuple (peso_estimado_kg, confiança, versão_da_calibração)
+        """
+        weights, confidences, version = self.estimate_batch(
+            station_id,
+            [detection],
+            [frame],
+            depth_frames=None if depth_frame is None else [depth_frame],
+            scale_reference=scale_reference
+        )
+        if np.isnan(weights[0]):
+            return self._estimate_fallback(detection) + (0,)
+        return float(weights[0]), float(confidences[0]), version
+    
+    def estimate_batch(
+        self,
+        station_id: int,
+        detections: List[Detection],
+        frames: List[np.ndarray],
+        depth_frames: Optional[List[Optional[np.ndarray]]] = None,
+        scale_reference: Optional[float] = None,
+        intrinsics: Optional[List[Optional[CameraIntrinsics]]] = None
+    ) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Estima o peso de várias detecções da mesma estação
+        
+        As medições são extraídas por detecção e o modelo é avaliado em uma
+        única operação matricial. intrinsics (um por item) é necessário
+        quando os frames são recortes; senão vem da estação.
+            
+        Returns:
+            Tuple (pesos_kg, confianças, versão_da_calibração); versão 0 =
+            fallback sem calibração. Itens sem medição válida (profundidade
+            insuficiente) voltam com peso NaN e confiança 0.
+        """
+        calibration = self.calibrations.get(station_id)
+        if calibration is None:
+            logger.warning(f"Sem calibração para estação {station_id}")
+            return self._estimate_fallback_batch(detections)
+        
+        scale_reference = scale_reference or self.scale_references.get(station_id)
+        try:
+            # Extrair medições dos animais
+            rows = []
+            for i, (detection, frame) in enumerate(zip(detections, frames)):
+                depth_frame = depth_frames[i] if depth_frames is not None else None
+                camera = intrinsics[i] if intrinsics is not None else None
+                if depth_frame is not None and camera is None:
+                    camera = self.intrinsics_for(station_id, depth_frame.shape)
+                rows.append(self._extract_measurements(
+                    detection, frame, depth_frame, scale_reference, camera, self.floor_depths.get(station_id)
+                ))
+            
+            valid = np.array([row is not None for row in rows])
+            if not valid.any():
+                logger.warning(f"Sem medições válidas na estação {station_id}")
+                return self._estimate_fallback_batch(detections)
+            
+            # Aplicar modelo de regressão
+            weights = np.full(len(rows), np.nan)
+            weights[valid] = np.clip(calibration.predict(np.array([r for r in rows if r is not None])), 100, 1500)
+            
+            # Calcular confiança baseada na qualidade da medição
+            confidences = np.minimum(0.95, np.array([d.confidence for d in detections]) * 0.9)
+            confidences[~valid] = 0.0
+            
+            return weights, confidences, calibration.version
+            
+        except Exception as e:
+            logger.error(f"Erro na estimativa de peso: {e}")
+            return self._estimate_fallback_batch(detections)
+    
+    def _extract_measurements(
+        self,
+        detection: Detection,
+        frame: np.ndarray,
+        depth_frame: Optional[np.ndarray],
+        scale_reference: Optional[float],
+        intrinsics: Optional[CameraIntrinsics] = None,
+        floor_depth: Optional[float] = None
+    ) -> Optional[List[float]]:
+        """
+        Extrai medições do animal para estimativa de peso
+        
+        Para câmera RGB: usa proporções do bounding box
+        Para câmera depth: usa dimensões reais em metros (nuvem de pontos)
+        """
+        x1, y1, x2, y2 = detection.bbox
+        width_px = x2 - x1
+        height_px = y2 - y1
+        
+        if depth_frame is not None:
+            # [volume, comprimento, largura, altura, distância]; None = profundidade insuficiente
+            measurements = point_cloud_measurements(depth_frame, detection.bbox, intrinsics, floor_depth)
+            return None if measurements is None else measurements.tolist()
+        
+        elif scale_reference:
+            # Usar referência de escala para RGB
+            width_m = width_px / scale_reference
+            height_m = height_px / scale_reference
+            
+            # Estimar área lateral
+            area = width_m * height_m
+            
+            return [area, width_m, height_m]
+        
+        else:
+            # Fallback: usar apenas proporções do bounding box
+            area_px = width_px * height_px
+            aspect_ratio = width_px / max(height_px, 1)
+            
+            return [area_px, aspect_ratio, width_px, height_px]
+    
+    def _estimate_fallback(self, detection: Detection) -> Tuple[float, float]:
+        """
+        Estimativa de fallback baseada apenas no tamanho do bounding box
+        """
+        area = detection.area
+        
+        # Fórmula empírica simplificada
+        # Ajustar coeficientes com dados reais
+        weight = 200 + (area / 1000) * 2.5
+        weight = max(150, min(800, weight))
+        
+        return weight, 0.5
+    
+    def _estimate_fallback_batch(self, detections: List[Detection]) -> Tuple[np.ndarray, np.ndarray, int]:
+        """Fallback para várias detecções (versão de calibração 0)"""
+        estimates = [self._estimate_fallback(d) for d in detections]
+        return (
+            np.array([e[0] for e in estimates], dtype=np.float64),
+            np.array([e[1] for e in estimates], dtype=np.float64),
+            0
+        )
+
+
+class CalibrationStore:
+    """
+    Calibrações de peso por estação, com cache em disco por versão
+    
+    Cada versão recebida do backend é gravada (de forma atômica) em
+    calibration_dir/station_{id}_v{versão}.json, então o agente sobe com a
+    última calibração conhecida mesmo sem backend. refresh() informa a versão
+    vigente ao backend, que só devolve os parâmetros quando ela mudou; a nova
+    versão é trocada no WeightEstimator sem reiniciar o agente.
+    """
+    
+    def __init__(self, api_client: 'APIClient', estimator: WeightEstimator, directory: Optional[str] = None):
+        self.api_client = api_client
+        self.estimator = estimator
+        self.directory = directory or config.calibration_dir
+        self.lock = threading.Lock()
+        self.swaps = 0
+        self.errors = 0
+        
+        os.makedirs(self.directory, exist_ok=True)
+    
+    def _path(self, station_id: int, version: int) -> str:
+        return os.path.join(self.directory, f"station_{station_id}_v{version}.json")
+    
+    def cached_versions(self, station_id: int) -> List[int]:
+        """Versões em cache de uma estação, em ordem crescente"""
+        prefix = f"station_{station_id}_v"
+        versions = []
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith('.json'):
+                try:
+                    versions.append(int(name[len(prefix):-len('.json')]))
+                except ValueError:
+                    continue
+        return sorted(versions)
+    
+    def load_cached(self, station_id: int) -> bool:
+        """Carrega a versão mais recente em cache (usado na partida, antes do backend responder)"""
+        for version in reversed(self.cached_versions(station_id)):
+            try:
+                with open(self._path(station_id, version)) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Calibração em cache ilegível ({self._path(station_id, version)}): {e}")
+                continue
+            if self._apply(entry):
+                return True
+        return False
+    
+    def refresh(self, station_id: int) -> bool:
+        """Busca a versão vigente no backend; retorna True se a calibração foi trocada"""
+        with self.lock:
+            known = self.estimator.version_for(station_id)
+            entry = self.api_client.fetch_calibration(station_id, known or None)
+            if not entry or entry.get('unchanged') or entry.get('version') == known:
+                return False
+            
+            if not self._apply(entry):
+                return False
+            self._save(entry)
+            return True
+    
+    def _apply(self, entry: Dict) -> bool:
+        station_id = entry['stationId']
+        try:
+            self.estimator.load_calibration(station_id, entry['params'], version=entry['version'])
+            self.estimator.load_station_config(station_id, entry.get('stationConfig'))
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Calibração v{entry.get('version')} da estação {station_id} inválida: {e}")
+            return False
+        
+        self.swaps += 1
+        return True
+    
+    def _save(self, entry: Dict):
+        path = self._path(entry['stationId'], entry['version'])
+        tmp = path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.error(f"Erro ao gravar calibração em cache: {e}")
+    
+    def get_stats(self) -> Dict:
+        return {
+            'versions': dict(sorted(
+                (station_id, model.version) for station_id, model in self.estimator.calibrations.items()
+            )),
+            'swaps': self.swaps,
+            'errors': self.errors
+        }
+
+
+# ============================================================================
+# DETECTOR DE PASSAGEM (PESAGEM)
+# ============================================================================
+
+@dataclass
+class WeighCandidate:
+    """Recorte de um frame da passagem guardado para a estimativa de peso"""
+    crop: np.ndarray
+    bbox: Tuple[int, int, int, int]  # caixa no recorte
+    confidence: float
+    origin: Tuple[int, int]  # canto superior esquerdo do recorte no frame
+    frame_shape: Tuple[int, int]
+    depth: Optional[np.ndarray] = None  # mesmo recorte do frame de profundidade alinhado
+
+
+@dataclass
+class WeighPass:
+    """Um animal atravessando a zona de gatilho do corredor"""
+    id: int
+    started_at: float
+    last_seen: float
+    frames: int = 0
+    side: int = 0  # lado da linha de gatilho onde entrou (0 = sem linha)
+    crossed: bool = False
+    last_box: Optional[np.ndarray] = None
+    # heap (score, seq, recorte) com os melhores frames
+    candidates: List[Tuple[float, int, WeighCandidate]] = field(default_factory=list)
+    
+    def best(self, n: int) -> List[Tuple[float, int, WeighCandidate]]:
+        return sorted(self.candidates, key=lambda c: c[0], reverse=True)[:n]
+
+
+class WeighPassDetector:
+    """
+    Segue cada animal pela zona de gatilho do corredor e fecha uma passagem
+    
+    A zona vem de roi_config['trigger_zone'] (polígono) ou da faixa
+    config.weigh_trigger_zone; roi_config['trigger_line'] exige que o animal
+    cruze a linha para a passagem valer. Durante a passagem só são
+    guardados os weigh_candidates recortes de melhor qualidade (animal
+    inteiro no frame, centralizado na zona, confiança alta); o
+    WeightEstimator roda depois, apenas nos melhores, uma vez por passagem.
+    """
+    
+    def __init__(self, roi_config: Optional[Dict] = None):
+        self.roi_config = roi_config or {}
+        self.passes: Dict[int, WeighPass] = {}
+        self.finished_ids: deque = deque(maxlen=256)  # trilhas que já geraram passagem
+        self.shape: Optional[Tuple[int, int]] = None
+        self.zone_mask: Optional[np.ndarray] = None
+        self.zone_center_x = 0.0
+        self.zone_half_width = 1.0
+        self.line: Optional[np.ndarray] = None  # (2, 2) em pixels
+        self.source_size: Optional[Tuple[int, int]] = None  # resolução nativa do stream (geometry_scale)
+        self._seq = 0
+        self._next_id = 0
+        
+        # Estatísticas
+        self.completed = 0
+        self.discarded = 0
+    
+    def _setup(self, shape: Tuple[int, int]):
+        """Rasteriza zona e linha para a resolução do frame"""
+        h, w = shape
+        scale = geometry_scale(self.roi_config, shape, self.source_size)
+        
+        def to_pixels(points: Any) -> np.ndarray:
+            pts = np.array(points, dtype=np.float64).reshape(-1, 2)
+            return pts * [w, h] if pts.max() <= 1.0 else pts * scale
+        
+        if self.roi_config.get('trigger_zone'):
+            polygon = to_pixels(self.roi_config['trigger_zone'])
+        else:
+            x1, y1, x2, y2 = config.weigh_trigger_zone
+            polygon = to_pixels([[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
+        
+        self.zone_mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.fillPoly(self.zone_mask, [np.round(polygon).astype(np.int32)], 255)
+        self.zone_center_x = float(polygon[:, 0].mean())
+        self.zone_half_width = max(1.0, float(np.ptp(polygon[:, 0])) / 2)
+        
+        line = self.roi_config.get('trigger_line')
+        self.line = to_pixels(line)[:2] if line else None
+        self.shape = (h, w)
+    
+    def in_zone(self, detections: DetectionBatch, shape: Tuple[int, int]) -> np.ndarray:
+        """Máscara das detecções com o centro dentro da zona de gatilho"""
+        if self.shape != shape:
+            self._setup(shape)
+        h, w = self.shape
+        centers = detections.centers
+        cx = np.clip(centers[:, 0], 0, w - 1)
+        cy = np.clip(centers[:, 1], 0, h - 1)
+        return self.zone_mask[cy, cx] != 0
+    
+    def _line_side(self, centers: np.ndarray) -> np.ndarray:
+        """Lado da linha de gatilho de cada centro (-1, 0 ou 1)"""
+        (ax, ay), (bx, by) = self.line
+        cross = (bx - ax) * (centers[:, 1] - ay) - (by - ay) * (centers[:, 0] - ax)
+        return np.sign(cross).astype(np.int32)
+    
+    def _associate(self, xyxy: np.ndarray) -> np.ndarray:
+        """Sem tracker: casar caixas com as passagens abertas por IoU"""
+        ids = np.full(len(xyxy), -1, dtype=np.int64)
+        open_passes = [p for p in self.passes.values() if p.last_box is not None]
+        if open_passes and len(xyxy):
+            previous = np.stack([p.last_box for p in open_passes])
+            rows, cols = greedy_match(box_iou(xyxy, previous), 0.3)
+            ids[rows] = [open_passes[c].id for c in cols]
+        for i in np.flatnonzero(ids < 0):
+            ids[i] = self._next_id
+            self._next_id += 1
+        return ids
+    
+    def quality(self, xyxy: np.ndarray, conf: np.ndarray) -> np.ndarray:
+        """Nota de cada caixa como frame de pesagem (0 a 1)"""
+        h, w = self.shape
+        margin = config.weigh_edge_margin
+        truncated = (
+            (xyxy[:, 0] <= margin) | (xyxy[:, 1] <= margin)
+            | (xyxy[:, 2] >= w - margin) | (xyxy[:, 3] >= h - margin)
+        )
+        cx = (xyxy[:, 0] + xyxy[:, 2]) / 2
+        centered = 1.0 - np.minimum(1.0, np.abs(cx - self.zone_center_x) / self.zone_half_width)
+        return conf * (0.5 + 0.5 * centered) * np.where(truncated, 0.2, 1.0)
+    
+    def update(
+        self,
+        detections: DetectionBatch,
+        frame: np.ndarray,
+        now: float,
+        depth_frame: Optional[np.ndarray] = None
+    ) -> List[WeighPass]:
+        """
+        Atualiza as passagens com as detecções do frame (e profundidade alinhada, se houver)
+            
+        Returns:
+            Passagens concluídas neste frame (válidas, com candidatos)
+        """
+        in_zone = self.in_zone(detections, frame.shape[:2])
+        
+        xyxy = detections.xyxy
+        ids = detections.ids if detections.prefix == 'trk' else self._associate(xyxy)
+        finished: List[WeighPass] = []
+        
+        if len(xyxy):
+            centers = detections.centers
+            scores = self.quality(xyxy, detections.conf)
+            sides = self._line_side(centers) if self.line is not None else np.zeros(len(xyxy), dtype=np.int32)
+            
+            for i in range(len(xyxy)):
+                track_id = int(ids[i])
+                if track_id in self.finished_ids:
+                    continue
+                
+                weigh_pass = self.passes.get(track_id)
+                if not in_zone[i]:
+                    # Saiu da zona: encerrar a passagem
+                    if weigh_pass is not None:
+                        finished.append(self.passes.pop(track_id))
+                    continue
+                
+                if weigh_pass is None:
+                    weigh_pass = self.passes[track_id] = WeighPass(
+                        id=track_id, started_at=now, last_seen=now, side=int(sides[i])
+                    )
+                
+                weigh_pass.frames += 1
+                weigh_pass.last_seen = now
+                weigh_pass.last_box = xyxy[i]
+                if weigh_pass.side == 0:
+                    weigh_pass.side = int(sides[i])
+                elif sides[i] != 0 and sides[i] != weigh_pass.side:
+                    weigh_pass.crossed = True
+                
+                self._offer(weigh_pass, float(scores[i]), frame, xyxy[i], float(detections.conf[i]), depth_frame)
+        
+        # Animais que sumiram
+        for track_id in [tid for tid, p in self.passes.items() if now - p.last_seen > config.weigh_pass_timeout]:
+            finished.append(self.passes.pop(track_id))
+        
+        valid = []
+        for weigh_pass in finished:
+            self.finished_ids.append(weigh_pass.id)
+            if (
+                weigh_pass.frames >= config.weigh_min_pass_frames
+                and weigh_pass.candidates
+                and (self.line is None or weigh_pass.crossed)
+            ):
+                self.completed += 1
+                valid.append(weigh_pass)
+            else:
+                self.discarded += 1
+        return valid
+    
+    def _offer(
+        self,
+        weigh_pass: WeighPass,
+        score: float,
+        frame: np.ndarray,
+        box: np.ndarray,
+        conf: float,
+        depth_frame: Optional[np.ndarray] = None
+    ):
+        """Guarda o recorte se estiver entre os melhores da passagem"""
+        heap = weigh_pass.candidates
+        if len(heap) >= config.weigh_candidates and score <= heap[0][0]:
+            return
+        
+        h, w = frame.shape[:2]
+        margin = config.weigh_crop_margin
+        x1, y1 = max(0, int(box[0]) - margin), max(0, int(box[1]) - margin)
+        x2, y2 = min(w, int(box[2]) + margin), min(h, int(box[3]) + margin)
+        candidate = WeighCandidate(
+            crop=frame[y1:y2, x1:x2].copy(),  # o frame pode ser um slot reaproveitado
+            bbox=(int(box[0]) - x1, int(box[1]) - y1, int(box[2]) - x1, int(box[3]) - y1),
+            confidence=conf,
+            origin=(x1, y1),
+            frame_shape=(h, w),
+            depth=depth_frame[y1:y2, x1:x2].copy() if depth_frame is not None else None
+        )
+        
+        self._seq += 1
+        entry = (score, self._seq, candidate)
+        if len(heap) >= config.weigh_candidates:
+            heapq.heapreplace(heap, entry)
+        else:
+            heapq.heappush(heap, entry)
+    
+    def reset(self):
+        self.passes.clear()
+
+
+# ============================================================================
+# CAPTURA DE FRAMES
+# ============================================================================
+
+class FrameRing:
+    """
+    Anel de frames pré-alocados em memória compartilhada (por câmera)
+    
+    O FrameGrabber decodifica direto em um slot livre e publica o slot com
+    um número de sequência; o consumidor recebe uma view do slot (sem cópia)
+    e o mantém "preso" até pedir o próximo frame, então a escrita nunca
+    reutiliza o slot em uso nem o último publicado. Como a memória é
+    compartilhada, um processo de inferência lê o frame pelo nome do anel e
+    número do slot, sem serializar os pixels; a sequência do slot permite
+    conferir se o frame não foi sobrescrito no meio do caminho.
+    
+    Escrita e pinagem acontecem só no processo dono, sincronizadas pelo
+    FrameGrabber.
+    """
+    
+    # Anéis criados neste processo (para localizar um frame pelo endereço)
+    _registry: Dict[str, 'FrameRing'] = {}
+    _registry_lock = threading.Lock()
+    
+    def __init__(self, shape: Tuple[int, ...], slots: Optional[int] = None, name: Optional[str] = None):
+        self.shape = tuple(int(d) for d in shape)
+        self.slots = max(3, slots or config.frame_ring_slots)
+        self.owner = name is None
+        self.frame_bytes = int(np.prod(self.shape))
+        header_bytes = self.slots * 8
+        
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_bytes + self.slots * self.frame_bytes)
+        else:
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:  # Python < 3.13
+                self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        
+        # Cabeçalho: sequência de cada slot (0 = vazio, -1 = sendo escrito)
+        self.seqs = np.ndarray((self.slots,), dtype=np.int64, buffer=self.shm.buf)
+        self.frames = np.ndarray((self.slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf, offset=header_bytes)
+        self._base = self.frames.__array_interface__['data'][0]
+        
+        # Estado do escritor (só no processo dono)
+        self.latest = -1
+        self.pinned = -1
+        self._next_seq = 0
+        
+        if self.owner:
+            self.seqs[:] = 0
+            with FrameRing._registry_lock:
+                FrameRing._registry[self.name] = self
+    
+    @classmethod
+    def attach(cls, name: str, shape: Tuple[int, ...], slots: int) -> 'FrameRing':
+        """Abre, em outro processo, um anel criado pelo dono"""
+        return cls(shape, slots, name=name)
+    
+    def acquire_write_slot(self) -> int:
+        """Slot livre para a próxima decodificação (nem preso, nem o último publicado)"""
+        for i in range(1, self.slots + 1):
+            slot = (self.latest + i) % self.slots
+            if slot != self.pinned and slot != self.latest:
+                self.seqs[slot] = -1
+                return slot
+        return -1
+    
+    def publish(self, slot: int) -> int:
+        """Marca o slot como frame mais recente e retorna a sua sequência"""
+        self._next_seq += 1
+        self.seqs[slot] = self._next_seq
+        self.latest = slot
+        return self._next_seq
+    
+    def pin(self, slot: int):
+        """Reserva o slot para o consumidor (libera o anterior)"""
+        self.pinned = slot
+    
+    def is_current(self, slot: int, seq: int) -> bool:
+        """O slot ainda contém o frame de sequência seq?"""
+        return int(self.seqs[slot]) == seq
+    
+    @classmethod
+    def locate(cls, frame: np.ndarray) -> Optional[Tuple[str, Tuple[int, ...], int, int, int]]:
+        """
+        Identifica um frame que é um slot de algum anel deste processo
+            
+        Returns:
+            (nome, shape, slots, slot, sequência) ou None se o frame não
+            estiver em memória compartilhada
+        """
+        address = frame.__array_interface__['data'][0]
+        with cls._registry_lock:
+            rings = list(cls._registry.values())
+        
+        for ring in rings:
+            offset = address - ring._base
+            if 0 <= offset < ring.slots * ring.frame_bytes and frame.shape == ring.shape:
+                if offset % ring.frame_bytes == 0 and frame.flags['C_CONTIGUOUS']:
+                    slot = offset // ring.frame_bytes
+                    return ring.name, ring.shape, ring.slots, slot, int(ring.seqs[slot])
+        return None
+    
+    def close(self):
+        """Libera o mapeamento (e remove o segmento, se for o dono)"""
+        if self.owner:
+            with FrameRing._registry_lock:
+                FrameRing._registry.pop(self.name, None)
+        
+        self.seqs = None
+        self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # ainda há views em uso; o mapeamento some quando forem liberadas
+        
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class FFmpegCapture:
+    """
+    Captura via subprocesso FFmpeg que escreve frames BGR crus em um pipe
+    
+    Redimensionamento e conversão de formato acontecem dentro do FFmpeg,
+    então o Python só recebe frames já no tamanho de trabalho. Com
+    keyframe_only o decodificador descarta tudo que não é keyframe
+    (-skip_frame nokey), útil para câmeras de contagem que precisam de um
+    frame a cada poucos segundos. Aceita URLs RTSP/HTTP e arquivos locais.
+    
+    Imita a interface de cv2.VideoCapture usada pelo FrameGrabber:
+    isOpened(), grab(), retrieve(), read(), get(), set() e release().
+    """
+    
+    def __init__(self, url: str, width: Optional[int] = None, keyframe_only: bool = False):
+        self.url = url
+        self.keyframe_only = keyframe_only
+        self.width = 0
+        self.height = 0
+        self.source_size: Optional[Tuple[int, int]] = None  # resolução do stream antes do scale
+        self.fps = 0.0
+        self.process: Optional[subprocess.Popen] = None
+        self.stderr_lines: deque = deque(maxlen=20)
+        self._stderr_thread: Optional[threading.Thread] = None
+        self._buffer: Optional[bytearray] = None
+        self._grabbed = False
+        
+        try:
+            src_w, src_h, self.fps = self._probe()
+        except Exception as e:
+            logger.error(f"ffprobe falhou para {self._redacted()}: {e}")
+            return
+        self.source_size = (src_w, src_h)
+        
+        width = config.capture_width if width is None else width
+        if width and width < src_w:
+            self.width = width - width % 2
+            self.height = int(round(src_h * self.width / src_w / 2)) * 2
+        else:
+            self.width, self.height = src_w, src_h
+        
+        self._buffer = bytearray(self.width * self.height * 3)
+        self._start()
+    
+    def _is_rtsp(self) -> bool:
+        return self.url.lower().startswith('rtsp')
+    
+    def _redacted(self) -> str:
+        """URL sem usuário/senha, para logs"""
+        if '@' in self.url and '://' in self.url:
+            scheme, rest = self.url.split('://', 1)
+            return f"{scheme}://{rest.split('@', 1)[1]}"
+        return self.url
+    
+    def _input_args(self) -> List[str]:
+        args = []
+        if self._is_rtsp():
+            args += ['-rtsp_transport', 'tcp', '-timeout', str(int(config.ffmpeg_open_timeout * 1e6))]
+        return args
+    
+    def _probe(self) -> Tuple[int, int, float]:
+        """Resolução e FPS do stream de vídeo"""
+        result = subprocess.run(
+            [
+                config.ffprobe_path, '-v', 'error', *self._input_args(),
+                '-select_streams', 'v:0',
+                '-show_entries', 'stream=width,height,avg_frame_rate',
+                '-of', 'json', self.url
+            ],
+            capture_output=True,
+            timeout=config.ffmpeg_open_timeout,
+            check=True
+        )
+        stream = json.loads(result.stdout)['streams'][0]
+        num, _, den = stream.get('avg_frame_rate', '0/1').partition('/')
+        fps = float(num) / float(den) if den and float(den) else 0.0
+        return int(stream['width']), int(stream['height']), fps
+    
+    def command(self) -> List[str]:
+        """Linha de comando do FFmpeg"""
+        args = [config.ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-nostdin']
+        args += ['-fflags', 'nobuffer', '-flags', 'low_delay']
+        if self.keyframe_only:
+            args += ['-skip_frame', 'nokey']
+        args += self._input_args()
+        args += ['-i', self.url, '-an', '-sn', '-dn', '-fps_mode', 'passthrough']
+        args += ['-vf', f'scale={self.width}:{self.height}:flags=fast_bilinear']
+        args += ['-pix_fmt', 'bgr24', '-f', 'rawvideo', 'pipe:1']
+        return args
+    
+    def _start(self):
+        try:
+            self.process = subprocess.Popen(
+                self.command(),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                stdin=subprocess.DEVNULL,
+                bufsize=0
+            )
+        except OSError as e:
+            logger.error(f"Não foi possível iniciar o FFmpeg: {e}")
+            self.process = None
+    
+    def _drain_stderr(self):
+        """
+        Guarda as últimas linhas de erro do FFmpeg (sem deixar o pipe encher)
+        
+        A thread só nasce no primeiro grab(); no runtime assíncrono o
+        PipeFrameSource lê o stderr pelo event loop.
+        """
+        for line in iter(self.process.stderr.readline, b''):
+            self.stderr_lines.append(line.decode('utf-8', 'replace').rstrip())
+    
+    def isOpened(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+    
+    def grab(self) -> bool:
+        """Lê o próximo frame do pipe para o buffer interno"""
+        self._grabbed = False
+        if self.process is None:
+            return False
+        if self._stderr_thread is None:
+            self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+            self._stderr_thread.start()
+        
+        view = memoryview(self._buffer)
+        filled = 0
+        while filled < len(view):
+            n = self.process.stdout.readinto(view[filled:])
+            if not n:
+                if self.stderr_lines:
+                    logger.warning(f"FFmpeg encerrou ({self._redacted()}): {self.stderr_lines[-1]}")
+                return False
+            filled += n
+        
+        self._grabbed = True
+        return True
+    
+    def retrieve(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        """Entrega o frame do último grab(); escreve em image se o tamanho bater"""
+        if not self._grabbed:
+            return False, None
+        
+        frame = np.frombuffer(self._buffer, dtype=np.uint8).reshape(self.height, self.width, 3)
+        if image is not None and image.shape == frame.shape and image.dtype == np.uint8:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame.copy()
+    
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+    
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        return 0.0
+    
+    def set(self, prop: int, value: float) -> bool:
+        return False  # parâmetros são fixados na linha de comando
+    
+    def release(self):
+        """Encerra o subprocesso"""
+        if self.process is None:
+            return
+        
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
+        self.process = None
+
+
+class SyntheticCapture:
+    """
+    Fonte de frames sintéticos e determinísticos (demo e benchmark)
+    
+    URL: synthetic://1280x720?fps=25&animals=12&seed=1. Desenha animais
+    (elipses) andando sobre um pasto, sempre iguais para a mesma semente.
+    Com config.replay_realtime os frames saem no FPS pedido; sem ele, um
+    novo frame só é gerado depois que o anterior foi consumido.
+    
+    Com depth=1 (e height=2.5, distância câmera -> piso em metros) gera
+    também um frame de profundidade alinhado em mm: cada animal é um
+    semi-elipsoide de até 1,2 m de altura visto de cima.
+    """
+    
+    def __init__(self, url: str):
+        from urllib.parse import urlparse, parse_qs
+        parsed = urlparse(url)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        size = (parsed.netloc or '1280x720').lower().split('x')
+        
+        self.width, self.height = int(size[0]), int(size[1])
+        self.fps = float(query.get('fps', 25))
+        self.index = 0
+        self.pacer = ReplayPacer(self.fps)
+        self.lossless = not config.replay_realtime
+        
+        rng = np.random.default_rng(int(query.get('seed', config.simulation_seed)))
+        n = int(query.get('animals', 12))
+        self.positions = rng.uniform([0, 0], [self.width, self.height], size=(n, 2))
+        self.velocities = rng.normal(0, 2.0, size=(n, 2))
+        self.sizes = rng.integers(25, 60, size=(n, 2))
+        
+        self.background = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self.background[:] = (60, 120, 70)
+        self.opened = True
+        
+        self.has_depth = query.get('depth', '0') not in ('0', 'false')
+        self.floor_mm = float(query.get('height', 2.5)) * 1000
+        self.intrinsics = (
+            CameraIntrinsics.from_fov(self.width, self.height, config.depth_default_hfov)
+            if self.has_depth else None
+        )
+    
+    def isOpened(self) -> bool:
+        return self.opened
+    
+    def grab(self) -> bool:
+        if not self.opened:
+            return False
+        self.pacer.wait()
+        self.index += 1
+        return True
+    
+    def retrieve(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        shape = (self.height, self.width, 3)
+        frame = image if image is not None and image.shape == shape else np.empty(shape, dtype=np.uint8)
+        np.copyto(frame, self.background)
+        
+        for (x, y), (a, b) in zip(self._positions(), self.sizes):
+            cv2.ellipse(frame, (int(x), int(y)), (int(a), int(b)), 0, 0, 360, (40, 50, 90), -1)
+        return True, frame
+    
+    def _positions(self) -> np.ndarray:
+        """Centro dos animais no frame index (movimento com rebote nas bordas)"""
+        span = np.array([self.width, self.height], dtype=np.float64)
+        pos = np.abs((self.positions + self.velocities * self.index) % (2 * span) - span)
+        return (span - pos).astype(int)
+    
+    def retrieve_depth(self) -> Optional[np.ndarray]:
+        """Profundidade (uint16, mm) alinhada ao último frame"""
+        depth = np.full((self.height, self.width), self.floor_mm, dtype=np.float32)
+        for (x, y), (a, b) in zip(self._positions(), self.sizes):
+            x1, x2 = max(0, x - a), min(self.width, x + a + 1)
+            y1, y2 = max(0, y - b), min(self.height, y + b + 1)
+            if x2 <= x1 or y2 <= y1:
+                continue
+            dx = (np.arange(x1, x2) - x) / a
+            dy = (np.arange(y1, y2) - y) / b
+            r2 = dy[:, None] ** 2 + dx[None, :] ** 2
+            body = self.floor_mm - 1200.0 * np.sqrt(np.clip(1.0 - r2, 0.0, None))
+            np.minimum(depth[y1:y2, x1:x2], body, out=depth[y1:y2, x1:x2])
+        return depth.astype(np.uint16)
+    
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+    
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        return 0.0
+    
+    def set(self, prop: int, value: float) -> bool:
+        return False
+    
+    def release(self):
+        self.opened = False
+
+
+class ReplayPacer:
+    """
+    Ritmo de uma fonte gravada ou sintética
+    
+    Em tempo real, wait() espera o instante do próximo frame. No modo sem
+    perda (replay_realtime = False) não espera: a fonte se marca como
+    lossless e o FrameGrabber só avança quando o consumidor pede um frame,
+    então nada é descartado e o pipeline roda o mais rápido que conseguir.
+    """
+    
+    def __init__(self, fps: float):
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.realtime = config.replay_realtime and self.interval > 0
+        self.next_at = 0.0
+    
+    def wait(self):
+        if not self.realtime:
+            return
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        self.next_at = max(now, self.next_at) + self.interval
+
+
+class ReplayCapture:
+    """
+    Reprodução de um arquivo de vídeo gravado (em loop)
+    
+    Envolve o cv2.VideoCapture aplicando o ritmo do ReplayPacer.
+    """
+    
+    def __init__(self, path: str, loop: bool = True):
+        self.path = path
+        self.loop = loop
+        self.cap = cv2.VideoCapture(path)
+        self.pacer = ReplayPacer(self.cap.get(cv2.CAP_PROP_FPS) or 25.0)
+        self.lossless = not config.replay_realtime
+    
+    def isOpened(self) -> bool:
+        return self.cap.isOpened()
+    
+    def grab(self) -> bool:
+        self.pacer.wait()
+        if self.cap.grab():
+            return True
+        if not self.loop:
+            return False
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        return self.cap.grab()
+    
+    def retrieve(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        return self.cap.retrieve(image) if image is not None else self.cap.retrieve()
+    
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+    
+    def get(self, prop: int) -> float:
+        return self.cap.get(prop)
+    
+    def set(self, prop: int, value: float) -> bool:
+        return self.cap.set(prop, value)
+    
+    def release(self):
+        self.cap.release()
+
+
+class DepthReplayCapture:
+    """
+    Reprodução de uma gravação RGB + profundidade alinhada (em loop)
+    
+    O diretório tem o vídeo color.mp4 (ou color.avi/.mkv, ou imagens em
+    color/), a profundidade em depth/ (PNG de 16 bits, um por frame, na
+    mesma ordem) ou depth.npy (N, H, W), e opcionalmente intrinsics.json
+    ({fx, fy, cx, cy, width, height, depthScale?, fps?}). O frame i do
+    RGB corresponde ao frame i da profundidade.
+    """
+    
+    COLOR_VIDEOS = ('color.mp4', 'color.avi', 'color.mkv')
+    IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+    
+    def __init__(self, path: str, loop: bool = True):
+        self.path = path
+        self.loop = loop
+        self.index = -1
+        self.lossless = not config.replay_realtime
+        self.has_depth = True
+        
+        def listing(name: str, extensions: Tuple[str, ...]) -> List[str]:
+            folder = os.path.join(path, name)
+            if not os.path.isdir(folder):
+                return []
+            return [os.path.join(folder, n) for n in sorted(os.listdir(folder)) if n.lower().endswith(extensions)]
+        
+        self.cap: Optional[cv2.VideoCapture] = None
+        self.color_files = listing('color', self.IMAGE_EXTENSIONS)
+        for name in self.COLOR_VIDEOS:
+            if not self.color_files and os.path.exists(os.path.join(path, name)):
+                self.cap = cv2.VideoCapture(os.path.join(path, name))
+        
+        self.depth_files = listing('depth', ('.png', '.tif', '.tiff'))
+        self.depth_stack: Optional[np.ndarray] = None
+        if not self.depth_files and os.path.exists(os.path.join(path, 'depth.npy')):
+            self.depth_stack = np.load(os.path.join(path, 'depth.npy'), mmap_mode='r')
+        self.frames = len(self.depth_files) if self.depth_stack is None else len(self.depth_stack)
+        
+        info: Dict = {}
+        if os.path.exists(os.path.join(path, 'intrinsics.json')):
+            with open(os.path.join(path, 'intrinsics.json')) as f:
+                info = json.load(f)
+        self.intrinsics = CameraIntrinsics.from_dict(info) if 'fx' in info else None
+        fps = info.get('fps') or (self.cap.get(cv2.CAP_PROP_FPS) if self.cap is not None else 0) or 30.0
+        self.pacer = ReplayPacer(float(fps))
+    
+    def isOpened(self) -> bool:
+        color = self.cap.isOpened() if self.cap is not None else bool(self.color_files)
+        return color and self.frames > 0
+    
+    def grab(self) -> bool:
+        self.pacer.wait()
+        self.index += 1
+        at_end = self.index >= self.frames or (self.color_files and self.index >= len(self.color_files))
+        if self.cap is not None and not at_end:
+            at_end = not self.cap.grab()
+        if not at_end:
+            return True
+        
+        if not self.loop:
+            return False
+        self.index = 0
+        if self.cap is not None:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            return self.cap.grab()
+        return True
+    
+    def retrieve(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if self.cap is not None:
+            return self.cap.retrieve(image) if image is not None else self.cap.retrieve()
+        frame = cv2.imread(self.color_files[self.index])
+        if frame is None:
+            return False, None
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+    
+    def retrieve_depth(self) -> Optional[np.ndarray]:
+        """Profundidade alinhada ao último frame (unidades de depth_scale)"""
+        if self.depth_stack is not None:
+            return np.array(self.depth_stack[self.index])
+        return cv2.imread(self.depth_files[self.index], cv2.IMREAD_UNCHANGED)
+    
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+    
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FPS:
+            return 1.0 / self.pacer.interval if self.pacer.interval else 0.0
+        if self.cap is not None:
+            return self.cap.get(prop)
+        return 0.0
+    
+    def set(self, prop: int, value: float) -> bool:
+        return False
+    
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+        self.depth_stack = None
+
+
+class RealSenseCapture:
+    """
+    Câmera Intel RealSense: RGB + profundidade alinhada ao RGB
+    
+    URL: realsense://[serial]?width=1280&height=720&fps=30. Os intrínsecos
+    e a escala de profundidade vêm da própria câmera. Requer pyrealsense2.
+    """
+    
+    def __init__(self, url: str):
+        from urllib.parse import urlparse, parse_qs
+        import pyrealsense2 as rs
+        
+        parsed = urlparse(url)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        width, height = int(query.get('width', 1280)), int(query.get('height', 720))
+        self.fps = int(query.get('fps', 30))
+        
+        rs_config = rs.config()
+        if parsed.netloc:
+            rs_config.enable_device(parsed.netloc)
+        rs_config.enable_stream(rs.stream.color, width, height, rs.format.bgr8, self.fps)
+        rs_config.enable_stream(rs.stream.depth, width, height, rs.format.z16, self.fps)
+        
+        self.pipeline = rs.pipeline()
+        profile = self.pipeline.start(rs_config)
+        self.align = rs.align(rs.stream.color)
+        
+        depth_scale = profile.get_device().first_depth_sensor().get_depth_scale()
+        color = profile.get_stream(rs.stream.color).as_video_stream_profile().get_intrinsics()
+        self.intrinsics = CameraIntrinsics(
+            color.fx, color.fy, color.ppx, color.ppy, color.width, color.height, depth_scale
+        )
+        self.has_depth = True
+        self.opened = True
+        self._frames = None
+        self._depth = None
+    
+    def isOpened(self) -> bool:
+        return self.opened
+    
+    def grab(self) -> bool:
+        if not self.opened:
+            return False
+        try:
+            self._frames = self.pipeline.wait_for_frames(int(config.frame_read_timeout * 1000))
+        except RuntimeError:
+            return False
+        return True
+    
+    def retrieve(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if self._frames is None:
+            return False, None
+        # Alinhar só os frames que serão usados (custa da ordem de uma cópia do frame)
+        aligned = self.align.process(self._frames)
+        color = aligned.get_color_frame()
+        self._depth = aligned.get_depth_frame()
+        if not color:
+            return False, None
+        frame = np.asanyarray(color.get_data())
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame.copy()
+    
+    def retrieve_depth(self) -> Optional[np.ndarray]:
+        return None if self._depth is None else np.asanyarray(self._depth.get_data()).copy()
+    
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+    
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.intrinsics.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.intrinsics.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        return 0.0
+    
+    def set(self, prop: int, value: float) -> bool:
+        return False
+    
+    def release(self):
+        if self.opened:
+            self.opened = False
+            self.pipeline.stop()
+
+
+def open_capture(camera_config: CameraConfig) -> Any:
+    """
+    Abre a câmera com o backend configurado para ela
+    
+    Usa o substream quando disponível (capture_prefer_substream) e o
+    backend de CameraConfig, ou config.capture_backend se não definido.
+    URLs synthetic:// geram frames sintéticos e realsense:// abre uma
+    câmera RealSense (RGB + profundidade); o backend 'replay' reproduz um
+    arquivo gravado em loop, ou um diretório RGB + profundidade.
+    """
+    url = camera_config.rtsp_url
+    if config.capture_prefer_substream and camera_config.substream_url:
+        url = camera_config.substream_url
+    
+    if url.startswith('synthetic://'):
+        return SyntheticCapture(url)
+    if url.startswith('realsense://'):
+        return RealSenseCapture(url)
+    
+    backend = camera_config.capture_backend or config.capture_backend
+    if backend == 'replay':
+        # Diretório = gravação RGB + profundidade
+        return DepthReplayCapture(url) if os.path.isdir(url) else ReplayCapture(url)
+    if backend == 'ffmpeg':
+        return FFmpegCapture(url, camera_config.capture_width, camera_config.keyframe_only)
+    
+    if '://' in url and hasattr(cv2, 'CAP_PROP_OPEN_TIMEOUT_MSEC'):
+        # Prazos do próprio FFmpeg do OpenCV (o padrão espera ~30s por um RTSP morto)
+        cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG, [
+            cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(config.camera_open_timeout * 1000),
+            cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(config.frame_read_timeout * 1000),
+        ])
+    else:
+        cap = cv2.VideoCapture(url)
+    # Configurar buffer mínimo para baixa latência
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return cap
+
+
+def open_capture_with_timeout(camera_config: CameraConfig, timeout: Optional[float] = None) -> Any:
+    """
+    open_capture() com prazo: um stream que não responde não segura a câmera
+    
+    A abertura roda em thread própria. Estourado o prazo, levanta
+    TimeoutError; se o stream abrir depois, é liberado assim que abrir.
+    """
+    timeout = config.camera_open_timeout if timeout is None else timeout
+    future: Future = Future()
+    
+    def opener():
+        try:
+            future.set_result(open_capture(camera_config))
+        except Exception as e:
+            future.set_exception(e)
+    
+    threading.Thread(target=opener, name=f'open-camera-{camera_config.id}', daemon=True).start()
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        future.add_done_callback(_release_late_capture)
+        raise TimeoutError(f"stream não abriu em {timeout:.0f}s")
+
+
+def _release_late_capture(future: Future):
+    if future.exception() is None:
+        future.result().release()
+
+
+class FrameGrabber:
+    """
+    Drena o stream continuamente e entrega sempre o frame mais recente
+    
+    grab() apenas avança o stream; a decodificação (retrieve) só acontece
+    quando o consumidor pediu um frame e já passaram frame_skip frames desde
+    o último entregue. Assim o buffer RTSP nunca acumula frames velhos e não
+    pagamos decodificação de frames descartados.
+    
+    Com frame_ring_enabled, a decodificação acontece direto em um FrameRing
+    e read() devolve uma view do slot, válida até a próxima chamada.
+    
+    Fontes com profundidade (has_depth) entregam junto o frame de
+    profundidade alinhado, disponível em self.depth após cada read().
+    """
+    
+    def __init__(self, cap: Any, name: str, frame_skip: Optional[int] = None, labels: MetricLabels = ()):
+        self.cap = cap
+        self.name = name
+        self.labels = labels
+        self.frame_skip = max(1, frame_skip or config.frame_skip)
+        
+        self.running = False
+        self.failed = False
+        self.thread: Optional[threading.Thread] = None
+        
+        self._cond = threading.Condition()
+        self._wanted = False
+        self._since_decode = 0
+        self._frame: Optional[np.ndarray] = None
+        self._frame_slot = -1
+        self._frame_time = 0.0
+        self._seq = 0
+        
+        # Fontes gravadas sem perda: só avançar quando o consumidor pedir
+        self.lossless = bool(getattr(cap, 'lossless', False))
+        
+        # Profundidade alinhada ao frame entregue
+        self.has_depth = bool(getattr(cap, 'has_depth', False))
+        self.depth: Optional[np.ndarray] = None
+        self._depth: Optional[np.ndarray] = None
+        
+        # Anel em memória compartilhada (criado no primeiro frame)
+        self.use_ring = config.frame_ring_enabled
+        self.ring: Optional[FrameRing] = None
+        self._retired_rings: List[FrameRing] = []
+        
+        # Contadores
+        self.grabbed = 0
+        self.decoded = 0
+        self.skipped = 0  # pulados por frame_skip
+        self.dropped = 0  # consumidor ocupado: frame descartado sem decodificar
+        self.stale = 0  # entregues tarde demais (max_frame_age)
+        self.decode_errors = 0
+    
+    def start(self):
+        """Inicia a thread de captura"""
+        if self.running:
+            return
+        
+        self.running = True
+        self.thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        """Para a thread de captura"""
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+        
+        with self._cond:
+            rings = self._retired_rings + ([self.ring] if self.ring else [])
+            self.ring = None
+            self._retired_rings = []
+            self._frame = None
+        for ring in rings:
+            ring.close()
+    
+    def _retrieve(self) -> Tuple[bool, Optional[np.ndarray], int]:
+        """Decodifica o frame atual, no anel quando possível; retorna (ok, frame, slot)"""
+        if not self.use_ring:
+            ret, frame = self.cap.retrieve()
+            return ret, frame, -1
+        
+        with self._cond:
+            slot = self.ring.acquire_write_slot() if self.ring else -1
+        
+        if slot < 0:
+            ret, frame = self.cap.retrieve()
+        else:
+            target = self.ring.frames[slot]
+            ret, frame = self.cap.retrieve(target)
+            if ret and frame is not None and frame.__array_interface__['data'][0] == target.__array_interface__['data'][0]:
+                return True, target, slot
+        
+        if ret and frame is not None:
+            # Primeiro frame ou resolução mudou: (re)criar o anel
+            with self._cond:
+                if self.ring is None or self.ring.shape != frame.shape:
+                    if self.ring is not None:
+                        self._retired_rings.append(self.ring)
+                    try:
+                        self.ring = FrameRing(frame.shape)
+                    except Exception as e:
+                        logger.warning(f"Memória compartilhada indisponível para {self.name}: {e}")
+                        self.use_ring = False
+        return ret, frame, -1
+    
+    def _capture_loop(self):
+        """Chama grab() em todo frame e decodifica apenas o que será usado"""
+        while self.running:
+            if self.lossless:
+                with self._cond:
+                    if self._since_decode + 1 >= self.frame_skip:
+                        self._cond.wait_for(lambda: self._wanted or not self.running)
+            
+            if not self.cap.grab():
+                with self._cond:
+                    self.failed = True
+                    self._cond.notify_all()
+                return
+            
+            with self._cond:
+                self.grabbed += 1
+                self._since_decode += 1
+                if self._since_decode < self.frame_skip:
+                    self.skipped += 1
+                    continue
+                if not self._wanted:
+                    self.dropped += 1
+                    continue
+            
+            captured_at = time.monotonic()
+            with metrics.time('decode', self.labels):
+                ret, frame, slot = self._retrieve()
+                depth = self.cap.retrieve_depth() if ret and self.has_depth else None
+            
+            with self._cond:
+                if not ret:
+                    self.decode_errors += 1
+                    continue
+                if slot >= 0:
+                    self.ring.publish(slot)
+                self.decoded += 1
+                self._since_decode = 0
+                self._wanted = False
+                self._frame = frame
+                self._depth = depth
+                self._frame_slot = slot
+                self._frame_time = captured_at
+                self._seq += 1
+                self._cond.notify_all()
+    
+    def read(self, timeout: Optional[float] = None) -> Tuple[Optional[np.ndarray], float]:
+        """
+        Aguarda o próximo frame decodificado
+        
+        Com o anel ativo, o frame é uma view do slot e só é reaproveitado
+        depois da próxima chamada a read().
+            
+        Returns:
+            Tuple (frame, instante da captura em time.monotonic()) ou
+            (None, 0.0) se o stream falhou ou o tempo esgotou
+        """
+        if timeout is None:
+            timeout = config.frame_read_timeout
+        deadline = time.monotonic() + timeout
+        
+        with self._cond:
+            while True:
+                seq = self._seq
+                self._wanted = True
+                if self.lossless:
+                    self._cond.notify_all()
+                self._cond.wait_for(
+                    lambda: self._seq != seq or self.failed or not self.running,
+                    timeout=max(0.0, deadline - time.monotonic())
+                )
+                if self._seq == seq:
+                    self._wanted = False
+                    return None, 0.0
+                
+                frame, captured_at = self._frame, self._frame_time
+                self._frame = None
+                
+                if time.monotonic() - captured_at <= config.max_frame_age:
+                    if self._frame_slot >= 0 and self.ring is not None:
+                        self.ring.pin(self._frame_slot)
+                    self.depth = self._depth
+                    return frame, captured_at
+                
+                # Frame ficou parado tempo demais: pedir outro
+                self.stale += 1
+    
+    CAPTURE_COUNTERS = ('grabbed', 'decoded', 'skipped', 'dropped', 'stale', 'decode_errors')
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Retorna contadores de captura"""
+        with self._cond:
+            return {
+                'grabbed': self.grabbed,
+                'decoded': self.decoded,
+                'skipped': self.skipped,
+                'dropped': self.dropped,
+                'stale': self.stale,
+                'decode_errors': self.decode_errors,
+                'shared_memory': self.ring is not None,
+                'depth': self.has_depth,
+            }
+
+
+class MotionGate:
+    """
+    Detector de movimento barato para pular o YOLO em cenas paradas
+    
+    Compara uma versão reduzida (motion_gate_width px) e suavizada, em tons
+    de cinza, do frame atual com a do frame da última inferência, apenas
+    dentro do ROI. Se a fração de pixels alterados ficar abaixo de
+    motion_area_threshold, a câmera reaproveita as últimas detecções; uma
+    inferência nova é forçada após motion_max_staleness segundos.
+    """
+    
+    def __init__(
+        self,
+        width: Optional[int] = None,
+        pixel_threshold: Optional[int] = None,
+        area_threshold: Optional[float] = None,
+        max_staleness: Optional[float] = None
+    ):
+        self.width = width or config.motion_gate_width
+        self.pixel_threshold = pixel_threshold or config.motion_pixel_threshold
+        self.area_threshold = area_threshold if area_threshold is not None else config.motion_area_threshold
+        self.max_staleness = max_staleness if max_staleness is not None else config.motion_max_staleness
+        
+        self.reference: Optional[np.ndarray] = None
+        self.reference_time = 0.0
+        self._mask_source: Optional[np.ndarray] = None
+        self._mask_small: Optional[np.ndarray] = None
+        
+        # Estatísticas
+        self.checks = 0
+        self.hits = 0  # inferências evitadas
+        self.last_motion = 0.0  # fração alterada na última verificação
+    
+    def _downscale(self, frame: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        size = (self.width, max(1, int(round(h * self.width / w))))
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        small = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+    
+    def _roi_small(self, roi_mask: Optional[np.ndarray], shape: Tuple[int, int]) -> Optional[np.ndarray]:
+        if roi_mask is None:
+            return None
+        if self._mask_source is not roi_mask or self._mask_small.shape != shape:
+            self._mask_source = roi_mask
+            self._mask_small = cv2.resize(roi_mask, (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST) > 0
+        return self._mask_small
+    
+    def should_infer(self, frame: np.ndarray, roi_mask: Optional[np.ndarray], now: float) -> bool:
+        """
+        Decide se o frame precisa de inferência
+        
+        Quando retorna True, o frame passa a ser a nova referência (o chamador
+        deve rodar a detecção).
+        """
+        small = self._downscale(frame)
+        self.checks += 1
+        
+        if (
+            self.reference is None
+            or self.reference.shape != small.shape
+            or now - self.reference_time >= self.max_staleness
+        ):
+            self.reference, self.reference_time = small, now
+            return True
+        
+        changed = cv2.absdiff(small, self.reference) > self.pixel_threshold
+        mask = self._roi_small(roi_mask, small.shape)
+        if mask is not None:
+            total = int(mask.sum())
+            self.last_motion = int((changed & mask).sum()) / total if total else 0.0
+        else:
+            self.last_motion = float(changed.mean())
+        
+        if self.last_motion < self.area_threshold:
+            self.hits += 1
+            return False
+        
+        self.reference, self.reference_time = small, now
+        return True
+    
+    def reset(self):
+        """Força inferência no próximo frame"""
+        self.reference = None
+    
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.checks if self.checks else 0.0
+
+
+class FlowPropagator:
+    """
+    Propaga as caixas da última detecção com fluxo óptico esparso
+    
+    Entre duas inferências completas (keyframes, a cada
+    flow_keyframe_interval frames processados) as caixas andam alguns
+    pixels: cada uma leva uma grade de flow_grid x flow_grid pontos, que o
+    Lucas-Kanade piramidal acompanha do frame anterior para o atual, em tons
+    de cinza e reduzido para flow_width px. Um ponto só vale se voltar ao
+    lugar de origem no fluxo inverso (erro ida-e-volta até
+    flow_fb_threshold px); a caixa se move pela mediana dos deslocamentos
+    válidos e muda de tamanho pela mediana da variação da distância ao
+    centro. Quando menos de flow_min_tracked das caixas são acompanhadas,
+    propagate() devolve None e a câmera volta à detecção completa.
+    """
+    
+    def __init__(
+        self,
+        keyframe_interval: Optional[int] = None,
+        width: Optional[int] = None,
+        grid: Optional[int] = None
+    ):
+        self.keyframe_interval = max(1, keyframe_interval or config.flow_keyframe_interval)
+        self.width = width or config.flow_width
+        grid = grid or config.flow_grid
+        
+        # Grade relativa à caixa, longe das bordas (fundo), em (pontos, 2)
+        steps = np.linspace(0.2, 0.8, grid, dtype=np.float32)
+        gx, gy = np.meshgrid(steps, steps)
+        self.grid = np.stack([gx.ravel(), gy.ravel()], axis=1)
+        
+        self.prev_gray: Optional[np.ndarray] = None
+        self.scale = 1.0  # frame reduzido / frame original
+        self.detections: Optional[DetectionBatch] = None
+        self.since_keyframe = 0
+        
+        # Estatísticas
+        self.keyframes = 0
+        self.propagated = 0
+        self.fallbacks = 0  # propagações recusadas por baixa confiança
+        self.last_confidence = 0.0  # fração de caixas acompanhadas na última propagação
+    
+    def _gray(self, frame: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        self.scale = min(1.0, self.width / w)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        if self.scale < 1.0:
+            size = (self.width, max(1, int(round(h * self.scale))))
+            gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+        return gray
+    
+    def keyframe(self, frame: np.ndarray, detections: DetectionBatch):
+        """Frame com detecção completa: passa a ser a origem da propagação"""
+        self.prev_gray = self._gray(frame)
+        self.detections = detections
+        self.since_keyframe = 0
+        self.keyframes += 1
+    
+    def reset(self):
+        """Força detecção completa no próximo frame"""
+        self.prev_gray = None
+        self.detections = None
+    
+    def propagate(self, frame: np.ndarray) -> Optional[DetectionBatch]:
+        """
+        Caixas da última detecção movidas para este frame
+        
+        None = hora de um keyframe (intervalo cumprido, sem origem ou
+        confiança baixa); o chamador roda a detecção e chama keyframe().
+        """
+        if self.detections is None or self.since_keyframe + 1 >= self.keyframe_interval:
+            return None
+        
+        gray = self._gray(frame)
+        if gray.shape != self.prev_gray.shape:
+            return None
+        
+        detections = self.detections
+        if len(detections) > 0:
+            moved = self._flow(gray, detections.xyxy, frame.shape[:2])
+            if moved is None:
+                self.fallbacks += 1
+                return None
+            xyxy, tracked = moved
+            detections = DetectionBatch(
+                xyxy=xyxy[tracked],
+                conf=detections.conf[tracked],
+                cls=detections.cls[tracked],
+                ids=detections.ids[tracked],
+                prefix=detections.prefix
+            )
+        
+        self.prev_gray = gray
+        self.detections = detections
+        self.since_keyframe += 1
+        self.propagated += 1
+        return detections
+    
+    def _flow(
+        self,
+        gray: np.ndarray,
+        xyxy: np.ndarray,
+        shape: Tuple[int, int]
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Novas caixas (N, 4) e máscara das acompanhadas, ou None se a confiança é baixa"""
+        boxes = xyxy.astype(np.float32) * self.scale
+        n, m = len(boxes), len(self.grid)
+        
+        # Pontos da grade de cada caixa: (N * m, 1, 2)
+        origin = boxes[:, None, :2]
+        size = (boxes[:, 2:] - boxes[:, :2])[:, None, :]
+        p0 = (origin + size * self.grid[None]).reshape(-1, 1, 2)
+        
+        lk = dict(winSize=(15, 15), maxLevel=2)
+        p1, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, p0, None, **lk)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, self.prev_gray, p1, None, **lk)
+        
+        error = np.linalg.norm((p0 - back).reshape(n, m, 2), axis=2)
+        valid = (status.reshape(n, m) == 1) & (back_status.reshape(n, m) == 1) & (error < config.flow_fb_threshold)
+        tracked = valid.sum(axis=1) >= config.flow_min_points
+        
+        self.last_confidence = float(tracked.mean())
+        if self.last_confidence < config.flow_min_tracked:
+            return None
+        
+        p0 = p0.reshape(n, m, 2)[tracked]
+        p1 = p1.reshape(n, m, 2)[tracked]
+        valid = valid[tracked]
+        
+        # Medianas só dos pontos válidos (inválidos viram NaN)
+        p0 = np.where(valid[..., None], p0, np.nan)
+        p1 = np.where(valid[..., None], p1, np.nan)
+        shift = np.nanmedian(p1 - p0, axis=1)
+        c0 = np.nanmedian(p0, axis=1, keepdims=True)
+        c1 = np.nanmedian(p1, axis=1, keepdims=True)
+        d0 = np.linalg.norm(p0 - c0, axis=2)
+        d1 = np.linalg.norm(p1 - c1, axis=2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratio = np.where(d0 > 1.0, d1 / d0, np.nan)
+        scale = np.ones(len(ratio), dtype=np.float32)
+        measured = np.isfinite(ratio).any(axis=1)
+        if measured.any():
+            scale[measured] = np.clip(np.nanmedian(ratio[measured], axis=1), 0.8, 1.25)
+        
+        kept = boxes[tracked]
+        center = (kept[:, :2] + kept[:, 2:]) / 2 + shift
+        half = (kept[:, 2:] - kept[:, :2]) / 2 * scale[:, None]
+        moved = np.concatenate([center - half, center + half], axis=1) / self.scale
+        
+        h, w = shape
+        moved = np.clip(np.round(moved), 0, [w - 1, h - 1, w - 1, h - 1]).astype(np.int32)
+        out = xyxy.copy()
+        out[tracked] = moved
+        return out, tracked
+    
+    @property
+    def propagation_rate(self) -> float:
+        total = self.keyframes + self.propagated
+        return self.propagated / total if total else 0.0
+
+
+# ============================================================================
+# BARRAMENTO DE RESULTADOS
+# ============================================================================
+
+class ResultBus:
+    """
+    Entrega resultados das câmeras para a thread de envio sem nunca bloquear
+    
+    Contagens são estado: cada (curral, câmera) tem no máximo uma pendente e
+    uma nova contagem substitui a anterior no mesmo lugar da fila (só a
+    mais recente interessa). Pesos são eventos: entram em ordem e nunca são
+    descartados pelo barramento. Acima de capacity itens pendentes o
+    resultado vai para on_overflow (outbox em disco). Com o envio lento, as
+    contagens ficam menos frequentes em vez de a captura parar.
+    """
+    
+    QUEUED = 'queued'
+    COALESCED = 'coalesced'
+    OVERFLOWED = 'overflowed'
+    
+    def __init__(self, capacity: Optional[int] = None, on_overflow: Optional[Callable[[Dict], None]] = None):
+        self.capacity = capacity or config.queue_size
+        self.on_overflow = on_overflow
+        
+        self._cond = threading.Condition()
+        self._pending: OrderedDict = OrderedDict()  # chave -> resultado, em ordem de chegada
+        self._seq = 0
+        self.listener: Optional[Callable[[], None]] = None  # avisado a cada item novo (runtime assíncrono)
+        
+        # Estatísticas
+        self.published = 0
+        self.coalesced = 0
+        self.overflowed = 0
+        self.delivered = 0
+    
+    @staticmethod
+    def key(result: Dict) -> Optional[Tuple]:
+        """Chave de coalescência; None = evento que nunca é substituído"""
+        if result.get('type') == 'count':
+            return ('count', result.get('pen_id'), result.get('camera_id'))
+        return None
+    
+    def publish(self, result: Dict) -> str:
+        """Publica sem bloquear; retorna QUEUED, COALESCED ou OVERFLOWED"""
+        key = self.key(result)
+        with self._cond:
+            self.published += 1
+            if key is not None and key in self._pending:
+                self._pending[key] = result
+                self.coalesced += 1
+                return self.COALESCED
+            
+            queued = len(self._pending) < self.capacity
+            if queued:
+                if key is None:
+                    self._seq += 1
+                    key = ('event', self._seq)
+                self._pending[key] = result
+                self._cond.notify()
+            else:
+                self.overflowed += 1
+        
+        if queued:
+            if self.listener is not None:
+                self.listener()
+            return self.QUEUED
+        
+        # Fora do lock: o outbox faz I/O em disco
+        if self.on_overflow is not None:
+            self.on_overflow(result)
+        else:
+            logger.warning(f"Barramento de resultados cheio: resultado {result.get('type')} descartado")
+        return self.OVERFLOWED
+    
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Próximo resultado por ordem de chegada, ou None se o tempo esgotou"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._pending, timeout=timeout):
+                return None
+            _, result = self._pending.popitem(last=False)
+            self.delivered += 1
+            return result
+    
+    def qsize(self) -> int:
+        with self._cond:
+            return len(self._pending)
+    
+    def get_stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                'pending': len(self._pending),
+                'published': self.published,
+                'coalesced': self.coalesced,
+                'overflowed': self.overflowed,
+                'delivered': self.delivered,
+            }
+
+
+# ============================================================================
+# PROCESSADOR DE CÂMERA
+# ============================================================================
+
+class CameraProcessor:
+    """
+    Processa stream de uma câmera individual
+    """
+    
+    # Versões de ROI crescentes no processo: o cache de ROI dos workers de
+    # inferência nunca confunde uma ROI nova com a anterior
+    _roi_versions = itertools.count(1)
+    
+    def __init__(
+        self,
+        camera_config: CameraConfig,
+        detector: Any,
+        weight_estimator: WeightEstimator,
+        result_bus: ResultBus,
+        scheduler: Optional[InferenceScheduler] = None
+    ):
+        self.config = camera_config
+        self.detector = detector
+        self.weight_estimator = weight_estimator
+        self.result_bus = result_bus
+        self.scheduler = scheduler
+        if scheduler is not None:
+            scheduler.register(camera_config)
+        self.coalesced = 0  # contagens substituídas antes do envio
+        self.overflowed = 0  # desviadas para o outbox com o barramento cheio
+        
+        # Rótulos das métricas desta câmera
+        self.metric_labels: MetricLabels = self._metric_labels()
+        self.reconnects = 0
+        self.connect_failures = 0
+        self._connected_once = False
+        
+        # Partida (time.monotonic()): início, primeiro frame e primeiro resultado
+        self.started_at: Optional[float] = None
+        self.first_frame_at: Optional[float] = None
+        self.first_result_at: Optional[float] = None
+        self._capture_totals: Dict[str, int] = dict.fromkeys(FrameGrabber.CAPTURE_COUNTERS, 0)
+        
+        self.cap: Optional[cv2.VideoCapture] = None
+        self.grabber: Optional[FrameGrabber] = None
+        self.status = CameraStatus.OFFLINE
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        
+        # Contagem
+        self.count_history: List[int] = []
+        self.last_count_time = 0
+        self.last_raw_count = 0
+        
+        # Rastreamento
+        self.tracker: Optional[CattleTracker] = CattleTracker() if config.tracking_enabled else None
+        self.last_detection_time = 0.0
+        
+        # Gate de movimento: reaproveita a última detecção em cena parada
+        self.motion_gate: Optional[MotionGate] = MotionGate() if config.motion_gate_enabled else None
+        self.last_raw_detections: Optional[DetectionBatch] = None
+        
+        # Keyframes: detecção completa a cada N frames, fluxo óptico entre eles
+        self.propagator: Optional[FlowPropagator] = (
+            FlowPropagator() if config.flow_keyframe_interval > 1 else None
+        )
+        
+        # Peso
+        self.last_weight_time = 0
+        # Zona de gatilho; com weigh_pass_enabled, também as passagens
+        self.weigh_pass: Optional[WeighPassDetector] = None
+        if camera_config.weigh_station_id:
+            self.weigh_pass = WeighPassDetector(camera_config.roi_config)
+        
+        # Latência captura -> resultado (segundos)
+        self.latencies: deque = deque(maxlen=1000)
+        self.frames_processed = 0
+        
+        # Homografia imagem -> chão do curral (metros), para fusão entre câmeras
+        self.homography: Optional[np.ndarray] = None  # já na escala do frame recebido
+        self._homography_config: Optional[np.ndarray] = None  # como veio em roi_config
+        self.source_size: Optional[Tuple[int, int]] = None  # resolução nativa do stream aberto
+        
+        # ROI
+        self.roi: Optional[ROIRegion] = None
+        self.roi_mask: Optional[np.ndarray] = None
+        self._setup_roi()
+        
+        # Nova configuração do backend, aplicada entre dois frames
+        self._config_lock = threading.Lock()
+        self._pending_config: Optional[CameraConfig] = None
+    
+    def _metric_labels(self) -> MetricLabels:
+        return (
+            ('camera', str(self.config.id)),
+            ('pen', str(self.config.pen_id or '')),
+            ('station', str(self.config.weigh_station_id or '')),
+        )
+    
+    def _setup_roi(self):
+        """(Re)configura ROI e homografia; máscara e escala saem quando tivermos o tamanho do frame"""
+        self.roi = None
+        self.roi_mask = None
+        self.homography = None
+        self._homography_config = None
+        if self.config.roi_config and self.config.roi_config.get('homography'):
+            self._homography_config = np.array(self.config.roi_config['homography'], dtype=np.float64).reshape(3, 3)
+    
+    # Mudanças que exigem reabrir o stream
+    STREAM_FIELDS = ('rtsp_url', 'substream_url', 'type', 'capture_backend', 'capture_width', 'keyframe_only')
+    
+    @property
+    def target_config(self) -> CameraConfig:
+        """Configuração que a câmera terá após aplicar o que está pendente"""
+        with self._config_lock:
+            return self._pending_config or self.config
+    
+    def reconfigure(self, camera_config: CameraConfig):
+        """
+        Troca a configuração sem recriar o processador
+        
+        A troca acontece na thread de processamento, entre dois frames. O
+        stream só é reaberto se URL/backend mudou; ROI, homografia e zona de
+        pesagem são reconstruídas no lugar.
+        """
+        with self._config_lock:
+            self._pending_config = camera_config
+        if not self.running:
+            self._apply_pending_config()
+    
+    def _apply_pending_config(self):
+        with self._config_lock:
+            new, self._pending_config = self._pending_config, None
+        if new is None:
+            return
+        
+        changed = [f.name for f in fields(CameraConfig) if getattr(self.config, f.name) != getattr(new, f.name)]
+        if not changed:
+            return
+        self.config = new
+        
+        if any(name in self.STREAM_FIELDS for name in changed):
+            # O loop reconecta com a nova URL
+            self.disconnect()
+        
+        if 'roi_config' in changed:
+            self._setup_roi()
+            if self.motion_gate is not None:
+                self.motion_gate = MotionGate()
+            if self.propagator is not None:
+                self.propagator.reset()
+        
+        if 'roi_config' in changed or 'weigh_station_id' in changed:
+            self.weigh_pass = None
+            if new.weigh_station_id:
+                self.weigh_pass = WeighPassDetector(new.roi_config)
+                self.weigh_pass.source_size = self.source_size
+        
+        if 'pen_id' in changed or 'weigh_station_id' in changed:
+            self.metric_labels = self._metric_labels()
+            self.count_history.clear()
+            if self.scheduler is not None:
+                self.scheduler.register(new)
+        
+        logger.info(f"Câmera {new.name} reconfigurada: {', '.join(changed)}")
+    
+    def connect(self) -> bool:
+        """Conecta à câmera"""
+        try:
+            self._begin_connect()
+            self.attach(open_capture_with_timeout(self.config))
+            return True
+            
+        except Exception as e:
+            self._connect_failed(e)
+            return False
+    
+    def _begin_connect(self):
+        self.status = CameraStatus.CONNECTING
+        logger.info(f"Conectando à câmera {self.config.name}: {self.config.rtsp_url}")
+    
+    def _connect_failed(self, error: Exception):
+        logger.error(f"Erro ao conectar câmera {self.config.name}: {error}")
+        self.connect_failures += 1
+        self.status = CameraStatus.ERROR
+    
+    @property
+    def frame_skip(self) -> Optional[int]:
+        """frame_skip da leitura (só keyframes: usar todos)"""
+        return 1 if self.config.keyframe_only else None
+    
+    def attach(self, cap: Any, grabber: Any = None):
+        """
+        Passa a ler de um stream já aberto
+        
+        Sem grabber, o stream é drenado em thread própria (FrameGrabber); o
+        runtime assíncrono passa a sua fonte de frames.
+        """
+        if not cap.isOpened():
+            cap.release()
+            raise Exception("Não foi possível abrir o stream")
+        self.cap = cap
+        
+        # Câmera de profundidade: intrínsecos de fábrica (ou da gravação) para a estação
+        intrinsics = getattr(cap, 'intrinsics', None)
+        if intrinsics is not None and self.config.weigh_station_id:
+            self.weight_estimator.set_device_intrinsics(self.config.weigh_station_id, intrinsics)
+        
+        # Outra resolução nativa: refazer a escala da geometria no próximo frame
+        source_size = getattr(cap, 'source_size', None)
+        if source_size != self.source_size:
+            self.source_size = source_size
+            self.roi = None
+            if self.weigh_pass is not None:
+                self.weigh_pass.source_size = source_size
+                self.weigh_pass.shape = None
+        
+        self.grabber = grabber or FrameGrabber(cap, self.config.name, self.frame_skip, self.metric_labels)
+        self.grabber.start()
+        
+        if self._connected_once:
+            self.reconnects += 1
+        self._connected_once = True
+        self.status = CameraStatus.ONLINE
+        logger.info(f"Câmera {self.config.name} conectada com sucesso")
+    
+    def disconnect(self):
+        """Desconecta da câmera"""
+        if self.propagator is not None:
+            self.propagator.reset()  # o próximo frame não continua o anterior
+        if self.grabber:
+            self.grabber.stop()
+            # Manter os contadores acumulados entre reconexões
+            for key, value in self.grabber.get_stats().items():
+                if key in self._capture_totals:
+                    self._capture_totals[key] += value
+            self.grabber = None
+        if self.cap:
+            self.cap.release()
+            self.cap = None
+        self.status = CameraStatus.OFFLINE
+    
+    def start(self):
+        """Inicia processamento em thread separada"""
+        if self.running:
+            return
+        
+        self.running = True
+        self.started_at = time.monotonic()
+        self.thread = threading.Thread(target=self._process_loop, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        """Para o processamento"""
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=5)
+        self.disconnect()
+    
+    def _process_loop(self):
+        """Loop principal de processamento"""
+        reconnect_attempts = 0
+        
+        while self.running:
+            try:
+                if self._pending_config is not None:
+                    self._apply_pending_config()
+                
+                # Reconectar se necessário (espera curta no começo: câmeras ligam depois do agente)
+                if self.status != CameraStatus.ONLINE:
+                    if not self.connect():
+                        backoff = config.camera_reconnect_backoff * 2 ** reconnect_attempts
+                        reconnect_attempts += 1
+                        time.sleep(min(config.camera_reconnect_interval, backoff))
+                        continue
+                    reconnect_attempts = 0
+                
+                # Modelo ainda carregando em segundo plano: o stream já fica aberto
+                if not self.detector.wait_ready(0.5):
+                    continue
+                
+                # Descarte de carga: esperar a vez sem ler nem decodificar o frame
+                delay = self.admission_delay()
+                if delay > 0:
+                    time.sleep(min(delay, 0.5))
+                    continue
+                
+                # Aguardar o frame mais recente (frame_skip aplicado na captura)
+                frame, captured_at = self.grabber.read()
+                if frame is None:
+                    logger.warning(f"Falha ao ler frame da câmera {self.config.name}")
+                    self.disconnect()
+                    self.status = CameraStatus.ERROR
+                    continue
+                
+                self._handle_frame(frame, self.grabber.depth, captured_at)
+                
+            except Exception as e:
+                logger.error(f"Erro no loop de processamento: {e}")
+                # Liberar captura e grabber antes de reconectar (senão ficam abertos)
+                try:
+                    self.disconnect()
+                except Exception as close_error:
+                    logger.error(f"Erro ao desconectar câmera {self.config.name}: {close_error}")
+                self.status = CameraStatus.ERROR
+                time.sleep(1)
+    
+    def _handle_frame(self, frame: np.ndarray, depth_frame: Optional[np.ndarray], captured_at: float):
+        """Processa um frame lido e registra a latência captura -> resultado"""
+        if self.first_frame_at is None:
+            self.first_frame_at = time.monotonic()
+        
+        with metrics.time('frame', self.metric_labels):
+            self._process_frame(frame, depth_frame)
+        latency = time.monotonic() - captured_at
+        self.latencies.append(latency)
+        self.frames_processed += 1
+        if self.scheduler is not None:
+            self.scheduler.record(self.config.id, latency)
+    
+    def admission_delay(self) -> float:
+        """Segundos até o agendador liberar o próximo frame (0 = já)"""
+        if self.scheduler is None:
+            return 0.0
+        return self.scheduler.admit(self.config.id)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna contadores de captura e latência captura -> resultado"""
+        stats: Dict[str, Any] = self.grabber.get_stats() if self.grabber else {}
+        for key, total in self._capture_totals.items():
+            stats[key] = stats.get(key, 0) + total
+        latencies = list(self.latencies)
+        if latencies:
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            stats['latency_p50_ms'] = float(p50) * 1000
+            stats['latency_p95_ms'] = float(p95) * 1000
+            stats['latency_p99_ms'] = float(p99) * 1000
+            stats['latency_max_ms'] = max(latencies) * 1000
+        stats['frames_processed'] = self.frames_processed
+        if self.weigh_pass is not None and config.weigh_pass_enabled:
+            stats['weigh_passes'] = self.weigh_pass.completed
+            stats['weigh_passes_discarded'] = self.weigh_pass.discarded
+        stats['coalesced'] = self.coalesced
+        stats['overflowed'] = self.overflowed
+        stats['reconnects'] = self.reconnects
+        stats['connect_failures'] = self.connect_failures
+        if self.started_at is not None and self.first_result_at is not None:
+            stats['first_result_s'] = self.first_result_at - self.started_at
+        if self.scheduler is not None:
+            stats.update(self.scheduler.camera_stats(self.config.id))
+        if self.propagator is not None:
+            stats['flow_keyframes'] = self.propagator.keyframes
+            stats['flow_propagated'] = self.propagator.propagated
+            stats['flow_fallbacks'] = self.propagator.fallbacks
+            stats['flow_propagation_rate'] = self.propagator.propagation_rate
+        if self.motion_gate is not None:
+            stats['motion_gate_checks'] = self.motion_gate.checks
+            stats['motion_gate_hits'] = self.motion_gate.hits
+            stats['motion_gate_hit_rate'] = self.motion_gate.hit_rate
+        stats['status'] = self.status.value
+        return stats
+    
+    def _process_frame(self, frame: np.ndarray, depth_frame: Optional[np.ndarray] = None):
+        """Processa um frame individual (com o frame de profundidade alinhado, se houver)"""
+        current_time = time.time()
+        
+        # Criar ROI se necessário (uma vez por resolução)
+        if self.config.roi_config and (self.roi is None or self.roi.shape != frame.shape[:2]):
+            self._create_roi_mask(frame.shape[:2])
+        
+        # Detectar animais (ou apenas extrapolar as trilhas entre inferências)
+        if self._should_extrapolate(current_time):
+            with metrics.time('tracking', self.metric_labels):
+                detections = self.tracker.predict(current_time)
+        else:
+            if self._scene_unchanged(frame, current_time):
+                # Cena parada: reaproveitar as detecções da última inferência
+                detections = self.last_raw_detections
+            else:
+                detections = self._propagate(frame)
+                if detections is None:
+                    # Inclui a espera pelo lote compartilhado
+                    with metrics.time('detect', self.metric_labels):
+                        detections = self.detector.detect_array(
+                            frame,
+                            self.roi,
+                            camera_id=self.config.id,
+                            imgsz=self.scheduler.imgsz(self.config.id) if self.scheduler is not None else None
+                        )
+                    if self.propagator is not None:
+                        self.propagator.keyframe(frame, detections)
+                self.last_raw_detections = detections
+                self.last_raw_count = int((detections.conf >= config.detection_confidence).sum())
+            
+            self.last_detection_time = current_time
+            if self.tracker is not None:
+                with metrics.time('tracking', self.metric_labels):
+                    detections = self.tracker.update(detections, current_time)
+        
+        # Processar contagem (se câmera de curral)
+        if self.config.pen_id and current_time - self.last_count_time >= config.count_interval:
+            with metrics.time('count', self.metric_labels):
+                self._process_count(detections, current_time)
+        
+        # Processar peso (se câmera de pesagem)
+        if self.weigh_pass is not None and config.weigh_pass_enabled:
+            with metrics.time('weigh_pass', self.metric_labels):
+                completed = self.weigh_pass.update(detections, frame, current_time, depth_frame)
+            for weigh_pass in completed:
+                with metrics.time('weight', self.metric_labels):
+                    self._process_pass(weigh_pass)
+        elif self.weigh_pass is not None and current_time - self.last_weight_time >= config.weight_trigger_cooldown:
+            with metrics.time('weight', self.metric_labels):
+                self._process_weight(detections, frame, current_time, depth_frame)
+    
+    def _scene_unchanged(self, frame: np.ndarray, current_time: float) -> bool:
+        """Consulta o gate de movimento (só reaproveita se já houver uma detecção)"""
+        if self.motion_gate is None:
+            return False
+        with metrics.time('motion_gate', self.metric_labels):
+            infer = self.motion_gate.should_infer(frame, self.roi_mask, current_time)
+        return not infer and self.last_raw_detections is not None
+    
+    def _propagate(self, frame: np.ndarray) -> Optional[DetectionBatch]:
+        """Caixas do keyframe movidas por fluxo óptico (None = rodar a detecção)"""
+        if self.propagator is None:
+            return None
+        with metrics.time('propagate', self.metric_labels):
+            return self.propagator.propagate(frame)
+    
+    def _should_extrapolate(self, current_time: float) -> bool:
+        """
+        No modo 'extrapolate', câmeras apenas de curral rodam a detecção a
+        cada pen_detection_interval e usam as trilhas preditas no intervalo
+        """
+        return (
+            self.tracker is not None
+            and config.tracker_mode == 'extrapolate'
+            and self.config.pen_id is not None
+            and not self.config.weigh_station_id
+            and current_time - self.last_detection_time < config.pen_detection_interval
+        )
+    
+    def _create_roi_mask(self, shape: Tuple[int, int]):
+        """Cria máscara de ROI, retângulos de inferência e homografia para esta resolução"""
+        sx, sy = geometry_scale(self.config.roi_config, shape, self.source_size)
+        self.roi = ROIRegion.from_config(shape, self.config.roi_config, (sx, sy))
+        self.roi.version = next(CameraProcessor._roi_versions)
+        self.roi_mask = self.roi.mask
+        if self._homography_config is not None:
+            # A homografia recebe pixels da referência: desfazer a escala do frame antes
+            self.homography = self._homography_config @ np.diag([1.0 / sx, 1.0 / sy, 1.0])
+    
+    def _process_count(self, detections: DetectionBatch, current_time: float):
+        """Processa contagem de animais"""
+        count = self.last_raw_count
+        
+        # Adicionar ao histórico para suavização
+        self.count_history.append(count)
+        if len(self.count_history) > config.count_smoothing_window:
+            self.count_history.pop(0)
+        
+        if self.tracker is not None:
+            # Trilhas confirmadas já absorvem oclusões e falhas pontuais
+            smoothed_count = self.tracker.confirmed_count()
+        else:
+            # Calcular média móvel
+            smoothed_count = int(np.median(self.count_history))
+        
+        # Calcular confiança média
+        avg_confidence = detections.mean_confidence()
+        
+        # Enviar resultado
+        result = {
+            'type': 'count',
+            'camera_id': self.config.id,
+            'pen_id': self.config.pen_id,
+            'count': smoothed_count,
+            'raw_count': count,
+            'confidence': avg_confidence,
+            'timestamp': datetime.utcnow().isoformat(),
+            'created_at': time.monotonic(),
+            'detections': detections.to_json()
+        }
+        
+        # Posição dos animais no chão (pé da caixa), para deduplicar entre câmeras
+        if self.homography is not None:
+            feet = np.stack([detections.centers[:, 0], detections.xyxy[:, 3]], axis=1)
+            result['ground_points'] = project_to_ground(self.homography, feet).tolist()
+        
+        self._publish(result)
+        self.last_count_time = current_time
+        
+        logger.debug(f"Câmera {self.config.name}: {smoothed_count} animais detectados")
+    
+    def _publish(self, result: Dict):
+        """Publica um resultado sem nunca bloquear a câmera"""
+        started = time.perf_counter()
+        if self.first_result_at is None:
+            self.first_result_at = time.monotonic()
+        outcome = self.result_bus.publish(result)
+        if outcome == ResultBus.COALESCED:
+            self.coalesced += 1
+        elif outcome == ResultBus.OVERFLOWED:
+            self.overflowed += 1
+        metrics.observe('enqueue', time.perf_counter() - started, self.metric_labels)
+    
+    def _process_weight(
+        self,
+        detections: DetectionBatch,
+        frame: np.ndarray,
+        current_time: float,
+        depth_frame: Optional[np.ndarray] = None
+    ):
+        """Processa estimativa de peso (sem passagens: um peso por weight_trigger_cooldown)"""
+        # Só animais na zona de gatilho, a mesma usada pelas passagens
+        detections = detections.select(self.weigh_pass.in_zone(detections, frame.shape[:2]))
+        if not len(detections):
+            return
+        
+        # Pegar a detecção mais central/confiante
+        best_detection = detections.detection(int(np.argmax(detections.conf * detections.areas)))
+        
+        # Estimar peso
+        station_id = self.config.weigh_station_id
+        weight, confidence, calibration_version = self.weight_estimator.estimate(
+            station_id,
+            best_detection,
+            frame,
+            depth_frame=depth_frame,
+            scale_reference=None
+        )
+        
+        # Enviar resultado
+        result = {
+            'type': 'weight',
+            'station_id': station_id,
+            'camera_id': self.config.id,
+            'estimated_kg': weight,
+            'confidence': confidence,
+            'calibration_version': calibration_version,
+            'timestamp': datetime.utcnow().isoformat(),
+            'created_at': time.monotonic(),
+            'detection': {
+                'id': best_detection.id,
+                'bbox': best_detection.bbox,
+                'confidence': best_detection.confidence
+            }
+        }
+        
+        self._publish(result)
+        self.last_weight_time = current_time
+        
+        logger.info(f"Peso estimado: {weight:.1f}kg (confiança: {confidence:.2f})")
+    
+    def _process_pass(self, weigh_pass: WeighPass):
+        """Estima o peso de uma passagem a partir dos melhores recortes"""
+        station_id = self.config.weigh_station_id
+        best = weigh_pass.best(config.weigh_best_frames)
+        
+        candidates = [c for _, _, c in best]
+        has_depth = all(c.depth is not None for c in candidates)
+        
+        # Todos os recortes avaliados de uma vez, com a mesma versão de calibração
+        weights, confidences, calibration_version = self.weight_estimator.estimate_batch(
+            station_id,
+            [Detection(id=f"pass-{weigh_pass.id}", bbox=c.bbox, confidence=c.confidence) for c in candidates],
+            [c.crop for c in candidates],
+            depth_frames=[c.depth for c in candidates] if has_depth else None,
+            intrinsics=[
+                self.weight_estimator.intrinsics_for(station_id, c.frame_shape).cropped(*c.origin)
+                for c in candidates
+            ] if has_depth else None
+        )
+        
+        # Recortes sem profundidade suficiente ficam de fora
+        measured = ~np.isnan(weights)
+        estimates = [
+            (float(w), float(c), score)
+            for (score, _, _), w, c, ok in zip(best, weights, confidences, measured) if ok
+        ]
+        weights, confidences = weights[measured], confidences[measured]
+        
+        weight = float(np.median(weights))
+        # Estimativas discordantes reduzem a confiança
+        spread = float(np.ptp(weights) / weight) if weight > 0 else 1.0
+        confidence = float(np.mean(confidences)) * (1.0 - min(0.5, spread))
+        
+        best_candidate = candidates[int(np.argmax(measured))]
+        result = {
+            'type': 'weight',
+            'station_id': station_id,
+            'camera_id': self.config.id,
+            'estimated_kg': weight,
+            'confidence': confidence,
+            'calibration_version': calibration_version,
+            'timestamp': datetime.utcnow().isoformat(),
+            'created_at': time.monotonic(),
+            'detection': {
+                'id': f"pass-{weigh_pass.id}",
+                'bbox': best_candidate.bbox,
+                'confidence': best_candidate.confidence
+            },
+            'pass': {
+                'trackId': weigh_pass.id,
+                'frames': weigh_pass.frames,
+                'durationS': round(weigh_pass.last_seen - weigh_pass.started_at, 2),
+                'crossedLine': weigh_pass.crossed,
+                'estimates': [
+                    {'kg': round(w, 1), 'confidence': round(c, 3), 'quality': round(q, 3)}
+                    for w, c, q in estimates
+                ]
+            }
+        }
+        
+        self._publish(result)
+        self.last_weight_time = time.time()
+        
+        logger.info(
+            f"Passagem {weigh_pass.id}: {weight:.1f}kg (confiança: {confidence:.2f}, "
+            f"{len(estimates)} de {weigh_pass.frames} frames)"
+        )
+
+
+# ============================================================================
+# FUSÃO MULTI-CÂMERA POR CURRAL
+# ============================================================================
+
+def project_to_ground(homography: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """Projeta pontos de imagem (N, 2) no plano do chão com a homografia 3x3"""
+    if len(points) == 0:
+        return np.zeros((0, 2))
+    pts = np.hstack([points.astype(np.float64), np.ones((len(points), 1))])
+    projected = pts @ homography.T
+    return projected[:, :2] / projected[:, 2:3]
+
+
+def count_unique_ground_points(points: np.ndarray, camera_ids: np.ndarray, radius: float) -> int:
+    """
+    Conta animais distintos vistos por várias câmeras sobrepostas
+    
+    Pontos de câmeras diferentes a menos de radius metros são o mesmo animal
+    (componentes conexos); pontos da mesma câmera nunca são unidos.
+    """
+    n = len(points)
+    if n == 0:
+        return 0
+    
+    diff = points[:, None, :] - points[None, :, :]
+    close = (diff ** 2).sum(axis=2) <= radius ** 2
+    close &= camera_ids[:, None] != camera_ids[None, :]
+    
+    parent = np.arange(n)
+    
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    for i, j in zip(*np.nonzero(np.triu(close, k=1))):
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[rj] = ri
+    
+    return len({find(i) for i in range(n)})
+
+
+class PenAggregator:
+    """
+    Funde as contagens das câmeras de cada curral em uma única contagem
+    
+    Guarda a leitura mais recente de cada câmera e, a cada
+    pen_fusion_interval, aplica a aggregation_rule do PenConfig (median,
+    max, sum ou principal); o backend confere a regra de cada contagem
+    fundida com a do curral. Na regra sum, se todas as câmeras com leitura
+    recente tiverem homografia para o chão do curral, os animais vistos em
+    mais de uma câmera são deduplicados e a soma passa a ser a de animais
+    distintos. Na principal, o curral só é emitido com leitura recente da
+    câmera principal.
+    
+    Com sharding, as câmeras de um curral podem estar em nós diferentes:
+    só o nó dono do curral funde (os outros entram em suppressed e mandam
+    as suas leituras por export()), recebendo as dos outros nós em
+    merge_remote().
+    """
+    
+    def __init__(
+        self,
+        pens: Optional[Dict[int, PenConfig]] = None,
+        interval: Optional[float] = None,
+        max_age: Optional[float] = None,
+        dedup_radius: Optional[float] = None
+    ):
+        self.pens: Dict[int, PenConfig] = pens if pens is not None else {}
+        self.interval = interval if interval is not None else config.pen_fusion_interval
+        self.max_age = max_age if max_age is not None else config.pen_fusion_max_age
+        self.dedup_radius = dedup_radius if dedup_radius is not None else config.pen_dedup_radius_m
+        
+        self._lock = threading.Lock()
+        self._readings: Dict[int, Dict[int, Tuple[float, Dict]]] = {}  # pen -> camera -> (t, result)
+        self._last_emit: Dict[int, float] = {}
+        self.suppressed: Set[int] = set()  # currais fundidos em outro nó
+        
+        # Estatísticas
+        self.readings_in = 0
+        self.remote_in = 0
+        self.fused_out = 0
+    
+    def handles(self, result: Dict) -> bool:
+        """Indica se o resultado deve passar pela fusão"""
+        return result.get('type') == 'count' and result.get('pen_id') in self.pens
+    
+    def update(self, result: Dict, now: Optional[float] = None):
+        """Registra a contagem mais recente de uma câmera"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._readings.setdefault(result['pen_id'], {})[result['camera_id']] = (now, result)
+            self.readings_in += 1
+    
+    def forget_camera(self, camera_id: int):
+        """Descarta as leituras de uma câmera removida ou movida de curral"""
+        with self._lock:
+            for readings in self._readings.values():
+                readings.pop(camera_id, None)
+    
+    def flush(self, now: Optional[float] = None) -> List[Dict]:
+        """Emite uma contagem fundida por curral cujo intervalo já venceu"""
+        now = time.monotonic() if now is None else now
+        fused = []
+        
+        with self._lock:
+            for pen_id, readings in self._readings.items():
+                if pen_id in self.suppressed or now - self._last_emit.get(pen_id, 0.0) < self.interval:
+                    continue
+                
+                fresh = {
+                    camera_id: result for camera_id, (t, result) in readings.items()
+                    if now - t <= self.max_age
+                }
+                if not fresh or pen_id not in self.pens:
+                    continue
+                
+                result = self._fuse(self.pens[pen_id], fresh)
+                if result is not None:
+                    fused.append(result)
+                    self._last_emit[pen_id] = now
+            
+            self.fused_out += len(fused)
+        
+        return fused
+    
+    def _fuse(self, pen: PenConfig, readings: Dict[int, Dict]) -> Optional[Dict]:
+        """Aplica a regra de agregação do curral (None: câmera principal sem leitura)"""
+        camera_ids = sorted(readings)
+        counts = np.array([readings[c]['count'] for c in camera_ids])
+        confidences = np.array([readings[c]['confidence'] for c in camera_ids], dtype=np.float64)
+        
+        rule = pen.aggregation_rule
+        primary = pen.primary_camera_id if pen.primary_camera_id in readings else None
+        
+        if rule in ('principal', 'primary'):
+            if primary is None:
+                return None
+            count = readings[primary]['count']
+            method = 'principal'
+        elif rule == 'sum' and len(camera_ids) > 1 and all('ground_points' in readings[c] for c in camera_ids):
+            # Soma sem contar duas vezes quem aparece em mais de uma câmera
+            points = [np.asarray(readings[c]['ground_points'], dtype=np.float64).reshape(-1, 2) for c in camera_ids]
+            owners = np.concatenate([np.full(len(p), c) for c, p in zip(camera_ids, points)])
+            count = count_unique_ground_points(np.vstack(points), owners, self.dedup_radius)
+            method = 'homography'
+        elif rule == 'max':
+            count = int(counts.max())
+            method = 'max'
+        elif rule == 'sum':
+            count = int(counts.sum())
+            method = 'sum'
+        else:
+            count = int(round(float(np.median(counts))))
+            method = 'median'
+        
+        return {
+            'type': 'count',
+            'pen_id': pen.id,
+            'camera_id': primary if primary is not None else camera_ids[0],
+            'count': count,
+            'confidence': float(confidences.mean()),
+            'timestamp': max(readings[c]['timestamp'] for c in camera_ids),
+            'created_at': max(readings[c].get('created_at', 0.0) for c in camera_ids),
+            'fused': True,
+            'rule': method,
+            'cameras': [
+                {
+                    'cameraId': c,
+                    'count': readings[c]['count'],
+                    'confidence': readings[c]['confidence']
+                }
+                for c in camera_ids
+            ]
+        }
+    
+    def export(self, pen_ids: Set[int], now: Optional[float] = None) -> List[Dict]:
+        """Leituras recentes das câmeras locais destes currais, para o nó que os funde"""
+        now = time.monotonic() if now is None else now
+        partials = []
+        
+        with self._lock:
+            for pen_id in pen_ids:
+                for camera_id, (t, result) in self._readings.get(pen_id, {}).items():
+                    if result.get('remote') or now - t > self.max_age:
+                        continue
+                    partial = {
+                        'penId': pen_id,
+                        'cameraId': camera_id,
+                        'count': result['count'],
+                        'confidence': result['confidence'],
+                        'capturedAt': result['timestamp'],
+                        'ageS': now - t,
+                    }
+                    if 'ground_points' in result:
+                        partial['groundPoints'] = result['ground_points']
+                    partials.append(partial)
+        
+        return partials
+    
+    def merge_remote(self, partials: List[Dict], now: Optional[float] = None):
+        """Leituras de câmeras de outros nós (a idade já vem corrigida pelo coordenador)"""
+        now = time.monotonic() if now is None else now
+        
+        with self._lock:
+            for partial in partials:
+                t = now - partial.get('ageS', 0.0)
+                readings = self._readings.setdefault(partial['penId'], {})
+                current = readings.get(partial['cameraId'])
+                if current is not None and (current[0] >= t or current[1]['timestamp'] == partial['capturedAt']):
+                    continue  # já temos esta leitura (ou uma mais nova)
+                
+                result = {
+                    'type': 'count',
+                    'pen_id': partial['penId'],
+                    'camera_id': partial['cameraId'],
+                    'count': partial['count'],
+                    'confidence': partial['confidence'],
+                    'timestamp': partial['capturedAt'],
+                    'created_at': now,
+                    'remote': partial.get('nodeId', True),
+                }
+                if 'groundPoints' in partial:
+                    result['ground_points'] = partial['groundPoints']
+                readings[partial['cameraId']] = (t, result)
+                self.remote_in += 1
+    
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'pens': len(self.pens),
+                'readings_in': self.readings_in,
+                'remote_in': self.remote_in,
+                'suppressed': len(self.suppressed),
+                'fused_out': self.fused_out,
+            }
+
+
+# ============================================================================
+# API CLIENT
+# ============================================================================
+
+class BulkIngestUnavailable(Exception):
+    """O backend não tem vision.ingestBatch (versão anterior ao envio em lote)"""
+
+
+class APIClient:
+    """Cliente para comunicação com o backend"""
+    
+    def __init__(self, base_url: str, api_key: str):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        import requests  # só o processo principal fala com o backend (workers não pagam o import)
+        self.session = requests.Session()
+        
+        # Pool de conexões do tamanho do número de envios simultâneos
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=2,
+            pool_maxsize=max(config.upload_max_in_flight, 2)
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    def send_batch(self, items: List[Dict]) -> Tuple[List[Dict], int]:
+        """
+        Envia vários resultados em uma requisição para vision.ingestBatch
+        
+        Args:
+            items: Itens no formato {'type': ..., 'data': {...}}
+            
+        Returns:
+            Tuple (itens a reenviar, bytes enviados); BulkIngestUnavailable
+            se o backend não tem o endpoint
+        """
+        body = json.dumps({'apiKey': self.api_key, 'items': items}, separators=(',', ':')).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        
+        if len(body) >= config.upload_compress_min_bytes:
+            body = gzip.compress(body, compresslevel=5)
+            headers['Content-Encoding'] = 'gzip'
+        
+        response = self.session.post(
+            f"{self.base_url}/api/trpc/vision.ingestBatch",
+            data=body,
+            headers=headers,
+            timeout=config.upload_timeout
+        )
+        
+        if response.status_code == 404:
+            raise BulkIngestUnavailable("Backend sem vision.ingestBatch")
+        
+        if response.status_code != 200:
+            logger.warning(f"Erro ao enviar lote: {response.status_code}")
+            return items, len(body)
+        
+        # O backend responde 200 também quando recusa o lote (API Key, banco fora)
+        result = response.json().get('result', {}).get('data', {})
+        if not result.get('success'):
+            logger.warning(f"Lote recusado pelo backend: {result.get('error')}")
+            return items, len(body)
+        
+        results = result.get('results') or []
+        if len(results) != len(items):
+            logger.warning(f"Resposta do lote com {len(results)} resultados para {len(items)} itens")
+            return items, len(body)
+        
+        return [item for item, item_result in zip(items, results) if self._retry(item, item_result)], len(body)
+    
+    @staticmethod
+    def _retry(item: Dict, result: Dict) -> bool:
+        """
+        O item recusado deve ser reenviado?
+        
+        Recusas definitivas (dados inválidos) vêm com retryable=false e são
+        descartadas; as demais (ex.: erro no banco) voltam para o outbox.
+        """
+        if result.get('success'):
+            return False
+        if result.get('retryable') is False:
+            logger.warning(f"{item['type']} recusado pelo backend: {result.get('error')}")
+            return False
+        return True
+    
+    def send_count(self, pen_id: int, camera_id: int, count: int, confidence: float, timestamp: str, meta: Dict = None):
+        """Envia contagem para o backend"""
+        try:
+            payload = {
+                'type': 'count',
+                'apiKey': self.api_key,
+                'data': {
+                    'penId': pen_id,
+                    'cameraId': camera_id,
+                    'count': count,
+                    'confidence': confidence,
+                    'capturedAt': timestamp,
+                    'meta': meta
+                }
+            }
+            
+            response = self.session.post(
+                f"{self.base_url}/api/trpc/vision.ingest",
+                json=payload,
+                timeout=5
+            )
+            
+            if response.status_code == 200:
+                logger.debug(f"Contagem enviada: pen={pen_id}, count={count}")
+            else:
+                logger.warning(f"Erro ao enviar contagem: {response.status_code}")
+                
+        except Exception as e:
+            logger.error(f"Erro ao enviar contagem: {e}")
+    
+    def send_weight(self, station_id: int, weight: float, confidence: float, calibration_version: int, timestamp: str, meta: Dict = None):
+        """Envia estimativa de peso para o backend"""
+        try:
+            payload = {
+                'type': 'weight',
+                'apiKey': self.api_key,
+                'data': {
+                    'stationId': station_id,
+                    'estimatedKg': weight,
+                    'confidence': confidence,
+                    'calibrationVersion': calibration_version,
+                    'capturedAt': timestamp,
+                    'meta': meta
+                }
+            }
+            
+            response = self.session.post(
+                f"{self.base_url}/api/trpc/vision.ingest",
+                json=payload,
+                timeout=5
+            )
+            
+            if response.status_code == 200:
+                logger.debug(f"Peso enviado: station={station_id}, weight={weight}kg")
+            else:
+                logger.warning(f"Erro ao enviar peso: {response.status_code}")
+                
+        except Exception as e:
+            logger.error(f"Erro ao enviar peso: {e}")
+    
+    def send_item(self, item: Dict) -> bool:
+        """
+        Envia um item {'type', 'data'} pelo endpoint individual vision.ingest
+            
+        Returns:
+            False se o item deve ser reenviado depois
+        """
+        payload = {'type': item['type'], 'apiKey': self.api_key, 'data': item['data']}
+        if item.get('dedupKey'):
+            payload['dedupKey'] = item['dedupKey']  # reenvios não podem duplicar a linha
+        
+        try:
+            response = self.session.post(
+                f"{self.base_url}/api/trpc/vision.ingest",
+                json=payload,
+                timeout=5
+            )
+            
+            if response.status_code == 200:
+                return not self._retry(item, response.json().get('result', {}).get('data', {}))
+            logger.warning(f"Erro ao enviar {item['type']}: {response.status_code}")
+            
+        except Exception as e:
+            logger.error(f"Erro ao enviar {item['type']}: {e}")
+        
+        return False
+    
+    def fetch_agent_config(self, known_hash: Optional[str] = None) -> Optional[Dict]:
+        """
+        Busca câmeras e currais do agente
+        
+        Com known_hash igual ao atual o backend responde só
+        {'hash', 'unchanged': True}.
+        """
+        params = {'apiKey': self.api_key}
+        if known_hash:
+            params['knownHash'] = known_hash
+        
+        try:
+            response = self.session.get(
+                f"{self.base_url}/api/trpc/vision.getAgentConfig",
+                params={'input': json.dumps(params)},
+                timeout=10
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                return data.get('result', {}).get('data', {}).get('data')
+            
+        except Exception as e:
+            logger.error(f"Erro ao buscar configuração do agente: {e}")
+        
+        return None
+    
+    def fetch_calibration(self, station_id: int, known_version: Optional[int] = None) -> Optional[Dict]:
+        """
+        Busca a calibração vigente de uma estação
+        
+        Com known_version igual à vigente o backend responde só
+        {'version', 'unchanged': True}, sem os parâmetros.
+        """
+        params = {'apiKey': self.api_key, 'stationId': station_id}
+        if known_version is not None:
+            params['knownVersion'] = known_version
+        
+        try:
+            response = self.session.get(
+                f"{self.base_url}/api/trpc/vision.getCalibration",
+                params={'input': json.dumps(params)},
+                timeout=10
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                return data.get('result', {}).get('data', {}).get('data')
+            
+        except Exception as e:
+            logger.error(f"Erro ao buscar calibração da estação {station_id}: {e}")
+        
+        return None
+    
+    def agent_heartbeat(
+        self,
+        node_id: str,
+        lease_seconds: float,
+        cameras: List[int],
+        partials: List[Dict],
+        leaving: bool = False
+    ) -> Optional[Dict]:
+        """
+        Renova o lease deste nó no coordenador do backend (sharding)
+            
+        Returns:
+            {'nodes': nós vivos, 'partials': leituras de curral dos outros
+            nós} ou None se o backend não respondeu
+        """
+        payload = {
+            'apiKey': self.api_key,
+            'nodeId': node_id,
+            'leaseSeconds': lease_seconds,
+            'cameras': cameras,
+            'partials': partials,
+            'leaving': leaving
+        }
+        
+        try:
+            response = self.session.post(
+                f"{self.base_url}/api/trpc/vision.agentHeartbeat",
+                json=payload,
+                timeout=5
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                return data.get('result', {}).get('data', {}).get('data')
+            logger.warning(f"Erro no heartbeat do nó {node_id}: {response.status_code}")
+            
+        except Exception as e:
+            logger.error(f"Erro no heartbeat do nó {node_id}: {e}")
+        
+        return None
+
+
+# ============================================================================
+# OUTBOX EM DISCO (OPERAÇÃO OFFLINE)
+# ============================================================================
+
+class Outbox:
+    """
+    Log segmentado append-only em disco para resultados não enviados
+    
+    Cada segmento ({seq}.log) guarda um item JSON por linha; cursor.json
+    marca até onde o backend já confirmou. Segmentos totalmente confirmados
+    são apagados, e o tamanho/idade total é limitado descartando os
+    segmentos mais antigos. Os itens levam dedupKey, então reenviar um item
+    já recebido é inofensivo.
+    """
+    
+    CURSOR_FILE = 'cursor.json'
+    
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        segment_max_bytes: Optional[int] = None,
+        max_total_bytes: Optional[int] = None,
+        max_age: Optional[float] = None
+    ):
+        self.directory = directory or config.outbox_dir
+        self.segment_max_bytes = segment_max_bytes or config.outbox_segment_bytes
+        self.max_total_bytes = max_total_bytes or config.outbox_max_bytes
+        self.max_age = max_age if max_age is not None else config.outbox_max_age
+        
+        os.makedirs(self.directory, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self.segments: List[int] = sorted(
+            int(name[:-4]) for name in os.listdir(self.directory)
+            if name.endswith('.log') and name[:-4].isdigit()
+        )
+        self._writer = None
+        self.cursor: Tuple[int, int] = self._load_cursor()
+        
+        # Estatísticas
+        self.appended = 0
+        self.discarded_bytes = 0
+        
+        if self.segments:
+            logger.info(f"Outbox com {self.pending_bytes()} bytes pendentes em {len(self.segments)} segmentos")
+    
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:012d}.log")
+    
+    def _load_cursor(self) -> Tuple[int, int]:
+        try:
+            with open(os.path.join(self.directory, self.CURSOR_FILE)) as f:
+                data = json.load(f)
+            return int(data['segment']), int(data['offset'])
+        except (OSError, ValueError, KeyError):
+            return (self.segments[0] if self.segments else 0), 0
+    
+    def _save_cursor(self):
+        path = os.path.join(self.directory, self.CURSOR_FILE)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'segment': self.cursor[0], 'offset': self.cursor[1]}, f)
+        os.replace(tmp, path)
+    
+    def append(self, items: List[Dict]):
+        """Grava itens no fim do log (não faz I/O de rede)"""
+        if not items:
+            return
+        
+        data = b''.join(
+            json.dumps(item, separators=(',', ':')).encode('utf-8') + b'\n'
+            for item in items
+        )
+        
+        with self._lock:
+            if self._writer is None:
+                seq = self.segments[-1] + 1 if self.segments else max(self.cursor[0], 0)
+                self.segments.append(seq)
+                self._writer = open(self._path(seq), 'ab')
+            
+            self._writer.write(data)
+            self._writer.flush()
+            self.appended += len(items)
+            
+            if self._writer.tell() >= self.segment_max_bytes:
+                self._writer.close()
+                self._writer = None
+            
+            self._enforce_limits()
+    
+    def read(self, max_items: int) -> Tuple[List[Dict], Tuple[int, int]]:
+        """
+        Lê até max_items a partir do cursor, em ordem de gravação
+            
+        Returns:
+            Tuple (itens, posição a passar para commit() após o envio)
+        """
+        items: List[Dict] = []
+        
+        with self._lock:
+            if self._writer is not None:
+                self._writer.flush()
+            
+            seq, offset = self.cursor
+            for segment in [s for s in self.segments if s >= seq]:
+                if segment != seq:
+                    seq, offset = segment, 0
+                
+                with open(self._path(segment), 'rb') as f:
+                    f.seek(offset)
+                    while len(items) < max_items:
+                        line = f.readline()
+                        if not line.endswith(b'\n'):
+                            break  # fim do segmento (ou linha incompleta)
+                        offset += len(line)
+                        try:
+                            items.append(json.loads(line))
+                        except ValueError:
+                            logger.warning(f"Linha corrompida ignorada no outbox (segmento {segment})")
+                
+                if len(items) >= max_items:
+                    break
+            
+            return items, (seq, offset)
+    
+    def commit(self, position: Tuple[int, int]):
+        """Confirma o envio até position e apaga segmentos já consumidos"""
+        with self._lock:
+            self.cursor = position
+            self._save_cursor()
+            
+            active = self.segments[-1] if self._writer is not None else None
+            for segment in [s for s in self.segments if s < position[0] and s != active]:
+                self._delete(segment)
+    
+    def pending_bytes(self) -> int:
+        """Bytes ainda não confirmados"""
+        total = 0
+        for segment in self.segments:
+            if segment < self.cursor[0]:
+                continue
+            try:
+                size = os.path.getsize(self._path(segment))
+            except OSError:
+                continue
+            total += size - (self.cursor[1] if segment == self.cursor[0] else 0)
+        return max(0, total)
+    
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self.pending_bytes() == 0
+    
+    def _delete(self, segment: int):
+        if self._writer is not None and segment == self.segments[-1]:
+            self._writer.close()
+            self._writer = None
+        try:
+            os.remove(self._path(segment))
+        except OSError:
+            pass
+        self.segments.remove(segment)
+    
+    def _enforce_limits(self):
+        """Descarta segmentos antigos acima do tamanho ou idade máximos"""
+        now = time.time()
+        while len(self.segments) > 1:
+            oldest = self.segments[0]
+            path = self._path(oldest)
+            try:
+                too_old = now - os.path.getmtime(path) > self.max_age
+                size = os.path.getsize(path)
+            except OSError:
+                too_old, size = True, 0
+            
+            if not too_old and self.pending_bytes() <= self.max_total_bytes:
+                break
+            
+            if oldest >= self.cursor[0]:
+                logger.warning(f"Outbox cheio ou expirado: descartando segmento {oldest} ({size} bytes)")
+                self.discarded_bytes += size
+                self.cursor = (self.segments[1], 0)
+                self._save_cursor()
+            self._delete(oldest)
+    
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+    
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'pending_bytes': self.pending_bytes(),
+                'segments': len(self.segments),
+                'appended': self.appended,
+                'discarded_bytes': self.discarded_bytes,
+            }
+
+
+# ============================================================================
+# ENVIO EM LOTE
+# ============================================================================
+
+class BatchUploader:
+    """
+    Agrupa resultados e envia em lote para vision.ingestBatch
+    
+    Um lote sai quando atinge upload_batch_size itens ou quando o item mais
+    antigo passa de upload_max_batch_age segundos. O corpo vai comprimido
+    com gzip e até upload_max_in_flight requisições rodam em paralelo sobre
+    a sessão com pool de conexões, então uma requisição lenta não segura as
+    demais. Se o backend não tiver o endpoint em lote, volta ao envio
+    individual.
+    
+    Com um Outbox, lotes que falham (ou que chegam enquanto o link está
+    fora) vão para o disco; uma thread de replay reenvia o backlog em ordem,
+    em lotes grandes, sem ocupar o último slot de envio (reservado aos
+    resultados ao vivo).
+    
+    No runtime assíncrono, run() faz o despacho e o replay como coroutines;
+    só as requisições HTTP rodam no pool de envio.
+    """
+    
+    def __init__(
+        self,
+        api_client: APIClient,
+        batch_size: Optional[int] = None,
+        max_batch_age: Optional[float] = None,
+        max_in_flight: Optional[int] = None,
+        outbox: Optional[Outbox] = None
+    ):
+        self.api_client = api_client
+        self.outbox = outbox
+        self.batch_size = max(1, batch_size or config.upload_batch_size)
+        self.max_batch_age = max_batch_age if max_batch_age is not None else config.upload_max_batch_age
+        self.max_in_flight = max(1, max_in_flight or config.upload_max_in_flight)
+        
+        self._cond = threading.Condition()
+        self.pending: List[Tuple[Dict, float]] = []  # (item, criado em time.monotonic())
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self.bulk_supported = True
+        self.online = True
+        
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        self.replay_thread: Optional[threading.Thread] = None
+        self._retry_interval = config.outbox_retry_interval
+        
+        # Runtime assíncrono: event loop que aguarda lotes e slots livres
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slot_freed: Optional[asyncio.Event] = None
+        
+        # Estatísticas
+        self._stats_lock = threading.Lock()
+        self.started_at = 0.0
+        self.sent_items = 0
+        self.sent_batches = 0
+        self.failed_items = 0
+        self.failed_batches = 0
+        self.bytes_sent = 0
+        self.spooled_items = 0
+        self.replayed_items = 0
+        self.in_flight = 0
+        self.delays: deque = deque(maxlen=2000)  # criação -> confirmação do backend
+    
+    def start(self):
+        """Inicia a thread que monta e despacha os lotes"""
+        if self.running:
+            return
+        
+        self.running = True
+        self.started_at = time.monotonic()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='upload')
+        self.thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self.thread.start()
+        
+        if self.outbox is not None:
+            self.replay_thread = threading.Thread(target=self._replay_loop, daemon=True)
+            self.replay_thread.start()
+    
+    async def run(self):
+        """Despacho e replay como coroutines (runtime assíncrono); termina ao ser cancelada"""
+        self.running = True
+        self.started_at = time.monotonic()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='upload')
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._slot_freed = asyncio.Event()
+        
+        tasks = [self._dispatch_async()]
+        if self.outbox is not None:
+            tasks.append(self._replay_async())
+        await asyncio.gather(*tasks)
+    
+    def stop(self):
+        """Envia o que restou e aguarda as requisições em andamento"""
+        self._loop = None
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        if self.thread:
+            self.thread.join(timeout=5)
+        if self.replay_thread:
+            self.replay_thread.join(timeout=config.upload_timeout + 1)
+        
+        # Esvaziar o que sobrou
+        while self.pending:
+            self._dispatch(self._take_batch())
+        
+        if self.executor:
+            self.executor.shutdown(wait=True)
+        if self.outbox is not None:
+            self.outbox.close()
+    
+    def submit(self, item: Dict, created_at: Optional[float] = None):
+        """Enfileira um item {'type', 'data'} para o próximo lote (não bloqueia)"""
+        with self._cond:
+            self.pending.append((item, created_at or time.monotonic()))
+            full = len(self.pending) >= self.batch_size
+            if full:
+                self._cond.notify()
+        if full:
+            self._notify_loop(self._wakeup)
+    
+    def _notify_loop(self, event: Optional[asyncio.Event]):
+        """Acorda uma coroutine do runtime assíncrono (chamável de qualquer thread)"""
+        loop = self._loop
+        if loop is None or event is None:
+            return
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            pass  # loop já encerrado
+    
+    def _next_batch_in(self) -> float:
+        """Segundos até o próximo lote vencer (0 = já pode sair); chamar com _cond"""
+        if len(self.pending) >= self.batch_size:
+            return 0.0
+        if self.pending:
+            return max(0.0, self.max_batch_age - (time.monotonic() - self.pending[0][1]))
+        return 1.0
+    
+    def _dispatch_loop(self):
+        """Despacha lotes por tamanho ou idade"""
+        while self.running:
+            with self._cond:
+                while self.running:
+                    wait = self._next_batch_in()
+                    if wait <= 0.0:
+                        break
+                    self._cond.wait(timeout=wait)
+                if not self.running:
+                    return
+                batch = self._take_batch()
+            
+            self._dispatch(batch)
+    
+    async def _dispatch_async(self):
+        """_dispatch_loop como coroutine: espera lote e slot sem ocupar thread"""
+        while self.running:
+            self._wakeup.clear()
+            with self._cond:
+                wait = self._next_batch_in()
+                batch = self._take_batch() if wait <= 0.0 else None
+            
+            if batch is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            if self._spool_offline(batch):
+                continue
+            while not self._slots.acquire(blocking=False):
+                self._slot_freed.clear()
+                try:
+                    await asyncio.wait_for(self._slot_freed.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+            self._submit(batch)
+    
+    def _take_batch(self) -> List[Tuple[Dict, float]]:
+        batch = self.pending[:self.batch_size]
+        del self.pending[:self.batch_size]
+        return batch
+    
+    def _dispatch(self, batch: List[Tuple[Dict, float]]):
+        """Ocupa um slot de envio (espera se todos estiverem em uso) e envia"""
+        if not batch or self._spool_offline(batch):
+            return
+        
+        self._slots.acquire()
+        self._submit(batch)
+    
+    def _spool_offline(self, batch: List[Tuple[Dict, float]]) -> bool:
+        """Sem link: direto para o disco, sem ocupar slot de envio"""
+        if self.outbox is not None and not self.online:
+            self._spool([item for item, _ in batch])
+            return True
+        return False
+    
+    def _release_slot(self):
+        self._slots.release()
+        self._notify_loop(self._slot_freed)
+    
+    def _submit(self, batch: List[Tuple[Dict, float]]):
+        """Envia no pool de envio (o slot já foi ocupado)"""
+        with self._stats_lock:
+            self.in_flight += 1
+        
+        try:
+            self.executor.submit(self._upload, batch)
+        except RuntimeError:
+            # Executor já encerrado: enviar nesta thread
+            self._upload(batch)
+    
+    def _upload(self, batch: List[Tuple[Dict, float]]):
+        """Executa o envio de um lote (roda no pool de envio)"""
+        items = [item for item, _ in batch]
+        failed, sent_bytes = items, 0
+        started = time.perf_counter()
+        
+        try:
+            failed, sent_bytes = self._send(items)
+        except Exception as e:
+            logger.error(f"Erro ao enviar lote de {len(items)} resultados: {e}")
+            
+        finally:
+            metrics.observe('upload', time.perf_counter() - started)
+            now = time.monotonic()
+            failed_ids = {id(item) for item in failed}
+            with self._stats_lock:
+                self.in_flight -= 1
+                if len(failed) < len(items):
+                    self.sent_items += len(items) - len(failed)
+                    self.sent_batches += 1
+                    self.bytes_sent += sent_bytes
+                    self.delays.extend(now - created for item, created in batch if id(item) not in failed_ids)
+                if failed:
+                    self.failed_items += len(failed)
+                    self.failed_batches += 1
+            self._release_slot()
+            
+            if failed and self.outbox is not None:
+                # Só o lote inteiro recusado indica link fora; recusas de itens voltam para o outbox
+                if len(failed) == len(items):
+                    self.online = False
+                self._spool(failed)
+    
+    def _send(self, items: List[Dict]) -> Tuple[List[Dict], int]:
+        """
+        Envia pelo endpoint em lote ou, se o backend não o tiver, item a item
+            
+        Returns:
+            Tuple (itens a reenviar, bytes enviados)
+        """
+        if self.bulk_supported:
+            try:
+                return self.api_client.send_batch(items)
+            except BulkIngestUnavailable:
+                logger.warning("Backend sem envio em lote; usando envio individual")
+                self.bulk_supported = False
+        
+        return [item for item in items if not self.api_client.send_item(item)], 0
+    
+    def _spool(self, items: List[Dict]):
+        """Guarda itens no outbox para reenvio posterior"""
+        try:
+            self.outbox.append(items)
+            with self._stats_lock:
+                self.spooled_items += len(items)
+        except OSError as e:
+            logger.error(f"Erro ao gravar {len(items)} resultados no outbox: {e}")
+    
+    def _replay_loop(self):
+        """Reenvia o backlog do outbox em ordem quando o link volta"""
+        while self.running:
+            delay = self._replay_step(slot_timeout=1.0)
+            if delay > 0:
+                time.sleep(delay)
+    
+    async def _replay_async(self):
+        """_replay_loop como coroutine: a leitura do outbox e o POST rodam no pool de envio"""
+        loop = asyncio.get_running_loop()
+        while self.running:
+            delay = await loop.run_in_executor(self.executor, self._replay_step, 0.0)
+            if delay > 0:
+                await asyncio.sleep(delay)
+    
+    def _replay_step(self, slot_timeout: float) -> float:
+        """Reenvia um lote do outbox; retorna quantos segundos esperar até o próximo"""
+        items, position = self.outbox.read(config.outbox_replay_batch_size)
+        if not items:
+            return 1.0
+        
+        # Deixar ao menos um slot livre para resultados ao vivo
+        if not self.online or self.in_flight < max(1, self.max_in_flight - 1):
+            acquired = self._slots.acquire(timeout=slot_timeout)
+        else:
+            acquired = False
+        if not acquired:
+            return 0.05
+        
+        failed = items
+        try:
+            failed, _ = self._send(items)
+        except Exception as e:
+            logger.debug(f"Replay do outbox falhou: {e}")
+        finally:
+            self._release_slot()
+        
+        if len(failed) < len(items):
+            # Backend respondeu: confirmar o lote e devolver ao outbox só os itens recusados
+            self.outbox.commit(position)
+            if failed:
+                self._spool(failed)
+            with self._stats_lock:
+                self.replayed_items += len(items) - len(failed)
+            if not self.online:
+                logger.info("Conexão com o backend restabelecida; reenviando outbox")
+            self.online = True
+            if not failed:
+                self._retry_interval = config.outbox_retry_interval
+                return 0.0
+            return self._backoff()
+        
+        if self.online:
+            logger.warning("Backend inacessível; resultados serão guardados no outbox")
+        self.online = False
+        return self._backoff()
+    
+    def _backoff(self) -> float:
+        """Espera até a próxima tentativa de replay (dobra a cada falha)"""
+        delay = self._retry_interval
+        self._retry_interval = min(self._retry_interval * 2, 60.0)
+        return delay
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Throughput de envio e percentis do atraso fim a fim"""
+        with self._stats_lock:
+            stats: Dict[str, Any] = {
+                'sent_items': self.sent_items,
+                'sent_batches': self.sent_batches,
+                'failed_items': self.failed_items,
+                'failed_batches': self.failed_batches,
+                'bytes_sent': self.bytes_sent,
+                'in_flight': self.in_flight,
+                'pending': len(self.pending),
+                'spooled_items': self.spooled_items,
+                'replayed_items': self.replayed_items,
+                'online': self.online,
+            }
+            delays = list(self.delays)
+        
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        stats['items_per_second'] = stats['sent_items'] / elapsed if elapsed > 0 else 0.0
+        stats['requests_per_second'] = stats['sent_batches'] / elapsed if elapsed > 0 else 0.0
+        
+        if delays:
+            p50, p95, p99 = np.percentile(delays, [50, 95, 99])
+            stats['delay_p50_ms'] = float(p50) * 1000
+            stats['delay_p95_ms'] = float(p95) * 1000
+            stats['delay_p99_ms'] = float(p99) * 1000
+        
+        if self.outbox is not None:
+            stats['outbox'] = self.outbox.get_stats()
+        
+        return stats
+
+
+# ============================================================================
+# SHARDING ENTRE NÓS (VÁRIOS AGENTES NA MESMA FAZENDA)
+# ============================================================================
+
+def ring_hash(key: str) -> int:
+    """Posição estável no anel (igual em todos os nós e entre execuções)"""
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Anel de hash consistente com nós virtuais
+    
+    Cada nó ocupa virtual_nodes pontos do anel; a chave pertence ao
+    primeiro ponto depois do seu hash. Quando um nó entra ou sai, só as
+    chaves dele mudam de dono (~1/N), em vez de todas.
+    """
+    
+    def __init__(self, nodes: List[str], virtual_nodes: Optional[int] = None):
+        virtual_nodes = virtual_nodes or config.shard_virtual_nodes
+        self.nodes = sorted(set(nodes))
+        points = sorted((ring_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(virtual_nodes))
+        self._hashes = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+    
+    def owner(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        i = bisect.bisect(self._hashes, ring_hash(key)) % len(self._hashes)
+        return self._owners[i]
+
+
+class LocalCoordinator:
+    """
+    Coordenador em memória com a interface de APIClient.agent_heartbeat
+    
+    Faz o papel de vision.agentHeartbeat para vários VisionAgent no mesmo
+    processo (testes e demonstração): leases, nós vivos e repasse das
+    leituras parciais de curral entre nós.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.nodes: Dict[str, Dict] = {}  # node_id -> {'expires_at', 'seen_at', 'cameras', 'partials'}
+    
+    def agent_heartbeat(
+        self,
+        node_id: str,
+        lease_seconds: float,
+        cameras: List[int],
+        partials: List[Dict],
+        leaving: bool = False
+    ) -> Optional[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            if leaving:
+                self.nodes.pop(node_id, None)
+            else:
+                self.nodes[node_id] = {
+                    'expires_at': now + lease_seconds,
+                    'seen_at': now,
+                    'cameras': list(cameras),
+                    'partials': list(partials),
+                }
+            
+            for expired in [n for n, node in self.nodes.items() if node['expires_at'] <= now]:
+                del self.nodes[expired]
+            
+            relayed = [
+                {**partial, 'nodeId': other, 'ageS': partial['ageS'] + now - node['seen_at']}
+                for other, node in self.nodes.items() if other != node_id
+                for partial in node['partials']
+            ]
+            return {'nodes': sorted(self.nodes), 'partials': relayed}
+
+
+class ShardManager:
     """
+    Divide as câmeras da fazenda entre vários agentes
     
-    def __init__(
-        self,
-        camera_config: CameraConfig,
-        detector: CattleDetector,
-        weight_estimator: WeightEstimator,
-        result_queue: queue.Queue
-    ):
-        self.config = camera_config
-        self.detector = detector
-        self.weight_estimator = weight_estimator
-        self.result_queue = result_queue
+    Cada nó renova um lease no coordenador (vision.agentHeartbeat no
+    backend, ou LocalCoordinator) a cada shard_heartbeat_interval e recebe
+    a lista de nós vivos; câmeras e currais ficam com o dono no anel de
+    hash consistente, que todos os nós calculam igual. Um nó que para de
+    renovar sai da lista após shard_lease_seconds e as suas câmeras passam
+    para os outros. Sem resposta do coordenador, o nó mantém a última
+    divisão conhecida (na partida, após shard_join_timeout, assume que está
+    sozinho) para continuar contando com a internet fora.
+    """
+    
+    def __init__(self, coordinator: Any, node_id: Optional[str] = None):
+        self.coordinator = coordinator
+        self.node_id = node_id or config.node_id
+        self.ring: Optional[HashRing] = None  # None = divisão ainda desconhecida
+        self.started_at = time.monotonic()
+        self.last_heartbeat_at: Optional[float] = None
         
-        self.cap: Optional[cv2.VideoCapture] = None
-        self.status = CameraStatus.OFFLINE
-        self.running = False
-        self.thread: Optional[threading.Thread] = None
+        # Estatísticas
+        self.heartbeats = 0
+        self.failures = 0
+        self.rebalances = 0
+    
+    @property
+    def nodes(self) -> List[str]:
+        return self.ring.nodes if self.ring is not None else []
+    
+    def owner(self, key: str) -> Optional[str]:
+        return self.ring.owner(key) if self.ring is not None else None
+    
+    def camera_owner(self, camera_id: int) -> Optional[str]:
+        return self.owner(f"camera:{camera_id}")
+    
+    def pen_owner(self, pen_id: int) -> Optional[str]:
+        """Nó que funde o curral quando as câmeras dele estão em nós diferentes"""
+        return self.owner(f"pen:{pen_id}")
+    
+    def owns_camera(self, camera_id: int) -> bool:
+        return self.camera_owner(camera_id) == self.node_id
+    
+    def heartbeat(self, cameras: List[int], partials: List[Dict]) -> Tuple[bool, List[Dict]]:
+        """
+        Renova o lease e atualiza a lista de nós
+            
+        Returns:
+            (a divisão mudou, leituras parciais de curral dos outros nós)
+        """
+        reply = self.coordinator.agent_heartbeat(
+            self.node_id, config.shard_lease_seconds, cameras, partials
+        )
         
-        # Contagem
-        self.count_history: List[int] = []
-        self.last_count_time = 0
+        if reply is None:
+            self.failures += 1
+            if self.ring is None and time.monotonic() - self.started_at >= config.shard_join_timeout:
+                logger.warning(f"Coordenador sem resposta: nó {self.node_id} assume todas as câmeras")
+                return self._set_nodes([self.node_id]), []
+            return False, []
         
-        # Peso
-        self.last_weight_time = 0
+        self.heartbeats += 1
+        self.last_heartbeat_at = time.monotonic()
+        # Lease vencido do lado do coordenador: este heartbeat já o renovou
+        nodes = list(reply.get('nodes') or []) + [self.node_id]
+        return self._set_nodes(nodes), reply.get('partials') or []
+    
+    def _set_nodes(self, nodes: List[str]) -> bool:
+        nodes = sorted(set(nodes))
+        if self.ring is not None and self.ring.nodes == nodes:
+            return False
         
-        # ROI
-        self.roi_mask: Optional[np.ndarray] = None
-        self._setup_roi()
+        self.ring = HashRing(nodes)
+        self.rebalances += 1
+        logger.info(f"Divisão de câmeras: nós {', '.join(nodes)} (este: {self.node_id})")
+        return True
     
-    def _setup_roi(self):
-        """Configura máscara de ROI se definida"""
-        if self.config.roi_config and self.config.roi_config.get('enabled'):
-            # Criar máscara será feito quando tivermos o tamanho do frame
-            pass
+    def leave(self):
+        """Sai da divisão já (parada limpa), sem esperar o lease vencer"""
+        self.coordinator.agent_heartbeat(self.node_id, config.shard_lease_seconds, [], [], leaving=True)
     
-    def connect(self) -> bool:
-        """Conecta à câmera"""
-        try:
-            self.status = CameraStatus.CONNECTING
-            logger.info(f"Conectando à câmera {self.config.name}: {self.config.rtsp_url}")
-            
-            self.cap = cv2.VideoCapture(self.config.rtsp_url)
-            
-            if not self.cap.isOpened():
-                raise Exception("Não foi possível abrir o stream")
-            
-            # Configurar buffer mínimo para baixa latência
-            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            
-            self.status = CameraStatus.ONLINE
-            logger.info(f"Câmera {self.config.name} conectada com sucesso")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Erro ao conectar câmera {self.config.name}: {e}")
-            self.status = CameraStatus.ERROR
-            return False
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'node_id': self.node_id,
+            'nodes': self.nodes,
+            'heartbeats': self.heartbeats,
+            'failures': self.failures,
+            'rebalances': self.rebalances,
+            'last_heartbeat_s': (
+                time.monotonic() - self.last_heartbeat_at if self.last_heartbeat_at is not None else None
+            ),
+        }
+
+
+# ============================================================================
+# ENDPOINT DE MÉTRICAS (PROMETHEUS)
+# ============================================================================
+
+class MetricsServer:
+    """
+    Endpoint HTTP local com as métricas do agente no formato do Prometheus
     
-    def disconnect(self):
-        """Desconecta da câmera"""
-        if self.cap:
-            self.cap.release()
-            self.cap = None
-        self.status = CameraStatus.OFFLINE
+    Os histogramas por estágio vêm do PipelineMetrics; contadores e gauges
+    (frames lidos/descartados/processados, reconexões, fila de resultados,
+    envio e inferência) são lidos dos componentes só no momento do scrape,
+    então sem scrape o custo é zero.
+    """
+    
+    def __init__(self, agent: 'VisionAgent', host: Optional[str] = None, port: Optional[int] = None):
+        self.agent = agent
+        self.host = host or config.metrics_host
+        self.port = config.metrics_port if port is None else port
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.thread: Optional[threading.Thread] = None
     
     def start(self):
-        """Inicia processamento em thread separada"""
-        if self.running:
+        """Inicia o servidor HTTP em thread própria"""
+        if self.server is not None:
             return
         
-        self.running = True
-        self.thread = threading.Thread(target=self._process_loop, daemon=True)
+        exporter = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                try:
+                    body = exporter.render().encode('utf-8')
+                except Exception as e:
+                    logger.error(f"Erro ao gerar métricas: {e}")
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass  # não poluir o log a cada scrape
+        
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            logger.error(f"Não foi possível abrir o endpoint de métricas em {self.host}:{self.port}: {e}")
+            return
+        
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
         self.thread.start()
+        logger.info(f"Métricas em http://{self.host}:{self.server.server_address[1]}/metrics")
     
     def stop(self):
-        """Para o processamento"""
-        self.running = False
-        if self.thread:
-            self.thread.join(timeout=5)
-        self.disconnect()
+        """Para o servidor"""
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
     
-    def _process_loop(self):
-        """Loop principal de processamento"""
-        frame_count = 0
-        reconnect_attempts = 0
+    def render(self) -> str:
+        """Texto completo do /metrics"""
+        lines = metrics.render_prometheus()
+        lines += self._camera_metrics()
+        lines += self._pipeline_metrics()
+        return '\n'.join(lines) + '\n'
+    
+    @staticmethod
+    def _family(name: str, kind: str, help_text: str, samples: List[Tuple[MetricLabels, float]]) -> List[str]:
+        lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        lines += [f'{name}{format_labels(labels)} {float(value):g}' for labels, value in samples]
+        return lines
+    
+    def _camera_metrics(self) -> List[str]:
+        cameras = [(p.metric_labels, p.get_stats()) for p in list(self.agent.processors.values())]
         
-        while self.running:
-            try:
-                # Reconectar se necessário
-                if self.status != CameraStatus.ONLINE:
-                    if not self.connect():
-                        reconnect_attempts += 1
-                        time.sleep(min(30, 5 * reconnect_attempts))
-                        continue
-                    reconnect_attempts = 0
-                
-                # Capturar frame
-                ret, frame = self.cap.read()
-                if not ret:
-                    logger.warning(f"Falha ao ler frame da câmera {self.config.name}")
-                    self.status = CameraStatus.ERROR
-                    continue
-                
-                frame_count += 1
-                
-                # Pular frames para performance
-                if frame_count % config.frame_skip != 0:
-                    continue
-                
-                # Processar frame
-                self._process_frame(frame)
-                
-            except Exception as e:
-                logger.error(f"Erro no loop de processamento: {e}")
-                self.status = CameraStatus.ERROR
-                time.sleep(1)
+        families = [
+            ('vision_frames_grabbed_total', 'counter', 'Frames lidos do stream', 'grabbed'),
+            ('vision_frames_decoded_total', 'counter', 'Frames decodificados', 'decoded'),
+            ('vision_frames_skipped_total', 'counter', 'Frames pulados por frame_skip', 'skipped'),
+            ('vision_frames_dropped_total', 'counter', 'Frames descartados com o consumidor ocupado', 'dropped'),
+            ('vision_frames_stale_total', 'counter', 'Frames descartados por idade', 'stale'),
+            ('vision_frame_decode_errors_total', 'counter', 'Falhas de decodificação', 'decode_errors'),
+            ('vision_frames_processed_total', 'counter', 'Frames processados', 'frames_processed'),
+            ('vision_results_coalesced_total', 'counter', 'Contagens substituídas por outra mais recente antes do envio', 'coalesced'),
+            ('vision_results_overflowed_total', 'counter', 'Resultados desviados para o outbox com o barramento cheio', 'overflowed'),
+            ('vision_camera_reconnects_total', 'counter', 'Reconexões após queda do stream', 'reconnects'),
+            ('vision_camera_connect_failures_total', 'counter', 'Tentativas de conexão que falharam', 'connect_failures'),
+            ('vision_motion_gate_hits_total', 'counter', 'Frames sem movimento que pularam a inferência', 'motion_gate_hits'),
+            ('vision_flow_propagated_total', 'counter', 'Frames com caixas propagadas por fluxo óptico (sem YOLO)', 'flow_propagated'),
+            ('vision_flow_fallbacks_total', 'counter', 'Propagações recusadas por baixa confiança (voltaram ao YOLO)', 'flow_fallbacks'),
+            ('vision_weigh_passes_total', 'counter', 'Passagens pesadas', 'weigh_passes'),
+            ('vision_weigh_passes_discarded_total', 'counter', 'Passagens descartadas (curtas ou sem cruzar a linha)', 'weigh_passes_discarded'),
+        ]
+        
+        lines = []
+        for name, kind, help_text, key in families:
+            lines += self._family(name, kind, help_text, [(labels, stats.get(key, 0)) for labels, stats in cameras])
+        lines += self._family(
+            'vision_camera_online', 'gauge', 'Câmera conectada (1) ou não (0)',
+            [(labels, int(stats.get('status') == CameraStatus.ONLINE.value)) for labels, stats in cameras]
+        )
+        lines += self._family(
+            'vision_camera_first_result_seconds', 'gauge', 'Segundos do início da câmera até o primeiro resultado',
+            [(labels, stats['first_result_s']) for labels, stats in cameras if 'first_result_s' in stats]
+        )
+        lines += self._family(
+            'vision_camera_effective_fps', 'gauge', 'Frames processados por segundo na última janela do agendador',
+            [(labels, stats['effective_fps']) for labels, stats in cameras if 'effective_fps' in stats]
+        )
+        lines += self._family(
+            'vision_camera_shed_level', 'gauge', 'Nível de descarte de carga da câmera (0 = sem descarte)',
+            [(labels, stats['shed_level']) for labels, stats in cameras if 'shed_level' in stats]
+        )
+        lines += self._family(
+            'vision_camera_deadline_misses_total', 'counter', 'Frames que estouraram o prazo captura -> resultado',
+            [(labels, stats['deadline_misses']) for labels, stats in cameras if 'deadline_misses' in stats]
+        )
+        return lines
     
-    def _process_frame(self, frame: np.ndarray):
-        """Processa um frame individual"""
-        current_time = time.time()
+    def _pipeline_metrics(self) -> List[str]:
+        agent = self.agent
+        lines = self._family(
+            'vision_result_queue_depth', 'gauge', 'Resultados aguardando envio no barramento',
+            [((), agent.result_bus.qsize())]
+        )
+        lines += self._family(
+            'vision_startup_seconds', 'gauge', 'Segundos da partida do processo até o marco',
+            [
+                ((('milestone', name[:-len('_s')]),), value)
+                for name, value in agent.get_startup_stats().items() if value is not None
+            ]
+        )
         
-        # Criar máscara ROI se necessário
-        if self.roi_mask is None and self.config.roi_config:
-            self._create_roi_mask(frame.shape[:2])
+        upload = agent.uploader.get_stats()
+        lines += self._family('vision_upload_items_total', 'counter', 'Resultados enviados/falhos', [
+            ((('status', 'sent'),), upload['sent_items']),
+            ((('status', 'failed'),), upload['failed_items']),
+        ])
+        lines += self._family('vision_upload_requests_total', 'counter', 'Requisições de envio', [
+            ((('status', 'sent'),), upload['sent_batches']),
+            ((('status', 'failed'),), upload['failed_batches']),
+        ])
+        lines += self._family('vision_upload_bytes_total', 'counter', 'Bytes enviados', [((), upload['bytes_sent'])])
+        lines += self._family('vision_upload_in_flight', 'gauge', 'Requisições em andamento', [((), upload['in_flight'])])
+        lines += self._family('vision_upload_pending', 'gauge', 'Resultados aguardando lote', [((), upload['pending'])])
+        lines += self._family('vision_upload_online', 'gauge', 'Backend acessível', [((), int(upload['online']))])
+        lines += self._family(
+            'vision_outbox_items_total', 'counter', 'Resultados gravados/reenviados pelo outbox',
+            [((('op', 'spooled'),), upload['spooled_items']), ((('op', 'replayed'),), upload['replayed_items'])]
+        )
+        if 'outbox' in upload:
+            lines += self._family(
+                'vision_outbox_pending_bytes', 'gauge', 'Bytes aguardando reenvio no outbox',
+                [((), upload['outbox']['pending_bytes'])]
+            )
+        
+        if agent.shard is not None:
+            shard = agent.shard.get_stats()
+            lines += self._family('vision_shard_nodes', 'gauge', 'Nós vivos dividindo as câmeras', [((), len(shard['nodes']))])
+            lines += self._family(
+                'vision_shard_cameras', 'gauge', 'Câmeras da fazenda por dono',
+                [
+                    ((('scope', 'local'),), len(agent.processors)),
+                    ((('scope', 'cluster'),), len(agent.cluster_cameras)),
+                ]
+            )
+            lines += self._family(
+                'vision_shard_heartbeats_total', 'counter', 'Heartbeats no coordenador',
+                [((('status', 'ok'),), shard['heartbeats']), ((('status', 'failed'),), shard['failures'])]
+            )
+            lines += self._family(
+                'vision_shard_rebalances_total', 'counter', 'Mudanças na divisão de câmeras', [((), shard['rebalances'])]
+            )
         
-        # Detectar animais
-        detections = self.detector.detect(frame, self.roi_mask)
+        if agent.scheduler is not None:
+            lines += self._family(
+                'vision_inference_overloaded', 'gauge', 'Agendador descartando carga por atraso (1) ou não (0)',
+                [((), int(agent.scheduler.overloaded))]
+            )
         
-        # Processar contagem (se câmera de curral)
-        if self.config.pen_id and current_time - self.last_count_time >= config.count_interval:
-            self._process_count(detections, current_time)
+        if agent.shared_inference:
+            inference = agent.inference_service.get_stats()
+            lines += self._family('vision_inference_frames_total', 'counter', 'Frames inferidos', [((), inference['frames'])])
+            workers = [((('worker', str(w['id'])),), w) for w in inference.get('workers', [])]
+            if workers:
+                lines += self._family(
+                    'vision_inference_worker_up', 'gauge', 'Worker de inferência pronto',
+                    [(labels, int(w['ready'])) for labels, w in workers]
+                )
+                lines += self._family(
+                    'vision_inference_worker_restarts_total', 'counter', 'Reinícios do worker',
+                    [(labels, w['restarts']) for labels, w in workers]
+                )
         
-        # Processar peso (se câmera de pesagem)
-        if self.config.weigh_station_id and current_time - self.last_weight_time >= config.weight_trigger_cooldown:
-            self._process_weight(detections, frame, current_time)
+        return lines
+
+
+# ============================================================================
+# RUNTIME ASSÍNCRONO (EVENT LOOP)
+# ============================================================================
+
+class AsyncFrameSource:
+    """
+    Base das fontes de frame do runtime assíncrono
     
-    def _create_roi_mask(self, shape: Tuple[int, int]):
-        """Cria máscara de ROI"""
-        h, w = shape
-        self.roi_mask = np.zeros((h, w), dtype=np.uint8)
+    Mesmos contadores e atributos do FrameGrabber (depth, get_stats()),
+    mas read() é uma coroutine e nenhuma thread fica presa à câmera.
+    """
+    
+    def __init__(self, cap: Any, name: str, frame_skip: Optional[int] = None, labels: MetricLabels = ()):
+        self.cap = cap
+        self.name = name
+        self.labels = labels
+        self.frame_skip = max(1, frame_skip or config.frame_skip)
+        self.failed = False
+        self._since_decode = 0
         
-        if self.config.roi_config and self.config.roi_config.get('points'):
-            points = np.array(self.config.roi_config['points'], dtype=np.int32)
-            cv2.fillPoly(self.roi_mask, [points], 255)
-        else:
-            self.roi_mask[:] = 255  # Usar frame inteiro
+        self.has_depth = bool(getattr(cap, 'has_depth', False))
+        self.depth: Optional[np.ndarray] = None
+        
+        # Contadores
+        self.grabbed = 0
+        self.decoded = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.stale = 0
+        self.decode_errors = 0
     
-    def _process_count(self, detections: List[Detection], current_time: float):
-        """Processa contagem de animais"""
-        count = len(detections)
+    def start(self):
+        pass
+    
+    def stop(self):
+        self.failed = True
+    
+    async def read(self, timeout: Optional[float] = None) -> Tuple[Optional[np.ndarray], float]:
+        raise NotImplementedError
+    
+    def get_stats(self) -> Dict[str, int]:
+        stats = {key: getattr(self, key) for key in FrameGrabber.CAPTURE_COUNTERS}
+        stats['shared_memory'] = False
+        stats['depth'] = self.has_depth
+        return stats
+
+
+class PipeFrameSource(AsyncFrameSource):
+    """
+    Frames do FFmpegCapture lidos do pipe pelo próprio event loop
+    
+    stdout e stderr do FFmpeg ficam em modo não bloqueante, registrados no
+    loop (add_reader): o pipe é drenado conforme os bytes chegam, frames
+    pulados ou sem consumidor são sobrescritos no buffer e só o frame
+    pedido é copiado. A decodificação já acontece no processo do FFmpeg,
+    então a câmera não ocupa thread nenhuma.
+    """
+    
+    PIPE_SIZE = 1 << 20  # pipe maior = menos wakeups por frame (Linux)
+    
+    def __init__(self, cap: 'FFmpegCapture', name: str, frame_skip: Optional[int] = None, labels: MetricLabels = ()):
+        super().__init__(cap, name, frame_skip, labels)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.shape = (cap.height, cap.width, 3)
+        self._buffer = bytearray(cap.height * cap.width * 3)
+        self._view = memoryview(self._buffer)
+        self._filled = 0
+        self._fds: List[int] = []
+        self._waiter: Optional[asyncio.Future] = None
+    
+    def start(self):
+        """Registra os pipes no event loop (chamar de dentro do loop)"""
+        self.loop = asyncio.get_running_loop()
+        stdout = self.cap.process.stdout.fileno()
+        stderr = self.cap.process.stderr.fileno()
+        for fd in (stdout, stderr):
+            os.set_blocking(fd, False)
+        try:
+            import fcntl
+            fcntl.fcntl(stdout, fcntl.F_SETPIPE_SZ, self.PIPE_SIZE)
+        except (ImportError, AttributeError, OSError):
+            pass
         
-        # Adicionar ao histórico para suavização
-        self.count_history.append(count)
-        if len(self.count_history) > config.count_smoothing_window:
-            self.count_history.pop(0)
+        self.loop.add_reader(stdout, self._on_frame_data, stdout)
+        self.loop.add_reader(stderr, self._on_stderr, stderr)
+        self._fds = [stdout, stderr]
+    
+    def stop(self):
+        """Tira os pipes do loop antes de o FFmpeg ser encerrado (chamável de qualquer thread)"""
+        if self.loop is None or not self._fds:
+            self.failed = True
+            return
         
-        # Calcular média móvel
-        smoothed_count = int(np.median(self.count_history))
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._fail()
+            return
         
-        # Calcular confiança média
-        avg_confidence = np.mean([d.confidence for d in detections]) if detections else 0.0
+        done = threading.Event()
         
-        # Enviar resultado
-        result = {
-            'type': 'count',
-            'camera_id': self.config.id,
-            'pen_id': self.config.pen_id,
-            'count': smoothed_count,
-            'raw_count': count,
-            'confidence': avg_confidence,
-            'timestamp': datetime.utcnow().isoformat(),
-            'detections': [
-                {'id': d.id, 'bbox': d.bbox, 'confidence': d.confidence}
-                for d in detections
-            ]
-        }
+        def fail():
+            try:
+                self._fail()
+            finally:
+                done.set()
         
-        self.result_queue.put(result)
-        self.last_count_time = current_time
+        try:
+            self.loop.call_soon_threadsafe(fail)
+        except RuntimeError:
+            return  # loop já encerrado
+        done.wait(timeout=2)
+    
+    def _fail(self):
+        """Stream encerrado: sai do loop e libera quem aguarda frame"""
+        self.failed = True
+        fds, self._fds = self._fds, []
+        for fd in fds:
+            self.loop.remove_reader(fd)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result((None, 0.0))
+    
+    def _on_frame_data(self, fd: int):
+        """Lê o que houver no pipe (até EAGAIN), fechando frames inteiros"""
+        while self._fds:
+            try:
+                n = os.readv(fd, [self._view[self._filled:]])
+            except BlockingIOError:
+                return
+            except OSError:
+                n = 0
+            if not n:
+                if self.cap.stderr_lines:
+                    logger.warning(f"FFmpeg encerrou ({self.cap._redacted()}): {self.cap.stderr_lines[-1]}")
+                self._fail()
+                return
+            
+            self._filled += n
+            if self._filled == len(self._buffer):
+                self._filled = 0
+                self._frame_complete()
+    
+    def _frame_complete(self):
+        self.grabbed += 1
+        self._since_decode += 1
+        if self._since_decode < self.frame_skip:
+            self.skipped += 1
+            return
         
-        logger.debug(f"Câmera {self.config.name}: {smoothed_count} animais detectados")
+        waiter = self._waiter
+        if waiter is None or waiter.done():
+            self.dropped += 1
+            return
+        
+        with metrics.time('decode', self.labels):
+            frame = np.frombuffer(self._buffer, dtype=np.uint8).reshape(self.shape).copy()
+        self.decoded += 1
+        self._since_decode = 0
+        waiter.set_result((frame, time.monotonic()))
     
-    def _process_weight(self, detections: List[Detection], frame: np.ndarray, current_time: float):
-        """Processa estimativa de peso"""
-        if not detections:
+    def _on_stderr(self, fd: int):
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
             return
+        except OSError:
+            data = b''
+        if not data:
+            self.loop.remove_reader(fd)
+            if fd in self._fds:
+                self._fds.remove(fd)
+            return
+        for line in data.decode('utf-8', 'replace').splitlines():
+            if line.strip():
+                self.cap.stderr_lines.append(line.rstrip())
+    
+    async def read(self, timeout: Optional[float] = None) -> Tuple[Optional[np.ndarray], float]:
+        """Aguarda o próximo frame completo que passe pelo frame_skip"""
+        if self.failed:
+            return None, 0.0
         
-        # Pegar a detecção mais central/confiante
-        best_detection = max(detections, key=lambda d: d.confidence * d.area)
+        self._waiter = self.loop.create_future()
+        try:
+            return await asyncio.wait_for(self._waiter, config.frame_read_timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            return None, 0.0
+        finally:
+            self._waiter = None
+
+
+class ExecutorFrameSource(AsyncFrameSource):
+    """
+    Frames de capturas bloqueantes (OpenCV, sintéticas, gravações, RealSense)
+    
+    Cada read() agenda no executor de decodificação um único trabalho que
+    avança o stream até o frame ao vivo (grab() do que acumulou no buffer
+    enquanto a câmera processava, sem decodificar) e decodifica só esse
+    frame. Entre leituras a câmera não ocupa thread; em RTSP prefira o
+    backend 'ffmpeg', que o event loop drena continuamente.
+    
+    Fontes gravadas ou sintéticas em tempo real têm o ritmo (ReplayPacer)
+    feito pelo event loop, com asyncio.sleep, e não dentro do grab().
+    """
+    
+    MAX_CATCHUP = 250  # grabs por leitura (limita o custo de esvaziar um buffer grande)
+    
+    def __init__(
+        self,
+        cap: Any,
+        name: str,
+        frame_skip: Optional[int] = None,
+        labels: MetricLabels = (),
+        executor: Optional[ThreadPoolExecutor] = None
+    ):
+        super().__init__(cap, name, frame_skip, labels)
+        self.executor = executor
+        self.lossless = bool(getattr(cap, 'lossless', False))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        self.interval = 1.0 / min(max(fps, 1.0), 60.0)  # RTSP às vezes informa 90000
+        self._lock = threading.Lock()  # stop() espera o grab em andamento
+        
+        pacer = getattr(cap, 'pacer', None)
+        self.pace_interval = pacer.interval if pacer is not None and pacer.realtime else 0.0
+        if self.pace_interval:
+            pacer.realtime = False
+        self._next_at = 0.0
+    
+    def stop(self):
+        self.failed = True
+        if self._lock.acquire(timeout=config.frame_read_timeout):
+            self._lock.release()
+    
+    async def read(self, timeout: Optional[float] = None) -> Tuple[Optional[np.ndarray], float]:
+        """Avança até o frame ao vivo e decodifica só ele, no executor de decodificação"""
+        if self.failed:
+            return None, 0.0
         
-        # Verificar se está na zona de trigger
-        # (implementar lógica de zona de trigger se necessário)
+        if self.pace_interval:
+            # Esperar no loop até o frame pedido estar "no ar"
+            now = time.monotonic()
+            due_at = max(now, self._next_at) + max(0, self.frame_skip - self._since_decode - 1) * self.pace_interval
+            self._next_at = due_at + self.pace_interval
+            if due_at > now:
+                await asyncio.sleep(due_at - now)
         
-        # Estimar peso
-        station_id = self.config.weigh_station_id
-        weight, confidence = self.weight_estimator.estimate(
-            station_id,
-            best_detection,
-            frame,
-            depth_frame=None,  # Adicionar suporte a depth se disponível
-            scale_reference=None
+        job = asyncio.get_running_loop().run_in_executor(self.executor, self._grab_latest)
+        try:
+            return await asyncio.wait_for(job, config.frame_read_timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            return None, 0.0
+    
+    def _grab_latest(self) -> Tuple[Optional[np.ndarray], float]:
+        with self._lock:
+            grabs = 0
+            while not self.failed:
+                started = time.monotonic()
+                if not self.cap.grab():
+                    self.failed = True
+                    break
+                grabs += 1
+                self.grabbed += 1
+                self._since_decode += 1
+                if self._since_decode < self.frame_skip:
+                    self.skipped += 1
+                    continue
+                
+                # grab() instantâneo = frame que estava no buffer; o ao vivo ainda vem
+                live = self.lossless or self.pace_interval or time.monotonic() - started >= self.interval / 2
+                if not live and grabs < self.MAX_CATCHUP:
+                    self.dropped += 1
+                    continue
+                
+                captured_at = time.monotonic()
+                with metrics.time('decode', self.labels):
+                    ret, frame = self.cap.retrieve()
+                    depth = self.cap.retrieve_depth() if ret and self.has_depth else None
+                if not ret or frame is None:
+                    self.decode_errors += 1
+                    continue
+                
+                self.decoded += 1
+                self._since_decode = 0
+                self.depth = depth
+                return frame, captured_at
+            
+            return None, 0.0
+
+
+class AsyncRuntime:
+    """
+    Runtime de event loop do VisionAgent (runtime_mode = 'asyncio')
+    
+    Cada câmera é uma coroutine que cuida de conexão, backoff de reconexão e
+    leitura; roteamento de resultados e despacho dos envios também são
+    coroutines. O que bloqueia vai para executores de tamanho fixo:
+    abertura de streams (io), leitura de capturas bloqueantes (decode) e
+    processamento dos frames, com a inferência em lote do
+    InferenceService (process). O número de threads não depende mais do
+    número de câmeras, e câmera parada ou offline só custa um timer.
+    """
+    
+    def __init__(self, agent: 'VisionAgent'):
+        self.agent = agent
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+        
+        self.io_executor: Optional[ThreadPoolExecutor] = None
+        self.decode_executor: Optional[ThreadPoolExecutor] = None
+        self.process_executor: Optional[ThreadPoolExecutor] = None
+        
+        self.camera_tasks: Dict[int, asyncio.Task] = {}
+        self.service_tasks: List[asyncio.Task] = []
+        self._results_ready: Optional[asyncio.Event] = None
+    
+    def start(self):
+        """Cria o event loop em thread própria e inicia roteamento, envio e câmeras"""
+        if self.running:
+            return
+        
+        self.running = True
+        self.io_executor = ThreadPoolExecutor(config.async_io_workers, thread_name_prefix='camera-io')
+        self.decode_executor = ThreadPoolExecutor(config.async_decode_workers, thread_name_prefix='decode')
+        self.process_executor = ThreadPoolExecutor(config.async_process_workers, thread_name_prefix='process')
+        
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self.thread = threading.Thread(target=self._run_loop, args=(started,), name='event-loop', daemon=True)
+        self.thread.start()
+        started.wait()
+        
+        asyncio.run_coroutine_threadsafe(self._start_services(), self.loop).result()
+        for processor in self.agent._processor_snapshot():
+            self.add_camera(processor)
+        logger.info(
+            f"Runtime assíncrono iniciado (executores: io {config.async_io_workers}, "
+            f"decodificação {config.async_decode_workers}, processamento {config.async_process_workers})"
         )
+    
+    def _run_loop(self, started: threading.Event):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(started.set)
+        self.loop.run_forever()
+    
+    async def _start_services(self):
+        self._results_ready = asyncio.Event()
+        loop = self.loop
+        self.agent.result_bus.listener = lambda: loop.call_soon_threadsafe(self._results_ready.set)
+        self.service_tasks = [
+            loop.create_task(self._route_results()),
+            loop.create_task(self.agent.uploader.run()),
+        ]
+    
+    def stop(self):
+        """Cancela as coroutines, fecha os streams e encerra o loop"""
+        if not self.running:
+            return
+        self.running = False
+        self.agent.result_bus.listener = None
         
-        # Enviar resultado
-        result = {
-            'type': 'weight',
-            'station_id': station_id,
-            'camera_id': self.config.id,
-            'estimated_kg': weight,
-            'confidence': confidence,
-            'timestamp': datetime.utcnow().isoformat(),
-            'detection': {
-                'id': best_detection.id,
-                'bbox': best_detection.bbox,
-                'confidence': best_detection.confidence
-            }
-        }
+        for processor in self.agent._processor_snapshot():
+            self.remove_camera(processor)
         
-        self.result_queue.put(result)
-        self.last_weight_time = current_time
+        future = asyncio.run_coroutine_threadsafe(self._cancel(self.service_tasks), self.loop)
+        future.result(timeout=5)
+        self.service_tasks = []
         
-        logger.info(f"Peso estimado: {weight:.1f}kg (confiança: {confidence:.2f})")
-
-
-# ============================================================================
-# API CLIENT
-# ============================================================================
-
-class APIClient:
-    """Cliente para comunicação com o backend"""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+        self.loop.close()
+        for executor in (self.process_executor, self.decode_executor, self.io_executor):
+            executor.shutdown(wait=True)
     
-    def __init__(self, base_url: str, api_key: str):
-        self.base_url = base_url.rstrip('/')
-        self.api_key = api_key
-        self.session = requests.Session()
+    @staticmethod
+    async def _cancel(tasks: List[asyncio.Task]):
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
     
-    def send_count(self, pen_id: int, camera_id: int, count: int, confidence: float, timestamp: str, meta: Dict = None):
-        """Envia contagem para o backend"""
-        try:
-            payload = {
-                'type': 'count',
-                'apiKey': self.api_key,
-                'data': {
-                    'penId': pen_id,
-                    'cameraId': camera_id,
-                    'count': count,
-                    'confidence': confidence,
-                    'capturedAt': timestamp,
-                    'meta': meta
-                }
-            }
-            
-            response = self.session.post(
-                f"{self.base_url}/api/trpc/vision.ingest",
-                json=payload,
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                logger.debug(f"Contagem enviada: pen={pen_id}, count={count}")
-            else:
-                logger.warning(f"Erro ao enviar contagem: {response.status_code}")
-                
-        except Exception as e:
-            logger.error(f"Erro ao enviar contagem: {e}")
+    def add_camera(self, processor: 'CameraProcessor'):
+        """
+        Inicia a coroutine da câmera (chamável de qualquer thread)
+        
+        Antes do loop existir não faz nada: start() percorre os processadores
+        e inicia todos. Chamadas repetidas para a mesma câmera são ignoradas.
+        """
+        if self.loop is None or self.loop.is_closed():
+            return
+        processor.running = True
+        processor.started_at = time.monotonic()
+        self.loop.call_soon_threadsafe(self._spawn_camera, processor)
     
-    def send_weight(self, station_id: int, weight: float, confidence: float, calibration_version: int, timestamp: str, meta: Dict = None):
-        """Envia estimativa de peso para o backend"""
+    def _spawn_camera(self, processor: 'CameraProcessor'):
+        camera_id = processor.config.id
+        task = self.camera_tasks.get(camera_id)
+        if task is not None and not task.done():
+            return
+        self.camera_tasks[camera_id] = self.loop.create_task(self._run_camera(processor))
+    
+    def remove_camera(self, processor: 'CameraProcessor'):
+        """Cancela a coroutine da câmera e fecha o stream (fora do loop)"""
+        processor.running = False
+        
+        async def cancel():
+            task = self.camera_tasks.pop(processor.config.id, None)
+            if task is not None:
+                await self._cancel([task])
+        
         try:
-            payload = {
-                'type': 'weight',
-                'apiKey': self.api_key,
-                'data': {
-                    'stationId': station_id,
-                    'estimatedKg': weight,
-                    'confidence': confidence,
-                    'calibrationVersion': calibration_version,
-                    'capturedAt': timestamp,
-                    'meta': meta
-                }
-            }
-            
-            response = self.session.post(
-                f"{self.base_url}/api/trpc/vision.ingest",
-                json=payload,
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                logger.debug(f"Peso enviado: station={station_id}, weight={weight}kg")
-            else:
-                logger.warning(f"Erro ao enviar peso: {response.status_code}")
-                
+            asyncio.run_coroutine_threadsafe(cancel(), self.loop).result(timeout=5)
         except Exception as e:
-            logger.error(f"Erro ao enviar peso: {e}")
+            logger.error(f"Erro ao parar a câmera {processor.config.name}: {e}")
+        processor.stop()
+    
+    def _frame_source(self, cap: Any, processor: 'CameraProcessor') -> AsyncFrameSource:
+        if isinstance(cap, FFmpegCapture):
+            return PipeFrameSource(cap, processor.config.name, processor.frame_skip, processor.metric_labels)
+        return ExecutorFrameSource(
+            cap, processor.config.name, processor.frame_skip, processor.metric_labels, self.decode_executor
+        )
     
-    def fetch_cameras(self) -> List[Dict]:
-        """Busca configurações das câmeras do backend"""
+    async def _connect(self, processor: 'CameraProcessor') -> bool:
+        """Abre o stream no executor de io, com o prazo de camera_open_timeout"""
+        processor._begin_connect()
+        opening = self.io_executor.submit(open_capture, processor.config)
         try:
-            response = self.session.get(
-                f"{self.base_url}/api/trpc/vision.getCamerasStatus",
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('result', {}).get('data', {}).get('data', [])
-            
+            cap = await asyncio.wait_for(asyncio.wrap_future(opening), config.camera_open_timeout)
+            processor.attach(cap, self._frame_source(cap, processor))
+            return True
+        except asyncio.CancelledError:
+            opening.add_done_callback(_release_late_capture)
+            raise
+        except asyncio.TimeoutError:
+            opening.add_done_callback(_release_late_capture)
+            processor._connect_failed(TimeoutError(f"stream não abriu em {config.camera_open_timeout:.0f}s"))
+            return False
         except Exception as e:
-            logger.error(f"Erro ao buscar câmeras: {e}")
+            processor._connect_failed(e)
+            return False
+    
+    async def _run_camera(self, processor: 'CameraProcessor'):
+        """Supervisão de uma câmera: conexão, backoff, leitura e processamento"""
+        loop = asyncio.get_running_loop()
+        reconnect_attempts = 0
         
-        return []
+        while processor.running:
+            try:
+                if processor._pending_config is not None:
+                    await loop.run_in_executor(self.io_executor, processor._apply_pending_config)
+                
+                if processor.status != CameraStatus.ONLINE:
+                    if not await self._connect(processor):
+                        backoff = config.camera_reconnect_backoff * 2 ** reconnect_attempts
+                        reconnect_attempts += 1
+                        await asyncio.sleep(min(config.camera_reconnect_interval, backoff))
+                        continue
+                    reconnect_attempts = 0
+                
+                if not processor.detector.wait_ready(0):
+                    await asyncio.sleep(0.2)
+                    continue
+                
+                delay = processor.admission_delay()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                
+                source = processor.grabber
+                frame, captured_at = await source.read()
+                if frame is None:
+                    logger.warning(f"Falha ao ler frame da câmera {processor.config.name}")
+                    await loop.run_in_executor(self.io_executor, processor.disconnect)
+                    processor.status = CameraStatus.ERROR
+                    continue
+                
+                await loop.run_in_executor(
+                    self.process_executor, processor._handle_frame, frame, source.depth, captured_at
+                )
+                
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro no loop de processamento: {e}")
+                try:
+                    await loop.run_in_executor(self.io_executor, processor.disconnect)
+                except Exception as close_error:
+                    logger.error(f"Erro ao desconectar câmera {processor.config.name}: {close_error}")
+                processor.status = CameraStatus.ERROR
+                await asyncio.sleep(1)
     
-    def fetch_calibration(self, station_id: int) -> Optional[Dict]:
-        """Busca calibração de uma estação"""
-        # Implementar quando necessário
-        return None
+    async def _route_results(self):
+        """Resultados do barramento para a fusão por curral ou para o envio"""
+        agent = self.agent
+        while self.running:
+            try:
+                if config.pen_fusion_enabled:
+                    for fused in agent.pen_aggregator.flush():
+                        agent._send_result(fused)
+                
+                self._results_ready.clear()
+                result = agent.result_bus.get(timeout=0)
+                if result is None:
+                    try:
+                        await asyncio.wait_for(self._results_ready.wait(), timeout=0.2)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                
+                agent._route_result(result)
+                
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro no roteamento de resultados: {e}")
+                await asyncio.sleep(0.2)
 
 
 # ============================================================================
@@ -732,39 +7388,113 @@ class VisionAgent:
     """
     
     def __init__(self):
-        self.detector = CattleDetector()
+        # Prioridade por papel da câmera e descarte de carga sob sobrecarga
+        self.scheduler = InferenceScheduler() if config.scheduler_enabled else None
+        if config.inference_mode == 'process':
+            # O modelo é carregado só nos workers
+            self.detector = None
+            self.inference_service = ProcessInferencePool(scheduler=self.scheduler)
+        else:
+            # Carga em segundo plano: as câmeras conectam enquanto o modelo carrega
+            self.detector = CattleDetector(background=config.model_background_load)
+            self.inference_service = InferenceService(self.detector, scheduler=self.scheduler)
+        self.shared_inference = config.batched_inference or config.inference_mode == 'process'
         self.weight_estimator = WeightEstimator()
         self.api_client = APIClient(config.api_base_url, config.api_key)
+        self.calibration_store = CalibrationStore(self.api_client, self.weight_estimator)
+        self.outbox = Outbox()
+        self.uploader = BatchUploader(self.api_client, outbox=self.outbox)
         
-        self.result_queue = queue.Queue(maxsize=config.queue_size)
+        self.result_bus = ResultBus(config.queue_size, on_overflow=self._spill_result)
         self.processors: Dict[int, CameraProcessor] = {}
+        self.pens: Dict[int, PenConfig] = {}
+        self.pen_aggregator = PenAggregator(self.pens)
+        
+        self.metrics_server = MetricsServer(self) if config.metrics_enabled else None
+        
+        # Event loop no lugar de thread por câmera (runtime_mode = 'asyncio')
+        self.runtime = AsyncRuntime(self) if config.runtime_mode == 'asyncio' else None
         
         self.running = False
         self.sender_thread: Optional[threading.Thread] = None
+        self.calibration_thread: Optional[threading.Thread] = None
+        self._calibration_wakeup = threading.Event()
+        self.first_result_at: Optional[float] = None  # time.monotonic() do primeiro envio
+        
+        # Configuração remota (câmeras e currais do backend)
+        self.sync_enabled = False  # ligado pelo main() fora do modo demo
+        self.config_hash: Optional[str] = None
+        self.config_syncs = 0
+        self.config_thread: Optional[threading.Thread] = None
+        self._config_lock = threading.Lock()
+        self._config_wakeup = threading.Event()
+        
+        # Sharding: este nó roda só as câmeras que o anel lhe atribui
+        self.shard = ShardManager(self.api_client) if config.shard_enabled else None
+        self.cluster_cameras: Dict[int, CameraConfig] = {}  # todas as câmeras da fazenda
+        self.split_pens: Set[int] = set()  # currais com câmeras em mais de um nó
+        self.shard_thread: Optional[threading.Thread] = None
+        self._shard_wakeup = threading.Event()
     
     def add_camera(self, camera_config: CameraConfig):
-        """Adiciona uma câmera para processamento"""
+        """Adiciona uma câmera para processamento (e a inicia, se o agente já está rodando)"""
         if camera_config.id in self.processors:
             logger.warning(f"Câmera {camera_config.id} já existe")
             return
         
         processor = CameraProcessor(
             camera_config,
-            self.detector,
+            self.inference_service if self.shared_inference else self.detector,
             self.weight_estimator,
-            self.result_queue
+            self.result_bus,
+            self.scheduler
         )
         
         self.processors[camera_config.id] = processor
+        self._index_camera(camera_config)
+        if self.running:
+            self._start_processor(processor)
+        
         logger.info(f"Câmera {camera_config.name} adicionada")
     
     def remove_camera(self, camera_id: int):
         """Remove uma câmera"""
         if camera_id in self.processors:
-            self.processors[camera_id].stop()
-            del self.processors[camera_id]
+            self._stop_processor(self.processors.pop(camera_id))
+            self._unindex_camera(camera_id)
+            if self.scheduler is not None:
+                self.scheduler.unregister(camera_id)
             logger.info(f"Câmera {camera_id} removida")
     
+    def _start_processor(self, processor: CameraProcessor):
+        if self.runtime is not None:
+            self.runtime.add_camera(processor)
+        else:
+            processor.start()
+    
+    def _stop_processor(self, processor: CameraProcessor):
+        if self.runtime is not None and self.runtime.running:
+            self.runtime.remove_camera(processor)
+        else:
+            processor.stop()
+    
+    def _index_camera(self, camera_config: CameraConfig):
+        """Registra a câmera no seu curral"""
+        if camera_config.pen_id is not None:
+            pen = self.pens.setdefault(
+                camera_config.pen_id,
+                PenConfig(id=camera_config.pen_id, name=f"Curral {camera_config.pen_id}")
+            )
+            if camera_config.id not in pen.camera_ids:
+                pen.camera_ids.append(camera_config.id)
+    
+    def _unindex_camera(self, camera_id: int):
+        """Tira a câmera dos currais e descarta suas leituras pendentes na fusão"""
+        for pen in self.pens.values():
+            if camera_id in pen.camera_ids:
+                pen.camera_ids.remove(camera_id)
+        self.pen_aggregator.forget_camera(camera_id)
+    
     def start(self):
         """Inicia o Vision Agent"""
         if self.running:
@@ -773,13 +7503,45 @@ class VisionAgent:
         logger.info("Iniciando Vision Agent...")
         self.running = True
         
-        # Iniciar thread de envio de resultados
-        self.sender_thread = threading.Thread(target=self._sender_loop, daemon=True)
-        self.sender_thread.start()
+        if self.metrics_server is not None:
+            self.metrics_server.start()
         
-        # Iniciar processadores de câmera
-        for processor in self.processors.values():
-            processor.start()
+        # Calibrações: última versão em cache já na partida; backend em segundo plano
+        for station_id in self._weigh_station_ids():
+            self.calibration_store.load_cached(station_id)
+        self._calibration_wakeup.clear()
+        self.calibration_thread = threading.Thread(target=self._calibration_loop, daemon=True)
+        self.calibration_thread.start()
+        
+        # Iniciar serviço de inferência compartilhado
+        if self.shared_inference:
+            self.inference_service.start()
+        
+        if self.runtime is not None:
+            # Roteamento, envio e câmeras como coroutines
+            self.runtime.start()
+        else:
+            # Iniciar envio em lote e thread de envio de resultados
+            self.uploader.start()
+            self.sender_thread = threading.Thread(target=self._sender_loop, daemon=True)
+            self.sender_thread.start()
+            
+            # Iniciar processadores de câmera
+            for processor in self._processor_snapshot():
+                processor.start()
+        
+        # Recarregar câmeras/currais alterados no backend sem reiniciar
+        # (só depois de processadores e envio no ar: a sincronização adiciona e remove câmeras)
+        if self.sync_enabled:
+            self._config_wakeup.clear()
+            self.config_thread = threading.Thread(target=self._config_loop, daemon=True)
+            self.config_thread.start()
+        
+        # Lease no coordenador e divisão das câmeras entre os nós
+        if self.shard is not None:
+            self._shard_wakeup.clear()
+            self.shard_thread = threading.Thread(target=self._shard_loop, daemon=True)
+            self.shard_thread.start()
         
         logger.info(f"Vision Agent iniciado com {len(self.processors)} câmeras")
     
@@ -788,77 +7550,389 @@ class VisionAgent:
         logger.info("Parando Vision Agent...")
         self.running = False
         
+        # Sincronização de configuração e rebalanceamento parados antes dos processadores
+        self._config_wakeup.set()
+        self._shard_wakeup.set()
+        for thread in (self.config_thread, self.shard_thread):
+            if thread:
+                thread.join(timeout=5)
+        
         # Parar processadores
-        for processor in self.processors.values():
+        if self.runtime is not None:
+            self.runtime.stop()
+        for processor in self._processor_snapshot():
             processor.stop()
         
+        if self.shared_inference:
+            self.inference_service.stop()
+        
         # Aguardar thread de envio
         if self.sender_thread:
             self.sender_thread.join(timeout=5)
         
+        self._calibration_wakeup.set()
+        if self.calibration_thread:
+            self.calibration_thread.join(timeout=5)
+        
+        # Câmeras deste nó passam para os outros já no próximo heartbeat deles
+        if self.shard is not None:
+            try:
+                self.shard.leave()
+            except Exception as e:
+                logger.error(f"Erro ao sair da divisão de câmeras: {e}")
+        
+        self.uploader.stop()
+        stats = self.uploader.get_stats()
+        logger.info(
+            f"Envio: {stats['sent_items']} resultados em {stats['sent_batches']} requisições, "
+            f"{stats['failed_items']} falhas"
+        )
+        
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        
         logger.info("Vision Agent parado")
     
+    def _processor_snapshot(self) -> List[CameraProcessor]:
+        """Cópia dos processadores, tirada sob o lock da sincronização de configuração"""
+        with self._config_lock:
+            return list(self.processors.values())
+    
+    def _weigh_station_ids(self) -> List[int]:
+        return sorted({
+            p.target_config.weigh_station_id for p in list(self.processors.values())
+            if p.target_config.weigh_station_id is not None
+        })
+    
+    def refresh_calibrations(self) -> int:
+        """Busca novas versões de calibração das estações; retorna quantas foram trocadas"""
+        swapped = 0
+        for station_id in self._weigh_station_ids():
+            try:
+                swapped += self.calibration_store.refresh(station_id)
+            except Exception as e:
+                logger.error(f"Erro ao atualizar calibração da estação {station_id}: {e}")
+        return swapped
+    
+    def _calibration_loop(self):
+        """Consulta o backend por novas versões de calibração periodicamente"""
+        while self.running:
+            self.refresh_calibrations()
+            self._calibration_wakeup.wait(config.calibration_refresh_interval)
+            self._calibration_wakeup.clear()
+    
     def _sender_loop(self):
         """Loop de envio de resultados para o backend"""
         while self.running:
             try:
+                # Contagens fundidas por curral
+                if config.pen_fusion_enabled:
+                    for fused in self.pen_aggregator.flush():
+                        self._send_result(fused)
+                
                 # Aguardar resultado com timeout
-                try:
-                    result = self.result_queue.get(timeout=1)
-                except queue.Empty:
+                result = self.result_bus.get(timeout=0.2)
+                if result is None:
                     continue
                 
-                # Enviar para backend
-                if result['type'] == 'count':
-                    self.api_client.send_count(
-                        pen_id=result['pen_id'],
-                        camera_id=result['camera_id'],
-                        count=result['count'],
-                        confidence=result['confidence'],
-                        timestamp=result['timestamp'],
-                        meta={
-                            'raw_count': result.get('raw_count'),
-                            'detections': result.get('detections')
-                        }
-                    )
-                
-                elif result['type'] == 'weight':
-                    self.api_client.send_weight(
-                        station_id=result['station_id'],
-                        weight=result['estimated_kg'],
-                        confidence=result['confidence'],
-                        calibration_version=1,  # TODO: buscar versão atual
-                        timestamp=result['timestamp'],
-                        meta={
-                            'detection': result.get('detection')
-                        }
-                    )
+                self._route_result(result)
                 
             except Exception as e:
                 logger.error(f"Erro no loop de envio: {e}")
     
-    def load_cameras_from_api(self):
-        """Carrega configurações de câmeras do backend"""
-        cameras = self.api_client.fetch_cameras()
+    def _route_result(self, result: Dict):
+        """Contagens de curral passam pela fusão; o resto vai direto"""
+        if config.pen_fusion_enabled and self.pen_aggregator.handles(result):
+            self.pen_aggregator.update(result)
+        else:
+            self._send_result(result)
+    
+    def _spill_result(self, result: Dict):
+        """Fila cheia: grava o resultado direto no outbox (chamado pela câmera)"""
+        try:
+            self.outbox.append([self._to_ingest_item(result)])
+        except OSError as e:
+            logger.error(f"Erro ao gravar resultado no outbox: {e}")
+    
+    def _send_result(self, result: Dict):
+        """Enfileira um resultado para o próximo lote de envio"""
+        self.uploader.submit(self._to_ingest_item(result), result.get('created_at'))
+        if self.first_result_at is None:
+            self.first_result_at = time.monotonic()
+            startup = self.get_startup_stats()
+            logger.info(
+                f"Primeiro resultado {startup['first_result_s']:.1f}s após a partida "
+                f"(modelo pronto em {startup['model_ready_s'] or 0:.1f}s, "
+                f"primeiro frame em {startup['first_frame_s'] or 0:.1f}s)"
+            )
+    
+    def get_startup_stats(self) -> Dict[str, Optional[float]]:
+        """Segundos desde a partida do processo até cada marco (None = ainda não aconteceu)"""
+        model_ready = self.inference_service.ready_at if self.detector is None else self.detector.ready_at
+        first_frame = min(
+            (p.first_frame_at for p in list(self.processors.values()) if p.first_frame_at is not None),
+            default=None
+        )
+        return {
+            name: (at - STARTED_AT if at is not None else None)
+            for name, at in (
+                ('model_ready_s', model_ready),
+                ('first_frame_s', first_frame),
+                ('first_result_s', self.first_result_at),
+            )
+        }
+    
+    def _to_ingest_item(self, result: Dict) -> Dict:
+        """Converte um resultado interno no item esperado por vision.ingest"""
+        if result['type'] == 'count':
+            if result.get('fused'):
+                meta = {
+                    'fused': True,
+                    'rule': result.get('rule'),
+                    'cameras': result.get('cameras')
+                }
+            else:
+                meta = {
+                    'raw_count': result.get('raw_count'),
+                    'detections': result.get('detections')
+                }
+            
+            return {
+                'type': 'count',
+                'dedupKey': uuid.uuid4().hex,
+                'data': {
+                    'penId': result['pen_id'],
+                    'cameraId': result['camera_id'],
+                    'count': result['count'],
+                    'confidence': result['confidence'],
+                    'capturedAt': result['timestamp'],
+                    'meta': meta
+                }
+            }
+        
+        return {
+            'type': 'weight',
+            'dedupKey': uuid.uuid4().hex,
+            'data': {
+                'stationId': result['station_id'],
+                'estimatedKg': result['estimated_kg'],
+                'confidence': result['confidence'],
+                'calibrationVersion': result.get('calibration_version', 0),
+                'capturedAt': result['timestamp'],
+                'meta': {
+                    'detection': result.get('detection'),
+                    'pass': result.get('pass')
+                }
+            }
+        }
+    
+    def sync_config(self) -> bool:
+        """
+        Sincroniza câmeras e currais com o backend
         
-        for cam in cameras:
-            if cam.get('status') == 'offline':
-                continue
+        O backend só devolve a configuração quando o hash do conteúdo mudou;
+        aí apenas os processadores afetados são criados, removidos ou
+        reconfigurados. O detector compartilhado e os streams que não
+        mudaram continuam rodando.
+            
+        Returns:
+            True se a configuração mudou
+        """
+        data = self.api_client.fetch_agent_config(self.config_hash)
+        if not data or data.get('unchanged'):
+            return False
+        
+        self._apply_config(data)
+        self.config_syncs += 1
+        self._save_config_cache(data)
+        
+        # Estações novas: buscar a calibração já
+        self._calibration_wakeup.set()
+        return True
+    
+    def load_cached_config(self) -> bool:
+        """
+        Aplica a última configuração recebida do backend, gravada em disco
+        
+        Na partida as câmeras começam a conectar sem esperar o backend (que
+        pode voltar depois da energia); o sync em segundo plano envia o hash
+        em cache e só recebe o conteúdo se algo mudou.
+        """
+        try:
+            with open(config.agent_config_cache) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.error(f"Erro ao ler configuração em cache: {e}")
+            return False
+        
+        self._apply_config(data)
+        logger.info(f"Configuração em cache aplicada ({len(data.get('cameras', []))} câmeras)")
+        return True
+    
+    def _apply_config(self, data: Dict):
+        with self._config_lock:
+            self._apply_pens(data.get('pens', []))
+            cameras = [self._camera_from_api(cam) for cam in data.get('cameras', [])]
+            self.cluster_cameras = {camera.id: camera for camera in cameras}
+            self._reconcile_cameras(self._owned_cameras(cameras))
+            self._update_split_pens()
+            self.config_hash = data.get('hash')
+    
+    def _owned_cameras(self, cameras: List[CameraConfig]) -> List[CameraConfig]:
+        """Câmeras que este nó deve rodar (todas, sem sharding)"""
+        if self.shard is None:
+            return cameras
+        return [camera for camera in cameras if self.shard.owns_camera(camera.id)]
+    
+    def _update_split_pens(self):
+        """Currais com câmeras em nós diferentes: só o dono do curral funde"""
+        if self.shard is None:
+            return
+        
+        owners: Dict[int, Set[Optional[str]]] = {}
+        for camera in self.cluster_cameras.values():
+            if camera.pen_id is not None:
+                owners.setdefault(camera.pen_id, set()).add(self.shard.camera_owner(camera.id))
+        
+        self.split_pens = {pen_id for pen_id, nodes in owners.items() if len(nodes) > 1}
+        self.pen_aggregator.suppressed = {
+            pen_id for pen_id in self.split_pens if self.shard.pen_owner(pen_id) != self.shard.node_id
+        }
+    
+    def rebalance(self):
+        """Aplica a divisão atual do anel: inicia as câmeras recebidas e para as que saíram"""
+        with self._config_lock:
+            self._reconcile_cameras(self._owned_cameras(list(self.cluster_cameras.values())))
+            self._update_split_pens()
+    
+    def shard_heartbeat(self) -> bool:
+        """
+        Renova o lease, troca leituras parciais de curral e rebalanceia
             
-            camera_config = CameraConfig(
-                id=cam['id'],
-                name=cam['name'],
-                rtsp_url=cam.get('rtspUrl', ''),
-                type=CameraType(cam.get('type', 'rtsp')),
-                position=cam.get('position'),
-                pen_id=cam.get('penId'),
-                weigh_station_id=cam.get('weighStationId'),
-                roi_config=cam.get('roiConfig')
+        Returns:
+            True se a divisão de câmeras mudou
+        """
+        partials = self.pen_aggregator.export(self.pen_aggregator.suppressed)
+        with self._config_lock:
+            running = sorted(self.processors)
+        changed, remote = self.shard.heartbeat(running, partials)
+        if changed:
+            self.rebalance()
+        
+        # Leituras das câmeras dos outros nós nos currais que este nó funde
+        fused_here = self.split_pens - self.pen_aggregator.suppressed
+        self.pen_aggregator.merge_remote([
+            partial for partial in remote
+            if partial.get('penId') in fused_here and partial.get('cameraId') not in self.processors
+        ])
+        return changed
+    
+    def _shard_loop(self):
+        """Heartbeat periódico no coordenador"""
+        while self.running:
+            try:
+                self.shard_heartbeat()
+            except Exception as e:
+                logger.error(f"Erro no heartbeat de sharding: {e}")
+            # Na partida (divisão desconhecida, sem câmeras) tentar de novo logo
+            self._shard_wakeup.wait(config.shard_heartbeat_interval if self.shard.ring is not None else 0.5)
+            self._shard_wakeup.clear()
+    
+    def _save_config_cache(self, data: Dict):
+        path = config.agent_config_cache
+        tmp = path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.error(f"Erro ao gravar configuração em cache: {e}")
+    
+    def _apply_pens(self, pens: List[Dict]):
+        """Atualiza os currais mantendo as câmeras já associadas"""
+        for pen in pens:
+            existing = self.pens.get(pen['id'])
+            self.pens[pen['id']] = PenConfig(
+                id=pen['id'],
+                name=pen.get('name', f"Curral {pen['id']}"),
+                aggregation_rule=pen.get('aggregationRule') or 'median',
+                primary_camera_id=pen.get('primaryCameraId'),
+                camera_ids=existing.camera_ids if existing else []
             )
+        
+        # Currais removidos no backend (os que ainda têm câmera são recriados por _index_camera)
+        known = {pen['id'] for pen in pens}
+        for pen_id in [pid for pid in self.pens if pid not in known]:
+            del self.pens[pen_id]
+    
+    def _reconcile_cameras(self, cameras: List[CameraConfig]):
+        """Aplica a diferença entre as câmeras rodando e as do backend"""
+        desired = {camera.id: camera for camera in cameras}
+        added = removed = changed = 0
+        
+        for camera_id in [cid for cid in self.processors if cid not in desired]:
+            self.remove_camera(camera_id)
+            removed += 1
+        
+        for camera_config in desired.values():
+            processor = self.processors.get(camera_config.id)
+            if processor is None:
+                self.add_camera(camera_config)
+                added += 1
+                continue
+            
+            current = processor.target_config
+            if current == camera_config:
+                self._index_camera(camera_config)
+                continue
             
-            self.add_camera(camera_config)
+            if current.pen_id != camera_config.pen_id:
+                self._unindex_camera(camera_config.id)
+            self._index_camera(camera_config)
+            processor.reconfigure(camera_config)
+            changed += 1
+        
+        logger.info(
+            f"Configuração do backend: {len(desired)} câmeras "
+            f"({added} novas, {removed} removidas, {changed} alteradas)"
+        )
+    
+    @staticmethod
+    def _camera_from_api(cam: Dict) -> CameraConfig:
+        """
+        CameraConfig de um item de vision.getAgentConfig
         
-        logger.info(f"Carregadas {len(cameras)} câmeras do backend")
+        Diferente do antigo load_cameras_from_api, câmeras com status
+        'offline' não são puladas: o status é a saúde gravada pela ingestão
+        (começa 'offline'), então o filtro impediria uma câmera nova de
+        subir, e o backend nem o envia (ficaria fora do hash).
+        """
+        return CameraConfig(
+            id=cam['id'],
+            name=cam['name'],
+            rtsp_url=cam.get('rtspUrl', ''),
+            type=CameraType(cam.get('type', 'rtsp')),
+            position=cam.get('position'),
+            pen_id=cam.get('penId'),
+            weigh_station_id=cam.get('weighStationId'),
+            roi_config=cam.get('roiConfig'),
+            substream_url=cam.get('substreamUrl'),
+            capture_backend=cam.get('captureBackend'),
+            capture_width=cam.get('captureWidth'),
+            keyframe_only=bool(cam.get('keyframeOnly', False))
+        )
+    
+    def _config_loop(self):
+        """Sincroniza na partida e depois verifica periodicamente se a configuração mudou"""
+        while self.running:
+            try:
+                self.sync_config()
+            except Exception as e:
+                logger.error(f"Erro ao sincronizar configuração: {e}")
+            self._config_wakeup.wait(config.config_refresh_interval)
+            self._config_wakeup.clear()
 
 
 # ============================================================================
@@ -867,8 +7941,24 @@ class VisionAgent:
 
 def main():
     """Função principal"""
+    parser = argparse.ArgumentParser(description="Vision Agent - Fazenda Digital")
+    parser.add_argument(
+        '--compare-backends', metavar='FONTE',
+        help="compara config.inference_backend com o Ultralytics em um vídeo, imagem ou diretório"
+    )
+    parser.add_argument('--frames', type=int, default=100, help="frames usados na comparação")
+    args = parser.parse_args()
+    
+    if args.compare_backends:
+        frames = load_frames(args.compare_backends, args.frames)
+        if not frames:
+            logger.error(f"Nenhum frame lido de {args.compare_backends}")
+            sys.exit(1)
+        print(json.dumps(compare_backends(frames), indent=2))
+        return
+    
     logger.info("=" * 60)
-    logger.info("FAZENDA DIGITAL - VISION AGENT v4.0.0")
+    logger.info(f"FAZENDA DIGITAL - VISION AGENT v{VERSION}")
     logger.info("=" * 60)
     
     # Criar agente
@@ -878,12 +7968,13 @@ def main():
     if os.getenv('DEMO_MODE', 'false').lower() == 'true':
         logger.info("Modo de demonstração ativado")
         
-        # Câmeras de curral (simuladas)
+        # Curral com 4 câmeras (simuladas)
+        agent.pens[1] = PenConfig(id=1, name="Curral Demo", primary_camera_id=1)
         for i, pos in enumerate(['NE', 'NW', 'SE', 'SW']):
             agent.add_camera(CameraConfig(
                 id=i + 1,
                 name=f"Câmera Curral {pos}",
-                rtsp_url=f"rtsp://demo/curral_{pos}",  # URL simulada
+                rtsp_url=f"synthetic://1280x720?fps=10&animals=15&seed={i + 1}",  # frames sintéticos
                 type=CameraType.RTSP,
                 position=pos,
                 pen_id=1
@@ -893,14 +7984,15 @@ def main():
         agent.add_camera(CameraConfig(
             id=5,
             name="Câmera Corredor Pesagem",
-            rtsp_url="rtsp://demo/pesagem",
+            rtsp_url="synthetic://1280x720?fps=10&animals=1&seed=5",
             type=CameraType.RGB,
             weigh_station_id=1
         ))
     
     else:
-        # Carregar câmeras do backend
-        agent.load_cameras_from_api()
+        # Câmeras da última configuração já na partida; o backend é consultado em segundo plano
+        agent.sync_enabled = True
+        agent.load_cached_config()
     
     # Iniciar agente
     agent.start()
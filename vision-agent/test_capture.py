@@ -0,0 +1,134 @@
+"""
+Testes de captura: FFmpegCapture contra arquivo local e escala da geometria
+
+Rodar a partir de vision-agent/: python -m pytest -q
+"""
+
+import shutil
+
+import cv2
+import numpy as np
+import pytest
+
+from main import (
+    CameraConfig, CameraProcessor, CameraType, FFmpegCapture, ROIRegion,
+    WeighPassDetector, WeightEstimator, ResultBus, config, geometry_scale, open_capture,
+)
+
+
+def write_video(path, width=320, height=240, frames=10, fps=10):
+    """Vídeo MJPG com um quadrado que anda (sem depender do ffmpeg)"""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    assert writer.isOpened()
+    for i in range(frames):
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        cv2.rectangle(frame, (10 + 5 * i, 40), (60 + 5 * i, 90), (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+requires_ffmpeg = pytest.mark.skipif(
+    shutil.which(config.ffmpeg_path) is None or shutil.which(config.ffprobe_path) is None,
+    reason="ffmpeg/ffprobe não instalados"
+)
+
+
+@requires_ffmpeg
+def test_ffmpeg_capture_scales_local_file(tmp_path):
+    video = write_video(tmp_path / 'curral.avi')
+    cap = FFmpegCapture(str(video), width=160)
+    try:
+        assert cap.isOpened()
+        assert cap.source_size == (320, 240)
+        ok, frame = cap.read()
+        assert ok
+        assert frame.shape == (120, 160, 3)
+    finally:
+        cap.release()
+
+
+@requires_ffmpeg
+def test_ffmpeg_capture_keyframe_only_reads_local_file(tmp_path):
+    video = write_video(tmp_path / 'curral.avi')
+    cap = FFmpegCapture(str(video), width=0, keyframe_only=True)
+    try:
+        ok, frame = cap.read()
+        assert ok
+        assert frame.shape == (240, 320, 3)
+    finally:
+        cap.release()
+
+
+@requires_ffmpeg
+def test_open_capture_selects_ffmpeg_per_camera(tmp_path):
+    video = write_video(tmp_path / 'curral.avi')
+    camera = CameraConfig(
+        id=1, name='c1', rtsp_url=str(video), type=CameraType.RTSP,
+        capture_backend='ffmpeg', capture_width=160
+    )
+    cap = open_capture(camera)
+    try:
+        assert isinstance(cap, FFmpegCapture)
+        assert cap.read()[1].shape[:2] == (120, 160)
+    finally:
+        cap.release()
+
+
+def test_geometry_scale_uses_reference_resolution():
+    roi = {'frameWidth': 1920, 'frameHeight': 1080}
+    assert geometry_scale(roi, (360, 640)) == pytest.approx((1 / 3, 1 / 3))
+    # Sem referência em roi_config: resolução nativa do stream
+    assert geometry_scale({}, (360, 640), (1280, 720)) == pytest.approx((0.5, 0.5))
+    assert geometry_scale(None, (360, 640)) == (1.0, 1.0)
+
+
+def test_roi_pixels_follow_frame_size():
+    roi_config = {'points': [[0, 0], [1280, 0], [1280, 360], [0, 360]]}
+    roi = ROIRegion.from_config((360, 640), roi_config, geometry_scale(roi_config, (360, 640), (1280, 720)))
+    # Metade de cima do frame reduzido
+    assert roi.mask[:179].all()
+    assert not roi.mask[182:].any()
+
+
+def test_normalized_roi_ignores_scale():
+    roi_config = {'points': [[0, 0], [0.5, 0], [0.5, 1], [0, 1]]}
+    roi = ROIRegion.from_config((100, 200), roi_config, (0.25, 0.25))
+    assert roi.mask[:, :99].all()
+    assert not roi.mask[:, 102:].any()
+
+
+def test_weigh_trigger_line_scaled_to_frame():
+    detector = WeighPassDetector({'trigger_line': [[640, 0], [640, 720]]})
+    detector.source_size = (1280, 720)
+    detector._setup((360, 640))
+    assert detector.line.tolist() == [[320.0, 0.0], [320.0, 360.0]]
+
+
+def test_homography_scaled_to_frame():
+    # Homografia desenhada em 1280x720: 100 px = 1 m
+    homography = np.diag([0.01, 0.01, 1.0])
+    camera = CameraConfig(
+        id=1, name='c1', rtsp_url='synthetic://', type=CameraType.RTSP,
+        roi_config={'enabled': False, 'homography': homography.tolist(), 'frameWidth': 1280, 'frameHeight': 720}
+    )
+    processor = CameraProcessor(camera, None, WeightEstimator(), ResultBus(10))
+    processor._create_roi_mask((360, 640))
+    # O pixel (320, 180) do frame reduzido é o (640, 360) da referência
+    point = processor.homography @ np.array([320.0, 180.0, 1.0])
+    assert point[:2] / point[2] == pytest.approx([6.4, 3.6])
+
+
+def test_roi_version_changes_on_rebuild():
+    # O cache de ROI dos workers é por versão: toda ROI nova precisa de outra versão
+    camera = CameraConfig(
+        id=1, name='c1', rtsp_url='synthetic://', type=CameraType.RTSP,
+        roi_config={'points': [[0, 0], [0.5, 0], [0.5, 1], [0, 1]]}
+    )
+    processor = CameraProcessor(camera, None, WeightEstimator(), ResultBus(10))
+    processor._create_roi_mask((100, 200))
+    first = processor.roi.version
+    processor._setup_roi()
+    processor._create_roi_mask((100, 200))
+    assert first is not None
+    assert processor.roi.version > first
@@ -0,0 +1,133 @@
+"""
+Testes da configuração remota: mapeamento de getAgentConfig e reconciliação das câmeras
+
+Rodar a partir de vision-agent/: python -m pytest -q
+"""
+
+import pytest
+
+from main import CameraType, VisionAgent, config
+
+
+class FakeClient:
+    """Devolve as respostas de vision.getAgentConfig na ordem"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.hashes = []
+
+    def fetch_agent_config(self, known_hash=None):
+        self.hashes.append(known_hash)
+        return self.responses.pop(0)
+
+
+def camera(camera_id, **extra):
+    cam = {
+        'id': camera_id,
+        'name': f"Câmera {camera_id}",
+        'rtspUrl': f"rtsp://10.0.0.{camera_id}/stream",
+        'type': 'rtsp',
+        'penId': 1,
+        'status': 'offline',
+    }
+    cam.update(extra)
+    return cam
+
+
+@pytest.fixture
+def agent(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, 'simulate_detection', True)
+    monkeypatch.setattr(config, 'model_background_load', False)
+    monkeypatch.setattr(config, 'inference_mode', 'thread')
+    monkeypatch.setattr(config, 'runtime_mode', 'thread')
+    monkeypatch.setattr(config, 'shard_enabled', False)
+    monkeypatch.setattr(config, 'metrics_enabled', False)
+    monkeypatch.setattr(config, 'outbox_dir', str(tmp_path / 'outbox'))
+    monkeypatch.setattr(config, 'calibration_dir', str(tmp_path / 'calibrations'))
+    monkeypatch.setattr(config, 'agent_config_cache', str(tmp_path / 'agent_config.json'))
+    return VisionAgent()
+
+
+def test_camera_from_api_maps_capture_settings():
+    camera_config = VisionAgent._camera_from_api(camera(
+        3,
+        substreamUrl='rtsp://10.0.0.3/sub',
+        captureBackend='ffmpeg',
+        captureWidth=640,
+        keyframeOnly=True
+    ))
+    assert camera_config.type == CameraType.RTSP
+    assert camera_config.pen_id == 1
+    assert camera_config.substream_url == 'rtsp://10.0.0.3/sub'
+    assert camera_config.capture_backend == 'ffmpeg'
+    assert camera_config.capture_width == 640
+    assert camera_config.keyframe_only is True
+
+
+def test_camera_from_api_defaults_missing_capture_settings():
+    camera_config = VisionAgent._camera_from_api(camera(3))
+    assert camera_config.substream_url is None
+    assert camera_config.capture_backend is None
+    assert camera_config.capture_width is None
+    assert camera_config.keyframe_only is False
+
+
+def test_sync_only_touches_changed_cameras(agent):
+    agent.api_client = FakeClient(
+        {'hash': 'h1', 'pens': [{'id': 1, 'name': 'Curral 1'}], 'cameras': [camera(1), camera(2)]},
+        {'unchanged': True, 'hash': 'h1'},
+        {'hash': 'h2', 'pens': [{'id': 1, 'name': 'Curral 1'}], 'cameras': [camera(1), camera(3, captureWidth=640)]},
+    )
+
+    # Câmeras com status 'offline' (nunca ingeriram) também sobem
+    assert agent.sync_config() is True
+    assert sorted(agent.processors) == [1, 2]
+    first = agent.processors[1]
+
+    assert agent.sync_config() is False
+    assert agent.api_client.hashes == [None, 'h1']
+
+    assert agent.sync_config() is True
+    assert sorted(agent.processors) == [1, 3]
+    assert agent.processors[1] is first
+    assert agent.processors[3].config.capture_width == 640
+    assert agent.pens[1].camera_ids == [1, 3]
+    assert agent.config_hash == 'h2'
+    assert agent.config_syncs == 2
+
+
+def test_reconfigure_moves_camera_between_pens(agent):
+    agent.api_client = FakeClient(
+        {
+            'hash': 'h1',
+            'pens': [{'id': 1, 'name': 'Curral 1'}, {'id': 2, 'name': 'Curral 2', 'aggregationRule': 'max'}],
+            'cameras': [camera(1), camera(2)]
+        },
+        {
+            'hash': 'h2',
+            'pens': [{'id': 1, 'name': 'Curral 1'}, {'id': 2, 'name': 'Curral 2', 'aggregationRule': 'max'}],
+            'cameras': [camera(1), camera(2, penId=2)]
+        },
+    )
+    agent.sync_config()
+    processor = agent.processors[2]
+    assert agent.pens[2].aggregation_rule == 'max'
+
+    agent.sync_config()
+    assert agent.processors[2] is processor
+    assert processor.config.pen_id == 2
+    assert agent.pens[1].camera_ids == [1]
+    assert agent.pens[2].camera_ids == [2]
+
+
+def test_cached_config_is_applied_on_restart(agent):
+    agent.api_client = FakeClient(
+        {'hash': 'h1', 'pens': [], 'cameras': [camera(1, keyframeOnly=True)]}
+    )
+    agent.sync_config()
+
+    restarted = VisionAgent()
+    assert restarted.load_cached_config() is True
+    assert sorted(restarted.processors) == [1]
+    assert restarted.processors[1].config.keyframe_only is True
+    assert restarted.config_hash == 'h1'
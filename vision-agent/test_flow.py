@@ -0,0 +1,75 @@
+"""
+Testes do FlowPropagator: caixas acompanham o movimento entre keyframes
+
+Rodar a partir de vision-agent/: python -m pytest -q
+"""
+
+import numpy as np
+
+from main import DetectionBatch, FlowPropagator
+
+
+def textured_frame(shift=0, width=320, height=240):
+    """Frame com textura (ruído suavizado) deslocado shift px para a direita"""
+    rng = np.random.default_rng(7)
+    noise = rng.integers(0, 255, (height, width + 64), dtype=np.uint8)
+    noise = np.repeat(np.repeat(noise[::4, ::4], 4, axis=0), 4, axis=1)[:height, :width + 64]
+    frame = noise[:, 32 - shift:32 - shift + width]
+    return np.ascontiguousarray(np.stack([frame] * 3, axis=2))
+
+
+def boxes(*xyxy):
+    xyxy = np.asarray(xyxy, dtype=np.int32).reshape(-1, 4)
+    return DetectionBatch(
+        xyxy=xyxy,
+        conf=np.full(len(xyxy), 0.9, dtype=np.float32),
+        cls=np.zeros(len(xyxy), dtype=np.int32),
+        ids=np.arange(1, len(xyxy) + 1, dtype=np.int64),
+        prefix="trk"
+    )
+
+
+def test_no_propagation_before_keyframe():
+    flow = FlowPropagator(keyframe_interval=3)
+    assert flow.propagate(textured_frame()) is None
+
+
+def test_boxes_follow_translation():
+    flow = FlowPropagator(keyframe_interval=5, width=320, grid=4)
+    flow.keyframe(textured_frame(0), boxes([60, 60, 140, 140], [180, 100, 260, 180]))
+    moved = flow.propagate(textured_frame(3))
+    assert moved is not None
+    assert moved.ids.tolist() == [1, 2]
+    assert np.abs(moved.xyxy - np.array([[63, 60, 143, 140], [183, 100, 263, 180]])).max() <= 1
+    assert flow.last_confidence == 1.0
+
+
+def test_keyframe_interval_forces_detection():
+    flow = FlowPropagator(keyframe_interval=3, width=320)
+    flow.keyframe(textured_frame(0), boxes([60, 60, 140, 140]))
+    assert flow.propagate(textured_frame(1)) is not None
+    assert flow.propagate(textured_frame(2)) is not None
+    assert flow.propagate(textured_frame(3)) is None
+    assert flow.propagation_rate == 2 / 3
+
+
+def test_untrackable_frame_falls_back_to_detection():
+    flow = FlowPropagator(keyframe_interval=5, width=320)
+    flow.keyframe(textured_frame(0), boxes([60, 60, 140, 140]))
+    other = np.random.default_rng(1).integers(0, 255, (240, 320, 3), dtype=np.uint8)
+    assert flow.propagate(other) is None
+    assert flow.fallbacks == 1
+
+
+def test_empty_detections_propagate_empty():
+    flow = FlowPropagator(keyframe_interval=3, width=320)
+    flow.keyframe(textured_frame(0), DetectionBatch.empty("trk"))
+    assert len(flow.propagate(textured_frame(1))) == 0
+
+
+def test_reset_and_resolution_change_require_keyframe():
+    flow = FlowPropagator(keyframe_interval=5, width=640)
+    flow.keyframe(textured_frame(0), boxes([60, 60, 140, 140]))
+    assert flow.propagate(textured_frame(0, width=160, height=120)) is None
+    flow.reset()
+    assert flow.propagate(textured_frame(0)) is None
@@ -0,0 +1,85 @@
+"""
+Testes do FrameRing: rotação dos slots, sequências e leitura por outro mapeamento
+
+Rodar a partir de vision-agent/: python -m pytest -q
+"""
+
+import numpy as np
+import pytest
+
+from main import FrameRing
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing((4, 6, 3), slots=3)
+    yield ring
+    ring.close()
+
+
+def test_write_slot_skips_pinned_and_latest(ring):
+    first = ring.acquire_write_slot()
+    ring.publish(first)
+    ring.pin(first)
+    second = ring.acquire_write_slot()
+    assert second != first
+    ring.publish(second)
+    third = ring.acquire_write_slot()
+    assert third not in (first, second)
+    # Consumidor no primeiro slot e o terceiro publicado: só o segundo está livre
+    ring.publish(third)
+    assert ring.acquire_write_slot() == second
+
+
+def test_minimum_three_slots():
+    ring = FrameRing((2, 2, 3), slots=1)
+    try:
+        assert ring.slots == 3
+    finally:
+        ring.close()
+
+
+def test_publish_sequence_detects_overwrite(ring):
+    slot = ring.acquire_write_slot()
+    seq = ring.publish(slot)
+    assert ring.is_current(slot, seq)
+    
+    # O slot volta a ser escrito depois de duas publicações
+    for _ in range(3):
+        ring.publish(ring.acquire_write_slot())
+    assert not ring.is_current(slot, seq)
+
+
+def test_locate_frame_view(ring):
+    slot = ring.acquire_write_slot()
+    ring.frames[slot][:] = 7
+    seq = ring.publish(slot)
+    
+    name, shape, slots, found_slot, found_seq = FrameRing.locate(ring.frames[slot])
+    assert (name, shape, slots) == (ring.name, ring.shape, ring.slots)
+    assert (found_slot, found_seq) == (slot, seq)
+    assert FrameRing.locate(np.zeros(ring.shape, dtype=np.uint8)) is None
+
+
+def test_attached_ring_reads_published_pixels(ring):
+    slot = ring.acquire_write_slot()
+    ring.frames[slot][:] = np.arange(ring.frame_bytes, dtype=np.uint8).reshape(ring.shape)
+    seq = ring.publish(slot)
+    
+    reader = FrameRing.attach(ring.name, ring.shape, ring.slots)
+    try:
+        assert not reader.owner
+        assert reader.is_current(slot, seq)
+        assert np.array_equal(reader.frames[slot], ring.frames[slot])
+    finally:
+        reader.close()
+    # Fechar o leitor não remove o segmento do dono
+    assert ring.is_current(slot, seq)
+
+
+def test_close_unregisters_ring():
+    ring = FrameRing((2, 2, 3))
+    name = ring.name
+    assert name in FrameRing._registry
+    ring.close()
+    assert name not in FrameRing._registry
@@ -0,0 +1,104 @@
+"""
+Testes da fusão por curral: regras de agregação do PenAggregator
+
+Rodar a partir de vision-agent/: python -m pytest -q
+"""
+
+import numpy as np
+
+from main import PenAggregator, PenConfig, count_unique_ground_points
+
+
+def reading(camera_id, count, pen_id=1, confidence=0.8, timestamp=100.0, **extra):
+    return {
+        'type': 'count',
+        'pen_id': pen_id,
+        'camera_id': camera_id,
+        'count': count,
+        'confidence': confidence,
+        'timestamp': timestamp,
+        **extra,
+    }
+
+
+def make_aggregator(rule, primary=None, **kwargs):
+    pen = PenConfig(id=1, name='Curral 1', aggregation_rule=rule, primary_camera_id=primary, camera_ids=[10, 11, 12])
+    params = {'interval': 5.0, 'max_age': 10.0, 'dedup_radius': 0.5}
+    params.update(kwargs)
+    return PenAggregator({1: pen}, **params)
+
+
+def fuse(aggregator, readings, now=100.0):
+    for r in readings:
+        aggregator.update(r, now=now)
+    return aggregator.flush(now=now)
+
+
+def test_median_rule_is_default():
+    [result] = fuse(make_aggregator('median'), [reading(10, 4), reading(11, 9), reading(12, 5)])
+    assert result['count'] == 5
+    assert result['rule'] == 'median'
+    assert result['fused'] is True
+    assert [c['cameraId'] for c in result['cameras']] == [10, 11, 12]
+
+
+def test_max_and_sum_rules():
+    readings = [reading(10, 4), reading(11, 9), reading(12, 5)]
+    assert fuse(make_aggregator('max'), readings)[0]['count'] == 9
+    [result] = fuse(make_aggregator('sum'), readings)
+    assert (result['count'], result['rule']) == (18, 'sum')
+
+
+def test_principal_rule_waits_for_primary_camera():
+    aggregator = make_aggregator('principal', primary=11)
+    assert fuse(aggregator, [reading(10, 4), reading(12, 5)]) == []
+
+    [result] = fuse(aggregator, [reading(11, 7)], now=101.0)
+    assert (result['count'], result['camera_id'], result['rule']) == (7, 11, 'principal')
+
+
+def test_sum_with_ground_points_counts_shared_animals_once():
+    # O animal em (1, 1) aparece nas duas câmeras; a soma bruta seria 4
+    readings = [
+        reading(10, 2, ground_points=[[1.0, 1.0], [5.0, 5.0]]),
+        reading(11, 2, ground_points=[[1.2, 1.1], [9.0, 9.0]]),
+    ]
+    [result] = fuse(make_aggregator('sum'), readings)
+    assert (result['count'], result['rule']) == (3, 'homography')
+
+
+def test_sum_falls_back_to_plain_sum_without_points_on_every_camera():
+    readings = [reading(10, 2, ground_points=[[1.0, 1.0], [5.0, 5.0]]), reading(11, 2)]
+    [result] = fuse(make_aggregator('sum'), readings)
+    assert (result['count'], result['rule']) == (4, 'sum')
+
+
+def test_same_camera_points_are_never_merged():
+    points = np.array([[0.0, 0.0], [0.1, 0.0], [0.2, 0.0]])
+    assert count_unique_ground_points(points, np.array([1, 1, 1]), radius=1.0) == 3
+    assert count_unique_ground_points(points, np.array([1, 2, 1]), radius=1.0) == 1
+
+
+def test_stale_readings_and_interval_are_respected():
+    aggregator = make_aggregator('max')
+    aggregator.update(reading(10, 20), now=80.0)  # mais velha que max_age no flush
+    [result] = fuse(aggregator, [reading(11, 3)], now=100.0)
+    assert result['count'] == 3
+
+    # Dentro do intervalo nada é emitido; depois dele, sim
+    assert fuse(aggregator, [reading(11, 4)], now=103.0) == []
+    assert fuse(aggregator, [reading(11, 4)], now=105.0)[0]['count'] == 4
+
+
+def test_suppressed_pen_exports_instead_of_fusing():
+    local = make_aggregator('sum')
+    local.suppressed.add(1)
+    assert fuse(local, [reading(10, 2)]) == []
+    partials = local.export({1}, now=100.0)
+    assert [(p['cameraId'], p['count']) for p in partials] == [(10, 2)]
+
+    owner = make_aggregator('sum')
+    owner.merge_remote(partials, now=100.0)
+    [result] = fuse(owner, [reading(11, 5)])
+    assert result['count'] == 7
+    assert owner.get_stats()['remote_in'] == 1
@@ -0,0 +1,102 @@
+"""
+Testes do Outbox: ordem, cursor persistente, limpeza de segmentos e limites
+
+Rodar a partir de vision-agent/: python -m pytest -q
+"""
+
+import os
+
+from main import Outbox
+
+
+def items(start, n):
+    return [{'dedupKey': f"k{i}", 'count': i} for i in range(start, start + n)]
+
+
+def test_read_returns_items_in_order_without_consuming(tmp_path):
+    outbox = Outbox(str(tmp_path))
+    outbox.append(items(0, 5))
+    first, _ = outbox.read(3)
+    again, _ = outbox.read(3)
+    assert [i['count'] for i in first] == [0, 1, 2]
+    assert again == first
+    outbox.close()
+
+
+def test_commit_advances_cursor(tmp_path):
+    outbox = Outbox(str(tmp_path))
+    outbox.append(items(0, 5))
+    batch, position = outbox.read(3)
+    outbox.commit(position)
+    rest, position = outbox.read(10)
+    assert [i['count'] for i in rest] == [3, 4]
+    outbox.commit(position)
+    assert outbox.is_empty()
+    assert outbox.read(10)[0] == []
+    outbox.close()
+
+
+def test_cursor_survives_restart(tmp_path):
+    outbox = Outbox(str(tmp_path))
+    outbox.append(items(0, 4))
+    outbox.commit(outbox.read(2)[1])
+    outbox.close()
+    
+    reopened = Outbox(str(tmp_path))
+    assert [i['count'] for i in reopened.read(10)[0]] == [2, 3]
+    assert os.path.exists(tmp_path / Outbox.CURSOR_FILE)
+    reopened.close()
+
+
+def test_consumed_segments_are_deleted(tmp_path):
+    outbox = Outbox(str(tmp_path), segment_max_bytes=64)
+    for start in range(0, 20, 2):
+        outbox.append(items(start, 2))
+    assert len(outbox.segments) > 3
+    
+    batch, position = outbox.read(100)
+    assert [i['count'] for i in batch] == list(range(20))
+    outbox.commit(position)
+    assert len(outbox.segments) == 1
+    assert outbox.pending_bytes() == 0
+
+
+def test_partial_line_is_not_read(tmp_path):
+    outbox = Outbox(str(tmp_path))
+    outbox.append(items(0, 1))
+    outbox.close()
+    # Gravação interrompida no meio da linha
+    with open(outbox._path(outbox.segments[-1]), 'ab') as f:
+        f.write(b'{"dedupKey":"k1"')
+    
+    reopened = Outbox(str(tmp_path))
+    assert [i['count'] for i in reopened.read(10)[0]] == [0]
+    reopened.close()
+
+
+def test_size_limit_discards_oldest_segments(tmp_path):
+    outbox = Outbox(str(tmp_path), segment_max_bytes=64, max_total_bytes=256)
+    for start in range(0, 60, 2):
+        outbox.append(items(start, 2))
+    
+    stats = outbox.get_stats()
+    assert stats['appended'] == 60
+    assert stats['discarded_bytes'] > 0
+    assert outbox.pending_bytes() <= 256 + 64
+    # Sobram os itens mais recentes, ainda em ordem
+    counts = [i['count'] for i in outbox.read(100)[0]]
+    assert counts == sorted(counts)
+    assert counts[-1] == 59
+    outbox.close()
+
+
+def test_age_limit_discards_expired_segments(tmp_path):
+    outbox = Outbox(str(tmp_path), segment_max_bytes=16, max_age=60)
+    outbox.append(items(0, 1))
+    old = outbox._path(outbox.segments[0])
+    os.utime(old, (0, 0))
+    outbox.append(items(1, 1))
+    outbox.append(items(2, 1))
+    assert not os.path.exists(old)
+    assert [i['count'] for i in outbox.read(10)[0]] == [1, 2]
+    outbox.close()
@@ -0,0 +1,82 @@
+"""
+Testes do ResultBus: coalescência de contagens, ordem dos pesos e desvio para o outbox
+
+Rodar a partir de vision-agent/: python -m pytest -q
+"""
+
+import threading
+
+from main import ResultBus
+
+
+def count(camera_id, value, pen_id=1):
+    return {'type': 'count', 'pen_id': pen_id, 'camera_id': camera_id, 'count': value}
+
+
+def weight(value):
+    return {'type': 'weight', 'camera_id': 9, 'weight': value}
+
+
+def drain(bus):
+    results = []
+    while True:
+        result = bus.get(timeout=0)
+        if result is None:
+            return results
+        results.append(result)
+
+
+def test_newer_count_replaces_pending_one_in_place():
+    bus = ResultBus(10)
+    assert bus.publish(count(1, 5)) == ResultBus.QUEUED
+    assert bus.publish(count(2, 7)) == ResultBus.QUEUED
+    assert bus.publish(count(1, 6)) == ResultBus.COALESCED
+
+    # A câmera 1 mantém a sua posição na fila, com o valor mais recente
+    assert [(r['camera_id'], r['count']) for r in drain(bus)] == [(1, 6), (2, 7)]
+    assert bus.get_stats() == {'pending': 0, 'published': 3, 'coalesced': 1, 'overflowed': 0, 'delivered': 2}
+
+
+def test_counts_of_same_camera_in_different_pens_are_not_merged():
+    bus = ResultBus(10)
+    bus.publish(count(1, 5, pen_id=1))
+    assert bus.publish(count(1, 3, pen_id=2)) == ResultBus.QUEUED
+    assert bus.qsize() == 2
+
+
+def test_weights_are_never_coalesced_and_keep_order():
+    bus = ResultBus(10)
+    for value in (410.0, 412.5, 398.0):
+        assert bus.publish(weight(value)) == ResultBus.QUEUED
+    bus.publish(count(1, 5))
+    bus.publish(count(1, 6))
+
+    assert [r.get('weight', r.get('count')) for r in drain(bus)] == [410.0, 412.5, 398.0, 6]
+
+
+def test_full_bus_overflows_without_blocking():
+    spilled = []
+    bus = ResultBus(2, on_overflow=spilled.append)
+    bus.publish(count(1, 5))
+    bus.publish(weight(400.0))
+
+    # Contagem pendente ainda é coalescida com o barramento cheio
+    assert bus.publish(count(1, 6)) == ResultBus.COALESCED
+    assert bus.publish(weight(401.0)) == ResultBus.OVERFLOWED
+    assert bus.publish(count(2, 1)) == ResultBus.OVERFLOWED
+    assert [r.get('weight', r.get('count')) for r in spilled] == [401.0, 1]
+    assert bus.get_stats()['overflowed'] == 2
+
+
+def test_get_waits_for_publish_and_notifies_listener():
+    bus = ResultBus(10)
+    notified = []
+    bus.listener = lambda: notified.append(True)
+    assert bus.get(timeout=0.01) is None
+
+    timer = threading.Timer(0.05, bus.publish, args=(count(1, 5),))
+    timer.start()
+    result = bus.get(timeout=2.0)
+    timer.join()
+    assert result['count'] == 5
+    assert notified == [True]
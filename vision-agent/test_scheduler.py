@@ -0,0 +1,109 @@
+"""
+Testes do InferenceScheduler: papéis, limite de FPS, descarte e recuperação
+
+Rodar a partir de vision-agent/: python -m pytest -q
+"""
+
+import pytest
+
+from main import CameraConfig, CameraType, InferenceScheduler, config
+
+
+def camera(camera_id, pen_id=None, weigh_station_id=None):
+    return CameraConfig(
+        id=camera_id, name=f"c{camera_id}", rtsp_url='synthetic://', type=CameraType.RTSP,
+        pen_id=pen_id, weigh_station_id=weigh_station_id
+    )
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setattr(config, 'detection_imgsz', 640)
+    monkeypatch.setattr(config, 'scheduler_min_imgsz', 320)
+    monkeypatch.setattr(config, 'scheduler_rate_levels', 3)
+    monkeypatch.setattr(config, 'scheduler_interval', 2.0)
+    monkeypatch.setattr(config, 'scheduler_miss_ratio', 0.1)
+    monkeypatch.setattr(config, 'scheduler_recover_windows', 3)
+    scheduler = InferenceScheduler()
+    scheduler.register(camera(1, weigh_station_id=1))
+    scheduler.register(camera(2, pen_id=1))
+    scheduler.register(camera(3))
+    return scheduler
+
+
+def run_window(scheduler, start, latency, frames=10):
+    """Uma janela de scheduler_interval com a mesma latência em todas as câmeras"""
+    for i in range(frames):
+        for camera_id in list(scheduler.budgets):
+            scheduler.record(camera_id, latency, now=start + i * 0.01)
+    end = start + config.scheduler_interval
+    scheduler.record(3, 0.0, now=end)
+    return end
+
+
+def test_priority_follows_role(scheduler):
+    assert [scheduler.priority(c) for c in (1, 2, 3)] == [0, 1, 2]
+    assert scheduler.priority(99) == InferenceScheduler.ROLE_PRIORITY['other']
+    assert scheduler.get_stats()['max_level'] == 6
+
+
+def test_register_updates_role(scheduler):
+    scheduler.register(camera(3, pen_id=2))
+    assert scheduler.budgets[3].role == 'pen'
+    scheduler.unregister(3)
+    assert scheduler.camera_stats(3) == {}
+
+
+def test_admit_enforces_target_fps(scheduler):
+    scheduler.budgets[2].target_fps = 5.0
+    assert scheduler.admit(2, now=10.0) == 0.0
+    assert scheduler.admit(2, now=10.1) == pytest.approx(0.1)
+    assert scheduler.admit(2, now=10.2) == 0.0
+    assert scheduler.budgets[2].throttled == 1
+    # Sem limite: sempre admitida
+    assert scheduler.admit(1, now=10.0) == scheduler.admit(1, now=10.0) == 0.0
+
+
+def test_overload_sheds_lowest_tier_first_and_never_weigh(scheduler):
+    now = scheduler.window_started
+    now = run_window(scheduler, now, latency=5.0)
+    assert scheduler.overloaded
+    assert [scheduler.budgets[c].level for c in (1, 2, 3)] == [0, 0, 1]
+    
+    for _ in range(10):
+        now = run_window(scheduler, now, latency=5.0)
+    assert scheduler.budgets[1].level == 0
+    assert scheduler.budgets[3].level == scheduler.max_level
+    assert scheduler.budgets[2].level > 0
+
+
+def test_shed_levels_halve_fps_then_shrink_imgsz(scheduler):
+    budget = scheduler.budgets[3]
+    budget.base_fps = 8.0
+    budget.level = 1
+    assert budget.max_fps == 4.0 and budget.imgsz is None
+    budget.level = 3
+    assert budget.max_fps == 1.0 and scheduler.imgsz(3) is None
+    budget.level = 4
+    assert scheduler.imgsz(3) == 480
+    budget.level = scheduler.max_level
+    assert scheduler.imgsz(3) == 320
+
+
+def test_restore_after_healthy_windows_most_important_first(scheduler):
+    now = scheduler.window_started
+    for _ in range(8):
+        now = run_window(scheduler, now, latency=5.0)
+    pen_level = scheduler.budgets[2].level
+    other_level = scheduler.budgets[3].level
+    assert pen_level > 0
+    
+    # Duas janelas com folga ainda não devolvem (histerese)
+    for _ in range(2):
+        now = run_window(scheduler, now, latency=0.0)
+    assert scheduler.budgets[2].level == pen_level
+    
+    now = run_window(scheduler, now, latency=0.0)
+    assert scheduler.budgets[2].level == pen_level - 1
+    assert scheduler.budgets[3].level == other_level
+    assert scheduler.restore_events == 1
@@ -0,0 +1,97 @@
+"""
+Testes do sharding: HashRing consistente e ShardManager com LocalCoordinator
+
+Rodar a partir de vision-agent/: python -m pytest -q
+"""
+
+from main import HashRing, LocalCoordinator, ShardManager, config
+
+
+def test_hash_ring_is_deterministic_and_order_independent():
+    a = HashRing(['n1', 'n2', 'n3'], virtual_nodes=64)
+    b = HashRing(['n3', 'n1', 'n2', 'n1'], virtual_nodes=64)
+    keys = [f"camera:{i}" for i in range(200)]
+    assert [a.owner(k) for k in keys] == [b.owner(k) for k in keys]
+    assert a.nodes == ['n1', 'n2', 'n3']
+
+
+def test_hash_ring_spreads_keys_over_nodes():
+    ring = HashRing(['n1', 'n2', 'n3', 'n4'], virtual_nodes=128)
+    owners = [ring.owner(f"camera:{i}") for i in range(2000)]
+    for node in ring.nodes:
+        assert 300 < owners.count(node) < 700
+
+
+def test_hash_ring_moves_only_keys_of_removed_node():
+    keys = [f"camera:{i}" for i in range(1000)]
+    before = HashRing(['n1', 'n2', 'n3', 'n4'], virtual_nodes=128)
+    after = HashRing(['n1', 'n2', 'n3'], virtual_nodes=128)
+    for key in keys:
+        if before.owner(key) != 'n4':
+            assert after.owner(key) == before.owner(key)
+        else:
+            assert after.owner(key) in ('n1', 'n2', 'n3')
+
+
+def test_empty_hash_ring_has_no_owner():
+    assert HashRing([]).owner('camera:1') is None
+
+
+def test_shard_managers_agree_and_split_cameras():
+    coordinator = LocalCoordinator()
+    a = ShardManager(coordinator, node_id='a')
+    b = ShardManager(coordinator, node_id='b')
+    a.heartbeat([], [])
+    b.heartbeat([], [])
+    changed, _ = a.heartbeat([], [])
+    assert changed
+    assert a.nodes == b.nodes == ['a', 'b']
+    
+    cameras = range(1, 41)
+    owned_a = {c for c in cameras if a.owns_camera(c)}
+    owned_b = {c for c in cameras if b.owns_camera(c)}
+    assert owned_a and owned_b
+    assert owned_a | owned_b == set(cameras)
+    assert not owned_a & owned_b
+    assert a.pen_owner(7) == b.pen_owner(7)
+
+
+def test_leave_hands_cameras_to_remaining_node():
+    coordinator = LocalCoordinator()
+    a = ShardManager(coordinator, node_id='a')
+    b = ShardManager(coordinator, node_id='b')
+    a.heartbeat([], [])
+    b.heartbeat([], [])
+    a.heartbeat([], [])
+    
+    b.leave()
+    changed, _ = a.heartbeat([], [])
+    assert changed
+    assert a.nodes == ['a']
+    assert all(a.owns_camera(c) for c in range(1, 21))
+
+
+def test_partials_relayed_to_other_nodes():
+    coordinator = LocalCoordinator()
+    a = ShardManager(coordinator, node_id='a')
+    b = ShardManager(coordinator, node_id='b')
+    partial = {'penId': 3, 'cameraId': 1, 'count': 12, 'ageS': 0.0}
+    a.heartbeat([1], [partial])
+    _, remote = b.heartbeat([2], [])
+    assert len(remote) == 1
+    assert remote[0]['nodeId'] == 'a'
+    assert remote[0]['count'] == 12
+
+
+class SilentCoordinator:
+    def agent_heartbeat(self, *args, **kwargs):
+        return None
+
+
+def test_node_assumes_all_cameras_without_coordinator(monkeypatch):
+    monkeypatch.setattr(config, 'shard_join_timeout', 0.0)
+    manager = ShardManager(SilentCoordinator(), node_id='solo')
+    changed, remote = manager.heartbeat([1, 2], [])
+    assert changed and remote == []
+    assert manager.owns_camera(1) and manager.owns_camera(99)
+    assert manager.failures == 1
@@ -0,0 +1,232 @@
+"""
+Testes do BatchUploader: lotes, fallback individual e outbox com backend instável
+
+Rodar a partir de vision-agent/: python -m pytest -q
+"""
+
+import time
+
+import pytest
+
+from main import APIClient, BatchUploader, BulkIngestUnavailable, Outbox
+
+
+class InlineExecutor:
+    """Executa o envio na própria thread do teste"""
+    
+    def submit(self, fn, *args):
+        fn(*args)
+    
+    def shutdown(self, wait=True):
+        pass
+
+
+class FakeClient:
+    """APIClient falso: guarda as dedupKeys aceitas"""
+    
+    def __init__(self, bulk=True, fail_items=0):
+        self.bulk = bulk
+        self.fail_items = fail_items  # próximos envios individuais que falham
+        self.batch_calls = 0
+        self.delivered = []
+    
+    def send_batch(self, items):
+        self.batch_calls += 1
+        if not self.bulk:
+            raise BulkIngestUnavailable("Backend sem vision.ingestBatch")
+        self.delivered.extend(item['dedupKey'] for item in items)
+        return [], 100
+    
+    def send_item(self, item):
+        if self.fail_items > 0:
+            self.fail_items -= 1
+            return False
+        self.delivered.append(item['dedupKey'])
+        return True
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.data = data
+    
+    def json(self):
+        return {'result': {'data': self.data}}
+
+
+class FakeSession:
+    """Sessão HTTP falsa: devolve as respostas na ordem e guarda os corpos"""
+    
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.posts = []
+    
+    def post(self, url, **kwargs):
+        self.posts.append((url, kwargs))
+        return self.responses.pop(0)
+
+
+def api_client(*responses):
+    client = APIClient('http://backend', 'chave')
+    client.session = FakeSession(*responses)
+    return client
+
+
+def items(*keys):
+    return [{'type': 'count', 'dedupKey': key, 'data': {'penId': 1, 'count': 3}} for key in keys]
+
+
+def make_uploader(client, tmp_path=None, **kwargs):
+    outbox = Outbox(str(tmp_path)) if tmp_path is not None else None
+    uploader = BatchUploader(client, outbox=outbox, **kwargs)
+    uploader.executor = InlineExecutor()
+    return uploader
+
+
+def dispatch(uploader, batch):
+    uploader._dispatch([(item, time.monotonic()) for item in batch])
+
+
+def test_batch_sent_when_full():
+    client = FakeClient()
+    uploader = make_uploader(client, batch_size=2, max_batch_age=60)
+    for item in items('a', 'b', 'c'):
+        uploader.submit(item)
+    assert uploader._next_batch_in() == 0.0
+    dispatch(uploader, [item for item, _ in uploader._take_batch()])
+    assert client.delivered == ['a', 'b']
+    assert len(uploader.pending) == 1
+    assert uploader.get_stats()['sent_batches'] == 1
+
+
+def test_falls_back_to_individual_sends():
+    client = FakeClient(bulk=False)
+    uploader = make_uploader(client)
+    dispatch(uploader, items('a', 'b'))
+    dispatch(uploader, items('c'))
+    assert not uploader.bulk_supported
+    assert client.batch_calls == 1
+    assert client.delivered == ['a', 'b', 'c']
+
+
+def test_replay_uses_individual_sends_without_bulk_endpoint(tmp_path):
+    client = FakeClient(bulk=False, fail_items=2)
+    uploader = make_uploader(client, tmp_path)
+    
+    # Primeiros envios individuais falham: lote vai para o outbox e o link cai
+    dispatch(uploader, items('a', 'b'))
+    assert not uploader.online
+    dispatch(uploader, items('c'))
+    assert uploader.get_stats()['spooled_items'] == 3
+    
+    # O replay também usa o envio individual e religa o envio ao vivo
+    assert uploader._replay_step(slot_timeout=0.0) == 0.0
+    assert uploader.online
+    assert client.batch_calls == 1
+    assert uploader.outbox.is_empty()
+    assert {'a', 'b', 'c'} <= set(client.delivered)
+    
+    dispatch(uploader, items('d'))
+    assert client.delivered[-1] == 'd'
+    assert uploader.get_stats()['spooled_items'] == 3
+    uploader.outbox.close()
+
+
+def test_replay_backs_off_while_backend_down(tmp_path, monkeypatch):
+    client = FakeClient()
+    uploader = make_uploader(client, tmp_path)
+    uploader.outbox.append(items('a'))
+    
+    def down(batch):
+        raise ConnectionError("sem link")
+    monkeypatch.setattr(client, 'send_batch', down)
+    
+    first = uploader._replay_step(slot_timeout=0.0)
+    second = uploader._replay_step(slot_timeout=0.0)
+    assert not uploader.online
+    assert second == pytest.approx(2 * first)
+    assert not uploader.outbox.is_empty()
+    uploader.outbox.close()
+
+
+@pytest.mark.parametrize('data', [
+    {'success': False, 'error': 'Unauthorized'},
+    {'success': False, 'error': 'Database não disponível'},
+])
+def test_batch_refused_with_http_200_is_spooled(tmp_path, data):
+    uploader = make_uploader(api_client(FakeResponse(200, data)), tmp_path)
+    dispatch(uploader, items('a', 'b'))
+    assert not uploader.online
+    assert [item['dedupKey'] for item in uploader.outbox.read(10)[0]] == ['a', 'b']
+    assert uploader.get_stats()['sent_items'] == 0
+    uploader.outbox.close()
+
+
+def test_only_rejected_items_are_spooled(tmp_path):
+    data = {'success': True, 'results': [
+        {'success': True},
+        {'success': False, 'error': 'Erro interno'},
+        {'success': True, 'duplicate': True},
+        {'success': False, 'error': 'Dados incompletos para contagem', 'retryable': False},
+    ]}
+    uploader = make_uploader(api_client(FakeResponse(200, data)), tmp_path)
+    dispatch(uploader, items('a', 'b', 'c', 'd'))
+    assert uploader.online
+    assert [item['dedupKey'] for item in uploader.outbox.read(10)[0]] == ['b']
+    stats = uploader.get_stats()
+    assert (stats['sent_items'], stats['failed_items']) == (3, 1)
+    uploader.outbox.close()
+
+
+def test_replay_commits_batch_and_respools_rejected_items(tmp_path):
+    data = {'success': True, 'results': [{'success': True}, {'success': False, 'error': 'Erro interno'}]}
+    uploader = make_uploader(api_client(FakeResponse(200, data)), tmp_path)
+    uploader.outbox.append(items('a', 'b'))
+    
+    assert uploader._replay_step(slot_timeout=0.0) > 0
+    assert uploader.online
+    assert [item['dedupKey'] for item in uploader.outbox.read(10)[0]] == ['b']
+    assert uploader.get_stats()['replayed_items'] == 1
+    uploader.outbox.close()
+
+
+def test_replay_keeps_outbox_when_batch_refused(tmp_path):
+    refused = FakeResponse(200, {'success': False, 'error': 'Database não disponível'})
+    uploader = make_uploader(api_client(refused), tmp_path)
+    uploader.outbox.append(items('a'))
+    assert uploader._replay_step(slot_timeout=0.0) > 0
+    assert not uploader.online
+    assert [item['dedupKey'] for item in uploader.outbox.read(10)[0]] == ['a']
+    uploader.outbox.close()
+
+
+def test_individual_send_checks_success():
+    client = api_client(
+        FakeResponse(200, {'success': True}),
+        FakeResponse(200, {'success': False, 'error': 'Unauthorized'}),
+        FakeResponse(500),
+    )
+    assert client.send_item(items('a')[0])
+    assert not client.send_item(items('b')[0])
+    assert not client.send_item(items('c')[0])
+
+
+def test_missing_bulk_endpoint_raises():
+    with pytest.raises(BulkIngestUnavailable):
+        api_client(FakeResponse(404)).send_batch(items('a'))
+
+
+def test_individual_fallback_keeps_dedup_key_and_spools_only_failures(tmp_path):
+    client = api_client(
+        FakeResponse(404),
+        FakeResponse(200, {'success': True}),
+        FakeResponse(200, {'success': False, 'error': 'Erro interno'}),
+        FakeResponse(200, {'success': True, 'duplicate': True}),
+    )
+    uploader = make_uploader(client, tmp_path)
+    dispatch(uploader, items('a', 'b', 'c'))
+    
+    individual = [kwargs['json'] for url, kwargs in client.session.posts if url.endswith('vision.ingest')]
+    assert [payload['dedupKey'] for payload in individual] == ['a', 'b', 'c']
+    assert [item['dedupKey'] for item in uploader.outbox.read(10)[0]] == ['b']
+    uploader.outbox.close()
@@ -0,0 +1,58 @@
+"""
+Testes da pesagem: zona de gatilho nas passagens e no modo por cooldown
+
+Rodar a partir de vision-agent/: python -m pytest -q
+"""
+
+import numpy as np
+
+from main import CameraConfig, CameraProcessor, CameraType, DetectionBatch, ResultBus, WeightEstimator, config
+
+
+def detections(*xyxy, prefix="det"):
+    xyxy = np.asarray(xyxy, dtype=np.int32).reshape(-1, 4)
+    return DetectionBatch(
+        xyxy=xyxy,
+        conf=np.full(len(xyxy), 0.9, dtype=np.float32),
+        cls=np.zeros(len(xyxy), dtype=np.int32),
+        ids=np.arange(len(xyxy), dtype=np.int64),
+        prefix=prefix
+    )
+
+
+def weigh_processor():
+    camera = CameraConfig(id=1, name='balança', rtsp_url='synthetic://', type=CameraType.RTSP, weigh_station_id=1)
+    bus = ResultBus(10)
+    return CameraProcessor(camera, None, WeightEstimator(), bus), bus
+
+
+def test_zone_mask_uses_default_band():
+    processor, _ = weigh_processor()
+    # Faixa padrão: 30% a 70% da largura
+    inside = processor.weigh_pass.in_zone(detections([300, 100, 340, 200], [10, 100, 60, 200]), (480, 640))
+    assert inside.tolist() == [True, False]
+
+
+def test_pass_completed_when_animal_leaves_zone(monkeypatch):
+    monkeypatch.setattr(config, 'weigh_min_pass_frames', 2)
+    processor, _ = weigh_processor()
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    for i, x in enumerate([200, 260, 320, 380]):
+        # Trilha 0 do tracker atravessando a faixa da esquerda para a direita
+        assert processor.weigh_pass.update(detections([x, 150, x + 80, 300], prefix="trk"), frame, float(i)) == []
+    done = processor.weigh_pass.update(detections([540, 150, 620, 300], prefix="trk"), frame, 4.0)
+    assert len(done) == 1
+    assert done[0].frames >= 2
+
+
+def test_cooldown_weighing_only_inside_trigger_zone(monkeypatch):
+    monkeypatch.setattr(config, 'weigh_pass_enabled', False)
+    processor, bus = weigh_processor()
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    
+    processor._process_weight(detections([0, 100, 150, 300]), frame, 1.0)
+    assert bus.qsize() == 0
+    
+    processor._process_weight(detections([0, 100, 150, 300], [280, 100, 360, 300]), frame, 2.0)
+    result = bus.get(timeout=0)
+    assert list(result['detection']['bbox']) == [280, 100, 360, 300]